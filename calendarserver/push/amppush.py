@@ -90,6 +90,16 @@ class AMPPushForwarder(object):
                 dataChangedTimestamp=dataChangedTimestamp,
                 priority=priority.value)
 
+    @inlineCallbacks
+    def enqueueMany(self, transaction, pushKeys, dataChangedTimestamp=None):
+        if dataChangedTimestamp is None:
+            dataChangedTimestamp = int(time.time())
+        for id, priority in pushKeys:
+            yield self.enqueue(
+                transaction, id,
+                dataChangedTimestamp=dataChangedTimestamp,
+                priority=priority)
+
 
 class AMPPushMasterListeningProtocol(amp.AMP):
     """
@@ -202,6 +212,22 @@ class AMPPushMaster(object):
                 tokens, pushKey,
                 dataChangedTimestamp, priority)
 
+    @inlineCallbacks
+    def enqueueMany(self, transaction, pushKeys, dataChangedTimestamp=None):
+        """
+        Sends AMP push notifications for many push keys at once.
+
+        @param pushKeys: the push keys and the priority to use for each
+        @type pushKeys: C{list} of (C{str}, L{PushPriority}) tuples
+        """
+        if dataChangedTimestamp is None:
+            dataChangedTimestamp = int(time.time())
+        for pushKey, priority in pushKeys:
+            yield self.enqueue(
+                transaction, pushKey,
+                dataChangedTimestamp=dataChangedTimestamp,
+                priority=priority)
+
     @inlineCallbacks
     def sendNotification(self, token, id, dataChangedTimestamp, priority):
         for subscriber in self.subscribers:
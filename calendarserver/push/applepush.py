@@ -33,16 +33,18 @@ from twisted.internet.defer import inlineCallbacks, returnValue, succeed
 from twisted.internet.protocol import ClientFactory, ReconnectingClientFactory
 from twistedcaldav.extensions import DAVResource, DAVResourceWithoutChildrenMixin
 from twistedcaldav.resource import ReadOnlyNoCopyResourceMixIn
+import collections
 import json
 import OpenSSL
 import struct
 import time
 from txdav.common.icommondatastore import InvalidSubscriptionValues
-from calendarserver.push.ipush import PushPriority
+from calendarserver.push.ipush import PushPriority, IAPNProviderConnection
 from calendarserver.push.util import validToken, TokenHistory, PushScheduler
 from twext.internet.adaptendpoint import connect
 from twext.internet.gaiendpoint import GAIEndpoint
 from twisted.python.constants import Values, ValueConstant
+from zope.interface import implements
 
 log = Logger()
 
@@ -126,6 +128,8 @@ class ApplePushNotifierService(service.MultiService):
                     keychainIdentity=settings[protocol]["KeychainIdentity"],
                     staggerNotifications=settings["EnableStaggering"],
                     staggerSeconds=settings["StaggerSeconds"],
+                    coalesceSeconds=settings["CoalesceSeconds"],
+                    connectionCount=settings["ProviderConnections"],
                     testConnector=providerTestConnector,
                     reactor=reactor,
                 )
@@ -224,11 +228,69 @@ class ApplePushNotifierService(service.MultiService):
                         tokens, pushKey,
                         dataChangedTimestamp, priority)
 
+    @inlineCallbacks
+    def enqueueMany(self, transaction, pushKeys, dataChangedTimestamp=None):
+        """
+        Sends Apple Push Notifications for many push keys at once.  The
+        subscriptions for all the keys are looked up together, and each
+        provider is handed all of its notifications as a single batch.
+
+        @param pushKeys: the push keys and the priority to use for each
+        @type pushKeys: C{list} of (C{str}, L{PushPriority}) tuples
+        @param dataChangedTimestamp: Timestamp (epoch seconds) for the data change
+            which triggered these notifications (Only used for unit tests)
+        @type key: C{int}
+        """
+
+        # Unit tests can pass this value in; otherwise it defaults to now
+        if dataChangedTimestamp is None:
+            dataChangedTimestamp = int(time.time())
+
+        # Only keys with a provider need to be looked up
+        providerKeys = []
+        for pushKey, priority in pushKeys:
+            try:
+                protocol = pushKey.split("/")[1]
+            except IndexError:
+                # pushKey has no protocol, so we can't do anything with it
+                self.log.error("Push key '{key}' is missing protocol", key=pushKey)
+                continue
+            provider = self.providers.get(protocol, None)
+            if provider is not None:
+                providerKeys.append((provider, pushKey, priority,))
+
+        if not providerKeys:
+            return
+
+        subscriptions = (yield transaction.apnSubscriptionsByKeys(
+            [pushKey for _ignore_provider, pushKey, _ignore_priority in providerKeys]
+        ))
+
+        batches = collections.OrderedDict()
+        for provider, pushKey, priority in providerKeys:
+            tokens = [
+                record.token for record in subscriptions.get(pushKey, ())
+                if record.token and record.subscriberGUID
+            ]
+            if tokens:
+                batches.setdefault(provider, []).append(
+                    (tokens, pushKey, dataChangedTimestamp, priority,)
+                )
+
+        for provider, batch in batches.iteritems():
+            self.log.debug(
+                "Sending APNS notifications for {num} keys",
+                num=len(batch)
+            )
+            provider.scheduleNotificationBatch(batch)
+
 
 class APNProviderProtocol(Protocol):
     """
     Implements the Provider portion of APNS
     """
+    implements(IAPNProviderConnection)
+
     log = Logger()
 
     # Sent by provider
@@ -348,15 +410,40 @@ class APNProviderProtocol(Protocol):
             which triggered this notification
         @type key: C{int}
         """
+        self.sendNotifications([(token, key, dataChangedTimestamp, priority)])
+
+    def sendNotifications(self, notifications):
+        """
+        Sends a batch of push notification messages with a single write.
+
+        @param notifications: the notifications to send
+        @type notifications: iterable of (token, key, dataChangedTimestamp,
+            priority) tuples, as passed to L{sendNotification}
+        """
+        frames = []
+        for token, key, dataChangedTimestamp, priority in notifications:
+            frame = self._notificationFrame(token, key, dataChangedTimestamp, priority)
+            if frame is not None:
+                frames.append(frame)
+        if frames:
+            self.transport.write("".join(frames))
+
+    def _notificationFrame(self, token, key, dataChangedTimestamp, priority):
+        """
+        Build the binary message for a notification.
+
+        @return: the message, or C{None} if the notification is invalid
+        @rtype: C{str}
+        """
 
         if not (token and key and dataChangedTimestamp):
-            return
+            return None
 
         try:
             binaryToken = token.replace(" ", "").decode("hex")
         except:
             self.log.error("Invalid APN token in database: {token}", token=token)
-            return
+            return None
 
         identifier = self.history.add(token)
         apnsPriority = ApplePushPriority.lookupByValue(priority.value).value
@@ -411,34 +498,31 @@ class APNProviderProtocol(Protocol):
             1    # Priority                         # B
         )
 
-        self.transport.write(
-            struct.pack(
-                "!BIBH32sBH%dsBHIBHIBHB" % (payloadLength,),
+        return struct.pack(
+            "!BIBH32sBH%dsBHIBHIBHB" % (payloadLength,),
 
-                command,                         # Command
-                frameLength,                     # Frame length
+            command,                         # Command
+            frameLength,                     # Frame length
 
-                1,                               # Item 1 (Device token)
-                32,                              # Token Length
-                binaryToken,                     # Token
+            1,                               # Item 1 (Device token)
+            32,                              # Token Length
+            binaryToken,                     # Token
 
-                2,                               # Item 2 (Payload)
-                payloadLength,                   # Payload length
-                payload,                         # Payload
+            2,                               # Item 2 (Payload)
+            payloadLength,                   # Payload length
+            payload,                         # Payload
 
-                3,                               # Item 3 (Notification ID)
-                4,                               # Notification ID Length
-                identifier,                      # Notification ID
+            3,                               # Item 3 (Notification ID)
+            4,                               # Notification ID Length
+            identifier,                      # Notification ID
 
-                4,                               # Item 4 (Expiration)
-                4,                               # Expiration length
-                int(time.time()) + 72 * 60 * 60,  # Expires in 72 hours
+            4,                               # Item 4 (Expiration)
+            4,                               # Expiration length
+            int(time.time()) + 72 * 60 * 60,  # Expires in 72 hours
 
-                5,                               # Item 5 (Priority)
-                1,                               # Priority length
-                apnsPriority,                    # Priority
-
-            )
+            5,                               # Item 5 (Priority)
+            1,                               # Priority length
+            apnsPriority,                    # Priority
         )
 
 
@@ -535,6 +619,7 @@ class APNProviderService(APNConnectionService):
         self, store, host, port, certPath, keyPath, chainPath="",
         passphrase="", keychainIdentity="", sslMethod="TLSv1_METHOD",
         staggerNotifications=False, staggerSeconds=3,
+        coalesceSeconds=0, connectionCount=1, factoryClass=APNProviderFactory,
         testConnector=None, reactor=None
     ):
 
@@ -545,8 +630,16 @@ class APNProviderService(APNConnectionService):
             testConnector=testConnector, reactor=reactor)
 
         self.store = store
-        self.factory = None
+        self.factoryClass = factoryClass
+        self.factories = []
+        self.connectionCount = connectionCount
         self.queue = []
+
+        # Notifications waiting to be sent in the next batch, mapping (token, key) to
+        # (dataChangedTimestamp, priority)
+        self.coalesceSeconds = coalesceSeconds
+        self.pending = collections.OrderedDict()
+        self.pendingCall = None
         if staggerNotifications:
             self.scheduler = PushScheduler(
                 self.reactor, self.sendNotification,
@@ -556,15 +649,32 @@ class APNProviderService(APNConnectionService):
 
     def startService(self):
         self.log.debug("APNProviderService startService")
-        self.factory = APNProviderFactory(self, self.store)
-        self.reactor.callWhenRunning(self.connect, self.factory)
+        for _ignore in range(self.connectionCount):
+            factory = self.factoryClass(self, self.store)
+            self.factories.append(factory)
+            self.reactor.callWhenRunning(self.connect, factory)
 
     def stopService(self):
         self.log.debug("APNProviderService stopService")
-        if self.factory is not None:
-            self.factory.stopTrying()
+        for factory in self.factories:
+            factory.stopTrying()
         if self.scheduler is not None:
             self.scheduler.stop()
+        if self.pendingCall is not None and self.pendingCall.active():
+            self.pendingCall.cancel()
+        self.pendingCall = None
+
+    def connections(self):
+        """
+        The currently connected provider connections.
+
+        @rtype: C{list} of L{IAPNProviderConnection}
+        """
+        # Service has reference to factory has reference to protocol instance
+        return [
+            factory.connection for factory in self.factories
+            if getattr(factory, "connection", None) is not None
+        ]
 
     def clientConnectionMade(self):
         # Service the queue
@@ -573,11 +683,11 @@ class APNProviderService(APNConnectionService):
             # sent will be put back into the queue.
             queued = list(self.queue)
             self.queue = []
-            for (token, key), dataChangedTimestamp, priority in queued:
-                if token and key and dataChangedTimestamp and priority:
-                    self.sendNotification(
-                        token, key, dataChangedTimestamp,
-                        priority)
+            self.sendNotifications([
+                (token, key, dataChangedTimestamp, priority)
+                for (token, key), dataChangedTimestamp, priority in queued
+                if token and key and dataChangedTimestamp and priority
+            ])
 
     def scheduleNotifications(self, tokens, key, dataChangedTimestamp, priority):
         """
@@ -594,17 +704,90 @@ class APNProviderService(APNConnectionService):
             which triggered this notification
         @type key: C{int}
         """
-        # Service has reference to factory has reference to protocol instance
-        connection = getattr(self.factory, "connection", None)
-        if connection is not None:
+        if self.connections():
             if self.scheduler is not None:
                 self.scheduler.schedule(tokens, key, dataChangedTimestamp, priority)
+            elif self.coalesceSeconds:
+                self._addPending(tokens, key, dataChangedTimestamp, priority)
             else:
-                for token in tokens:
-                    self.sendNotification(token, key, dataChangedTimestamp, priority)
+                self.sendNotifications([
+                    (token, key, dataChangedTimestamp, priority)
+                    for token in tokens
+                ])
         else:
             self._saveForWhenConnected(tokens, key, dataChangedTimestamp, priority)
 
+    def scheduleNotificationBatch(self, batch):
+        """
+        Schedule notifications for several keys at once.  When notifications
+        are sent directly they all go out together in a single batch, rather
+        than one batch per key.
+
+        @param batch: the notifications to schedule
+        @type batch: C{list} of (tokens, key, dataChangedTimestamp, priority)
+            tuples, as passed to L{scheduleNotifications}
+        """
+        if self.connections() and self.scheduler is None and not self.coalesceSeconds:
+            self.sendNotifications([
+                (token, key, dataChangedTimestamp, priority)
+                for tokens, key, dataChangedTimestamp, priority in batch
+                for token in tokens
+            ])
+        else:
+            for tokens, key, dataChangedTimestamp, priority in batch:
+                self.scheduleNotifications(tokens, key, dataChangedTimestamp, priority)
+
+    def _addPending(self, tokens, key, dataChangedTimestamp, priority):
+        """
+        Add notifications to the next batch, which is sent once
+        C{self.coalesceSeconds} have passed.  A notification for a (token, key)
+        pair already in the batch just updates the timestamp and raises the
+        priority of the existing one.
+        """
+        for token in tokens:
+            existing = self.pending.get((token, key))
+            if existing is not None:
+                dataChangedTimestamp = max(dataChangedTimestamp, existing[0])
+                if existing[1].value > priority.value:
+                    priority = existing[1]
+            self.pending[(token, key)] = (dataChangedTimestamp, priority)
+
+        if self.pendingCall is None:
+            self.pendingCall = self.reactor.callLater(self.coalesceSeconds, self._sendPending)
+
+    def _sendPending(self):
+        """
+        Send the current batch of notifications.
+        """
+        self.pendingCall = None
+        pending = self.pending
+        self.pending = collections.OrderedDict()
+        self.log.debug("APNProviderService sending batch of {count} notifications", count=len(pending))
+        self.sendNotifications([
+            (token, key, dataChangedTimestamp, priority)
+            for (token, key), (dataChangedTimestamp, priority) in pending.iteritems()
+        ])
+
+    def sendNotifications(self, notifications):
+        """
+        Send a batch of notifications, spreading them over the provider
+        connections.  If there is no connection the notifications are saved for
+        later.
+
+        @param notifications: the notifications to send
+        @type notifications: C{list} of (token, key, dataChangedTimestamp,
+            priority) tuples
+        """
+        connections = self.connections()
+        if not connections:
+            for token, key, dataChangedTimestamp, priority in notifications:
+                self._saveForWhenConnected([token], key, dataChangedTimestamp, priority)
+        else:
+            for ctr, connection in enumerate(connections):
+                batch = notifications[ctr::len(connections)]
+                if batch:
+                    connection.sendNotifications(batch)
+
     def _saveForWhenConnected(self, tokens, key, dataChangedTimestamp, priority):
         """
         Called in order to save notifications that can't be sent now because there
@@ -645,12 +828,7 @@ class APNProviderService(APNConnectionService):
         if not (token and key and dataChangedTimestamp, priority):
             return
 
-        # Service has reference to factory has reference to protocol instance
-        connection = getattr(self.factory, "connection", None)
-        if connection is None:
-            self._saveForWhenConnected([token], key, dataChangedTimestamp, priority)
-        else:
-            connection.sendNotification(token, key, dataChangedTimestamp, priority)
+        self.sendNotifications([(token, key, dataChangedTimestamp, priority)])
 
 
 class APNFeedbackProtocol(Protocol):
@@ -15,6 +15,7 @@
 ##
 
 from twisted.python.constants import Values, ValueConstant
+from zope.interface import Interface
 
 
 class PushPriority(Values):
@@ -24,3 +25,24 @@ class PushPriority(Values):
     low = ValueConstant(1)
     medium = ValueConstant(5)
     high = ValueConstant(10)
+
+
+class IAPNProviderConnection(Interface):
+    """
+    A connection to the APNS provider API, over which an APNProviderService
+    sends notifications.  APNProviderProtocol implements this over the binary
+    provider protocol; another transport (for example HTTP/2) can be used by
+    giving the service a factory class whose instances take the service and
+    store, set their C{connection} attribute to a provider of this interface
+    once connected, call the service's C{clientConnectionMade()}, and support
+    C{stopTrying()}.
+    """
+
+    def sendNotifications(notifications):  # @NoSelf
+        """
+        Send a batch of notifications.
+
+        @param notifications: the notifications to send
+        @type notifications: iterable of (token, key, dataChangedTimestamp,
+            priority) tuples
+        """
@@ -45,26 +45,42 @@ class PushNotificationWork(WorkItem, fromTable(schema.PUSH_NOTIFICATION_WORK)):
     default_priority = WORK_PRIORITY_HIGH
     default_weight = WORK_WEIGHT_1
 
+    # The maximum number of push work items to handle in one batch
+    batchSize = 500
+
     @inlineCallbacks
     def doWork(self):
 
-        # Find all work items with the same push ID and find the highest
-        # priority.  Delete matching work items.
+        # Find all work items with the same push ID, along with any other push
+        # work items that are due and not yet assigned to a worker, so that
+        # they can all be distributed in one batch. Delete matching work items.
+        # The work and job rows are locked, skipping any already locked by
+        # another worker or by the job queue, so that no two transactions
+        # handle the same work item.
+        job = schema.JOB
         results = (yield Select(
-            [self.table.WORK_ID, self.table.JOB_ID, self.table.PUSH_PRIORITY],
-            From=self.table, Where=self.table.PUSH_ID == self.pushID).on(
-            self.transaction))
-
-        maxPriority = self.pushPriority
-
-        # If there are other enqueued work items for this push ID, find the
+            [self.table.WORK_ID, self.table.JOB_ID, self.table.PUSH_ID, self.table.PUSH_PRIORITY],
+            From=self.table.join(job, self.table.JOB_ID == job.JOB_ID),
+            Where=(self.table.PUSH_ID == self.pushID).Or(
+                (job.IS_ASSIGNED == 0).And(
+                    job.PAUSE == 0).And(
+                    job.NOT_BEFORE <= datetime.datetime.utcnow())
+            ),
+            Limit=self.batchSize,
+            ForUpdate=True,
+            SkipLocked=True,
+        ).on(self.transaction))
+
+        # If there are other enqueued work items for a push ID, find the
         # highest priority one and use that value. Note that L{results} will
         # not contain this work item as job processing behavior will have already
         # deleted it. So we need to make sure the max priority calculation includes
         # this one.
+        maxPriorities = {self.pushID: self.pushPriority}
         if results:
-            workIDs, jobIDs, priorities = zip(*results)
-            maxPriority = max(priorities + (self.pushPriority,))
+            workIDs, jobIDs, pushIDs, priorities = zip(*results)
+            for pushID, priority in zip(pushIDs, priorities):
+                maxPriorities[pushID] = max(maxPriorities.get(pushID, priority), priority)
 
             # Delete the work items and jobs we selected - deleting the job will ensure that there are no
             # orphaned" jobs left in the job queue which would otherwise get to run at some later point,
@@ -80,9 +96,11 @@ class PushNotificationWork(WorkItem, fromTable(schema.PUSH_NOTIFICATION_WORK)):
 
         pushDistributor = self.transaction._pushDistributor
         if pushDistributor is not None:
-            # Convert the integer priority value back into a constant
-            priority = PushPriority.lookupByValue(maxPriority)
-            yield pushDistributor.enqueue(self.transaction, self.pushID, priority=priority)
+            # Convert the integer priority values back into constants
+            yield pushDistributor.enqueueMany(self.transaction, [
+                (pushID, PushPriority.lookupByValue(priority))
+                for pushID, priority in sorted(maxPriorities.items())
+            ])
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -187,13 +205,22 @@ class NotifierFactory(object):
     def send(self, prefix, id, txn, priority=PushPriority.high):
         """
         Enqueue a push notification work item on the provided transaction.
+        Only one work item is enqueued for each push ID in a transaction - a
+        later notification for the same push ID just raises the priority of
+        that work item if needed.
         """
-        yield txn.enqueue(
-            PushNotificationWork,
-            pushID=self.pushKeyForId(prefix, id),
-            notBefore=datetime.datetime.utcnow() + datetime.timedelta(seconds=self.coalesceSeconds),
-            pushPriority=priority.value
-        )
+        pushID = self.pushKeyForId(prefix, id)
+        work = txn.pushWorkItem(pushID)
+        if work is None:
+            work = yield txn.enqueue(
+                PushNotificationWork,
+                pushID=pushID,
+                notBefore=datetime.datetime.utcnow() + datetime.timedelta(seconds=self.coalesceSeconds),
+                pushPriority=priority.value
+            )
+            txn.setPushWorkItem(pushID, work)
+        elif priority.value > work.pushPriority:
+            yield work.update(pushPriority=priority.value)
 
     def newNotifier(self, storeObject):
         return Notifier(self, storeObject)
@@ -265,3 +292,21 @@ class PushDistributor(object):
             yield observer.enqueue(
                 transaction, pushKey,
                 dataChangedTimestamp=None, priority=priority)
+
+    @inlineCallbacks
+    def enqueueMany(self, transaction, pushKeys):
+        """
+        Pass along a batch of enqueued pushKeys to any observers, so that
+        each observer can handle them together.
+
+        @param transaction: a transaction to use, if needed
+        @type transaction: L{CommonStoreTransaction}
+
+        @param pushKeys: the push keys to distribute to the observers, and
+            the priority level of each
+        @type pushKeys: C{list} of (C{str}, L{PushPriority}) tuples
+        """
+        for observer in self.observers:
+            yield observer.enqueueMany(
+                transaction, pushKeys,
+                dataChangedTimestamp=None)
@@ -18,14 +18,18 @@ import json
 import struct
 import time
 from calendarserver.push.applepush import (
-    ApplePushNotifierService, APNProviderProtocol, ApplePushPriority
+    ApplePushNotifierService, APNProviderProtocol, ApplePushPriority,
+    APNProviderService
 )
-from calendarserver.push.ipush import PushPriority
+from calendarserver.push.ipush import PushPriority, IAPNProviderConnection
 from calendarserver.push.util import validToken, TokenHistory
 from twistedcaldav.test.util import StoreTestCase
 from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
 from txdav.common.icommondatastore import InvalidSubscriptionValues
+from zope.interface import implements
+from zope.interface.verify import verifyClass
 from twistedcaldav.config import ConfigDict
 
 
@@ -46,6 +50,8 @@ class ApplePushNotifierServiceTests(StoreTestCase):
             "FeedbackUpdateSeconds": 300,
             "EnableStaggering": True,
             "StaggerSeconds": 3,
+            "CoalesceSeconds": 0,
+            "ProviderConnections": 1,
             "CalDAV": {
                 "Enabled": True,
                 "CertificatePath": "caldav.cer",
@@ -154,9 +160,11 @@ class ApplePushNotifierServiceTests(StoreTestCase):
         # The queue should be empty
         self.assertEquals(service.providers["CalDAV"].queue, [])
 
-        # Verify data sent to APN
+        # Verify data sent to APN - both queued notifications are written at
+        # once; check the second
         providerConnector = service.providers["CalDAV"].testConnector
-        rawData = providerConnector.transport.data
+        self.assertEquals(len(providerConnector.transport.data), 2 * 199)
+        rawData = providerConnector.transport.data[199:]
         self.assertEquals(len(rawData), 199)
         data = struct.unpack("!BI", rawData[:5])
         self.assertEquals(data[0], 2)  # command
@@ -344,6 +352,38 @@ class ApplePushNotifierServiceTests(StoreTestCase):
 
         service.stopService()
 
+    @inlineCallbacks
+    def test_apnSubscriptionsByKeys(self):
+        """
+        L{apnSubscriptionsByKeys} returns the subscriptions for each of the
+        keys, across several queries if needed.
+        """
+        token = "2d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"
+        token2 = "3d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"
+        key1 = "/CalDAV/calendars.example.com/user01/calendar/"
+        key2 = "/CalDAV/calendars.example.com/user02/calendar/"
+        key3 = "/CalDAV/calendars.example.com/user03/calendar/"
+        uid = "D2256BCC-48E2-42D1-BD89-CBA1E4CCDFFB"
+
+        txn = self._sqlCalendarStore.newTransaction()
+        yield txn.addAPNSubscription(token, key1, 1000, uid, "test agent", "127.0.0.1")
+        yield txn.addAPNSubscription(token2, key1, 1000, uid, "test agent", "127.0.0.1")
+        yield txn.addAPNSubscription(token, key2, 1000, uid, "test agent", "127.0.0.1")
+
+        subscriptions = (yield txn.apnSubscriptionsByKeys([key1, key2, key3], batchSize=2))
+        yield txn.commit()
+        self.assertEqual(
+            dict([
+                (key, sorted([record.token for record in records]))
+                for key, records in subscriptions.items()
+            ]),
+            {
+                key1: [token, token2],
+                key2: [token],
+                key3: [],
+            }
+        )
+
     def test_validToken(self):
         self.assertTrue(validToken("2d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"))
         self.assertFalse(validToken("d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"))
@@ -410,6 +450,116 @@ class ApplePushNotifierServiceTests(StoreTestCase):
         )
 
 
+class APNProviderServiceTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.callWhenRunning = lambda callable, *args: callable(*args)
+        self.connectors = []
+        test = self
+
+        class Connector(TestConnector):
+            def connect(self, service, factory):
+                TestConnector.connect(self, service, factory)
+                test.connectors.append(self)
+
+        self.service = APNProviderService(
+            None, "gateway.push.apple.com", 2195, "caldav.cer", "caldav.pem",
+            coalesceSeconds=5, connectionCount=2,
+            testConnector=Connector(), reactor=self.clock,
+        )
+        self.service.startService()
+
+    def frames(self):
+        """
+        The (token, key, priority) of each notification written to the
+        provider connections.
+        """
+        results = []
+        for protocol in self.service.connections():
+            data = protocol.transport.data or ""
+            while data:
+                _ignore_command, frameLength = struct.unpack("!BI", data[:5])
+                frame, data = data[5:5 + frameLength], data[5 + frameLength:]
+                token = frame[3:35].encode("hex")
+                payloadLength = struct.unpack("!H", frame[36:38])[0]
+                payload = json.loads(frame[38:38 + payloadLength])
+                priority = struct.unpack("!B", frame[-1])[0]
+                results.append((token, payload["key"], priority))
+        return sorted(results)
+
+    def test_coalesce(self):
+        """
+        Notifications within the coalescing window are sent together, once
+        per (token, key) with the highest priority, spread over the provider
+        connections.
+        """
+        token1 = "2d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"
+        token2 = "3d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"
+        key = "/CalDAV/calendars.example.com/user01/calendar/"
+
+        self.assertEqual(len(self.service.connections()), 2)
+        self.service.scheduleNotifications([token1, token2], key, 1000, PushPriority.low)
+        self.service.scheduleNotifications([token1], key, 1001, PushPriority.high)
+        self.service.scheduleNotifications([token2], key, 1002, PushPriority.medium)
+        self.assertEqual(self.frames(), [])
+
+        self.clock.advance(5)
+        self.assertEqual(
+            self.frames(),
+            [
+                (token1, key, ApplePushPriority.high.value),
+                (token2, key, ApplePushPriority.medium.value),
+            ]
+        )
+        for protocol in self.service.connections():
+            self.assertNotEqual(protocol.transport.data, None)
+
+    def test_providerTransport(self):
+        """
+        The service sends notifications over whatever provider connections its
+        factory class makes.
+        """
+        self.assertTrue(verifyClass(IAPNProviderConnection, APNProviderProtocol))
+
+        class RecordingConnection(object):
+            implements(IAPNProviderConnection)
+
+            def __init__(self):
+                self.sent = []
+
+            def sendNotifications(self, notifications):
+                self.sent.extend(notifications)
+
+        class RecordingFactory(object):
+
+            def __init__(self, service, store):
+                self.connection = RecordingConnection()
+
+            def stopTrying(self):
+                pass
+
+        class NullConnector(object):
+
+            def connect(self, service, factory):
+                pass
+
+        service = APNProviderService(
+            None, "gateway.push.apple.com", 2195, "caldav.cer", "caldav.pem",
+            factoryClass=RecordingFactory,
+            testConnector=NullConnector(), reactor=self.clock,
+        )
+        service.startService()
+        token = "2d0d55cd7f98bcb81c6e24abcdc35168254c7846a43e2828b1ba5a8f82e219df"
+        key = "/CalDAV/calendars.example.com/user01/calendar/"
+        service.scheduleNotifications([token], key, 1000, PushPriority.high)
+        self.assertEqual(
+            service.connections()[0].sent,
+            [(token, key, 1000, PushPriority.high)]
+        )
+        service.stopService()
+
+
 class TestConnector(object):
 
     def connect(self, service, factory):
@@ -18,6 +18,7 @@ from twistedcaldav.test.util import StoreTestCase
 from calendarserver.push.notifier import PushDistributor
 from calendarserver.push.notifier import getPubSubAPSConfiguration
 from calendarserver.push.notifier import PushNotificationWork
+from calendarserver.push.notifier import NotifierFactory as PushNotifierFactory
 from twisted.internet.defer import inlineCallbacks, succeed
 from twistedcaldav.config import ConfigDict
 from txdav.common.datastore.test.util import populateCalendarsFrom
@@ -165,6 +166,7 @@ class StubDistributor(object):
 
     def reset(self):
         self.history = []
+        self.batches = []
 
     def enqueue(
         self, transaction, pushID, dataChangedTimestamp=None,
@@ -173,6 +175,11 @@ class StubDistributor(object):
         self.history.append((pushID, priority))
         return(succeed(None))
 
+    def enqueueMany(self, transaction, pushKeys):
+        self.history.extend(pushKeys)
+        self.batches.append(pushKeys)
+        return(succeed(None))
+
 
 class PushNotificationWorkTests(StoreTestCase):
 
@@ -260,6 +267,68 @@ class PushNotificationWorkTests(StoreTestCase):
             pushDistributor.history,
             [("/CalDAV/localhost/bar/", PushPriority.high)])
 
+    @inlineCallbacks
+    def test_workBatch(self):
+        """
+        L{PushNotificationWork.doWork} distributes any other due push work
+        items along with its own, as a single batch, and removes them.
+        """
+        pushDistributor = StubDistributor()
+        txn = self._sqlCalendarStore.newTransaction()
+        txn._pushDistributor = pushDistributor
+
+        work = yield txn.enqueue(
+            PushNotificationWork,
+            pushID="/CalDAV/localhost/foo/",
+            pushPriority=PushPriority.low.value
+        )
+        yield txn.enqueue(
+            PushNotificationWork,
+            pushID="/CalDAV/localhost/foo/",
+            pushPriority=PushPriority.high.value
+        )
+        yield txn.enqueue(
+            PushNotificationWork,
+            pushID="/CalDAV/localhost/bar/",
+            pushPriority=PushPriority.medium.value
+        )
+
+        yield work.doWork()
+        self.assertEqual(
+            pushDistributor.batches,
+            [[
+                ("/CalDAV/localhost/bar/", PushPriority.medium),
+                ("/CalDAV/localhost/foo/", PushPriority.high),
+            ]]
+        )
+        remaining = yield PushNotificationWork.all(txn)
+        self.assertEqual(remaining, [])
+        yield txn.abort()
+
+    @inlineCallbacks
+    def test_sendCoalesced(self):
+        """
+        Notifications sent for the same push ID within one transaction result
+        in a single work item with the highest priority.
+        """
+        factory = PushNotifierFactory("localhost", 0)
+
+        txn = self._sqlCalendarStore.newTransaction()
+        yield factory.send("CalDAV", "bar", txn, priority=PushPriority.low)
+        yield factory.send("CalDAV", "bar", txn, priority=PushPriority.high)
+        yield factory.send("CalDAV", "bar", txn, priority=PushPriority.medium)
+        yield factory.send("CalDAV", "baz", txn, priority=PushPriority.medium)
+        work = yield PushNotificationWork.all(txn)
+        yield txn.abort()
+
+        self.assertEquals(
+            sorted([(item.pushID, item.pushPriority) for item in work]),
+            [
+                ("/CalDAV/localhost/bar/", PushPriority.high.value),
+                ("/CalDAV/localhost/baz/", PushPriority.medium.value),
+            ]
+        )
+
 
 class NotifierFactory(StoreTestCase):
 
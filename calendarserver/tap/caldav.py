@@ -83,6 +83,8 @@ from txweb2.metafd import ConnectionLimiter, ReportingHTTPService
 from txweb2.server import Site
 
 from txdav.base.datastore.dbapiclient import DBAPIConnector
+from txdav.caldav.datastore.offload import CalendarDataOffloadService, \
+    installCalendarDataOffload
 from txdav.caldav.datastore.scheduling.imip.inbound import MailRetriever
 from txdav.caldav.datastore.scheduling.imip.inbound import scheduleNextMailPoll
 from txdav.common.datastore.upgrade.migrate import UpgradeToDatabaseStep
@@ -872,6 +874,23 @@ class CalDAVServiceMaker (object):
             sendCAsToClient=config.Authentication.ClientCertificate.SendCAsToClient,
         )
 
+    def makeCalendarDataOffload(self, result):
+        """
+        Start the helper processes used to parse, validate and expand large
+        calendar data, and install them for use by the store.
+
+        @param result: the service to add the helper process service to
+        @type result: L{MultiService}
+        """
+        offloadService = CalendarDataOffloadService(
+            config.CalendarDataOffload.ProcessCount,
+            config.CalendarDataOffload.MinSize,
+            config.getProvider().getConfigFileName(),
+        )
+        offloadService.setName("calendar-offload")
+        offloadService.setServiceParent(result)
+        installCalendarDataOffload(offloadService)
+
     def makeService_Slave(self, options):
         """
         Create a "slave" service, a subprocess of a service created with
@@ -897,6 +916,10 @@ class CalDAVServiceMaker (object):
             pool.setName("db")
             pool.setServiceParent(result)
 
+        # Optionally offload processing of large calendar data
+        if config.CalendarDataOffload.Enabled:
+            self.makeCalendarDataOffload(result)
+
         if config.ControlSocket:
             id = config.ControlSocket
             self.log.info("Control via AF_UNIX: {id}", id=id)
@@ -974,6 +997,7 @@ class CalDAVServiceMaker (object):
                 batchSize=config.GroupCaching.BatchSize,
                 batchSchedulingIntervalSeconds=config.GroupCaching.BatchSchedulingIntervalSeconds,
                 useDirectoryBasedDelegates=config.GroupCaching.UseDirectoryBasedDelegates,
+                incrementalRefresh=config.GroupCaching.IncrementalRefresh,
                 cacheNotifier=cacheNotifier,
             )
         else:
@@ -1153,6 +1177,7 @@ class CalDAVServiceMaker (object):
             reportingService = ReportingHTTPService(
                 requestFactory, int(config.MetaFD), contextFactory,
                 usingSocketFile=config.SocketFiles.Enabled,
+                reportLatency=config.AdaptiveRequestLimit.Enabled,
             )
             reportingService.setName("http-{}".format(int(config.MetaFD)))
             reportingService.setServiceParent(connectionService)
@@ -1344,6 +1369,10 @@ class CalDAVServiceMaker (object):
 
             result = self.requestProcessingService(options, store, logObserver)
 
+            # Optionally offload processing of large calendar data
+            if config.CalendarDataOffload.Enabled:
+                self.makeCalendarDataOffload(result)
+
             # Optionally set up push notifications
             pushDistributor = None
             if config.Notifications.Enabled:
@@ -1419,6 +1448,7 @@ class CalDAVServiceMaker (object):
                     batchSize=config.GroupCaching.BatchSize,
                     batchSchedulingIntervalSeconds=config.GroupCaching.BatchSchedulingIntervalSeconds,
                     useDirectoryBasedDelegates=config.GroupCaching.UseDirectoryBasedDelegates,
+                    incrementalRefresh=config.GroupCaching.IncrementalRefresh,
                     cacheNotifier=cacheNotifier,
                 )
             else:
@@ -1802,9 +1832,19 @@ class CalDAVServiceMaker (object):
         inheritSSLFDs = []
 
         if config.UseMetaFD:
+            limiterOptions = {}
+            if config.AdaptiveRequestLimit.Enabled:
+                limiterOptions["minRequests"] = (
+                    config.AdaptiveRequestLimit.MinRequests *
+                    config.MultiProcess.ProcessCount
+                )
+                limiterOptions["targetLatency"] = config.AdaptiveRequestLimit.TargetLatency
+            if config.WorkerAffinity.Enabled:
+                limiterOptions["affinityTolerance"] = config.WorkerAffinity.Tolerance
             cl = ConnectionLimiter(config.MaxAccepts,
                                    (config.MaxRequests *
-                                    config.MultiProcess.ProcessCount))
+                                    config.MultiProcess.ProcessCount),
+                                   **limiterOptions)
             dispatcher = cl.dispatcher
         else:
             # keep a reference to these so they don't close
@@ -1951,6 +1991,7 @@ class CalDAVServiceMaker (object):
                     batchSize=config.GroupCaching.BatchSize,
                     batchSchedulingIntervalSeconds=config.GroupCaching.BatchSchedulingIntervalSeconds,
                     useDirectoryBasedDelegates=config.GroupCaching.UseDirectoryBasedDelegates,
+                    incrementalRefresh=config.GroupCaching.IncrementalRefresh,
                     cacheNotifier=cacheNotifier,
                 )
             else:
@@ -92,6 +92,7 @@ from txdav.common.datastore.sql import current_sql_schema
 from txdav.common.datastore.upgrade.sql.upgrade import NotAllowedToUpgrade
 from txdav.dps.client import DirectoryService as DirectoryProxyClientService
 from txdav.who.cache import CachingDirectoryService
+from txdav.who.sharedcache import SharedRecordTable
 from txdav.who.util import directoryFromConfig
 
 from txweb2.auth.basic import BasicCredentialFactory
@@ -234,6 +235,10 @@ def storeFromConfigWithDPSClient(config, txnFactory):
             expireSeconds=config.DirectoryCaching.CachingSeconds,
             lookupsBetweenPurges=config.DirectoryCaching.LookupsBetweenPurges,
             negativeCaching=config.DirectoryCaching.NegativeCachingEnabled,
+            sharedCache=(
+                SharedRecordTable(config.DirectoryProxy.SharedCache.Path)
+                if config.DirectoryProxy.SharedCache.Enabled else None
+            ),
         )
     store.setDirectoryService(directory)
     return store
@@ -44,6 +44,8 @@ from __future__ import print_function
 from uuid import uuid4
 import collections
 import itertools
+import json
+import os
 import sys
 import time
 import traceback
@@ -58,7 +60,9 @@ from pycalendar.period import Period
 from pycalendar.timezone import Timezone
 from twext.enterprise.dal.syntax import Select, Parameter, Count, Update
 from twext.python.log import Logger
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, Deferred, \
+    DeferredList, DeferredSemaphore
+from twisted.internet.protocol import ProcessProtocol
 from twisted.python import usage
 from twisted.python.usage import Options
 from twistedcaldav.datafilters.peruserdata import PerUserDataFilter
@@ -202,7 +206,7 @@ Component.validRecurrenceIDs = new_validRecurrenceIDs
 if not hasattr(Component, "maxAlarmCounts"):
     Component.hasDuplicateAlarms = new_hasDuplicateAlarms
 
-VERSION = "13"
+VERSION = "14"
 
 
 def printusage(e=None):
@@ -263,6 +267,19 @@ Options for --ical / --upgrade:
 --path     : Scan the calendar home or calendar identified by the
              specified URI
 
+Options for a parallel --ical scan:
+
+--workers N    : scan using N processes. Calendar homes are divided
+                 into shards by resource ID, each scanned by a
+                 separate process.
+--results PATH : file to append problems to, one JSON object per line.
+                 Required with --workers.
+--state PATH   : file recording the shards that have been scanned, so
+                 that an interrupted scan resumes where it left off
+                 when run again [DEFAULT: the results file + ".state"].
+--shard-size N : number of calendar home resource IDs in each shard
+                 [DEFAULT: 1000].
+
 Options for --mismatch:
 
 --uid      : look for mismatches with the specified iCalendar UID only.
@@ -320,6 +337,8 @@ v12: Fix double-booking false positives caused by timezones-by-reference.
 
 v13: Add new options for --nuke and --ical. Add fix for invalid GEO.
 
+v14: Add parallel, resumable --ical scans.
+
 """ % (VERSION,)
 
 
@@ -354,6 +373,8 @@ class CalVerifyOptions(Options):
         ['no-organizer', '', "Detect dark events without an organizer"],
         ['invalid-organizer', '', "Detect dark events with an organizer not in the directory"],
         ['disabled-organizer', '', "Detect dark events with a disabled organizer"],
+
+        ['json', '', "Write --ical problems as JSON lines (used by --workers)."],
     ]
 
     optParameters = [
@@ -365,6 +386,11 @@ class CalVerifyOptions(Options):
         ['days', 'T', "365", "Number of days for scanning events into the future."],
         ['path', '', "", "Split event given its path."],
         ['rid', '', "", "Split date-time."],
+        ['workers', '', "0", "Number of processes for a parallel --ical scan."],
+        ['results', '', "", "JSON lines results file for a parallel --ical scan."],
+        ['state', '', "", "State file for resuming a parallel --ical scan."],
+        ['shard-size', '', "1000", "Number of home resource IDs in each shard of a parallel --ical scan."],
+        ['home-range', '', "", "Only scan homes with resource IDs in the range LOW:HIGH (used by --workers)."],
     ]
 
     def __init__(self):
@@ -374,6 +400,17 @@ class CalVerifyOptions(Options):
     def getUsage(self, width=None):
         return ""
 
+    def postOptions(self):
+        try:
+            workers = int(self["workers"])
+            int(self["shard-size"])
+        except ValueError:
+            raise usage.UsageError("--workers and --shard-size must be numbers")
+        if workers and not self["results"]:
+            raise usage.UsageError("--workers requires --results")
+        if workers and (self["uuid"] or self["uid"] or self["path"]):
+            raise usage.UsageError("--workers cannot be used with --uuid, --uid or --path")
+
     def opt_output(self, filename):
         """
         Specify output file path (default: '-', meaning stdout).
@@ -424,7 +461,8 @@ class CalVerifyService(WorkerService, object):
         """
         Do the operation stopping the reactor when done.
         """
-        self.output.write("\n---- CalVerify %s version: %s ----\n" % (self.title(), VERSION,))
+        if not self.options.get("json"):
+            self.output.write("\n---- CalVerify %s version: %s ----\n" % (self.title(), VERSION,))
 
         try:
             yield self.doAction()
@@ -463,6 +501,15 @@ class CalVerifyService(WorkerService, object):
         ).on(self.txn, **kwds))
         returnValue(tuple([uid[0] for uid in rows]))
 
+    @inlineCallbacks
+    def getAllHomeResourceIDs(self):
+        ch = schema.CALENDAR_HOME
+        rows = (yield Select(
+            [ch.RESOURCE_ID, ],
+            From=ch,
+        ).on(self.txn))
+        returnValue(tuple([row[0] for row in rows]))
+
     @inlineCallbacks
     def countHomeContents(self, uid):
         ch = schema.CALENDAR_HOME
@@ -536,6 +583,35 @@ class CalVerifyService(WorkerService, object):
         ).on(self.txn, **kwds))
         returnValue(tuple(rows))
 
+    @inlineCallbacks
+    def getAllResourceInfoForHomeRange(self, low, high, inbox=False, calendar=None):
+        co = schema.CALENDAR_OBJECT
+        cb = schema.CALENDAR_BIND
+        ch = schema.CALENDAR_HOME
+
+        if calendar:
+            cojoin = (cb.CALENDAR_RESOURCE_ID == co.CALENDAR_RESOURCE_ID).And(
+                cb.BIND_MODE == _BIND_MODE_OWN).And(
+                cb.CALENDAR_RESOURCE_NAME == calendar)
+        elif inbox:
+            cojoin = (cb.CALENDAR_RESOURCE_ID == co.CALENDAR_RESOURCE_ID).And(
+                cb.BIND_MODE == _BIND_MODE_OWN)
+        else:
+            cojoin = (cb.CALENDAR_RESOURCE_ID == co.CALENDAR_RESOURCE_ID).And(
+                cb.BIND_MODE == _BIND_MODE_OWN).And(
+                cb.CALENDAR_RESOURCE_NAME != "inbox")
+
+        kwds = {"Low": low, "High": high}
+        rows = (yield Select(
+            [ch.OWNER_UID, co.RESOURCE_ID, co.ICALENDAR_UID, cb.CALENDAR_RESOURCE_NAME, co.MD5, co.ORGANIZER, co.CREATED, co.MODIFIED],
+            From=ch.join(
+                cb, type="inner", on=(ch.RESOURCE_ID == cb.CALENDAR_HOME_RESOURCE_ID)).join(
+                co, type="inner", on=cojoin),
+            Where=(ch.RESOURCE_ID >= Parameter("Low")).And(ch.RESOURCE_ID <= Parameter("High")),
+            GroupBy=(ch.OWNER_UID, co.RESOURCE_ID, co.ICALENDAR_UID, cb.CALENDAR_RESOURCE_NAME, co.MD5, co.ORGANIZER, co.CREATED, co.MODIFIED,),
+        ).on(self.txn, **kwds))
+        returnValue(tuple(rows))
+
     @inlineCallbacks
     def getAllResourceInfoTimeRange(self, start):
         co = schema.CALENDAR_OBJECT
@@ -1000,6 +1076,10 @@ class BadDataService(CalVerifyService):
                 calendar = segments[3] if len(segments) == 4 else None
             rows = yield self.getAllResourceInfoWithUUID(uuid, inbox=True, calendar=calendar)
             descriptor = "getAllResourceInfoWithUUID"
+        elif self.options.get("home-range"):
+            low, high = [int(value) for value in self.options["home-range"].split(":")]
+            rows = yield self.getAllResourceInfoForHomeRange(low, high, inbox=True, calendar=self.options.get("calendar"))
+            descriptor = "getAllResourceInfoForHomeRange"
         else:
             rows = yield self.getAllResourceInfo(inbox=True)
             descriptor = "getAllResourceInfo"
@@ -1007,6 +1087,10 @@ class BadDataService(CalVerifyService):
         yield self.txn.commit()
         self.txn = None
 
+        if self.options.get("json"):
+            yield self.calendarDataStream(rows)
+            returnValue(None)
+
         if self.options["verbose"]:
             self.output.write("%s time: %.1fs\n" % (descriptor, time.time() - t,))
 
@@ -1104,6 +1188,47 @@ class BadDataService(CalVerifyService):
                 safePercent(diff_time, total, 1000.0),
             ))
 
+    @inlineCallbacks
+    def calendarDataStream(self, rows):
+        """
+        Check each calendar resource for valid iCalendar data, writing each
+        problem to the output as a line of JSON as soon as it is found rather
+        than collecting them. A final line gives the number of resources
+        checked and the number with problems.
+        """
+
+        self.txn = self.store.newTransaction()
+
+        count = 0
+        badlen = 0
+        for owner, resid, uid, calname, _ignore_md5, _ignore_organizer, _ignore_created, _ignore_modified in rows:
+            try:
+                result, message = yield self.validCalendarData(resid, calname == "inbox")
+            except Exception:
+                result = False
+                message = "Exception for validCalendarData"
+            if not result:
+                self.output.write(json.dumps({
+                    "owner": owner,
+                    "uid": uid,
+                    "resid": resid,
+                    "problem": message,
+                }) + "\n")
+                badlen += 1
+            count += 1
+
+            # To avoid holding locks on all the rows scanned, commit every 100 resources
+            if divmod(count, 100)[1] == 0:
+                yield self.txn.commit()
+                self.txn = self.store.newTransaction()
+                self.output.flush()
+
+        yield self.txn.commit()
+        self.txn = None
+
+        self.output.write(json.dumps({"objects": count, "bad": badlen}) + "\n")
+        self.output.flush()
+
     errorPrefix = "Calendar data had unfixable problems:\n  "
 
     @inlineCallbacks
@@ -1337,6 +1462,208 @@ class BadDataService(CalVerifyService):
         returnValue(caldata)
 
 
+class _ShardProcessProtocol(ProcessProtocol):
+    """
+    Collects the JSON lines written by a calverify process scanning one shard
+    of calendar homes. C{finished} fires with a tuple of the problems found
+    and the final summary, or fails if the process did not complete its scan.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.problems = []
+        self.summary = None
+        self.finished = Deferred()
+
+    def outReceived(self, data):
+        lines = (self.buffer + data).split("\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            self.lineReceived(line)
+
+    def errReceived(self, data):
+        log.debug("calverify shard process: {data}", data=data)
+
+    def lineReceived(self, line):
+        # Anything other than JSON is ignored
+        if not line.startswith("{"):
+            return
+        try:
+            item = json.loads(line)
+        except ValueError:
+            return
+        if "objects" in item:
+            self.summary = item
+        else:
+            self.problems.append(item)
+
+    def processEnded(self, reason):
+        if self.buffer:
+            self.lineReceived(self.buffer)
+            self.buffer = ""
+        if self.summary is None:
+            self.finished.errback(reason)
+        else:
+            self.finished.callback((self.problems, self.summary,))
+
+
+class ParallelBadDataService(BadDataService):
+    """
+    Service which scans for bad calendar data using a pool of calverify
+    processes. Calendar homes are divided into shards by resource ID, each
+    of which is scanned by a separate process. The problems found are
+    appended to a JSON lines results file as each shard completes, and the
+    completed shards are recorded in a state file, so that an interrupted
+    scan can be resumed by running the same command again.
+    """
+
+    def title(self):
+        return "Parallel Bad Data Service"
+
+    @inlineCallbacks
+    def doAction(self):
+
+        workers = int(self.options["workers"])
+        shardSize = int(self.options["shard-size"])
+        resultsPath = self.options["results"]
+        statePath = self.options["state"] or resultsPath + ".state"
+
+        self.output.write("\n---- Scanning calendar data with %d processes ----\n" % (workers,))
+
+        state = self.loadState(statePath, shardSize)
+        if state is None:
+            returnValue(None)
+
+        self.txn = self.store.newTransaction()
+        homeIDs = yield self.getAllHomeResourceIDs()
+        yield self.txn.commit()
+        self.txn = None
+
+        shards = sorted(set([homeID // shardSize for homeID in homeIDs]) - set(state["completed"]))
+        self.shardCount = len(shards)
+        self.shardsDone = 0
+        self.shardsFailed = 0
+        self.scanned = 0
+        self.startTime = time.time()
+        self.logResult("Number of shards to scan", self.shardCount)
+
+        results = open(resultsPath, "a")
+        try:
+            semaphore = DeferredSemaphore(workers)
+            yield DeferredList([
+                semaphore.run(self.scanShard, shard, shardSize, state, statePath, results)
+                for shard in shards
+            ])
+        finally:
+            results.close()
+
+        elapsed = time.time() - self.startTime
+        self.total = state["objects"]
+        self.logResult("Number of events processed", state["objects"])
+        self.logResult("Bad iCalendar data", state["bad"], state["objects"])
+        self.logResult("Objects/sec", "%.1f" % (safePercent(self.scanned, elapsed, 1.0),))
+        if self.shardsFailed:
+            self.logResult("Failed shards", self.shardsFailed)
+            self.output.write("Run again to retry the failed shards\n")
+
+        self.printSummary()
+
+    def loadState(self, statePath, shardSize):
+        """
+        Read the state left by an earlier scan, or create a new state if there
+        is none.
+
+        @return: the state, or C{None} if the state file cannot be used
+        @rtype: L{dict}
+        """
+        if os.path.exists(statePath):
+            with open(statePath) as f:
+                state = json.load(f)
+            if state["shardSize"] != shardSize:
+                self.output.write("State file %s was created with a shard size of %d\n" % (statePath, state["shardSize"],))
+                return None
+            self.output.write("Resuming scan: %d shards already complete\n" % (len(state["completed"]),))
+        else:
+            state = {
+                "shardSize": shardSize,
+                "completed": [],
+                "objects": 0,
+                "bad": 0,
+            }
+        return state
+
+    def saveState(self, statePath, state):
+        """
+        Write the state, replacing the state file in one step so that an
+        interruption cannot leave it partially written.
+        """
+        tempPath = statePath + ".tmp"
+        with open(tempPath, "w") as f:
+            json.dump(state, f)
+        os.rename(tempPath, statePath)
+
+    def shardArguments(self, low, high):
+        """
+        The command line for a process scanning the homes with resource IDs in
+        the range C{low} to C{high}.
+        """
+        args = [
+            sys.executable, "-m", "calendarserver.tools.calverify",
+            "--ical", "--json",
+            "--config", self.options["config"],
+            "--home-range", "%d:%d" % (low, high,),
+        ]
+        if self.options["fix"]:
+            args.append("--fix")
+        if self.options["calendar"]:
+            args.extend(("--calendar", self.options["calendar"],))
+        return args
+
+    def spawnShard(self, low, high):
+        """
+        Start a process scanning one shard.
+
+        @return: a L{Deferred} firing with the problems found and the summary
+        """
+        protocol = _ShardProcessProtocol()
+        args = self.shardArguments(low, high)
+        self.reactor.spawnProcess(protocol, args[0], args, env=os.environ)
+        return protocol.finished
+
+    @inlineCallbacks
+    def scanShard(self, shard, shardSize, state, statePath, results):
+        """
+        Scan one shard, then record its problems and mark it complete.
+        """
+        low = shard * shardSize
+        high = low + shardSize - 1
+        try:
+            problems, summary = yield self.spawnShard(low, high)
+        except Exception, e:
+            self.shardsFailed += 1
+            self.output.write("Shard %d-%d failed: %s\n" % (low, high, e,))
+            returnValue(None)
+
+        for problem in problems:
+            results.write(json.dumps(problem) + "\n")
+        results.flush()
+
+        state["completed"].append(shard)
+        state["objects"] += summary["objects"]
+        state["bad"] += summary["bad"]
+        self.saveState(statePath, state)
+
+        self.shardsDone += 1
+        self.scanned += summary["objects"]
+        elapsed = time.time() - self.startTime
+        self.output.write("Shard %d-%d: %d objects, %d bad - %d of %d shards, %.1f objects/sec\n" % (
+            low, high, summary["objects"], summary["bad"],
+            self.shardsDone, self.shardCount,
+            safePercent(self.scanned, elapsed, 1.0),
+        ))
+        self.output.flush()
+
+
 class SchedulingMismatchService(CalVerifyService):
     """
     Service which detects mismatched scheduled events.
@@ -3208,6 +3535,8 @@ def main(argv=sys.argv, stderr=sys.stderr, reactor=None):
         elif options["missing"]:
             return OrphansService(store, options, output, reactor, config)
         elif options["ical"]:
+            if int(options["workers"]):
+                return ParallelBadDataService(store, options, output, reactor, config)
             return BadDataService(store, options, output, reactor, config)
         elif options["mismatch"]:
             return SchedulingMismatchService(store, options, output, reactor, config)
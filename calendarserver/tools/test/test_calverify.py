@@ -25,12 +25,14 @@ Tests for calendarserver.tools.calverify
 
 from calendarserver.tools.calverify import BadDataService, \
     SchedulingMismatchService, DoubleBookingService, DarkPurgeService, \
-    EventSplitService, MissingLocationService
+    EventSplitService, MissingLocationService, ParallelBadDataService, \
+    CalVerifyOptions
 
 from pycalendar.datetime import DateTime
 
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, succeed
+from twisted.python import usage
 
 from twistedcaldav.config import config
 from twistedcaldav.ical import normalize_iCalStr
@@ -39,6 +41,7 @@ from twistedcaldav.test.util import StoreTestCase
 from txdav.common.datastore.test.util import populateCalendarsFrom
 
 from StringIO import StringIO
+import json
 
 
 OK_ICS = """BEGIN:VCALENDAR
@@ -566,6 +569,150 @@ class CalVerifyDataTests(StoreTestCase):
                 attendee.value().startswith("/principals")
             )
 
+    @inlineCallbacks
+    def test_scanBadDataJSON(self):
+        """
+        CalVerifyService.doScan of a range of homes with JSON output. Make sure
+        each problem is written as a line of JSON, followed by a summary.
+        """
+
+        home = yield self.homeUnderTest(name="home1")
+        homeID = home.id()
+        yield self.commit()
+
+        options = {
+            "ical": True,
+            "fix": False,
+            "nobase64": False,
+            "verbose": False,
+            "uid": "",
+            "uuid": "",
+            "path": "",
+            "tzid": "",
+            "json": True,
+            "home-range": "%d:%d" % (homeID, homeID,),
+        }
+        output = StringIO()
+        calverify = BadDataService(self._sqlCalendarStore, options, output, reactor, config)
+        calverify.emailDomain = "example.com"
+        yield calverify.doAction()
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(lines[-1], {"objects": self.number_to_process, "bad": 11})
+        self.assertEqual(
+            set([(line["owner"], line["uid"],) for line in lines[:-1]]),
+            set((
+                ("home1", "BAD1",),
+                ("home1", "BAD2",),
+                ("home1", "BAD3",),
+                ("home1", "BAD4",),
+                ("home1", "BAD5",),
+                ("home1", "BAD6",),
+                ("home1", "BAD10",),
+                ("home1", "BAD11",),
+                ("home1", "BAD12",),
+                ("home1", "BAD13",),
+                ("home1", "BAD14",),
+            ))
+        )
+
+    @inlineCallbacks
+    def test_scanBadDataHomeRangeCalendar(self):
+        """
+        CalVerifyService.doScan of a range of homes only scans the calendar
+        given by --calendar, as the shards of a parallel scan do.
+        """
+
+        home = yield self.homeUnderTest(name="home1")
+        homeID = home.id()
+        yield self.commit()
+
+        for calendar, objects in (("calendar_1", self.number_to_process,), ("calendar_2", 0,),):
+            options = {
+                "ical": True,
+                "fix": False,
+                "nobase64": False,
+                "verbose": False,
+                "uid": "",
+                "uuid": "",
+                "path": "",
+                "tzid": "",
+                "json": True,
+                "calendar": calendar,
+                "home-range": "%d:%d" % (homeID, homeID,),
+            }
+            output = StringIO()
+            calverify = BadDataService(self._sqlCalendarStore, options, output, reactor, config)
+            calverify.emailDomain = "example.com"
+            yield calverify.doAction()
+
+            lines = [json.loads(line) for line in output.getvalue().splitlines()]
+            self.assertEqual(lines[-1]["objects"], objects)
+
+    def test_parallelOptions(self):
+        """
+        --workers cannot be combined with the options that select a single
+        home, event or path, since the shards would not apply them.
+        """
+        for option, value in (("--uuid", "home1",), ("--uid", "BAD1",), ("--path", "/calendars/__uids__/home1/calendar_1/1.ics",),):
+            options = CalVerifyOptions()
+            self.assertRaises(
+                usage.UsageError,
+                options.parseOptions,
+                ["--ical", "--workers", "2", "--results", "results.json", option, value],
+            )
+
+    @inlineCallbacks
+    def test_parallelResume(self):
+        """
+        ParallelBadDataService records the shards it scans in its state file,
+        and does not scan them again when run a second time.
+        """
+
+        resultsPath = self.mktemp()
+        options = {
+            "ical": True,
+            "fix": False,
+            "verbose": False,
+            "tzid": "",
+            "config": "",
+            "calendar": "",
+            "workers": "2",
+            "shard-size": "1",
+            "results": resultsPath,
+            "state": "",
+        }
+
+        scanned = []
+
+        def spawnShard(low, high):
+            scanned.append((low, high,))
+            return succeed((
+                [{"owner": "home%d" % (low,), "uid": "BAD", "resid": 1, "problem": "Bad"}],
+                {"objects": 2, "bad": 1},
+            ))
+
+        output = StringIO()
+        calverify = ParallelBadDataService(self._sqlCalendarStore, options, output, reactor, config)
+        calverify.spawnShard = spawnShard
+        yield calverify.doAction()
+
+        self.assertNotEqual(scanned, [])
+        self.assertTrue(all([low == high for low, high in scanned]))
+        self.assertEqual(calverify.results["Number of events processed"], 2 * len(scanned))
+        self.assertEqual(calverify.results["Bad iCalendar data"], len(scanned))
+        with open(resultsPath) as f:
+            self.assertEqual(len(f.readlines()), len(scanned))
+
+        del scanned[:]
+        output = StringIO()
+        calverify = ParallelBadDataService(self._sqlCalendarStore, options, output, reactor, config)
+        calverify.spawnShard = spawnShard
+        yield calverify.doAction()
+
+        self.assertEqual(scanned, [])
+        self.assertEqual(calverify.results["Number of shards to scan"], 0)
+
     @inlineCallbacks
     def test_scanBadCuaOnly(self):
         """
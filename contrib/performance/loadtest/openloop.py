@@ -0,0 +1,489 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+##
+
+"""
+Open-loop throughput testing for the load simulator.
+
+The regular arrival policies add clients whose profiles each act on their own
+timers, and wait for one operation to finish before scheduling the next. When
+the server slows down, fewer requests get sent, so the slow period is sampled
+less and tail latency is under-reported ("coordinated omission").
+
+L{OpenLoopRamp} instead issues operations at a fixed rate, independent of how
+quickly the server responds, and measures each operation's latency from the
+time it was I{supposed} to be sent. The rate is increased in steps until the
+latency or throughput shows the server is saturated, and a machine-readable
+report of each step and the knee of the latency curve is written out.
+"""
+
+from __future__ import division
+
+import json
+import math
+
+from twisted.internet.defer import maybeDeferred
+from twisted.python.failure import Failure
+from twisted.python.log import msg, err
+from twisted.python.reflect import namedAny
+
+from contrib.performance.loadtest.profiles import SKIPPED
+from contrib.performance.loadtest.sim import LoadSimulator
+
+
+class LatencyHistogram(object):
+    """
+    A histogram of latencies with a fixed relative precision, in the style of
+    HdrHistogram. Values are recorded as whole microseconds into log-linear
+    buckets: each power of two range is split into C{2 ** (subBucketBits - 1)}
+    equal buckets, so a recorded value is reported to within
+    C{2 ** -(subBucketBits - 1)} of its true value regardless of magnitude,
+    while memory use only grows with the log of the largest value.
+
+    @ivar subBucketBits: number of bits of precision kept for each value
+    @type subBucketBits: L{int}
+    """
+
+    def __init__(self, subBucketBits=8):
+        self.subBucketBits = subBucketBits
+        self._counts = {}
+        self._count = 0
+        self._total = 0
+        self._max = 0
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self.subBucketBits)
+        return (shift, value >> shift)
+
+    @staticmethod
+    def _bucketValue(bucket):
+        """
+        The largest value that falls into a bucket, which is what is reported
+        for all values in it so that percentiles are never under-stated.
+        """
+        shift, mantissa = bucket
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        """
+        Record a latency.
+
+        @param seconds: the latency
+        @type seconds: L{float}
+        @param count: the number of times to record it
+        @type count: L{int}
+        """
+        value = max(0, int(round(seconds * 1000000)))
+        bucket = self._bucket(value)
+        self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self._count += count
+        self._total += value * count
+        self._max = max(self._max, value)
+
+    def add(self, other):
+        """
+        Add all the values recorded in another histogram, with the same
+        precision, to this one.
+        """
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self._count += other._count
+        self._total += other._total
+        self._max = max(self._max, other._max)
+
+    def count(self):
+        return self._count
+
+    def mean(self):
+        """
+        @return: the mean latency in seconds, or C{None} if nothing was
+            recorded
+        """
+        if not self._count:
+            return None
+        return self._total / self._count / 1000000
+
+    def max(self):
+        """
+        @return: the largest latency in seconds, or C{None} if nothing was
+            recorded
+        """
+        if not self._count:
+            return None
+        return self._max / 1000000
+
+    def percentile(self, percentile):
+        """
+        @param percentile: the percentile to determine, from 0 to 100
+        @type percentile: L{float}
+
+        @return: the latency in seconds at or below which C{percentile}
+            percent of the recorded latencies fall, or C{None} if nothing was
+            recorded
+        """
+        if not self._count:
+            return None
+        target = max(1, int(math.ceil(self._count * percentile / 100)))
+        seen = 0
+        for bucket in sorted(self._counts, key=self._bucketValue):
+            seen += self._counts[bucket]
+            if seen >= target:
+                return min(self._bucketValue(bucket), self._max) / 1000000
+        return self._max / 1000000
+
+    def toDict(self, percentiles=(50, 90, 99, 99.9)):
+        """
+        @return: a summary of the histogram suitable for serializing as JSON
+        @rtype: L{dict}
+        """
+        result = {
+            "count": self._count,
+            "mean": self.mean(),
+            "max": self.max(),
+        }
+        for percentile in percentiles:
+            result["p%s" % (percentile,)] = self.percentile(percentile)
+        return result
+
+
+class OpenLoopStep(object):
+    """
+    The results of running operations at one target rate.
+
+    @ivar rate: the target rate, in operations per second
+    @ivar start: the reactor time the step started at
+    @ivar issued: the number of operations started
+    @ivar completed: the number of operations which finished before the step
+        was evaluated, whether they succeeded or not
+    @ivar skipped: the number of operations whose profile found nothing to do
+        and sent no request; these are not counted as completed and have no
+        latency recorded
+    @ivar errors: the number of operations which failed, or which could not
+        be started because no client was available
+    @ivar outstanding: the number of operations still running when the step
+        was evaluated
+    @ivar pending: mapping of a marker for each running operation to its
+        label and intended start time
+    @ivar histograms: mapping of operation label to L{LatencyHistogram}
+    """
+
+    def __init__(self, rate, start):
+        self.rate = rate
+        self.start = start
+        self.issued = 0
+        self.completed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.outstanding = 0
+        self.finished = False
+        self.pending = {}
+        self.histograms = {}
+
+    def record(self, label, latency, success):
+        if label not in self.histograms:
+            self.histograms[label] = LatencyHistogram()
+        self.histograms[label].record(latency)
+        if not success:
+            self.errors += 1
+
+    def overall(self):
+        """
+        @return: a L{LatencyHistogram} of all operations in this step
+        """
+        result = LatencyHistogram()
+        for histogram in self.histograms.values():
+            result.add(histogram)
+        return result
+
+    def errorRate(self):
+        attempted = self.issued - self.skipped
+        if not attempted:
+            return 0.0
+        return self.errors / attempted
+
+    def toDict(self, duration):
+        return {
+            "targetRate": self.rate,
+            "achievedRate": self.completed / duration,
+            "issued": self.issued,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "outstanding": self.outstanding,
+            "latency": self.overall().toDict(),
+            "operations": dict([
+                (label, histogram.toDict())
+                for label, histogram in self.histograms.items()
+            ]),
+        }
+
+
+class OpenLoopRamp(object):
+    """
+    An arrival policy which adds a fixed population of clients, then drives
+    operations against them at a rate which increases in steps, to find the
+    highest rate the server can sustain.
+
+    Operations are started at evenly spaced intended times, regardless of
+    whether earlier operations have finished, and their latency is measured
+    from the intended time rather than the time they actually got going. That
+    way any delay in the simulator or the server counts against the latency
+    of every operation it held up. Each operation is run by calling
+    L{ProfileBase.action} on a profile of the configured type, attached to the
+    next started client in turn.
+
+    After each step, plus C{drainTime} seconds for stragglers, the step is
+    evaluated. Operations still outstanding are recorded with their latency
+    so far. A step is considered saturated if:
+
+        - the C{kneeQuantile} latency is more than C{kneeLatencyFactor} times
+          that of the first step, or more than C{maxLatency} seconds;
+        - fewer than C{1 - throughputTolerance} of the target rate of
+          operations completed, not counting operations which were skipped
+          because their profile had nothing to do; or
+        - the fraction of operations which failed exceeds C{maxErrorRate}.
+
+    The knee is the rate of the last step before the first saturated one. The
+    run then ends, and a JSON report is written to C{reportPath}.
+
+    @ivar operations: a list of C{dict}s with keys C{label}, C{class} (the
+        fully qualified name of a L{ProfileBase} subclass), C{params} (passed
+        to the profile class, converting distributions as for profiles in the
+        clients configuration) and C{weight} (relative frequency)
+    """
+
+    def __init__(
+        self, reactor, clients, clientsPerUser=1, operations=(),
+        startRate=1.0, rateStep=1.0, maxRate=50.0, stepDuration=60,
+        warmup=60, drainTime=10, kneeQuantile=99.0, kneeLatencyFactor=3.0,
+        maxLatency=None, throughputTolerance=0.1, maxErrorRate=0.01,
+        reportPath=None,
+    ):
+        self.reactor = reactor
+        self.clients = clients
+        self.clientsPerUser = clientsPerUser
+        self.operations = []
+        for operation in operations:
+            profileType = operation["class"]
+            if isinstance(profileType, basestring):
+                profileType = namedAny(profileType)
+            self.operations.append((
+                operation.get("label", profileType.__name__),
+                profileType,
+                LoadSimulator._convertParams(dict(operation.get("params", {}))),
+                operation.get("weight", 1),
+            ))
+        if not self.operations:
+            raise ValueError("At least one operation must be configured")
+        self.startRate = startRate
+        self.rateStep = rateStep
+        self.maxRate = maxRate
+        self.stepDuration = stepDuration
+        self.warmup = warmup
+        self.drainTime = drainTime
+        self.kneeQuantile = kneeQuantile
+        self.kneeLatencyFactor = kneeLatencyFactor
+        self.maxLatency = maxLatency
+        self.throughputTolerance = throughputTolerance
+        self.maxErrorRate = maxErrorRate
+        self.reportPath = reportPath
+
+        self.steps = []
+        self.knee = None
+        self._baseline = None
+        self._nextClient = 0
+        self._nextOperation = 0
+        self._schedule = self._weightedSchedule()
+        self._profiles = {}
+        self._userNumbers = None
+
+    def _weightedSchedule(self):
+        """
+        Interleave the operations according to their weights, so that the mix
+        of operations is deterministic and even across any part of a step.
+        """
+        schedule = []
+        credit = [0.0] * len(self.operations)
+        total = sum([operation[3] for operation in self.operations])
+        for _ignore in range(int(total)):
+            for index, operation in enumerate(self.operations):
+                credit[index] += operation[3]
+            index = credit.index(max(credit))
+            credit[index] -= total
+            schedule.append(index)
+        return schedule
+
+    def run(self, simulator):
+        self._sim = simulator
+        simulator.add(self.clients, self.clientsPerUser)
+        self.reactor.callLater(self.warmup, self._startStep, self.startRate)
+
+    def _startStep(self, rate):
+        step = OpenLoopStep(rate, self.reactor.seconds())
+        self.steps.append(step)
+        msg(type="openloop", phase="start", rate=rate)
+        self._tick(step)
+
+    def _tick(self, step):
+        """
+        Start every operation whose intended time has arrived, then wait for
+        the next one.
+        """
+        now = self.reactor.seconds()
+        end = step.start + self.stepDuration
+        while True:
+            intended = step.start + step.issued / step.rate
+            if intended > now or intended >= end:
+                break
+            step.issued += 1
+            self._issue(step, intended)
+
+        intended = step.start + step.issued / step.rate
+        if intended < end:
+            self.reactor.callLater(intended - now, self._tick, step)
+        else:
+            self.reactor.callLater(end + self.drainTime - now, self._finishStep, step)
+
+    def _startedClients(self):
+        return [client for client in self._sim.clients if client.started]
+
+    def _profileFor(self, client, index):
+        """
+        Get the profile that runs the given operation for the given client,
+        creating it the first time.
+        """
+        key = (id(client), index)
+        if key not in self._profiles:
+            if self._userNumbers is None:
+                self._userNumbers = dict([
+                    (record.uid, number)
+                    for number, record in enumerate(self._sim._records)
+                ])
+            _ignore_label, profileType, params, _ignore_weight = self.operations[index]
+            self._profiles[key] = profileType(
+                self.reactor, self._sim, client,
+                self._userNumbers.get(client.record.uid, 0), **params
+            )
+        return self._profiles[key]
+
+    def _issue(self, step, intended):
+        index = self._schedule[self._nextOperation % len(self._schedule)]
+        self._nextOperation += 1
+        label = self.operations[index][0]
+
+        clients = self._startedClients()
+        if not clients:
+            # Nothing was sent, so there is no latency to record
+            step.completed += 1
+            step.errors += 1
+            return
+        client = clients[self._nextClient % len(clients)]
+        self._nextClient += 1
+
+        def finished(result):
+            if step.finished:
+                # Already recorded as outstanding
+                return
+            if result is SKIPPED:
+                # No request was sent, so the time taken says nothing about
+                # the server
+                step.skipped += 1
+                del step.pending[token]
+                msg(type="openloop", phase="skip", label=label)
+                return
+            if isinstance(result, Failure):
+                err(result, "open loop operation %s failed" % (label,))
+                success = False
+            else:
+                success = not self._failedResponse(result)
+            latency = self.reactor.seconds() - intended
+            step.completed += 1
+            del step.pending[token]
+            step.record(label, latency, success)
+            msg(
+                type="openloop", phase="end", label=label,
+                duration=latency, success=success,
+            )
+
+        token = object()
+        step.pending[token] = (label, intended)
+        d = maybeDeferred(self._profileFor(client, index).action)
+        d.addBoth(finished)
+
+    @staticmethod
+    def _failedResponse(result):
+        """
+        Profiles report an unexpected response code by passing back the
+        response itself rather than failing.
+        """
+        code = getattr(result, "code", None)
+        return isinstance(code, int) and code >= 400
+
+    def _finishStep(self, step):
+        now = self.reactor.seconds()
+        step.finished = True
+        pending, step.pending = step.pending, {}
+        for label, intended in pending.values():
+            step.outstanding += 1
+            step.record(label, now - intended, True)
+
+        summary = step.toDict(self.stepDuration)
+        msg(type="openloop", phase="step", **summary)
+
+        if self._saturated(step):
+            self._finish()
+        else:
+            self.knee = step.rate
+            rate = step.rate + self.rateStep
+            if rate > self.maxRate:
+                self._finish()
+            else:
+                self._startStep(rate)
+
+    def _saturated(self, step):
+        latency = step.overall().percentile(self.kneeQuantile)
+        if self._baseline is None:
+            self._baseline = latency
+        if latency is not None:
+            if self.maxLatency is not None and latency > self.maxLatency:
+                return True
+            if self._baseline and latency > self._baseline * self.kneeLatencyFactor:
+                return True
+        expected = step.rate * self.stepDuration - step.skipped
+        if step.completed - step.errors < expected * (1 - self.throughputTolerance):
+            return True
+        return step.errorRate() > self.maxErrorRate
+
+    def report(self):
+        """
+        @return: the results of the run, suitable for serializing as JSON
+        @rtype: L{dict}
+        """
+        return {
+            "kneeRate": self.knee,
+            "kneeQuantile": self.kneeQuantile,
+            "stepDuration": self.stepDuration,
+            "clients": self.clients * self.clientsPerUser,
+            "steps": [step.toDict(self.stepDuration) for step in self.steps],
+        }
+
+    def _finish(self):
+        report = self.report()
+        msg(type="openloop", phase="knee", rate=self.knee)
+        if self.reportPath:
+            with open(self.reportPath, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        self.reactor.stop()
@@ -49,6 +49,10 @@ from pycalendar.duration import Duration
 from datetime import datetime, timedelta
 import dateutil
 
+# Result of an L{ProfileBase.action} which found nothing to do, and so did not
+# send any request to the server.
+SKIPPED = object()
+
 
 class ProfileBase(object):
     """
@@ -75,6 +79,18 @@ class ProfileBase(object):
         """
         return succeed(None)
 
+    def action(self):
+        """
+        Perform this profile's operation once, right away. Arrival policies
+        which drive operations at their own rate, such as
+        L{contrib.performance.loadtest.openloop.OpenLoopRamp}, use this instead
+        of L{run}.
+
+        @return: a L{Deferred} that fires when the operation is done, with
+            L{SKIPPED} if there was nothing to do and no request was sent
+        """
+        raise NotImplementedError("%s does not support single actions" % (self.__class__.__name__,))
+
     def _calendarsOfType(self, calendarType, componentType, justOwned=False):
         results = []
 
@@ -317,13 +333,13 @@ END:VCALENDAR
         Try to add a new event, or perhaps remove an
         existing attendee from an event.
 
-        @return: C{None} if there are no events to play with,
-            otherwise a L{Deferred} which fires when the attendee
-            change has been made.
+        @return: a L{Deferred} which fires with L{SKIPPED} if there are
+            no calendars to play with, otherwise when the attendee change
+            has been made.
         """
 
         if not self._client.started:
-            return succeed(None)
+            return succeed(SKIPPED)
 
         # Find calendars which are eligible for invites
         calendars = self._calendarsOfType(caldavxml.calendar, "VEVENT", justOwned=True)
@@ -374,6 +390,10 @@ END:VCALENDAR
             )
             return self._newOperation("invite", d)
 
+        return succeed(SKIPPED)
+
+    action = _invite
+
 
 class Accepter(ProfileBase):
     """
@@ -620,13 +640,13 @@ END:VCALENDAR
     def _addEvent(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            return succeed(None)
+            return succeed(SKIPPED)
 
         calendar = self._getRandomCalendarOfType('VEVENT')
 
         if not calendar:
             # No VEVENT calendars, so no new event...
-            return succeed(None)
+            return succeed(SKIPPED)
 
         # Copy the template event and fill in some of its fields
         # to make a new event to create on the calendar.
@@ -655,6 +675,8 @@ END:VCALENDAR
         d = self._client.addEvent(href, vcalendar, attachmentSize=attachmentSize)
         return self._newOperation("create", d)
 
+    action = _addEvent
+
 
 class EventUpdaterBase(ProfileBase):
 
@@ -662,11 +684,11 @@ class EventUpdaterBase(ProfileBase):
     def action(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            returnValue(None)
+            returnValue(SKIPPED)
 
         event = self._getRandomEventOfType('VEVENT', justOwned=True)
         if not event:
-            returnValue(None)
+            returnValue(SKIPPED)
         component = event.component
         vevent = component.mainComponent()
 
@@ -771,12 +793,16 @@ class EventCountLimiter(EventUpdaterBase):
     def action(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            returnValue(None)
+            returnValue(SKIPPED)
 
+        deleted = False
         for calendar in self._calendarsOfType(caldavxml.calendar, "VEVENT", justOwned=True):
             while len(calendar.events) > self._limit:
                 event = calendar.events[self.random.choice(calendar.events.keys())]
                 yield self._client.deleteEvent(event.url)
+                deleted = True
+        if not deleted:
+            returnValue(SKIPPED)
 
 
 class CalendarSharer(ProfileBase):
@@ -808,9 +834,10 @@ class CalendarSharer(ProfileBase):
     def action(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            returnValue(None)
+            returnValue(SKIPPED)
 
-        yield self.shareCalendar()
+        result = yield self.shareCalendar()
+        returnValue(result)
 
     @inlineCallbacks
     def shareCalendar(self):
@@ -818,16 +845,16 @@ class CalendarSharer(ProfileBase):
         # pick a calendar
         calendar = self._getRandomCalendarOfType('VEVENT', justOwned=True)
         if not calendar:
-            returnValue(None)
+            returnValue(SKIPPED)
 
         # don't exceed maxSharees
         if len(calendar.invitees) >= self._maxSharees:
-            returnValue(None)
+            returnValue(SKIPPED)
 
         # pick a random sharee
         shareeRecord = self._sim.getRandomUserRecord(besides=self._number)
         if shareeRecord is None:
-            returnValue(None)
+            returnValue(SKIPPED)
 
         # POST the sharing invite
         mailto = "mailto:{}".format(shareeRecord.email)
@@ -1026,7 +1053,7 @@ END:VCALENDAR
     def _addTask(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            return succeed(None)
+            return succeed(SKIPPED)
 
         calendars = self._calendarsOfType(caldavxml.calendar, "VTODO")
 
@@ -1049,6 +1076,10 @@ END:VCALENDAR
             d = self._client.addEvent(href, vcalendar)
             return self._newOperation("create", d)
 
+        return succeed(SKIPPED)
+
+    action = _addTask
+
 
 class TimeRanger(ProfileBase):
     """
@@ -1076,15 +1107,19 @@ class TimeRanger(ProfileBase):
     def _runQuery(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            return succeed(None)
+            return succeed(SKIPPED)
 
         now = datetime.now(dateutil.tz.tzutc())
         start = now.strftime("%Y%m%dT%H%M%SZ")
         end = (now + timedelta(seconds=24 * 60 * 60)).strftime("%Y%m%dT%H%M%SZ")
 
         calendar = self._getRandomCalendarOfType('VEVENT')
+        if not calendar:
+            return succeed(SKIPPED)
         return self._client.timeRangeQuery(calendar.url, start, end)
 
+    action = _runQuery
+
 
 class DeepRefresher(ProfileBase):
     """
@@ -1112,10 +1147,12 @@ class DeepRefresher(ProfileBase):
     def _deepRefresh(self):
         # Don't perform any operations until the client is up and running
         if not self._client.started:
-            return succeed(None)
+            return succeed(SKIPPED)
 
         return self._client.deepRefresh()
 
+    action = _deepRefresh
+
 
 class APNSSubscriber(ProfileBase):
     """
@@ -0,0 +1,247 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+##
+
+"""
+Tests for L{contrib.performance.loadtest.openloop}.
+"""
+
+import json
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from contrib.performance.loadtest.openloop import LatencyHistogram, OpenLoopRamp
+from contrib.performance.loadtest.profiles import ProfileBase, SKIPPED
+from contrib.performance.loadtest.sim import _DirectoryRecord
+
+
+class StoppableClock(Clock):
+
+    stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class StubClient(object):
+
+    started = True
+
+    def __init__(self, record):
+        self.record = record
+
+
+class StubSimulator(object):
+    """
+    Just enough of L{CalendarClientSimulator} for L{OpenLoopRamp}.
+    """
+
+    def __init__(self):
+        self._records = []
+        self.clients = []
+
+    def add(self, numClients, clientsPerUser):
+        for i in range(numClients):
+            record = _DirectoryRecord(
+                u"user%02d" % (i,), u"user%02d" % (i,), u"User %02d" % (i,),
+                u"user%02d@example.org" % (i,), u"user%02d" % (i,), "PodA",
+            )
+            self._records.append(record)
+            for _ignore in range(clientsPerUser):
+                self.clients.append(StubClient(record))
+
+
+class DelayedProfile(ProfileBase):
+    """
+    A profile whose action takes a time determined by a callable.
+    """
+
+    def setParameters(self, delay, skip=lambda: False):
+        self.delay = delay
+        self.skip = skip
+        self.enabled = True
+
+    def action(self):
+        if self.skip():
+            return succeed(SKIPPED)
+        d = Deferred()
+        self._reactor.callLater(self.delay(), d.callback, None)
+        return d
+
+
+class LatencyHistogramTests(TestCase):
+    """
+    Tests for L{LatencyHistogram}.
+    """
+
+    def test_percentiles(self):
+        """
+        Percentiles are reported to within the histogram's precision, and
+        never below the true value.
+        """
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+        self.assertEqual(histogram.count(), 1000)
+        self.assertEqual(histogram.max(), 1.0)
+        for percentile, expected in ((50, 0.5), (90, 0.9), (99, 0.99), (100, 1.0)):
+            value = histogram.percentile(percentile)
+            self.assertTrue(expected <= value <= expected * 1.01, (percentile, value))
+        self.assertAlmostEqual(histogram.mean(), 0.5005, places=6)
+
+    def test_empty(self):
+        """
+        An empty histogram has no percentiles.
+        """
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(99), None)
+        self.assertEqual(histogram.toDict()["count"], 0)
+
+    def test_add(self):
+        """
+        L{LatencyHistogram.add} combines the values of two histograms.
+        """
+        first = LatencyHistogram()
+        first.record(0.001, 99)
+        second = LatencyHistogram()
+        second.record(2.0)
+        first.add(second)
+        self.assertEqual(first.count(), 100)
+        self.assertEqual(first.max(), 2.0)
+        self.assertTrue(first.percentile(50) < 0.0011)
+        self.assertEqual(first.percentile(100), 2.0)
+
+
+class OpenLoopRampTests(TestCase):
+    """
+    Tests for L{OpenLoopRamp}.
+    """
+
+    def ramp(self, delay, skip=lambda: False, **params):
+        self.clock = StoppableClock()
+        ramp = OpenLoopRamp(
+            self.clock, 3,
+            operations=[{
+                "label": "delayed",
+                "class": DelayedProfile,
+                "params": {"delay": delay, "skip": skip},
+            }],
+            warmup=1, drainTime=5, **params
+        )
+        ramp.run(StubSimulator())
+        return ramp
+
+    def test_coordinatedOmission(self):
+        """
+        Operations held up by a stall are issued late, but their latency is
+        measured from when they should have been sent.
+        """
+        ramp = self.ramp(lambda: 0.01, startRate=2, maxRate=2, stepDuration=10)
+        self.clock.advance(1)
+
+        # Stall for five seconds, then let everything run
+        self.clock.advance(5)
+        self.clock.pump([0.01] * 1600)
+
+        self.assertTrue(self.clock.stopped)
+        step = ramp.steps[0]
+        self.assertEqual(step.issued, 20)
+        self.assertEqual(step.completed, 20)
+        histogram = step.histograms["delayed"]
+        # Half the operations were due during the stall, and are charged
+        # for the time they were held up
+        self.assertTrue(histogram.max() >= 4.5)
+        self.assertTrue(histogram.percentile(75) > 1.0)
+        self.assertTrue(histogram.percentile(25) < 0.1)
+
+    def test_knee(self):
+        """
+        The rate is stepped up until latency rises sharply, and the last rate
+        before that is reported as the knee.
+        """
+        def delay():
+            return 0.01 if ramp.steps[-1].rate <= 3 else 0.5
+        reportPath = self.mktemp()
+        ramp = self.ramp(
+            delay, startRate=1, rateStep=1, maxRate=10, stepDuration=10,
+            reportPath=reportPath,
+        )
+        self.clock.pump([0.01] * 10000)
+
+        self.assertTrue(self.clock.stopped)
+        self.assertEqual(ramp.knee, 3)
+        self.assertEqual([step.rate for step in ramp.steps], [1, 2, 3, 4])
+
+        with open(reportPath) as f:
+            report = json.load(f)
+        self.assertEqual(report["kneeRate"], 3)
+        self.assertEqual(len(report["steps"]), 4)
+        self.assertEqual(report["steps"][1]["issued"], 20)
+        self.assertEqual(report["steps"][1]["achievedRate"], 2.0)
+        self.assertIn("p99", report["steps"][3]["operations"]["delayed"])
+
+    def test_throughput(self):
+        """
+        A step in which operations cannot keep up with the target rate is
+        saturated, even if the latency of the completed ones is low.
+        """
+        def delay():
+            return 0.01 if ramp.steps[-1].rate <= 1 else 100
+        ramp = self.ramp(delay, startRate=1, rateStep=1, maxRate=10, stepDuration=10)
+        self.clock.pump([0.01] * 5000)
+
+        self.assertTrue(self.clock.stopped)
+        self.assertEqual(ramp.knee, 1)
+        self.assertEqual(ramp.steps[1].completed, 0)
+        self.assertEqual(ramp.steps[1].outstanding, 20)
+
+    def test_maxRate(self):
+        """
+        The run ends at C{maxRate} if the server never saturates.
+        """
+        ramp = self.ramp(lambda: 0.01, startRate=1, rateStep=1, maxRate=3, stepDuration=5)
+        self.clock.pump([0.01] * 10000)
+        self.assertTrue(self.clock.stopped)
+        self.assertEqual(ramp.knee, 3)
+        self.assertEqual(len(ramp.steps), 3)
+
+    def test_skipped(self):
+        """
+        Operations whose profile sends no request are counted as skipped,
+        are left out of the latency histograms, and do not count against the
+        throughput of the step.
+        """
+        actions = []
+
+        def skip():
+            actions.append(None)
+            return len(actions) % 2 == 0
+        ramp = self.ramp(
+            lambda: 0.01, skip=skip, startRate=2, maxRate=2, stepDuration=10
+        )
+        self.clock.pump([0.01] * 2000)
+
+        self.assertTrue(self.clock.stopped)
+        step = ramp.steps[0]
+        self.assertEqual(step.issued, 20)
+        self.assertEqual(step.skipped, 10)
+        self.assertEqual(step.completed, 10)
+        self.assertEqual(step.errors, 0)
+        self.assertEqual(step.histograms["delayed"].count(), 10)
+        self.assertEqual(step.toDict(10)["skipped"], 10)
+        self.assertEqual(ramp.knee, 2)
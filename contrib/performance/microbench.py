@@ -0,0 +1,706 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+In-process micro-benchmarks for server hot paths.
+
+Unlike L{benchmark}, these need neither a running server nor DTrace, so they
+run anywhere the server code does (in particular on Linux build hosts). Each
+benchmark is timed over a number of samples with the garbage collector
+disabled, and memory use is tracked via the process RSS and the number of
+live objects. Results can be written as JSON and compared against an earlier
+run to spot regressions.
+"""
+
+from __future__ import print_function
+
+import gc
+import json
+import platform
+import resource
+import sys
+from timeit import default_timer
+
+from pycalendar.datetime import DateTime
+from pycalendar.period import Period
+from pycalendar.timezone import Timezone
+
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.task import Clock
+from twisted.python.usage import UsageError, Options
+
+from twistedcaldav.cache import MemcacheResponseCache
+from twistedcaldav.datafilters.peruserdata import PerUserDataFilter
+from twistedcaldav.ical import Component
+from twistedcaldav.test.util import InMemoryMemcacheProtocol
+
+from txdav.caldav.datastore.scheduling.freebusy import FreebusyQuery
+from txdav.common.datastore.test.util import populateCalendarsFrom
+from txdav.xml.parser import WebDAVDocument
+
+from txweb2.http import Response
+from txweb2.http_headers import Headers
+from txweb2.stream import MemoryStream
+
+from contrib.performance.stats import mean, median, mad, stddev
+from contrib.performance.storeharness import StoreHarness, runStoreHarness
+
+
+_pageSize = resource.getpagesize()
+
+
+def _currentRSS():
+    """
+    @return: the resident set size of this process in bytes, or C{None} if it
+        cannot be determined.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _pageSize
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def _peakRSS():
+    """
+    @return: the peak resident set size of this process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _synchronousResult(d):
+    """
+    Extract the result of a L{Deferred} that has already fired.
+    """
+    result = []
+    d.addBoth(result.append)
+    if not result:
+        raise RuntimeError("Deferred did not fire synchronously")
+    if hasattr(result[0], "raiseException"):
+        result[0].raiseException()
+    return result[0]
+
+
+class Benchmark(object):
+    """
+    A named operation to time.
+
+    @ivar operation: one-argument callable that is timed
+    @ivar prepare: zero-argument callable whose result is passed to
+        C{operation}; it is called before every operation, outside of the
+        timed region, so that operations can be given fresh data
+    """
+
+    def __init__(self, name, operation, prepare=None, description=""):
+        self.name = name
+        self.operation = operation
+        self.prepare = prepare if prepare is not None else lambda: None
+        self.description = description
+
+
+class Measurer(object):
+    """
+    Measures L{Benchmark}s.
+
+    Each benchmark is first run to warm up any caches, then calibrated so
+    that each sample runs for at least C{minTime} seconds. Samples are taken
+    with garbage collection disabled (a collection is done before each one),
+    and only the operation itself is timed.
+    """
+
+    def __init__(self, samples=10, minTime=0.1, maxIterations=100000, timer=default_timer):
+        self.samples = samples
+        self.minTime = minTime
+        self.maxIterations = maxIterations
+        self.timer = timer
+
+    def _runOnce(self, benchmark):
+        arg = benchmark.prepare()
+        start = self.timer()
+        benchmark.operation(arg)
+        return self.timer() - start
+
+    def _iterations(self, benchmark):
+        """
+        Determine how many operations are needed per sample.
+        """
+        elapsed = self._runOnce(benchmark)
+        if elapsed <= 0:
+            return self.maxIterations
+        return max(1, min(self.maxIterations, int(self.minTime / elapsed)))
+
+    def measure(self, benchmark):
+        """
+        Measure one benchmark.
+
+        @return: a C{dict} of results, see L{summarize}
+        """
+        self._runOnce(benchmark)
+        iterations = self._iterations(benchmark)
+
+        memory = _MemoryTracker()
+        timings = []
+        enabled = gc.isenabled()
+        try:
+            for _ignore in range(self.samples):
+                gc.collect()
+                gc.disable()
+                total = 0.0
+                for _ignore in range(iterations):
+                    total += self._runOnce(benchmark)
+                gc.enable()
+                timings.append(total / iterations)
+        finally:
+            if enabled:
+                gc.enable()
+
+        return summarize(
+            benchmark, timings, iterations,
+            memory.done(self.samples * iterations)
+        )
+
+
+class _MemoryTracker(object):
+    """
+    Track the change in memory use over a number of operations.
+    """
+
+    def __init__(self):
+        gc.collect()
+        self.rss = _currentRSS()
+        self.peak = _peakRSS()
+        self.objects = len(gc.get_objects())
+
+    def done(self, operations):
+        gc.collect()
+        rss = _currentRSS()
+        return {
+            "rss_delta": rss - self.rss if rss is not None and self.rss is not None else None,
+            "peak_rss_delta": _peakRSS() - self.peak,
+            "objects_per_op": float(len(gc.get_objects()) - self.objects) / operations,
+        }
+
+
+def summarize(benchmark, timings, iterations, memory):
+    """
+    Summarize the samples taken for one benchmark.
+
+    @param timings: the mean time per operation of each sample, in seconds
+    @type timings: C{list} of C{float}
+
+    @return: a JSON-serializable C{dict}
+    """
+    return {
+        "name": benchmark.name,
+        "description": benchmark.description,
+        "iterations": iterations,
+        "samples": timings,
+        "min": min(timings),
+        "median": median(timings),
+        "mad": mad(timings),
+        "mean": mean(timings),
+        "stddev": stddev(timings),
+        "memory": memory,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare two runs, benchmark by benchmark.
+
+    @param baseline: results of the earlier run, as produced by L{report}
+    @param current: results of this run
+    @param threshold: the fractional increase in median time that counts as
+        a regression
+    @type threshold: C{float}
+
+    @return: a C{list} of (name, baseline median, current median, ratio,
+        regressed) tuples for each benchmark present in both runs. A change
+        only counts as a regression if it is also larger than the noise
+        (median absolute deviation) of both runs.
+    """
+    before = dict([(result["name"], result) for result in baseline["results"]])
+    comparison = []
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else float("inf")
+        noise = max(result["mad"], old["mad"])
+        regressed = ratio > 1.0 + threshold and result["median"] - old["median"] > noise
+        comparison.append((result["name"], old["median"], result["median"], ratio, regressed))
+    return comparison
+
+
+def report(results):
+    """
+    Wrap results with information about the host they were measured on.
+    """
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+_eventTemplate = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VTIMEZONE
+TZID:America/New_York
+BEGIN:STANDARD
+DTSTART:20071104T020000
+RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU
+TZNAME:EST
+TZOFFSETFROM:-0400
+TZOFFSETTO:-0500
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:20070311T020000
+RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU
+TZNAME:EDT
+TZOFFSETFROM:-0500
+TZOFFSETTO:-0400
+END:DAYLIGHT
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:microbench-%(uid)s
+DTSTART;TZID=America/New_York:20170102T100000
+DTEND;TZID=America/New_York:20170102T110000
+DTSTAMP:20170101T000000Z
+RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=150
+SUMMARY:Recurring meeting
+ORGANIZER;CN=User 01:mailto:user01@example.com
+%(attendees)sEND:VEVENT
+%(overrides)sBEGIN:X-CALENDARSERVER-PERUSER
+UID:microbench-%(uid)s
+X-CALENDARSERVER-PERUSER-UID:user01
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+TRANSP:TRANSPARENT
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Reminder
+TRIGGER:-PT15M
+END:VALARM
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+BEGIN:X-CALENDARSERVER-PERUSER
+UID:microbench-%(uid)s
+X-CALENDARSERVER-PERUSER-UID:user02
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Reminder
+TRIGGER:-PT5M
+END:VALARM
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+END:VCALENDAR
+"""
+
+_overrideTemplate = """BEGIN:VEVENT
+UID:microbench-%(uid)s
+RECURRENCE-ID;TZID=America/New_York:%(rid)sT100000
+DTSTART;TZID=America/New_York:%(rid)sT140000
+DTEND;TZID=America/New_York:%(rid)sT150000
+DTSTAMP:20170101T000000Z
+SUMMARY:Recurring meeting (moved)
+ORGANIZER;CN=User 01:mailto:user01@example.com
+%(attendees)sEND:VEVENT
+"""
+
+_propfindBody = """<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav" xmlns:CS="http://calendarserver.org/ns/">
+  <D:prop>
+    <D:resourcetype/>
+    <D:displayname/>
+    <D:getetag/>
+    <D:current-user-privilege-set/>
+    <D:owner/>
+    <D:sync-token/>
+    <C:supported-calendar-component-set/>
+    <C:calendar-description/>
+    <C:calendar-timezone/>
+    <C:schedule-calendar-transp/>
+    <CS:getctag/>
+    <CS:source/>
+  </D:prop>
+</D:propfind>
+"""
+
+
+def eventData(uid="1", attendees=10, overrides=5):
+    """
+    Generate a recurring event with the given number of attendees and
+    overridden instances, plus per-user data for two users.
+    """
+    attendeeLines = "".join([
+        "ATTENDEE;CN=User %02d;PARTSTAT=ACCEPTED:mailto:user%02d@example.com\n" % (i, i,)
+        for i in range(1, attendees + 1)
+    ])
+    rids = ["201701%02d" % (day,) for day in (4, 11, 18, 25, 30)][:overrides]
+    overrideText = "".join([
+        _overrideTemplate % {"uid": uid, "rid": rid, "attendees": attendeeLines}
+        for rid in rids
+    ])
+    return (_eventTemplate % {
+        "uid": uid,
+        "attendees": attendeeLines,
+        "overrides": overrideText,
+    }).replace("\n", "\r\n")
+
+
+def calendarBenchmarks():
+    """
+    Benchmarks of iCalendar processing: parsing, generation, recurrence
+    expansion, free busy and per-user data filtering.
+    """
+    data = eventData()
+    component = Component.fromString(data)
+    limit = DateTime(2019, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
+    timerange = Period(
+        DateTime(2017, 2, 1, 0, 0, 0, tzid=Timezone.UTCTimezone),
+        DateTime(2017, 3, 1, 0, 0, 0, tzid=Timezone.UTCTimezone),
+    )
+    tzinfo = Timezone(utc=True)
+
+    def freebusy(calendar):
+        query = FreebusyQuery(timerange=timerange)
+        fbinfo = FreebusyQuery.FBInfo([], [], [])
+        query.processEventFreeBusy(calendar, fbinfo, tzinfo)
+        return query.buildFreeBusyResult(fbinfo)
+
+    # Parse a fresh copy for operations that would otherwise benefit from
+    # recurrence expansion cached on the component
+    return [
+        Benchmark(
+            "ical-parse", lambda ignored: Component.fromString(data),
+            description="Component.fromString",
+        ),
+        Benchmark(
+            "ical-generate", lambda ignored: component.getText(),
+            description="Component.getText",
+        ),
+        Benchmark(
+            "ical-expand", lambda calendar: calendar.expandTimeRanges(limit),
+            prepare=lambda: Component.fromString(data),
+            description="Component.expandTimeRanges",
+        ),
+        Benchmark(
+            "freebusy-event", freebusy,
+            prepare=lambda: Component.fromString(data),
+            description="FreebusyQuery.processEventFreeBusy and buildFreeBusyResult",
+        ),
+        Benchmark(
+            "peruser-filter", PerUserDataFilter("user01").filter,
+            prepare=component.duplicate,
+            description="PerUserDataFilter.filter",
+        ),
+    ]
+
+
+def webdavBenchmarks():
+    """
+    Benchmarks of WebDAV XML parsing and serialization.
+    """
+    document = WebDAVDocument.fromString(_propfindBody)
+
+    return [
+        Benchmark(
+            "xml-parse", lambda ignored: WebDAVDocument.fromString(_propfindBody),
+            description="WebDAVDocument.fromString",
+        ),
+        Benchmark(
+            "xml-serialize", lambda ignored: document.root_element.toxml(),
+            description="WebDAVElement.toxml",
+        ),
+    ]
+
+
+class _StubPrincipal(object):
+
+    def __init__(self, uri, record):
+        self.uri = uri
+        self.record = record
+
+    def principalURL(self):
+        return self.uri
+
+
+class _StubRecord(object):
+
+    def __init__(self, uid):
+        self.uid = uid
+
+    def cacheToken(self):
+        return hash(self.uid)
+
+
+class _StubRequest(object):
+    """
+    The parts of a request used by L{MemcacheResponseCache} for canonical
+    (C{__uids__}) URIs.
+    """
+
+    def __init__(self, uri, principal, body):
+        self.method = "PROPFIND"
+        self.uri = uri
+        self.authnUser = principal
+        self.headers = Headers({"depth": "1"})
+        self.stream = MemoryStream(body)
+
+
+def responseCacheBenchmarks():
+    """
+    Benchmark hits in the PROPFIND response cache, using an in-memory cache
+    pool.
+    """
+    cachePool = InMemoryMemcacheProtocol(reactor=Clock())
+    cachePool.set("cacheToken:/principals/__uids__/user01/", "principal-token")
+    cachePool.set("cacheToken:/calendars/__uids__/user01/", "uri-token")
+    cache = MemcacheResponseCache(None, cachePool=cachePool)
+
+    # Principal tokens normally come from their own cache pool - look all
+    # tokens up in the in-memory one
+    cache._tokenForURI = lambda uri, cachePoolHandle=None: cachePool.get("cacheToken:%s" % (uri,)).addCallback(
+        lambda result: result[1] if result is not None else None
+    )
+
+    principal = _StubPrincipal("/principals/__uids__/user01/", _StubRecord("user01"))
+
+    def newRequest():
+        return _StubRequest("/calendars/__uids__/user01/", principal, _propfindBody)
+
+    _synchronousResult(cache.cacheResponseForRequest(
+        newRequest(), Response(207, stream="<multistatus/>" * 100)
+    ))
+
+    def hit(request):
+        if _synchronousResult(cache.getResponseForRequest(request)) is None:
+            raise RuntimeError("Response cache miss")
+
+    return [
+        Benchmark(
+            "response-cache-hit", hit, prepare=newRequest,
+            description="MemcacheResponseCache.getResponseForRequest",
+        ),
+    ]
+
+
+class StoreBenchmarks(StoreHarness):
+    """
+    Benchmarks that need a calendar store.
+    """
+
+    measurer = None
+    results = None
+    eventCount = 20
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(StoreBenchmarks, self).setUp()
+        yield populateCalendarsFrom(
+            {"user01": {"calendar_1": {}, "inbox": {}}},
+            self.storeUnderTest()
+        )
+
+    @inlineCallbacks
+    def _measure(self, benchmark):
+        """
+        Like L{Measurer.measure}, but for operations returning L{Deferred}s.
+        Each sample runs the operation until C{minTime} is reached.
+        """
+        measurer = self.measurer
+        samples = []
+        operations = 0
+        memory = _MemoryTracker()
+        for _ignore in range(measurer.samples):
+            total = 0.0
+            iterations = 0
+            while total < measurer.minTime and iterations < measurer.maxIterations:
+                arg = yield benchmark.prepare()
+                start = measurer.timer()
+                yield benchmark.operation(arg)
+                total += measurer.timer() - start
+                iterations += 1
+            samples.append(total / iterations)
+            operations += iterations
+        self.results.append(summarize(
+            benchmark, samples, operations / measurer.samples,
+            memory.done(operations)
+        ))
+
+    @inlineCallbacks
+    def test_store(self):
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar_1")
+        for i in range(self.eventCount):
+            yield calendar.createCalendarObjectWithName(
+                "%d.ics" % (i,), Component.fromString(eventData(str(i)))
+            )
+        yield self.commit()
+
+        # Each operation gets a new transaction; committing the previous one
+        # is not timed
+        component = Component.fromString(eventData("0"))
+
+        @inlineCallbacks
+        def prepareObject():
+            yield self.commit()
+            calendarObject = yield self.calendarObjectUnderTest(
+                name="0.ics", calendar_name="calendar_1", home="user01"
+            )
+            returnValue(calendarObject)
+
+        yield self._measure(Benchmark(
+            "store-update-database",
+            lambda calendarObject: calendarObject.updateDatabase(component.duplicate()),
+            prepare=prepareObject,
+            description="CalendarObject.updateDatabase",
+        ))
+
+        timerange = Period(
+            DateTime(2017, 2, 1, 0, 0, 0, tzid=Timezone.UTCTimezone),
+            DateTime(2017, 3, 1, 0, 0, 0, tzid=Timezone.UTCTimezone),
+        )
+
+        @inlineCallbacks
+        def prepareCalendar():
+            yield self.commit()
+            calendar = yield self.calendarUnderTest(home="user01", name="calendar_1")
+            returnValue(calendar)
+
+        def freebusy(calendar):
+            query = FreebusyQuery(timerange=timerange)
+            return query.generateFreeBusyInfo([calendar], FreebusyQuery.FBInfo([], [], []))
+
+        yield self._measure(Benchmark(
+            "store-freebusy", freebusy, prepare=prepareCalendar,
+            description="FreebusyQuery.generateFreeBusyInfo over %d events" % (self.eventCount,),
+        ))
+        yield self.commit()
+
+
+def storeBenchmarks(measurer):
+    """
+    Run the L{StoreBenchmarks}.
+
+    @return: the C{list} of results
+    """
+    StoreBenchmarks.measurer = measurer
+    StoreBenchmarks.results = []
+    runStoreHarness(StoreBenchmarks, "test_store")
+    return StoreBenchmarks.results
+
+
+allBenchmarks = [
+    calendarBenchmarks,
+    webdavBenchmarks,
+    responseCacheBenchmarks,
+]
+
+
+class MicroBenchmarkOptions(Options):
+    """
+    Command line options for the micro-benchmark runner.
+    """
+
+    synopsis = "microbench [options] [benchmark names]"
+
+    optParameters = [
+        ("samples", "n", 10, "Number of samples to take of each benchmark.", int),
+        ("min-time", "t", 0.1, "Minimum time in seconds for each sample.", float),
+        ("output", "o", None, "Write JSON results to this file."),
+        ("compare", "c", None, "Compare against the JSON results in this file."),
+        ("threshold", None, 0.1, "Fractional slow-down that counts as a regression.", float),
+    ]
+
+    optFlags = [
+        ("store", "s", "Also run benchmarks that need a calendar store (requires PostgreSQL)."),
+        ("list", "l", "List the available benchmarks."),
+    ]
+
+    def parseArgs(self, *names):
+        self["names"] = names
+
+    def postOptions(self):
+        if self["samples"] < 3:
+            raise UsageError("At least 3 samples are needed")
+        if self["min-time"] <= 0:
+            raise UsageError("min-time must be positive")
+
+
+def main(argv=None):
+    options = MicroBenchmarkOptions()
+    try:
+        options.parseOptions(sys.argv[1:] if argv is None else argv)
+    except UsageError, e:
+        print(e)
+        return 1
+
+    benchmarks = []
+    for factory in allBenchmarks:
+        benchmarks.extend(factory())
+
+    if options["list"]:
+        for benchmark in benchmarks:
+            print("%-24s %s" % (benchmark.name, benchmark.description))
+        return 0
+
+    if options["names"]:
+        benchmarks = [benchmark for benchmark in benchmarks if benchmark.name in options["names"]]
+
+    measurer = Measurer(samples=options["samples"], minTime=options["min-time"])
+    results = []
+    for benchmark in benchmarks:
+        result = measurer.measure(benchmark)
+        results.append(result)
+        print("%-24s %10.1f us  (+/- %.1f us, %d x %d)" % (
+            result["name"], result["median"] * 1e6, result["mad"] * 1e6,
+            options["samples"], result["iterations"],
+        ))
+
+    if options["store"]:
+        for result in storeBenchmarks(measurer):
+            results.append(result)
+            print("%-24s %10.1f us  (+/- %.1f us)" % (
+                result["name"], result["median"] * 1e6, result["mad"] * 1e6,
+            ))
+
+    current = report(results)
+    if options["output"]:
+        with open(options["output"], "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    if options["compare"]:
+        with open(options["compare"]) as f:
+            baseline = json.load(f)
+        regressions = 0
+        print()
+        for name, before, after, ratio, regressed in compare(baseline, current, options["threshold"]):
+            print("%-24s %10.1f us -> %10.1f us  %6.2fx%s" % (
+                name, before * 1e6, after * 1e6, ratio, "  REGRESSION" if regressed else "",
+            ))
+            regressions += regressed
+        if regressions:
+            return 2
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
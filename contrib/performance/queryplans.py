@@ -0,0 +1,534 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Query plan regression checks for the store's hot SQL queries.
+
+The queries the store runs most often are built dynamically through the DAL,
+so nothing in the schema itself shows whether they are still backed by
+indexes. This builds a test store in the local PostgreSQL, fills it with a
+synthetic population of homes, events and revisions, and captures
+C{EXPLAIN (ANALYZE, BUFFERS)} output for each registered hot query. Each plan
+is checked for sequential scans over more than a handful of rows, and its
+estimated cost compared with a checked-in baseline.
+
+Queries are registered with L{hotQuery}. Estimated costs only depend on the
+schema, the planner and the population, so they are compared rather than
+execution times; the baseline should be updated (C{--update-baseline}) when
+a change in cost is expected. The first run against a baseline with no costs
+recorded for its population records them; after that, queries with no
+recorded cost are reported as problems.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+
+from pycalendar.datetime import DateTime
+from pycalendar.duration import Duration
+
+from twext.enterprise.dal.syntax import QueryGenerator, FixedPlaceholder
+from twext.enterprise.ienterprise import POSTGRES_DIALECT
+
+from twisted.internet.defer import inlineCallbacks, returnValue, maybeDeferred
+from twisted.python.filepath import FilePath
+from twisted.python.usage import UsageError, Options
+from twisted.trial.unittest import SkipTest
+
+from twistedcaldav import caldavxml
+from twistedcaldav.config import config
+from twistedcaldav.dateops import normalizeForIndex, pyCalendarToSQLTimestamp
+from twistedcaldav.ical import Component, Property
+
+from txdav.caldav.datastore.query.filter import Filter
+from txdav.caldav.datastore.sql import Calendar, CalendarHome
+
+from contrib.performance.storeharness import StoreHarness, runStoreHarness
+
+
+defaultBaseline = FilePath(__file__).sibling("queryplans.json").path
+
+
+class HotQuery(object):
+    """
+    A query whose plan is checked.
+
+    @ivar build: callable taking a transaction and a L{SyntheticPopulation},
+        returning a tuple of the DAL statement and a C{dict} of its parameters,
+        or a L{Deferred} firing with one
+    """
+
+    def __init__(self, name, build, description=""):
+        self.name = name
+        self.build = build
+        self.description = description
+
+
+hotQueries = []
+
+
+def hotQuery(name, description=""):
+    """
+    Decorator to register a function building a hot query.
+    """
+    def decorate(build):
+        hotQueries.append(HotQuery(name, build, description))
+        return build
+    return decorate
+
+
+class SyntheticPopulation(object):
+    """
+    Identifiers of the objects in the synthetic store that the hot queries are
+    run against: a home in the middle of the population, its calendar, and a
+    revision halfway through that home's history.
+    """
+
+    def __init__(self, homes, events):
+        self.homes = homes
+        self.events = events
+        self.homeUID = None
+        self.homeID = None
+        self.calendarID = None
+        self.revision = None
+
+
+_eventTemplate = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:%(uid)s
+DTSTART:%(start)s
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+SUMMARY:Synthetic event %(uid)s
+%(rrule)sEND:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+
+def syntheticEvent(uid, start, recurring=False):
+    """
+    Calendar data for an event in the synthetic population.
+
+    @param start: the start of the (first instance of the) event
+    @type start: L{DateTime}
+    """
+    return _eventTemplate % {
+        "uid": uid,
+        "start": start.getText(),
+        "rrule": "RRULE:FREQ=WEEKLY;COUNT=10\r\n" if recurring else "",
+    }
+
+
+@inlineCallbacks
+def populate(store, homes, events):
+    """
+    Fill a store with C{homes} calendar homes, each with a calendar of
+    C{events} events spread over two years around today, one in five of them
+    recurring. Some events in each calendar are then changed and some removed,
+    so that there is a revision history.
+
+    @return: a L{Deferred} firing with a L{SyntheticPopulation}
+    """
+    population = SyntheticPopulation(homes, events)
+    today = DateTime.getNowUTC()
+    today.setHHMMSS(0, 0, 0)
+    for homeNumber in range(1, homes + 1):
+        txn = store.newTransaction(label="queryplans.populate")
+        uid = "user%02d" % (homeNumber,)
+        home = yield txn.calendarHomeWithUID(uid, create=True)
+        calendar = yield home.createCalendarWithName("synthetic")
+        for i in range(events):
+            start = today + Duration(days=(i * 730) // events - 365, hours=9 + i % 8)
+            yield calendar.createCalendarObjectWithName(
+                "%d.ics" % (i,),
+                Component.fromString(syntheticEvent("%s-%d" % (uid, i,), start, i % 5 == 0)),
+            )
+        for i in range(0, events, 10):
+            calendarObject = yield calendar.calendarObjectWithName("%d.ics" % (i,))
+            if i % 20:
+                component = yield calendarObject.component()
+                component.mainComponent().replaceProperty(Property("SUMMARY", "Changed"))
+                yield calendarObject.setComponent(component)
+            else:
+                yield calendarObject.remove()
+
+        if homeNumber == (homes + 1) // 2:
+            population.homeUID = uid
+            population.homeID = home.id()
+            population.calendarID = calendar.id()
+            population.revision = (yield home.syncTokenRevision()) // 2
+        yield txn.commit()
+
+    returnValue(population)
+
+
+@inlineCallbacks
+def explain(txn, statement, **kw):
+    """
+    Run a DAL statement under C{EXPLAIN (ANALYZE, BUFFERS)}.
+
+    @return: a L{Deferred} firing with the (JSON format) plan
+    @rtype: C{dict}
+    """
+    fragment = statement.toSQL(QueryGenerator(txn.dbtype, FixedPlaceholder("%s"))).bind(**kw)
+    rows = yield txn.execSQL(
+        "explain (analyze, buffers, format json) " + fragment.text,
+        fragment.parameters,
+    )
+    plan = rows[0][0]
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    returnValue(plan[0])
+
+
+def _planNodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        for descendant in _planNodes(child):
+            yield descendant
+
+
+def summarizePlan(plan):
+    """
+    Extract the interesting parts of a plan.
+
+    @param plan: a plan as produced by L{explain}
+
+    @return: a JSON-serializable C{dict} with the estimated C{cost}, the
+        C{time} it took in milliseconds, shared buffer C{hits} and C{reads},
+        the node types used, and a C{seqScans} mapping of each relation that
+        was sequentially scanned to the number of rows scanned.
+    """
+    root = plan["Plan"]
+    seqScans = {}
+    for node in _planNodes(root):
+        if node["Node Type"] == "Seq Scan":
+            rows = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * node.get("Actual Loops", 1)
+            relation = node["Relation Name"]
+            seqScans[relation] = seqScans.get(relation, 0) + rows
+    return {
+        "cost": root["Total Cost"],
+        "time": plan.get("Execution Time"),
+        "hits": root.get("Shared Hit Blocks", 0),
+        "reads": root.get("Shared Read Blocks", 0),
+        "nodes": sorted(set([node["Node Type"] for node in _planNodes(root)])),
+        "seqScans": seqScans,
+    }
+
+
+def compare(baseline, current, threshold, seqScanRows):
+    """
+    Check captured plans against a baseline.
+
+    @param baseline: the baseline, as written by L{updateBaseline}
+    @param current: the results of this run, as produced by L{report}
+    @param threshold: the fractional increase in estimated cost that counts
+        as a regression
+    @type threshold: C{float}
+    @param seqScanRows: sequential scans of at least this many rows are
+        problems, unless the baseline allows them for that relation
+    @type seqScanRows: C{int}
+
+    @return: a C{list} of (name, problems) tuples for each query, where
+        problems is a C{list} of descriptions of what is wrong with its plan.
+        Costs are only compared if the baseline was taken with the same
+        population; a query with no cost recorded in such a baseline is a
+        problem, since a cost regression in it could not be detected.
+    """
+    queries = baseline.get("queries", {})
+    sameSize = baseline.get("population") == current["population"]
+    comparison = []
+    for result in current["results"]:
+        old = queries.get(result["name"], {})
+        allowed = old.get("allowSeqScans", [])
+        problems = []
+        for relation, rows in sorted(result["seqScans"].items()):
+            if rows >= seqScanRows and relation not in allowed:
+                problems.append("sequential scan of %s (%d rows)" % (relation, rows,))
+        if sameSize:
+            if old.get("cost") is None:
+                problems.append("no baseline cost recorded (run with --update-baseline)")
+            elif result["cost"] > old["cost"] * (1.0 + threshold):
+                problems.append("cost %.1f -> %.1f" % (old["cost"], result["cost"],))
+        comparison.append((result["name"], problems))
+    return comparison
+
+
+def needsBaseline(baseline, current):
+    """
+    Check whether a baseline has yet to have any costs recorded for the
+    population of this run, in which case this run's costs should be recorded
+    rather than every query being reported as having no baseline.
+    """
+    if baseline.get("population", current["population"]) != current["population"]:
+        return False
+    for query in baseline.get("queries", {}).values():
+        if query.get("cost") is not None:
+            return False
+    return True
+
+
+def updateBaseline(baseline, current):
+    """
+    Record the costs of this run in the baseline, keeping any allowed
+    sequential scans.
+    """
+    queries = baseline.setdefault("queries", {})
+    for result in current["results"]:
+        queries.setdefault(result["name"], {"allowSeqScans": []})["cost"] = result["cost"]
+    baseline["population"] = current["population"]
+    return baseline
+
+
+def report(population, results):
+    """
+    Wrap results with the size of the population they were captured with.
+    """
+    return {
+        "population": {"homes": population.homes, "events": population.events},
+        "results": results,
+    }
+
+
+@hotQuery("calendar-not-expanded-within", "Calendar._notExpandedWithinQuery")
+def _notExpandedWithin(txn, population):
+    today = DateTime.getToday()
+    return (Calendar._notExpandedWithinQuery, {
+        "minDate": pyCalendarToSQLTimestamp(normalizeForIndex(today - Duration(days=30))),
+        "maxDate": pyCalendarToSQLTimestamp(normalizeForIndex(today + Duration(days=365))),
+        "resourceID": population.calendarID,
+    })
+
+
+def _timeRangeFilter():
+    start = DateTime.getNowUTC()
+    start.setHHMMSS(0, 0, 0)
+    end = start + Duration(days=7)
+    filter = Filter(
+        caldavxml.Filter(
+            caldavxml.ComponentFilter(
+                caldavxml.ComponentFilter(
+                    caldavxml.TimeRange(start=start.getText(), end=end.getText()),
+                    name=("VEVENT", "VFREEBUSY", "VAVAILABILITY"),
+                ),
+                name="VCALENDAR",
+            )
+        )
+    )
+    filter.settimezone(None)
+    return filter
+
+
+@hotQuery("calendar-query-timerange", "CalDAVSQLQueryGenerator time-range calendar-query")
+@inlineCallbacks
+def _calendarQuery(txn, population):
+    home = yield txn.calendarHomeWithUID(population.homeUID)
+    calendar = yield home.calendarWithName("synthetic")
+    statement, args, _ignore_usedtimerange = calendar._sqlquery(_timeRangeFilter(), None, False)
+    returnValue((statement, args))
+
+
+@hotQuery("calendar-query-freebusy", "CalDAVSQLQueryGenerator time-range free-busy query")
+@inlineCallbacks
+def _freebusyQuery(txn, population):
+    home = yield txn.calendarHomeWithUID(population.homeUID)
+    calendar = yield home.calendarWithName("synthetic")
+    statement, args, _ignore_usedtimerange = calendar._sqlquery(_timeRangeFilter(), population.homeUID, True)
+    returnValue((statement, args))
+
+
+@hotQuery("home-changes", "CommonHome._changesQuery")
+def _homeChanges(txn, population):
+    return (CalendarHome._changesQuery(config.SyncReportBatchSize), {
+        "resourceID": population.homeID,
+        "revision": population.revision,
+    })
+
+
+@hotQuery("home-sync-token", "CommonHome._syncTokenQuery")
+def _homeSyncToken(txn, population):
+    return (CalendarHome._syncTokenQuery, {"resourceID": population.homeID})
+
+
+@hotQuery("calendar-changes", "_SharedSyncLogic._objectNamesSinceRevisionQuery")
+def _calendarChanges(txn, population):
+    return (Calendar._objectNamesSinceRevisionQuery(config.SyncReportBatchSize), {
+        "resourceID": population.calendarID,
+        "revision": population.revision,
+    })
+
+
+@hotQuery("calendar-sync-token", "_SharedSyncLogic._childSyncTokenQuery")
+def _calendarSyncToken(txn, population):
+    return (Calendar._childSyncTokenQuery, {"resourceID": population.calendarID})
+
+
+@hotQuery("purge-old-events", "CommonStoreTransaction._oldEventsBase")
+def _oldEvents(txn, population):
+    cutoff = DateTime.getToday() - Duration(days=30)
+    return (txn._oldEventsBase(100), {"CutOff": pyCalendarToSQLTimestamp(cutoff)})
+
+
+@hotQuery("purge-orphaned-attachments", "CommonStoreTransaction._orphanedAttachmentsBase")
+def _orphanedAttachments(txn, population):
+    return (txn._orphanedAttachmentsBase(population.homeUID, 100), {"uuid": population.homeUID})
+
+
+class QueryPlanHarness(StoreHarness):
+    """
+    Captures the plans of the hot queries.
+    """
+
+    homes = 50
+    events = 100
+    queries = hotQueries
+    results = None
+    population = None
+
+    @inlineCallbacks
+    def test_plans(self):
+        txn = self.transactionUnderTest()
+        if txn.dbtype.dialect != POSTGRES_DIALECT:
+            raise SkipTest("Query plans are only captured for PostgreSQL")
+        yield self.commit()
+
+        population = yield populate(self.storeUnderTest(), self.homes, self.events)
+        txn = self.transactionUnderTest()
+        yield txn.execSQL("analyze")
+
+        for query in self.queries:
+            statement, kw = yield maybeDeferred(query.build, txn, population)
+            plan = yield explain(txn, statement, **kw)
+            result = summarizePlan(plan)
+            result["name"] = query.name
+            result["description"] = query.description
+            result["plan"] = plan
+            self.results.append(result)
+        yield self.abort()
+        QueryPlanHarness.population = population
+
+
+def capturePlans(homes, events, queries=hotQueries):
+    """
+    Run the L{QueryPlanHarness}.
+
+    @return: the results, as produced by L{report}, or C{None} if the plans
+        could not be captured
+    """
+    QueryPlanHarness.homes = homes
+    QueryPlanHarness.events = events
+    QueryPlanHarness.queries = queries
+    QueryPlanHarness.results = []
+    QueryPlanHarness.population = None
+    runStoreHarness(QueryPlanHarness, "test_plans")
+    if QueryPlanHarness.population is None:
+        return None
+    return report(QueryPlanHarness.population, QueryPlanHarness.results)
+
+
+class QueryPlanOptions(Options):
+    """
+    Command line options for the query plan harness.
+    """
+
+    synopsis = "queryplans [options] [query names]"
+
+    optParameters = [
+        ("homes", None, 50, "Number of calendar homes to populate.", int),
+        ("events", None, 100, "Number of events in each home.", int),
+        ("baseline", "b", defaultBaseline, "Baseline JSON file."),
+        ("output", "o", None, "Write the full plans as JSON to this file."),
+        ("threshold", None, 0.25, "Fractional increase in estimated cost that counts as a regression.", float),
+        ("seq-scan-rows", None, 1000, "Sequential scans of at least this many rows are problems.", int),
+    ]
+
+    optFlags = [
+        ("update-baseline", "u", "Record the costs of this run in the baseline file."),
+        ("list", "l", "List the registered queries."),
+    ]
+
+    def parseArgs(self, *names):
+        self["names"] = names
+
+    def postOptions(self):
+        if self["homes"] < 1 or self["events"] < 1:
+            raise UsageError("There must be at least one home and event")
+
+
+def main(argv=None):
+    options = QueryPlanOptions()
+    try:
+        options.parseOptions(sys.argv[1:] if argv is None else argv)
+    except UsageError, e:
+        print(e)
+        return 1
+
+    if options["list"]:
+        for query in hotQueries:
+            print("%-28s %s" % (query.name, query.description))
+        return 0
+
+    queries = hotQueries
+    if options["names"]:
+        queries = [query for query in queries if query.name in options["names"]]
+
+    current = capturePlans(options["homes"], options["events"], queries)
+    if current is None:
+        return 1
+
+    if options["output"]:
+        with open(options["output"], "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+
+    try:
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+    except IOError:
+        baseline = {}
+
+    if options["update-baseline"]:
+        with open(options["baseline"], "w") as f:
+            json.dump(updateBaseline(baseline, current), f, indent=2, sort_keys=True)
+        return 0
+
+    if needsBaseline(baseline, current):
+        with open(options["baseline"], "w") as f:
+            json.dump(updateBaseline(baseline, current), f, indent=2, sort_keys=True)
+        print("No baseline costs recorded yet: recorded the costs of this run in %s" % (options["baseline"],))
+
+    if baseline.get("population") != current["population"]:
+        print("Baseline population differs: not comparing costs")
+    results = dict([(result["name"], result) for result in current["results"]])
+    regressions = 0
+    for name, problems in compare(baseline, current, options["threshold"], options["seq-scan-rows"]):
+        result = results[name]
+        print("%-28s cost %10.1f  %8.3f ms  %s" % (
+            name, result["cost"], result["time"] or 0.0, ", ".join(result["nodes"]),
+        ))
+        for problem in problems:
+            print("    PROBLEM: %s" % (problem,))
+        regressions += len(problems) != 0
+    if regressions:
+        return 2
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Running performance tools against a test calendar store.
+
+Tools which need a real store, such as the store micro-benchmarks and the query
+plan checks, subclass L{StoreHarness} so that they can use the test store
+fixtures, and run it with L{runStoreHarness} rather than through trial.
+"""
+
+from __future__ import print_function
+
+import sys
+import unittest
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial.unittest import TestCase
+
+from txdav.common.datastore.test.util import CommonCommonTests
+
+
+class StoreHarness(CommonCommonTests, TestCase):
+    """
+    A trial test case with a calendar store and directory. The store is built in
+    a database under the current directory, which requires a local PostgreSQL
+    installation.
+    """
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(StoreHarness, self).setUp()
+        yield self.buildStoreAndDirectory()
+
+    def storeUnderTest(self):
+        return self.store
+
+
+def runStoreHarness(harnessClass, methodName):
+    """
+    Run one method of a L{StoreHarness} subclass outside of trial, reporting any
+    errors, failures and reasons it was skipped on standard error.
+
+    @return: C{True} if the method ran successfully
+    @rtype: C{bool}
+    """
+    result = unittest.TestResult()
+    harnessClass(methodName).run(result)
+    for _ignore_test, error in result.errors + result.failures:
+        print(error, file=sys.stderr)
+    for _ignore_test, reason in result.skipped:
+        print(reason, file=sys.stderr)
+    return result.wasSuccessful()
@@ -0,0 +1,84 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+import json
+
+from twisted.trial.unittest import TestCase
+
+from microbench import Benchmark, Measurer, compare, report, \
+    calendarBenchmarks, webdavBenchmarks, responseCacheBenchmarks
+
+
+class MeasurerTests(TestCase):
+
+    def test_measure(self):
+        """
+        Only the operation is timed, not the preparation of its argument,
+        and enough iterations are done to fill each sample.
+        """
+        now = [0.0]
+
+        def timer():
+            return now[0]
+
+        def prepare():
+            now[0] += 5.0
+            return 2.0
+
+        def operation(arg):
+            now[0] += arg
+
+        measurer = Measurer(samples=3, minTime=10.0, timer=timer)
+        result = measurer.measure(Benchmark("test", operation, prepare=prepare))
+        self.assertEqual(result["iterations"], 5)
+        self.assertEqual(result["samples"], [2.0, 2.0, 2.0])
+        self.assertEqual(result["median"], 2.0)
+        self.assertEqual(result["mad"], 0.0)
+        json.dumps(report([result]))
+
+    def test_benchmarksRun(self):
+        """
+        Each in-process benchmark runs without error.
+        """
+        measurer = Measurer(samples=3, minTime=0.0001, maxIterations=1)
+        for factory in (calendarBenchmarks, webdavBenchmarks, responseCacheBenchmarks):
+            for benchmark in factory():
+                result = measurer.measure(benchmark)
+                self.assertEqual(result["name"], benchmark.name)
+
+    def test_compare(self):
+        """
+        A slow-down beyond the threshold and the noise is a regression.
+        """
+        def result(name, median, mad):
+            return {"name": name, "median": median, "mad": mad}
+
+        baseline = report([
+            result("same", 1.0, 0.01),
+            result("slower", 1.0, 0.01),
+            result("noisy", 1.0, 0.5),
+            result("gone", 1.0, 0.01),
+        ])
+        current = report([
+            result("same", 1.05, 0.01),
+            result("slower", 1.5, 0.01),
+            result("noisy", 1.3, 0.01),
+            result("new", 1.0, 0.01),
+        ])
+        self.assertEqual(
+            [(name, regressed) for name, _ignore_before, _ignore_after, _ignore_ratio, regressed in compare(baseline, current, 0.1)],
+            [("same", False), ("slower", True), ("noisy", False)],
+        )
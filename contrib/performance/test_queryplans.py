@@ -0,0 +1,208 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+import json
+
+from pycalendar.datetime import DateTime
+
+from twisted.trial.unittest import TestCase
+
+from twistedcaldav.ical import Component
+
+from queryplans import summarizePlan, compare, updateBaseline, \
+    needsBaseline, syntheticEvent, hotQueries, defaultBaseline
+
+
+def seqScan(relation, rows, removed=0, loops=1):
+    return {
+        "Node Type": "Seq Scan",
+        "Relation Name": relation,
+        "Actual Rows": rows,
+        "Rows Removed by Filter": removed,
+        "Actual Loops": loops,
+    }
+
+
+class QueryPlanTests(TestCase):
+
+    plan = {
+        "Plan": {
+            "Node Type": "Nested Loop",
+            "Total Cost": 42.5,
+            "Shared Hit Blocks": 10,
+            "Shared Read Blocks": 2,
+            "Plans": [
+                {
+                    "Node Type": "Index Scan",
+                    "Relation Name": "calendar_object",
+                    "Index Name": "calendar_object_calendar_resource_id",
+                },
+                seqScan("calendar_object_revisions", 5, removed=1995),
+                {
+                    "Node Type": "Hash",
+                    "Plans": [seqScan("calendar_bind", 3, loops=2)],
+                },
+            ],
+        },
+        "Execution Time": 1.5,
+    }
+
+    def result(self, name="query", cost=42.5, seqScans=None):
+        return {
+            "name": name,
+            "cost": cost,
+            "seqScans": {} if seqScans is None else seqScans,
+        }
+
+    def test_summarizePlan(self):
+        """
+        L{summarizePlan} extracts the cost, timings, buffer usage and the
+        number of rows read by sequential scans anywhere in the plan.
+        """
+        summary = summarizePlan(self.plan)
+        self.assertEqual(summary["cost"], 42.5)
+        self.assertEqual(summary["time"], 1.5)
+        self.assertEqual(summary["hits"], 10)
+        self.assertEqual(summary["reads"], 2)
+        self.assertEqual(summary["nodes"], ["Hash", "Index Scan", "Nested Loop", "Seq Scan"])
+        self.assertEqual(summary["seqScans"], {
+            "calendar_object_revisions": 2000,
+            "calendar_bind": 6,
+        })
+
+    def test_compareSeqScans(self):
+        """
+        Sequential scans over many rows are problems, unless the baseline
+        allows them.
+        """
+        current = {
+            "population": {"homes": 1, "events": 1},
+            "results": [
+                self.result("a", seqScans={"calendar_bind": 6}),
+                self.result("b", seqScans={"calendar_object_revisions": 2000}),
+                self.result("c", seqScans={"time_range": 2000}),
+            ],
+        }
+        baseline = {"queries": {"c": {"allowSeqScans": ["time_range"]}}}
+        self.assertEqual(compare(baseline, current, 0.25, 1000), [
+            ("a", []),
+            ("b", ["sequential scan of calendar_object_revisions (2000 rows)"]),
+            ("c", []),
+        ])
+
+    def test_compareCost(self):
+        """
+        Increases in cost beyond the threshold are problems, but only if the
+        baseline was taken with the same population.
+        """
+        current = {
+            "population": {"homes": 1, "events": 1},
+            "results": [self.result("a", cost=12.0), self.result("b", cost=13.0)],
+        }
+        baseline = {
+            "population": {"homes": 1, "events": 1},
+            "queries": {"a": {"cost": 10.0}, "b": {"cost": 10.0}},
+        }
+        self.assertEqual(compare(baseline, current, 0.25, 1000), [
+            ("a", []),
+            ("b", ["cost 10.0 -> 13.0"]),
+        ])
+
+        baseline["population"] = {"homes": 2, "events": 1}
+        self.assertEqual(compare(baseline, current, 0.25, 1000), [
+            ("a", []),
+            ("b", []),
+        ])
+
+    def test_compareMissingCost(self):
+        """
+        A query with no cost in a baseline taken with the same population is a
+        problem, rather than silently never being compared.
+        """
+        current = {
+            "population": {"homes": 1, "events": 1},
+            "results": [self.result("a"), self.result("b")],
+        }
+        baseline = {
+            "population": {"homes": 1, "events": 1},
+            "queries": {"a": {"cost": None, "allowSeqScans": []}},
+        }
+        self.assertEqual(compare(baseline, current, 0.25, 1000), [
+            ("a", ["no baseline cost recorded (run with --update-baseline)"]),
+            ("b", ["no baseline cost recorded (run with --update-baseline)"]),
+        ])
+
+    def test_needsBaseline(self):
+        """
+        A baseline with no costs recorded for the population of this run needs
+        them recording, but once any are recorded the rest are problems.
+        """
+        current = {
+            "population": {"homes": 1, "events": 1},
+            "results": [self.result("a"), self.result("b")],
+        }
+        self.assertTrue(needsBaseline({}, current))
+        baseline = {
+            "population": {"homes": 1, "events": 1},
+            "queries": {"a": {"cost": None}, "b": {"cost": None}},
+        }
+        self.assertTrue(needsBaseline(baseline, current))
+        baseline["queries"]["a"]["cost"] = 10.0
+        self.assertFalse(needsBaseline(baseline, current))
+        baseline = {
+            "population": {"homes": 2, "events": 1},
+            "queries": {"a": {"cost": None}},
+        }
+        self.assertFalse(needsBaseline(baseline, current))
+
+    def test_updateBaseline(self):
+        """
+        L{updateBaseline} records costs and the population, keeping allowed
+        sequential scans.
+        """
+        baseline = {"queries": {"a": {"cost": 1.0, "allowSeqScans": ["x"]}}}
+        current = {
+            "population": {"homes": 1, "events": 1},
+            "results": [self.result("a", cost=2.0), self.result("b", cost=3.0)],
+        }
+        self.assertEqual(updateBaseline(baseline, current), {
+            "population": {"homes": 1, "events": 1},
+            "queries": {
+                "a": {"cost": 2.0, "allowSeqScans": ["x"]},
+                "b": {"cost": 3.0, "allowSeqScans": []},
+            },
+        })
+
+    def test_syntheticEvent(self):
+        """
+        Synthetic events are valid calendar data.
+        """
+        start = DateTime(2017, 1, 1, 9, 0, 0, tzid=None)
+        for recurring in (False, True):
+            component = Component.fromString(syntheticEvent("uid1", start, recurring))
+            component.validCalendarData()
+            self.assertEqual(component.resourceUID(), "uid1")
+
+    def test_baseline(self):
+        """
+        The checked-in baseline has an entry for each registered query.
+        """
+        with open(defaultBaseline) as f:
+            baseline = json.load(f)
+        self.assertEqual(
+            sorted(baseline["queries"].keys()),
+            sorted([query.name for query in hotQueries]),
+        )
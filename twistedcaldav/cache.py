@@ -17,10 +17,12 @@
 from twext.python.log import Logger
 from txweb2.dav.util import allDataFromStream
 from txweb2.http import Response
+from txweb2.http_headers import Headers
 from txweb2.iweb import IResource
 from txweb2.stream import MemoryStream
 
-from twisted.internet.defer import succeed, inlineCallbacks, returnValue
+from twisted.internet.defer import succeed, inlineCallbacks, returnValue, \
+    gatherResults, FirstError
 
 from twistedcaldav.config import config
 from twistedcaldav.memcachepool import CachePoolUserMixIn, defaultCachePool
@@ -70,6 +72,18 @@ is making the request (including proxy state changes etc).
 """
 
 
+def _gatherTokens(deferreds):
+    """
+    Wait for several token lookups at once, failing with the first lookup
+    failure itself (e.g. L{URINotFoundException}) rather than a L{FirstError}.
+    """
+    def _unwrap(f):
+        f.trap(FirstError)
+        return f.value.subFailure
+
+    return gatherResults(deferreds, consumeErrors=True).addErrback(_unwrap)
+
+
 class DisabledCacheNotifier(object):
 
     def __init__(self, *args, **kwargs):
@@ -171,6 +185,31 @@ class BaseResponseCache(object):
     """
     log = Logger()
 
+    # Clients send the same few PROPFIND bodies over and over, so remember
+    # the normalized hash of each raw body rather than re-normalizing it
+    _bodyHashes = {}
+    _bodyHashesMaxSize = 1000
+
+    @classmethod
+    def _hashBody(cls, requestBody):
+        """
+        Hash a request body, normalized for property order.
+        """
+        try:
+            return cls._bodyHashes[requestBody]
+        except KeyError:
+            pass
+
+        # Normalize the property order by doing a "dumb" sort on lines
+        requestLines = requestBody.splitlines()
+        requestLines.sort()
+        bodyHash = hash("\n".join(requestLines))
+
+        if len(cls._bodyHashes) >= cls._bodyHashesMaxSize:
+            cls._bodyHashes.clear()
+        cls._bodyHashes[requestBody] = bodyHash
+        return bodyHash
+
     def _principalURI(self, principal):
         return principal.principalURL() if principal is not None else "unauthenticated"
 
@@ -226,15 +265,25 @@ class BaseResponseCache(object):
 
     def _getURIs(self, request):
         """
-        Get principal and resource URIs from the request.
+        Get principal and resource URIs from the request. The result is
+        remembered on the request as both the cache lookup and, on a miss,
+        the cache store need it.
         """
+        if hasattr(request, "cacheURIs"):
+            return succeed(request.cacheURIs)
+
         def _getSecondURI(rURI):
             return self._canonicalizeURIForRequest(
                 self._principalURI(request.authnUser),
                 request).addCallback(lambda pURI: (pURI, rURI))
 
+        def _remember(uris):
+            request.cacheURIs = uris
+            return uris
+
         d = self._canonicalizeURIForRequest(request.uri, request)
         d.addCallback(_getSecondURI)
+        d.addCallback(_remember)
 
         return d
 
@@ -249,17 +298,15 @@ class BaseResponseCache(object):
             # Give it back to the request so it can be read again
             request.stream = MemoryStream(requestBody)
             request.stream.doStartReading = None
-
-            # Normalize the property order by doing a "dumb" sort on lines
-            requestLines = requestBody.splitlines()
-            requestLines.sort()
-            requestBody = "\n".join(requestLines)
+            bodyHash = self._hashBody(requestBody)
+        else:
+            bodyHash = hash(None)
 
         request.cacheKey = (request.method,
                             self._principalURI(request.authnUser),
                             request.uri,
                             request.headers.getHeader('depth'),
-                            hash(requestBody))
+                            bodyHash)
 
         returnValue(request.cacheKey)
 
@@ -296,6 +343,16 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
         Get the current token for a particular principal URI's directory record.
         """
 
+        # The authenticated principal's record is already at hand, so avoid
+        # locating its resource again
+        principal = request.authnUser
+        if (
+            principal is not None and
+            getattr(principal, "record", None) is not None and
+            principal.principalURL() == uri
+        ):
+            returnValue(principal.record.cacheToken())
+
         record = (yield self._getRecordForURI(uri, request))
         returnValue(record.cacheToken())
 
@@ -306,8 +363,9 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
         """
 
         if hasattr(request, "childCacheURIs"):
-            tokens = dict([(uri, (yield self._tokenForURI(uri)),) for uri in request.childCacheURIs])
-            returnValue(tokens)
+            uris = list(request.childCacheURIs)
+            tokens = (yield _gatherTokens([self._tokenForURI(uri) for uri in uris]))
+            returnValue(dict(zip(uris, tokens)))
         else:
             returnValue({})
 
@@ -317,12 +375,13 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
         Tokens are a principal token, directory record token, resource token and list
         of child resource tokens. A change to any one of those will cause cache invalidation.
         """
-        tokens = []
         pURI, rURI = (yield self._getURIs(request))
-        tokens.append((yield self._tokenForURI(pURI, "PrincipalToken")))
-        tokens.append((yield self._tokenForRecord(pURI, request)))
-        tokens.append((yield self._tokenForURI(rURI)))
-        tokens.append((yield self._tokensForChildren(rURI, request)))
+        tokens = (yield _gatherTokens([
+            self._tokenForURI(pURI, "PrincipalToken"),
+            self._tokenForRecord(pURI, request),
+            self._tokenForURI(rURI),
+            self._tokensForChildren(rURI, request),
+        ]))
         returnValue(tokens)
 
     @inlineCallbacks
@@ -395,8 +454,10 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                 )
                 returnValue(None)
 
-            for childuri, token in childTokens.items():
-                currentToken = (yield self._tokenForURI(childuri))
+            childuris = childTokens.keys()
+            currentChildTokens = (yield _gatherTokens([self._tokenForURI(childuri) for childuri in childuris]))
+            for childuri, currentToken in zip(childuris, currentChildTokens):
+                token = childTokens[childuri]
                 if currentToken != token:
                     self.log.debug(
                         "Child {uri} token doesn't match for {key!r}: {currentToken!r} != {token!r}",
@@ -408,12 +469,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     returnValue(None)
 
             self.log.debug("Response cache matched")
-            r = Response(code, stream=MemoryStream(body))
-
-            for key, value in headers.iteritems():
-                r.headers.setRawHeaders(key, value)
-
-            returnValue(r)
+            returnValue(Response(code, headers=Headers(rawHeaders=headers), stream=MemoryStream(body)))
 
         except URINotFoundException, e:
             self.log.debug("Could not locate URI: {e!r}", e=e)
@@ -32,9 +32,11 @@ from twext.internet.ssl import ChainingOpenSSLContextFactory
 from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
 from twisted.internet.error import ConnectionLost, ConnectionDone, ConnectError
 from twisted.internet.protocol import ClientFactory
+from zope.interface import implements
 
 from txweb2 import responsecode
 from txweb2.client.http import HTTPClientProtocol
+from txweb2.client.interfaces import IHTTPClientManager
 from txweb2.http import StatusResponse, HTTPError
 from txweb2.dav.util import allDataFromStream
 from txweb2.stream import MemoryStream
@@ -85,12 +87,36 @@ class PooledHTTPClientFactory(ClientFactory):
             del self.afterConnect
 
     def buildProtocol(self, addr):
-        self.instance = self.protocol()
+        manager = self.connectionPool.clientManager() if self.connectionPool is not None else None
+        self.instance = self.protocol(manager)
         self.reactor.callLater(0, self.onConnect.callback, self.instance)
         del self.onConnect
         return self.instance
 
 
+class _PersistentClientManager(object):
+    """
+    Tells an L{HTTPClientPool} when one of its persistent connections has read
+    the whole response and can take another request, or has gone away.
+    """
+    implements(IHTTPClientManager)
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def clientBusy(self, proto):
+        pass
+
+    def clientIdle(self, proto):
+        self.pool.clientFree(proto)
+
+    def clientPipelining(self, proto):
+        pass
+
+    def clientGone(self, proto):
+        self.pool.clientGone(proto)
+
+
 class HTTPClientPool(object):
     """
     A connection pool for HTTPClientProtocol instances.
@@ -112,6 +138,10 @@ class HTTPClientPool(object):
 
     @ivar _pendingConnects: A C{int} indicating how many connections are in
         progress.
+
+    @ivar _persistent: A C{bool} indicating whether connections are kept open
+        for further requests once a response has been read, rather than being
+        closed after each request.
     """
     log = Logger()
 
@@ -119,7 +149,7 @@ class HTTPClientPool(object):
     maxRetries = 2
 
     def __init__(self, name, scheme, endpoint, secureEndpoint,
-                 maxClients=5, reactor=None):
+                 maxClients=5, reactor=None, persistent=False):
         """
         @param endpoint: An L{IStreamClientEndpoint} indicating the server to
             connect to.
@@ -128,6 +158,9 @@ class HTTPClientPool(object):
 
         @param reactor: An L{IReactorTCP} provider used to initiate new
             connections.
+
+        @param persistent: A C{bool} indicating whether connections are reused
+            for multiple requests.
         """
 
         self._name = name
@@ -135,6 +168,7 @@ class HTTPClientPool(object):
         self._endpoint = endpoint
         self._secureEndpoint = secureEndpoint
         self._maxClients = maxClients
+        self._persistent = persistent
 
         if reactor is None:
             from twisted.internet import reactor
@@ -163,6 +197,13 @@ class HTTPClientPool(object):
         self.shutdown_deferred = Deferred()
         return self.shutdown_deferred
 
+    def clientManager(self):
+        """
+        @return: the L{IHTTPClientManager} for a new client, or C{None} if
+            the client need not report its state.
+        """
+        return _PersistentClientManager(self) if self._persistent else None
+
     def _newClientConnection(self):
         """
         Create a new client connection.
@@ -233,8 +274,12 @@ class HTTPClientPool(object):
             return result
 
         self.clientBusy(client)
-        d = client.submitRequest(request, closeAfter=True)
-        d.addCallbacks(_freeClientAfterRequest, _goneClientAfterError)
+        d = client.submitRequest(request, closeAfter=not self._persistent)
+        if self._persistent:
+            # The client is freed by its manager once the response has been read
+            d.addErrback(_goneClientAfterError)
+        else:
+            d.addCallbacks(_freeClientAfterRequest, _goneClientAfterError)
         return d
 
     @inlineCallbacks
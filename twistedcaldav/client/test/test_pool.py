@@ -0,0 +1,128 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.internet.defer import succeed, inlineCallbacks
+from twisted.internet.error import ConnectionDone
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport, Clock
+from twisted.trial import unittest
+
+from twistedcaldav.client.pool import HTTPClientPool
+
+from txweb2.client.http import ClientRequest, HTTPClientProtocol
+from txweb2.dav.util import allDataFromStream
+
+
+class TestReactor(Clock):
+    """
+    L{Clock} that an L{HTTPClientPool} can register its shutdown trigger with.
+    """
+
+    def addSystemEventTrigger(self, *args, **kwargs):
+        pass
+
+
+class TestPool(HTTPClientPool):
+    """
+    L{HTTPClientPool} that connects clients to in-memory transports.
+    """
+
+    def _newClientConnection(self):
+        client = HTTPClientProtocol(self.clientManager())
+        client.inputTimeOut = None
+        client.makeConnection(StringTransport())
+        self.connected.append(client)
+        return succeed(client)
+
+
+class HTTPClientPoolTests(unittest.TestCase):
+
+    def createPool(self, persistent):
+        pool = TestPool(
+            "test", "http", None, None,
+            maxClients=1, reactor=TestReactor(), persistent=persistent
+        )
+        pool.connected = []
+        return pool
+
+    def respond(self, client, keepAlive=True):
+        client.dataReceived(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Length: 2\r\n"
+            "Connection: {}\r\n"
+            "\r\n"
+            "OK".format("Keep-Alive" if keepAlive else "close")
+        )
+
+    @inlineCallbacks
+    def test_persistentReused(self):
+        """
+        In persistent mode a connection is reused for the next request once
+        the response has been read.
+        """
+        pool = self.createPool(True)
+        d = pool.submitRequest(ClientRequest("GET", "/", None, ""))
+        self.assertEqual(len(pool.connected), 1)
+        client = pool.connected[0]
+        self.assertTrue("Connection: Keep-Alive" in client.transport.value())
+        self.respond(client)
+        response = yield d
+        data = yield allDataFromStream(response.stream)
+        self.assertEqual(data, "OK")
+
+        client.transport.clear()
+        d = pool.submitRequest(ClientRequest("GET", "/", None, ""))
+        self.assertEqual(len(pool.connected), 1)
+        self.assertTrue(client.transport.value().startswith("GET / HTTP/1.1"))
+        self.respond(client)
+        response = yield d
+        self.assertEqual(response.code, 200)
+        self.assertFalse(client.transport.disconnecting)
+
+    @inlineCallbacks
+    def test_notPersistentClosed(self):
+        """
+        Without persistent mode a connection is closed after each request.
+        """
+        pool = self.createPool(False)
+        d = pool.submitRequest(ClientRequest("GET", "/", None, ""))
+        client = pool.connected[0]
+        self.assertTrue("Connection: close" in client.transport.value())
+        self.respond(client, keepAlive=False)
+        response = yield d
+        yield allDataFromStream(response.stream)
+        self.assertTrue(client.transport.disconnecting)
+
+    @inlineCallbacks
+    def test_persistentClosedByServer(self):
+        """
+        A request sent over a pooled connection that the server has closed is
+        retried over a new connection.
+        """
+        pool = self.createPool(True)
+        d = pool.submitRequest(ClientRequest("GET", "/", None, ""))
+        self.respond(pool.connected[0])
+        response = yield d
+        yield allDataFromStream(response.stream)
+
+        d = pool.submitRequest(ClientRequest("GET", "/", None, ""))
+        self.assertEqual(len(pool.connected), 1)
+        pool.connected[0].connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(len(pool.connected), 2)
+        self.respond(pool.connected[1])
+        response = yield d
+        data = yield allDataFromStream(response.stream)
+        self.assertEqual(data, "OK")
@@ -25,6 +25,7 @@ from twisted.internet.defer import inlineCallbacks, returnValue, succeed
 from twext.python.log import Logger
 
 from twistedcaldav.config import fullServerPath, config
+from twistedcaldav.database import AbstractADBAPIDatabase, ADBAPISqliteMixin
 from twistedcaldav.directory import xmlaugmentsparser
 from twistedcaldav.directory.xmlaugmentsparser import XMLAugmentsParser
 from twistedcaldav.xmlutil import newElementTreeWithRoot, addSubElement, \
@@ -247,6 +248,23 @@ class AugmentDB(object):
 
         raise NotImplementedError("Child class must define this.")
 
+    def _addRecordToXMLDB(self, record, parentNode):
+        record_node = addSubElement(parentNode, xmlaugmentsparser.ELEMENT_RECORD)
+        self._updateRecordInXMLDB(record, record_node)
+
+    def _updateRecordInXMLDB(self, record, recordNode):
+        del recordNode[:]
+        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_UID, record.uid)
+        if record.serverID:
+            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_SERVERID, record.serverID)
+        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLECALENDAR, "true" if record.enabledForCalendaring else "false")
+        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLEADDRESSBOOK, "true" if record.enabledForAddressBooks else "false")
+        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLELOGIN, "true" if record.enabledForLogin else "false")
+        if record.autoScheduleMode:
+            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_AUTOSCHEDULE_MODE, record.autoScheduleMode)
+        if record.autoAcceptGroup:
+            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_AUTOACCEPTGROUP, record.autoAcceptGroup)
+
 
 class AugmentXMLDB(AugmentDB):
     """
@@ -441,23 +459,6 @@ class AugmentXMLDB(AugmentDB):
         if changed:
             writeXML(xmlfile, augments_node)
 
-    def _addRecordToXMLDB(self, record, parentNode):
-        record_node = addSubElement(parentNode, xmlaugmentsparser.ELEMENT_RECORD)
-        self._updateRecordInXMLDB(record, record_node)
-
-    def _updateRecordInXMLDB(self, record, recordNode):
-        del recordNode[:]
-        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_UID, record.uid)
-        if record.serverID:
-            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_SERVERID, record.serverID)
-        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLECALENDAR, "true" if record.enabledForCalendaring else "false")
-        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLEADDRESSBOOK, "true" if record.enabledForAddressBooks else "false")
-        addSubElement(recordNode, xmlaugmentsparser.ELEMENT_ENABLELOGIN, "true" if record.enabledForLogin else "false")
-        if record.autoScheduleMode:
-            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_AUTOSCHEDULE_MODE, record.autoScheduleMode)
-        if record.autoAcceptGroup:
-            addSubElement(recordNode, xmlaugmentsparser.ELEMENT_AUTOACCEPTGROUP, record.autoAcceptGroup)
-
     def refresh(self):
         """
         Refresh any cached data.
@@ -529,3 +530,353 @@ class AugmentXMLDB(AugmentDB):
                     self.xmlFileStats[xmlFile] = (newModTime, newSize)
 
         return results
+
+
+class AugmentADAPI(AugmentDB, AbstractADBAPIDatabase):
+    """
+    DBAPI based augment database implementation.
+
+    Records are stored one row per UID, so lookups and changes only touch the
+    records involved. Every change is also written to a change log, which
+    each process polls (no more often than every C{statSeconds}) to
+    invalidate just the records changed by other processes.
+    """
+
+    schema_version = "1"
+    schema_type = "AUGMENTS"
+
+    # Number of change log entries kept - a process that falls further
+    # behind than this drops all its cached records
+    changeLogSize = 10000
+
+    def __init__(self, dbID, dbapiName, dbapiArgs, xmlFiles=(), statSeconds=15, **kwargs):
+
+        AugmentDB.__init__(self)
+        AbstractADBAPIDatabase.__init__(self, dbID, dbapiName, dbapiArgs, True, **kwargs)
+
+        self.xmlFiles = [fullServerPath(config.DataRoot, path) for path in xmlFiles]
+        self.statSeconds = statSeconds  # Don't poll for changes more often than this value
+        self.lastCached = 0
+        self.lastRevision = None
+        self.db = {}
+
+    @inlineCallbacks
+    def open(self):
+        """
+        Open the database, and note the current change log position so that
+        only subsequent changes invalidate cached records.
+        """
+        yield super(AugmentADAPI, self).open()
+        if self.lastRevision is None:
+            self.lastRevision = (yield self._db_value_for_sql("select max(REVISION) from AUGMENT_CHANGES")) or 0
+            self.lastCached = time.time()
+
+    def getAllUIDs(self):
+        """
+        Get all AugmentRecord UIDs.
+
+        @return: L{Deferred}
+        """
+        return self.queryList("select UID from AUGMENTS")
+
+    @inlineCallbacks
+    def _lookupAugmentRecord(self, uid):
+        """
+        Get an AugmentRecord for the specified UID.
+
+        @param uid: directory UID to lookup
+        @type uid: C{str}
+
+        @return: L{Deferred}
+        """
+
+        yield self._invalidateChanged()
+
+        if uid not in self.db:
+            rows = (yield self.query(
+                """
+                select UID, ENABLED, SERVERID, CALENDARING, ADDRESSBOOKS,
+                       LOGIN, AUTOSCHEDULE, AUTOSCHEDULEMODE, AUTOACCEPTGROUP
+                  from AUGMENTS where UID = :1
+                """,
+                (uid,)
+            ))
+            self.db[uid] = self._rowToRecord(rows[0]) if rows else None
+
+        returnValue(self.db[uid])
+
+    def _rowToRecord(self, row):
+        (
+            uid, enabled, serverID, calendaring, addressbooks, login,
+            autoSchedule, autoScheduleMode, autoAcceptGroup,
+        ) = row
+        return AugmentRecord(
+            uid,
+            enabled=enabled == "T",
+            serverID=serverID or "",
+            enabledForCalendaring=calendaring == "T",
+            enabledForAddressBooks=addressbooks == "T",
+            enabledForLogin=login == "T",
+            autoSchedule=autoSchedule == "T",
+            autoScheduleMode=autoScheduleMode or "default",
+            autoAcceptGroup=autoAcceptGroup or None,
+        )
+
+    @inlineCallbacks
+    def _invalidateChanged(self):
+        """
+        Drop cached records that other processes have changed since we last
+        looked at the change log.
+        """
+        if self.lastRevision is None or not self.initialized:
+            yield self.open()
+        if time.time() - self.lastCached <= self.statSeconds:
+            returnValue(None)
+        self.lastCached = time.time()
+
+        rows = (yield self.query(
+            "select REVISION, UID from AUGMENT_CHANGES where REVISION > :1 order by REVISION",
+            (self.lastRevision,)
+        ))
+        if not rows:
+            returnValue(None)
+
+        if rows[0][0] != self.lastRevision + 1:
+            # Changes we have not seen were pruned from the log
+            self.refresh()
+        else:
+            self._invalidate([uid for _ignore_revision, uid in rows])
+        self.lastRevision = rows[-1][0]
+
+    def _invalidate(self, uids):
+        for uid in uids:
+            self.db.pop(uid, None)
+            self.cachedRecords.pop(uid, None)
+
+    @inlineCallbacks
+    def addAugmentRecords(self, records):
+        """
+        Add or modify AugmentRecords in the DB.
+
+        @param records: augment records to add
+        @type records: C{list} of L{AugmentRecord}
+
+        @return: L{Deferred}
+        """
+
+        if not self.initialized:
+            yield self.open()
+        yield self._db_add_records(records)
+        self._invalidate([record.uid for record in records])
+
+    @inlineCallbacks
+    def removeAugmentRecords(self, uids):
+        """
+        Remove AugmentRecords with the specified UIDs.
+
+        @param uids: list of uids to remove
+        @type uids: C{list} of C{str}
+
+        @return: L{Deferred}
+        """
+
+        if not self.initialized:
+            yield self.open()
+        yield self.pool.runInteraction(self._changeRecords, (), uids)
+        self._invalidate(uids)
+
+    def _db_add_records(self, records):
+        return self.pool.runInteraction(self._changeRecords, records, ())
+
+    def _changeRecords(self, txn, records, uids):
+        """
+        Replace the given records and remove the given UIDs in a single
+        transaction, logging each changed UID.
+        """
+        changed = [(record.uid,) for record in records] + [(uid,) for uid in uids]
+        if not changed:
+            return
+        txn.executemany(self._prepare_statement("delete from AUGMENTS where UID = :1"), changed)
+        txn.executemany(
+            self._prepare_statement(
+                """
+                insert into AUGMENTS (
+                    UID, ENABLED, SERVERID, CALENDARING, ADDRESSBOOKS,
+                    LOGIN, AUTOSCHEDULE, AUTOSCHEDULEMODE, AUTOACCEPTGROUP
+                ) values (:1, :2, :3, :4, :5, :6, :7, :8, :9)
+                """
+            ),
+            [
+                (
+                    record.uid,
+                    "T" if record.enabled else "F",
+                    record.serverID,
+                    "T" if record.enabledForCalendaring else "F",
+                    "T" if record.enabledForAddressBooks else "F",
+                    "T" if record.enabledForLogin else "F",
+                    "T" if record.autoSchedule else "F",
+                    record.autoScheduleMode if record.autoScheduleMode else "",
+                    record.autoAcceptGroup if record.autoAcceptGroup else "",
+                )
+                for record in records
+            ]
+        )
+        txn.executemany(self._prepare_statement("insert into AUGMENT_CHANGES (UID) values (:1)"), changed)
+        txn.execute(
+            self._prepare_statement(
+                """
+                delete from AUGMENT_CHANGES
+                 where REVISION <= (select max(REVISION) from AUGMENT_CHANGES) - :1
+                """
+            ),
+            (self.changeLogSize,)
+        )
+
+    def refresh(self):
+        """
+        Refresh any cached data.
+        """
+        super(AugmentADAPI, self).refresh()
+        self.db.clear()
+        return None
+
+    @inlineCallbacks
+    def clean(self):
+        """
+        Remove all records.
+        """
+
+        yield self.removeAugmentRecords((yield self.getAllUIDs()))
+
+    @inlineCallbacks
+    def importFromXML(self, xmlFiles):
+        """
+        Add (or replace) the records in the given augments XML files.
+
+        @param xmlFiles: paths of the XML files to import
+        @type xmlFiles: C{list} of C{str}
+
+        @return: L{Deferred} firing with the number of records imported
+        """
+        records = self._parseXMLFiles(xmlFiles)
+        yield self.addAugmentRecords(records)
+        returnValue(len(records))
+
+    def _parseXMLFiles(self, xmlFiles):
+        results = {}
+        for xmlFile in xmlFiles:
+            if os.path.exists(xmlFile):
+                # Creating a parser does the parse
+                XMLAugmentsParser(xmlFile, results)
+        records = []
+        for record in results.itervalues():
+            record.uid = normalizeUUID(record.uid)
+            records.append(record)
+        return records
+
+    @inlineCallbacks
+    def exportToXML(self, xmlFile):
+        """
+        Write all records to an augments XML file.
+
+        @param xmlFile: path of the XML file to write
+        @type xmlFile: C{str}
+
+        @return: L{Deferred}
+        """
+        rows = (yield self.query(
+            """
+            select UID, ENABLED, SERVERID, CALENDARING, ADDRESSBOOKS,
+                   LOGIN, AUTOSCHEDULE, AUTOSCHEDULEMODE, AUTOACCEPTGROUP
+              from AUGMENTS order by UID
+            """
+        ))
+        _ignore_etree, augments_node = newElementTreeWithRoot(xmlaugmentsparser.ELEMENT_AUGMENTS)
+        for row in rows:
+            self._addRecordToXMLDB(self._rowToRecord(row), augments_node)
+        writeXML(xmlFile, augments_node)
+
+    def _db_version(self):
+        """
+        @return: the schema version assigned to this index.
+        """
+        return AugmentADAPI.schema_version
+
+    def _db_type(self):
+        """
+        @return: the collection type assigned to this index.
+        """
+        return AugmentADAPI.schema_type
+
+    @inlineCallbacks
+    def _db_init_data_tables(self):
+        """
+        Initialize the underlying database tables.
+        """
+
+        #
+        # AUGMENTS table - the UID column is unique, and so indexed
+        #
+        yield self._create_table(
+            "AUGMENTS",
+            (
+                ("UID", "text unique"),
+                ("ENABLED", "text(1)"),
+                ("SERVERID", "text"),
+                ("CALENDARING", "text(1)"),
+                ("ADDRESSBOOKS", "text(1)"),
+                ("LOGIN", "text(1)"),
+                ("AUTOSCHEDULE", "text(1)"),
+                ("AUTOSCHEDULEMODE", "text"),
+                ("AUTOACCEPTGROUP", "text"),
+            ),
+            ifnotexists=True,
+        )
+
+        #
+        # AUGMENT_CHANGES table - log of changed UIDs
+        #
+        yield self._create_table(
+            "AUGMENT_CHANGES",
+            (
+                ("REVISION", "serial"),
+                ("UID", "text"),
+            ),
+            ifnotexists=True,
+        )
+
+    @inlineCallbacks
+    def _db_recreate(self):
+        """
+        Populate a new database from the configured augments XML files.
+        """
+        records = self._parseXMLFiles(self.xmlFiles)
+        if records:
+            log.info("Importing {count} augment records from XML", count=len(records))
+            yield self._db_add_records(records)
+
+    def _db_empty_data_tables(self):
+        """
+        Empty the underlying database tables.
+        """
+        return self._db_execute("delete from AUGMENTS")
+
+    @inlineCallbacks
+    def _db_remove_data_tables(self):
+        yield self._db_execute("drop table if exists AUGMENTS")
+        yield self._db_execute("drop table if exists AUGMENT_CHANGES")
+
+
+class AugmentSqliteDB(ADBAPISqliteMixin, AugmentADAPI):
+    """
+    Sqlite based augment database implementation.
+    """
+
+    def __init__(self, dbpath, xmlFiles=(), statSeconds=15):
+
+        self.dbpath = fullServerPath(config.DataRoot, dbpath)
+        ADBAPISqliteMixin.__init__(self)
+        AugmentADAPI.__init__(
+            self, "Augments", "sqlite3", (self.dbpath,),
+            xmlFiles=xmlFiles, statSeconds=statSeconds,
+        )
@@ -15,7 +15,8 @@
 ##
 
 from twistedcaldav.test.util import TestCase
-from twistedcaldav.directory.augment import AugmentXMLDB, AugmentRecord
+from twistedcaldav.directory.augment import AugmentXMLDB, AugmentRecord, \
+    AugmentSqliteDB
 from twisted.internet.defer import inlineCallbacks
 from twistedcaldav.directory.xmlaugmentsparser import XMLAugmentsParser
 import cStringIO
@@ -194,6 +195,69 @@ class AugmentTestsMixin(object):
         yield self._checkRecord(newdb, testModifyRecords[0])
 
 
+class AugmentSqliteTests(AugmentTests, AugmentTestsMixin):
+
+    def _db(self, dbpath=None):
+        return AugmentSqliteDB(dbpath if dbpath else os.path.abspath(self.mktemp()))
+
+    @inlineCallbacks
+    def test_invalidation(self):
+        """
+        Changes made by another process invalidate just the changed records
+        once the change log is checked.
+        """
+
+        dbpath = os.path.abspath(self.mktemp())
+        db = AugmentSqliteDB(dbpath, statSeconds=3600)
+        other = AugmentSqliteDB(dbpath)
+        yield other.importFromXML((xmlFile,))
+
+        yield self._checkRecord(db, testRecords[0])
+        yield self._checkRecord(db, testRecords[1])
+
+        changed = AugmentRecord(**testRecords[0])
+        changed.enabledForCalendaring = True
+        yield other.addAugmentRecords((changed,))
+
+        # Not checked for changes yet
+        record = yield db.getAugmentRecord(testRecords[0]["uid"], "users")
+        self.assertFalse(record.enabledForCalendaring)
+
+        db.lastCached = 0
+        record = yield db.getAugmentRecord(testRecords[0]["uid"], "users")
+        self.assertTrue(record.enabledForCalendaring)
+        self.assertTrue(testRecords[1]["uid"] in db.db)
+
+        # Falling behind a pruned change log drops everything
+        other.changeLogSize = 1
+        yield other.removeAugmentRecords((testRecords[2]["uid"],))
+        yield other.addAugmentRecords((AugmentRecord(**testAddRecords[0]),))
+        db.lastCached = 0
+        yield db.getAugmentRecord(testRecords[0]["uid"], "users")
+        self.assertFalse(testRecords[1]["uid"] in db.db)
+
+    @inlineCallbacks
+    def test_importExport(self):
+        """
+        Records exported to XML read back the same in an XML augment DB, and
+        a new database imports the configured XML files.
+        """
+
+        db = AugmentSqliteDB(os.path.abspath(self.mktemp()), xmlFiles=(xmlFile,))
+        for item in testRecords:
+            yield self._checkRecord(db, item)
+
+        exported = os.path.abspath(self.mktemp())
+        yield db.exportToXML(exported)
+        dbxml = AugmentXMLDB((exported,))
+        self.assertEqual(
+            sorted(dbxml.db.keys()),
+            sorted((yield db.getAllUIDs()))
+        )
+        for item in testRecords:
+            yield self._checkRecord(dbxml, item)
+
+
 class AugmentXMLTests(AugmentTests):
 
     @inlineCallbacks
@@ -67,6 +67,7 @@ from twistedcaldav.customxml import calendarserver_namespace
 from twistedcaldav.method.report import http_REPORT
 
 from twistedcaldav.config import config
+from twistedcaldav.memcachepool import defaultCachePool
 from txdav.who.directory import CalendarDirectoryRecordMixin
 from twext.who.expression import Operand, MatchType, MatchFlags
 
@@ -630,6 +631,33 @@ class DAVResource (
     def contentType(self):
         return MimeType("httpd", "unix-directory") if self.isCollection() else None
 
+    @property
+    def groupMembershipCacheSeconds(self):
+        # Group membership results can only be remembered when there are
+        # principal cache tokens to key them on
+        if config.EnableResponseCache and config.Memcached.Pools.Default.ClientEnabled:
+            return config.GroupMembershipCacheSeconds
+        else:
+            return 0
+
+    @inlineCallbacks
+    def groupMembershipCacheToken(self, principal, request):
+        """
+        Changes to group membership and to delegates change the response cache
+        token of the group or delegator principal, so use that token. Only
+        principal URLs in the /principals/__uids__/ form (including proxy
+        sub-principals) have a token.
+        """
+        segments = principal.strip("/").split("/")
+        if len(segments) not in (3, 4) or segments[:2] != ["principals", "__uids__"]:
+            returnValue(None)
+
+        url = "/principals/__uids__/{uid}/".format(uid=segments[2])
+        result = yield defaultCachePool("PrincipalToken").get("cacheToken:{url}".format(url=url))
+        if result is not None:
+            _ignore_flags, result = result
+        returnValue(result if result is not None else "")
+
 
 class DAVResourceWithChildrenMixin (object):
     """
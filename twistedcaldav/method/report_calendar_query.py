@@ -228,6 +228,10 @@ def report_urn_ietf_params_xml_ns_caldav_calendar_query(self, request, calendar_
                     inherited_aces=filteredaces
                 )
 
+                # Load the data for all readable resources in one go
+                if generate_calendar_data or not index_query_ok:
+                    yield calresource.prefetchChildData([child for child, _ignore_uri in ok_resources])
+
                 for child, child_uri in ok_resources:
                     child_uri_name = child_uri[child_uri.rfind("/") + 1:]
 
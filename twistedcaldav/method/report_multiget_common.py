@@ -201,6 +201,10 @@ def multiget_common(self, request, multiget, collection_type):
                 inherited_aces=filteredaces
             )
 
+            # Load the data for all valid readable resources in one go
+            if hasData:
+                yield self.prefetchChildData([resource for resource, _ignore_href in ok_resources])
+
             # Get properties for all valid readable resources
             for resource, href in ok_resources:
                 try:
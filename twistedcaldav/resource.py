@@ -1409,6 +1409,36 @@ class CalDAVResource (
         caldata = PrivateEventFilter(self.accessMode, isowner).filter(caldata)
         returnValue(caldata)
 
+    def prefetchChildData(self, children):
+        """
+        Pre-load the data of the specified child resources, so that reports
+        returning the data of many children avoid a query per child. Only
+        implemented by store-backed collections; see storebridge.
+
+        @param children: the child resources
+        @type children: C{list} of L{CalDAVResource}
+        """
+        return succeed(None)
+
+    @inlineCallbacks
+    def iCalendarTextForUser(self, request, format=None):
+        """
+        Return the calendar data of this resource, filtered and serialized for
+        the user making the request, as returned by a GET.
+
+        @param format: the MIME type of the data to return
+        @type format: C{str}
+
+        @return: the calendar data
+        @rtype: C{str}
+        """
+
+        # Non DAV:owner's have limited access to the data
+        isowner = (yield self.isOwner(request)) if self.accessMode else True
+
+        caldata = yield self.iCalendarFiltered(isowner)
+        returnValue(caldata.getTextWithTimezones(includeTimezones=not config.EnableTimezonesByReference, format=format))
+
     def component(self):
         # storebridge handles this method
         raise NotImplementedError()
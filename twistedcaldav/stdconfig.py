@@ -128,6 +128,11 @@ DEFAULT_AUGMENT_PARAMS = {
         "xmlFiles": [],
         "statSeconds": 15,
     },
+    "sqlite": {
+        "dbpath": "augments.sqlite",
+        "xmlFiles": [],  # Imported when the database is first created
+        "statSeconds": 15,  # How often to check for changes made by other processes
+    },
 }
 
 
@@ -535,6 +540,7 @@ DEFAULT_CONFIG = {
     "EnableAddMember": True,  # POST ;add-member extension
     "EnableSyncReport": True,  # REPORT collection-sync
     "EnableSyncReportHome": True,  # REPORT collection-sync on home collections
+    "SyncReportBatchSize": 5000,  # Revision rows read per query when working out sync REPORT changes
     "EnableConfigSyncToken": True,  # Sync token includes config component
     "EnableWellKnown": True,  # /.well-known resource
     "EnableCalendarQueryExtended": True,  # Extended calendar-query REPORT
@@ -565,6 +571,7 @@ DEFAULT_CONFIG = {
                                      # secondary service MUST define its own writable path if
                                      # not None
         "PrettyPrintJSON": True,    # User friendly JSON output
+        "ExpandCacheSize": 1000,    # Maximum number of cached observance expansions
 
         "SecondaryService": {
             # Only one of these should be used when a secondary service is used
@@ -672,6 +679,9 @@ DEFAULT_CONFIG = {
         "Enabled": True,
         "SyncTokenLifetimeDays": 14.0,     # Number of days that a client sync report token is valid
         "CleanupPeriodDays": 2.0,  # Number of days between revision cleanups
+        "CompactionEnabled": True,  # Remove superseded revision rows after each cleanup
+        "CompactionBatchSize": 100,  # Number of homes per table handled in each compaction batch
+        "CompactionBatchDelaySeconds": 10,  # Number of seconds between compaction batches
     },
 
     "InboxCleanup": {
@@ -743,6 +753,10 @@ DEFAULT_CONFIG = {
             "RemoteServers": "remoteservers.xml",  # iSchedule server configurations
             "SerialNumber": 1,  # Capabilities serial number
             "DNSDebug": "",  # File where a fake Bind zone exists for creating fake DNS results
+            "ConnectionPool": {  # Persistent connections to other servers
+                "Enabled": True,
+                "MaxClients": 4,  # Maximum number of concurrent connections to any one server
+            },
             "DKIM": {      # DKIM options
                 "Enabled": True,  # DKIM signing/verification enabled
                 "Domain": "",  # Domain for DKIM (defaults to ServerHostName)
@@ -769,6 +783,9 @@ DEFAULT_CONFIG = {
                 "Username": "",  # For account sending mail
                 "Password": "",  # For account sending mail
                 "SuppressionDays": 7,  # Messages for events older than this may days are not sent
+                "MaxSessions": 2,  # Maximum number of concurrent SMTP sessions
+                "MaxMessagesPerSession": 100,  # Messages sent over one SMTP session before reconnecting
+                "SessionIdleTimeout": 30,  # Seconds an idle SMTP session is kept open for reuse
             },
             "Receiving": {
                 "Server": "",  # Server to retrieve email messages from
@@ -872,6 +889,8 @@ DEFAULT_CONFIG = {
                 "Environment": "PRODUCTION",
                 "EnableStaggering": False,
                 "StaggerSeconds": 3,
+                "CoalesceSeconds": 0,  # Batch notifications for this many seconds, dropping duplicates (when not staggering)
+                "ProviderConnections": 1,  # Number of concurrent connections to the provider
                 "CalDAV": {
                     "Enabled": False,
                     "CertificatePath": "Certificates/apns:com.apple.calendar.cert.pem",
@@ -904,6 +923,12 @@ DEFAULT_CONFIG = {
         "Enabled": False,
         "SocketPath": "directory-proxy.sock",
         "InSidecarCachingSeconds": 120,
+        "SharedCache": {
+            "Enabled": False,  # DPS shares the records it looks up with the workers on this host via a memory mapped file
+            "Path": "directory-cache.mmap",
+            "SizeMB": 64,  # Size of the shared file
+            "Buckets": 65536,  # Number of hash index slots
+        },
     },
 
     "DirectoryCaching": {
@@ -931,6 +956,33 @@ DEFAULT_CONFIG = {
     "MaxRequests": 3,
     "MaxAccepts": 1,
 
+    # Adapt the limit on outstanding requests to the request latency reported
+    # by the workers. The limit varies between MinRequests and MaxRequests
+    # (both per process), shrinking when the smoothed latency exceeds
+    # TargetLatency (seconds).
+    "AdaptiveRequestLimit": {
+        "Enabled": False,
+        "MinRequests": 1,
+        "TargetLatency": 2.0,
+    },
+
+    # Send connections from the same client address to the same worker
+    # process (to keep its caches warm), unless that worker has more than
+    # Tolerance outstanding requests above the least loaded one.
+    "WorkerAffinity": {
+        "Enabled": False,
+        "Tolerance": 1,
+    },
+
+    # Hand parsing, validation and recurrence expansion of calendar data of at
+    # least MinSize bytes off to ProcessCount helper processes (per worker),
+    # so that very large calendar objects do not block the worker.
+    "CalendarDataOffload": {
+        "Enabled": False,
+        "ProcessCount": 2,
+        "MinSize": 256 * 1024,
+    },
+
     "MaxDBConnectionsPerPool": 10,  # The maximum number of outstanding database
     # connections per database connection pool.
     # When SharedConnectionPool (see above) is
@@ -1100,6 +1152,7 @@ DEFAULT_CONFIG = {
         "InitialSchedulingDelaySeconds": 10,
         "BatchSize": 100,
         "BatchSchedulingIntervalSeconds": 2,
+        "IncrementalRefresh": False,  # Only refresh groups whose membership in the directory has changed
     },
 
     "GroupAttendees": {
@@ -1132,6 +1185,14 @@ DEFAULT_CONFIG = {
     "EnableResponseCache": True,
     "ResponseCacheTimeout": 30,  # Minutes
 
+    # Seconds that ACL group membership results are remembered across
+    # requests. Needs the response cache, whose principal tokens are used to
+    # detect membership changes. 0 to disable.
+    "GroupMembershipCacheSeconds": 60,
+
+    "EnableCalendarRenderCache": True,  # Cache calendar data rendered for GET
+    "CalendarRenderCacheTimeout": 60,  # Minutes
+
     "EnableFreeBusyCache": True,
     "FreeBusyCacheDaysBack": 7,
     "FreeBusyCacheDaysForward": 12 * 7,
@@ -1306,6 +1367,7 @@ RELATIVE_PATHS = [
     ("RunRoot", "ControlSocket"),
     ("RunRoot", ("Memcached", "Pools", "Default", "MemcacheSocket")),
     ("RunRoot", ("DirectoryProxy", "SocketPath",)),
+    ("RunRoot", ("DirectoryProxy", "SharedCache", "Path",)),
     ("SocketRoot", ("SocketFiles", "Secured")),
     ("SocketRoot", ("SocketFiles", "Unsecured")),
 ]
@@ -1543,7 +1605,7 @@ def _postUpdateAugmentService(configDict, reloading=False):
                 del configDict.AugmentService.params[param]
 
     # Upgrading augments.xml must be done prior to using the store/directory
-    if configDict.AugmentService.type == "xml":
+    if configDict.AugmentService.type in ("xml", "sqlite"):
         for fileName in configDict.AugmentService.params.xmlFiles:
             if fileName[0] not in ("/", "."):
                 fileName = os.path.join(configDict.DataRoot, fileName)
@@ -41,6 +41,7 @@ from twistedcaldav.instance import (
     InvalidOverriddenInstanceError, TooManyInstancesError
 )
 from twistedcaldav.memcachelock import MemcacheLockTimeoutError
+from twistedcaldav.memcacher import Memcacher
 from twistedcaldav.notifications import NotificationCollectionResource, NotificationResource
 from twistedcaldav.resource import CalDAVResource, DefaultAlarmPropertyMixin, \
     requiresPermissions
@@ -465,6 +466,15 @@ class _CommonHomeChildCollectionMixin(_CommonStoreExceptionHandler):
 
         returnValue(result)
 
+    def prefetchChildData(self, children):
+        """
+        Pre-load the data of the specified child resources in bulk.
+        """
+        return self._newStoreObject.loadObjectResourceText([
+            child._newStoreObject for child in children
+            if getattr(child, "_newStoreObject", None) is not None
+        ])
+
     @inlineCallbacks
     def createCollection(self):
         """
@@ -2502,6 +2512,8 @@ class CalendarObjectResource(_CalendarObjectMetaDataMixin, _CommonObjectResource
 
     _componentFromStream = VCalendar.fromString
 
+    renderCacher = Memcacher("CalendarRender")
+
     def allowedTypes(self):
         """
         Return a tuple of allowed MIME types for storing.
@@ -2540,6 +2552,46 @@ class CalendarObjectResource(_CalendarObjectMetaDataMixin, _CommonObjectResource
     def componentForUser(self):
         return self._newStoreObject.componentForUser()
 
+    @inlineCallbacks
+    def iCalendarTextForUser(self, request, format=None):
+        """
+        Avoid parsing and re-serializing the calendar data when possible: data
+        that needs no per-user filtering or timezone fixups is returned as
+        stored, and other data is cached once rendered for a particular user
+        and format.
+        """
+
+        # Timezones by reference strips standard VTIMEZONEs, and otherwise
+        # missing ones are added, so only data with no timezones at all can be
+        # returned exactly as stored - whichever way that is configured
+        if format == "text/calendar":
+            text = yield self._newStoreObject.unfilteredText()
+            if text is not None and "TZID" not in text:
+                returnValue(text)
+
+        if not config.EnableCalendarRenderCache:
+            text = yield super(CalendarObjectResource, self).iCalendarTextForUser(request, format)
+            returnValue(text)
+
+        # Non DAV:owner's have limited access to the data
+        isowner = (yield self.isOwner(request)) if self.accessMode else True
+
+        # The MD5 changes whenever the data changes, so entries never need invalidating
+        key = "{}/{}/{}/{}/{}".format(
+            self._newStoreObject.id(),
+            self._newStoreObject.md5(),
+            self._newStoreParent.viewerHome().uid(),
+            format,
+            isowner,
+        )
+        text = yield self.renderCacher.get(key)
+        if text is None:
+            caldata = yield self.iCalendarFiltered(isowner)
+            text = caldata.getTextWithTimezones(includeTimezones=not config.EnableTimezonesByReference, format=format)
+            if len(text) <= Memcacher.MEMCACHE_VALUE_LIMIT:
+                yield self.renderCacher.set(key, text, expireTime=config.CalendarRenderCacheTimeout * 60)
+        returnValue(text)
+
     def validIfScheduleMatch(self, request):
         """
         Check to see if the given request's C{If-Schedule-Tag-Match} header
@@ -462,6 +462,46 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
         d.addCallback(self.assertResponse, expected_response)
         return d
 
+    def test_bodyHashNormalized(self):
+        """
+        Request bodies that differ only in line order hash the same, and the
+        hash of each raw body is remembered.
+        """
+        body1 = "<a/>\n<b/>"
+        body2 = "<b/>\n<a/>"
+        self.assertEquals(self.rc._hashBody(body1), hash("<a/>\n<b/>"))
+        self.assertEquals(self.rc._hashBody(body2), hash("<a/>\n<b/>"))
+        self.assertTrue(body1 in MemcacheResponseCache._bodyHashes)
+
+    @inlineCallbacks
+    def test_URIsRememberedOnRequest(self):
+        """
+        The canonicalized URIs for a request are only computed once.
+        """
+        request = StubRequest(
+            'PROPFIND',
+            '/calendars/users/cdaboo/',
+            '/principals/__uids__/cdaboo/')
+        uris = (yield self.rc._getURIs(request))
+        self.assertEquals(uris, ('/principals/__uids__/cdaboo/', '/calendars/__uids__/cdaboo/'))
+        StubRequest.resources = {}
+        self.assertEquals((yield self.rc._getURIs(request)), uris)
+
+    @inlineCallbacks
+    def test_recordTokenFromAuthnUser(self):
+        """
+        The directory record token for the authenticated principal is taken
+        from its record without locating the principal resource.
+        """
+        request = StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/')
+        request.authnUser.record = StubDirectoryRecord('cdaboo-authn')
+        StubRequest.resources = {}
+        token = (yield self.rc._tokenForRecord('/principals/__uids__/cdaboo/', request))
+        self.assertEquals(token, StubDirectoryRecord('cdaboo-authn').cacheToken())
+
 
 class StubResponseCacheResource(object):
 
@@ -16,10 +16,12 @@
 
 from twistedcaldav.timezones import TimezoneCache
 from twistedcaldav.timezonestdservice import TimezoneInfo, \
-    PrimaryTimezoneDatabase
+    PrimaryTimezoneDatabase, ExpandCache, TimezoneStdServiceResource
+from txweb2.http_headers import Headers
 from xml.etree.ElementTree import Element
 import hashlib
 import os
+import zlib
 import twistedcaldav.test.util
 
 
@@ -60,6 +62,34 @@ class TestTimezoneInfo (twistedcaldav.test.util.TestCase):
         self.assertEqual(info2.md5, hashed)
 
 
+class TestExpandCache (twistedcaldav.test.util.TestCase):
+    """
+    Timezone expansion cache tests
+    """
+
+    def test_evictsLeastRecentlyUsed(self):
+
+        cache = ExpandCache(2)
+        cache.put(("A", 1, 2), "a")
+        cache.put(("B", 1, 2), "b")
+        self.assertEqual(cache.get(("A", 1, 2)), "a")
+        cache.put(("C", 1, 2), "c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(("B", 1, 2)), None)
+        self.assertEqual(cache.get(("A", 1, 2)), "a")
+        self.assertEqual(cache.get(("C", 1, 2)), "c")
+
+    def test_removeTimezones(self):
+
+        cache = ExpandCache(10)
+        cache.put(("A", 1, 2), "a1")
+        cache.put(("A", 2, 3), "a2")
+        cache.put(("B", 1, 2), "b")
+        cache.removeTimezones(set(("A",)))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(("B", 1, 2)), "b")
+
+
 class TestPrimaryTimezoneDatabase (twistedcaldav.test.util.TestCase):
     """
     Timezone support tests
@@ -149,3 +179,69 @@ class TestPrimaryTimezoneDatabase (twistedcaldav.test.util.TestCase):
         tz1 = db.getTimezone("US/Eastern")
         self.assertTrue(str(tz1).find("VTIMEZONE") != -1)
         self.assertTrue(str(tz1).find("TZID:US/Eastern") != -1)
+
+    def testListChangedSinceIndex(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+
+        db.timezones["America/New_York"].dtstamp = "21000101T000000Z"
+        db._invalidate(set(("America/New_York",)))
+        tzids = [tz.tzid for tz in db.listTimezones(db.dtstamp)]
+        self.assertEqual(tzids, ["America/New_York"])
+
+    def testGetResponseCached(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+
+        self.assertEqual(db.getTimezoneResponse("Bogus", "text/calendar"), None)
+
+        etag1, data1 = db.getTimezoneResponse("America/New_York", "text/calendar")
+        self.assertTrue(data1.find("TZID:America/New_York") != -1)
+        self.assertEqual(etag1, hashlib.md5(data1).hexdigest())
+        self.assertTrue(db.getTimezoneResponse("America/New_York", "text/calendar")[1] is data1)
+
+        # Alias is cached independently and invalidated with its target
+        _ignore, data2 = db.getTimezoneResponse("US/Eastern", "text/calendar")
+        self.assertTrue(data2.find("TZID:US/Eastern") != -1)
+        db._invalidate(set(("America/New_York",)))
+        self.assertFalse(("America/New_York", "text/calendar") in db._responses)
+        self.assertFalse(("US/Eastern", "text/calendar") in db._responses)
+
+    def testGetListResponse(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+
+        etag, data, gzdata = db.getListResponse(False)
+        self.assertEqual(etag, hashlib.md5(data).hexdigest())
+        self.assertEqual(zlib.decompress(gzdata, 16 + zlib.MAX_WBITS), data)
+        self.assertTrue(db.getListResponse(False)[1] is data)
+
+        db.updateDatabase()
+        self.assertFalse(db.getListResponse(False)[1] is data)
+
+    def testListEncodingETags(self):
+
+        class FakeRequest(object):
+            def __init__(self, acceptEncoding=None):
+                self.args = {}
+                self.headers = Headers()
+                if acceptEncoding:
+                    self.headers.setRawHeaders("accept-encoding", [acceptEncoding])
+
+        xmlfile = self.mktemp()
+        resource = TimezoneStdServiceResource.__new__(TimezoneStdServiceResource)
+        resource.timezones = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        resource.timezones.createNewDatabase()
+
+        plain = resource.actionList(FakeRequest())
+        gzipped = resource.actionList(FakeRequest("gzip"))
+        self.assertEqual(gzipped.headers.getHeader("content-encoding"), ["gzip"])
+        self.assertNotEqual(plain.headers.getHeader("etag"), gzipped.headers.getHeader("etag"))
+        self.assertEqual(plain.headers.getHeader("vary"), ["accept-encoding"])
+        self.assertEqual(gzipped.headers.getHeader("vary"), ["accept-encoding"])
@@ -36,7 +36,7 @@ from twisted.internet.defer import maybeDeferred
 from twistedcaldav.config import config
 from twistedcaldav.ical import Component as VComponent
 from twistedcaldav.storebridge import DropboxCollection, \
-    CalendarCollectionResource
+    CalendarCollectionResource, CalendarObjectResource
 from twistedcaldav.test.util import StoreTestCase, SimpleStoreRequest
 from twistedcaldav.vcard import Component as VCComponent
 
@@ -59,6 +59,19 @@ def _todo(f, why):
 rewriteOrRemove = lambda f: _todo(f, "Rewrite or remove")
 
 
+test_utc_event_text = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:uid-utc
+DTSTART:20170101T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+SUMMARY:UTC event
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
 class FakeChanRequest(object):
     code = 'request-not-finished'
 
@@ -351,6 +364,48 @@ class WrappingTests(StoreTestCase):
         self.assertEquals(calDavFileCalendar._associatedTransaction,
                           calendarHome._associatedTransaction)
 
+    @inlineCallbacks
+    def test_iCalendarTextUnfiltered(self):
+        """
+        With the default configuration, calendar data with no timezones and
+        nothing to filter for the user is returned as stored, without being
+        parsed and rendered.
+        """
+        def iCalendarFiltered(*args, **kwargs):
+            self.fail("Calendar data was filtered")
+        self.patch(CalendarObjectResource, "iCalendarFiltered", iCalendarFiltered)
+
+        yield self.populateOneObject("1.ics", test_utc_event_text)
+        calendarObject = yield self.getResource(
+            "calendars/users/wsanchez/calendar/1.ics"
+        )
+        stored = yield calendarObject._newStoreObject._text()
+        text = yield calendarObject.iCalendarTextForUser(
+            self.requestUnderTest, "text/calendar"
+        )
+        yield self.commit()
+        self.assertEqual(text, stored)
+        self.assertTrue("DTSTART:20170101T100000Z" in text)
+
+    @inlineCallbacks
+    def test_iCalendarTextTimezonesByReference(self):
+        """
+        When timezones by reference are enabled, the calendar data rendered for
+        a user has its standard VTIMEZONEs removed rather than being returned
+        exactly as stored.
+        """
+        self.patch(config, "EnableTimezonesByReference", True)
+        yield self.populateOneObject("1.ics", test_event_text)
+        calendarObject = yield self.getResource(
+            "calendars/users/wsanchez/calendar/1.ics"
+        )
+        text = yield calendarObject.iCalendarTextForUser(
+            self.requestUnderTest, "text/calendar"
+        )
+        yield self.commit()
+        self.assertTrue("TZID=US/Pacific" in text)
+        self.assertTrue("BEGIN:VTIMEZONE" not in text)
+
     @inlineCallbacks
     def test_attachmentQuotaExceeded(self):
         """
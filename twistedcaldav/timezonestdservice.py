@@ -32,7 +32,7 @@ from txweb2.dav.noneprops import NonePropertyStore
 from txweb2.dav.util import joinURL
 from txweb2.http import HTTPError, JSONResponse, StatusResponse
 from txweb2.http import Response
-from txweb2.http_headers import MimeType
+from txweb2.http_headers import MimeType, ETag
 from txweb2.stream import MemoryStream
 from txdav.xml import element as davxml
 
@@ -55,11 +55,14 @@ from pycalendar.icalendar.calendar import Calendar
 from pycalendar.datetime import DateTime
 from pycalendar.exceptions import InvalidData
 
+import bisect
+import collections
 import hashlib
 import itertools
 import json
 import os
 import urllib
+import zlib
 
 log = Logger()
 
@@ -80,7 +83,6 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         DAVResource.__init__(self, principalCollections=parent.principalCollections())
 
         self.parent = parent
-        self.expandcache = {}
         self.primary = True
         self.info_source = None
 
@@ -342,18 +344,36 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             if not dt.utc():
                 self.problemReport("invalid-changedsince", "Invalid changedsince request-URI query parameter value - not UTC", responsecode.BAD_REQUEST)
 
-        timezones = []
-        for tz in self.timezones.listTimezones(changedsince):
-            timezones.append({
-                "tzid": tz.tzid,
-                "last-modified": tz.dtstamp,
-                "aliases": tz.aliases,
-            })
-        result = {
-            "dtstamp": self.timezones.dtstamp,
-            "timezones": timezones,
-        }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+        if changedsince:
+            timezones = []
+            for tz in self.timezones.listTimezones(changedsince):
+                timezones.append({
+                    "tzid": tz.tzid,
+                    "last-modified": tz.dtstamp,
+                    "aliases": tz.aliases,
+                })
+            result = {
+                "dtstamp": self.timezones.dtstamp,
+                "timezones": timezones,
+            }
+            return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+
+        # The full list only changes when the database does, so serve a pre-serialized
+        # (and possibly pre-compressed) copy of it
+        etag, data, gzdata = self.timezones.getListResponse(config.TimezoneService.PrettyPrintJSON)
+
+        # Each encoding is a different representation, so needs its own strong ETag
+        response = Response(responsecode.OK)
+        response.headers.setHeader("content-type", MimeType("application", "json"))
+        response.headers.setHeader("vary", ["accept-encoding"])
+        if request.headers.getHeader("accept-encoding", {}).get("gzip", 0):
+            response.stream = MemoryStream(gzdata)
+            response.headers.setHeader("content-encoding", ["gzip"])
+            response.headers.setHeader("etag", ETag(etag + "-gzip"))
+        else:
+            response.stream = MemoryStream(data)
+            response.headers.setHeader("etag", ETag(etag))
+        return response
 
     def actionGet(self, request, tzid):
         """
@@ -367,15 +387,16 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         if accepted_type is None:
             self.problemReport("invalid-format", "Accept header does not match available media types", responsecode.NOT_ACCEPTABLE)
 
-        calendar = self.timezones.getTimezone(tzid)
-        if calendar is None:
+        result = self.timezones.getTimezoneResponse(tzid, accepted_type)
+        if result is None:
             self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
+        etag, tzdata = result
 
-        tzdata = calendar.getText(format=accepted_type if accepted_type != "text/plain" else None)
-
+        # The strong ETag lets the standard precondition filter answer conditional GETs
         response = Response()
         response.stream = MemoryStream(tzdata)
         response.headers.setHeader("content-type", MimeType.fromString("%s; charset=utf-8" % (accepted_type,)))
+        response.headers.setHeader("etag", ETag(etag))
         return response
 
     def actionExpand(self, request, tzid):
@@ -419,10 +440,10 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
 
         # Now do the expansion (but use a cache to avoid re-calculating TZs)
-        observances = self.expandcache.get((tzid, start, end), None)
+        observances = self.timezones.expandcache.get((tzid, start, end))
         if observances is None:
             observances = tzexpandlocal(tzdata, start, end, utc_onset=True)
-            self.expandcache[(tzid, start, end)] = observances
+            self.timezones.expandcache.put((tzid, start, end), observances)
 
         # Turn into JSON
         result = {
@@ -543,9 +564,52 @@ class TimezoneInfo(object):
         xmlutil.addSubElement(node, "md5", self.md5)
 
 
+class ExpandCache(object):
+    """
+    A bounded cache of timezone expansions, keyed by (tzid, start, end), that evicts
+    the least recently used entry when full.
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return None
+        self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+
+    def removeTimezones(self, tzids):
+        """
+        Remove all expansions for the specified tzids.
+        """
+        for key in [key for key in self._entries if key[0] in tzids]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
 class CommonTimezoneDatabase(object):
     """
     Maintains the database of timezones read from an XML file.
+
+    Serialized responses for each tzid and format, and for the full timezone list, are
+    cached in memory and only rebuilt when the underlying data changes.
     """
 
     def __init__(self, basepath, xmlfile):
@@ -555,6 +619,11 @@ class CommonTimezoneDatabase(object):
         self.timezones = {}
         self.aliases = {}
 
+        self.expandcache = ExpandCache(config.TimezoneService.ExpandCacheSize)
+        self._responses = {}
+        self._listResponses = {}
+        self._dtstampIndex = None
+
     def onStartup(self):
         return succeed(None)
 
@@ -571,22 +640,112 @@ class CommonTimezoneDatabase(object):
                     self.timezones[tz.tzid] = tz
                     for alias in tz.aliases:
                         self.aliases[alias] = tz.tzid
+        self._invalidate()
+
+    def _invalidate(self, tzids=None):
+        """
+        Discard cached responses after the timezone data has changed.
+
+        @param tzids: the tzids whose data changed, or C{None} if everything may have changed
+        @type tzids: L{set} or C{None}
+        """
+        self._listResponses = {}
+        self._dtstampIndex = None
+        if tzids is None:
+            self._responses = {}
+            self.expandcache.clear()
+        else:
+            # Aliases share the data of the timezone they point to
+            tzids = set(tzids)
+            tzids.update([alias for alias, tzid in self.aliases.items() if tzid in tzids])
+            for key in [key for key in self._responses if key[0] in tzids]:
+                del self._responses[key]
+            self.expandcache.removeTimezones(tzids)
+
+    def _buildDtstampIndex(self):
+        """
+        Build parallel lists of dtstamps and tzids sorted by dtstamp for fast changedsince
+        lookups.
+        """
+        index = sorted([
+            (tzinfo.dtstamp, tzid)
+            for tzid, tzinfo in self.timezones.items()
+            if tzid not in self.aliases
+        ])
+        self._dtstampIndex = ([item[0] for item in index], [item[1] for item in index],)
 
     def listTimezones(self, changedsince):
         """
         List timezones (not aliases) possibly changed since a particular dtstamp.
         """
 
-        for tzid, tzinfo in sorted(self.timezones.items(), key=lambda x: x[0]):
-            # Ignore those that are aliases
-            if tzid in self.aliases:
-                continue
+        if changedsince:
+            # Use the dtstamp index to find only the changed ones
+            if self._dtstampIndex is None:
+                self._buildDtstampIndex()
+            dtstamps, tzids = self._dtstampIndex
+            tzids = sorted(tzids[bisect.bisect_right(dtstamps, changedsince):])
+        else:
+            tzids = sorted([tzid for tzid in self.timezones if tzid not in self.aliases])
+
+        for tzid in tzids:
+            yield self.timezones[tzid]
+
+    def getListResponse(self, pretty):
+        """
+        Get the serialized JSON list of all timezones.
+
+        @param pretty: whether to pretty-print the JSON
+        @type pretty: L{bool}
+
+        @return: a tuple of the ETag value, the JSON data and the gzip-compressed JSON data
+        @rtype: L{tuple}
+        """
+        result = self._listResponses.get(pretty)
+        if result is None:
+            jobj = {
+                "dtstamp": self.dtstamp,
+                "timezones": [
+                    {
+                        "tzid": tz.tzid,
+                        "last-modified": tz.dtstamp,
+                        "aliases": tz.aliases,
+                    } for tz in self.listTimezones(None)
+                ],
+            }
+            kwargs = {}
+            if pretty:
+                kwargs["indent"] = 2
+                kwargs["separators"] = (',', ':')
+            data = json.dumps(jobj, **kwargs)
+            compress = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            gzdata = compress.compress(data) + compress.flush()
+            result = (hashlib.md5(data).hexdigest(), data, gzdata,)
+            self._listResponses[pretty] = result
+        return result
+
+    def getTimezoneResponse(self, tzid, format):
+        """
+        Get the serialized data for the requested timezone.
 
-            # Detect timestamp changes
-            if changedsince and tzinfo.dtstamp <= changedsince:
-                continue
+        @param tzid: the timezone to get
+        @type tzid: L{str}
+        @param format: the media type to serialize to
+        @type format: L{str}
 
-            yield tzinfo
+        @return: a tuple of the ETag value and the serialized data, or C{None} if the
+            timezone does not exist
+        @rtype: L{tuple} or C{None}
+        """
+        result = self._responses.get((tzid, format))
+        if result is None:
+            calendar = self.getTimezone(tzid)
+            if calendar is None:
+                return None
+            data = calendar.getText(format=format if format != "text/plain" else None)
+            result = (hashlib.md5(data).hexdigest(), data,)
+            self._responses[(tzid, format)] = result
+        return result
 
     def getTimezone(self, tzid):
         """
@@ -710,6 +869,7 @@ class PrimaryTimezoneDatabase(CommonTimezoneDatabase):
         self._scanTZs("", checkIfChanged=True)
         if self.changeCount:
             self._dumpTZs()
+        self._invalidate(self.changed)
 
 
 class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
@@ -775,6 +935,7 @@ class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
         self.dtstamp = newdtstamp
         self._dumpTZs()
         self._buildAliases()
+        self._invalidate(newtzids | changedtzids)
 
         log.debug("Sync with secondary server complete")
 
@@ -897,5 +1058,6 @@ class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
         try:
             os.remove(tzpath)
             del self.timezones[tzid]
+            self._invalidate(set((tzid,)))
         except IOError, e:
             log.error("Unable to write calendar file for {tzid}: {ex}", tzid=tzid, ex=str(e))
@@ -952,6 +952,7 @@ def migrateAutoSchedule(config, directory):
     augmentService = None
     serviceClass = {
         "xml": "twistedcaldav.directory.augment.AugmentXMLDB",
+        "sqlite": "twistedcaldav.directory.augment.AugmentSqliteDB",
     }
     augmentClass = namedClass(serviceClass[config.AugmentService.type])
     try:
@@ -0,0 +1,352 @@
+# -*- test-case-name: txdav.caldav.datastore.test.test_offload -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Offloading of CPU-heavy iCalendar processing to helper processes.
+
+Parsing, validating and expanding the recurrences of very large calendar
+objects can block a worker's reactor for a long time. When enabled, a
+L{CalendarDataOffloadService} runs a small pool of helper processes that do
+that work for calendar data above a size threshold. Results come back in a
+compact form: the fixed-up calendar text (only when fixes were made) and the
+problems found for validation, and a L{CompactInstanceList} for recurrence
+expansion.
+"""
+
+__all__ = [
+    "OffloadError",
+    "CompactInstance",
+    "CompactInstanceList",
+    "CalendarDataOffloadService",
+    "installCalendarDataOffload",
+    "calendarDataOffload",
+]
+
+from twext.internet.spawnsvc import SpawnerService
+from twext.python.log import Logger
+
+from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.protocols.basic import Int32StringReceiver
+
+from twistedcaldav.config import config
+from twistedcaldav.ical import Component, InvalidICalendarDataError
+from twistedcaldav.instance import InvalidOverriddenInstanceError, \
+    TooManyInstancesError
+from twistedcaldav.timezones import TimezoneCache
+
+import collections
+import cPickle
+
+log = Logger()
+
+_offloadService = None
+
+
+def installCalendarDataOffload(service):
+    """
+    Install the L{CalendarDataOffloadService} to use in this process.
+
+    @param service: the service, or C{None} to disable offloading
+    @type service: L{CalendarDataOffloadService} or C{None}
+    """
+    global _offloadService
+    _offloadService = service
+
+
+def calendarDataOffload():
+    """
+    @return: the L{CalendarDataOffloadService} to use in this process, or
+        C{None} if offloading is disabled.
+    """
+    return _offloadService
+
+
+class OffloadError(Exception):
+    """
+    The helper process failed to process a request for a reason other than
+    bad calendar data - callers should do the work themselves.
+    """
+
+
+class CompactInstance(object):
+    """
+    A recurrence instance as returned by a helper process: just the values
+    needed for time-range indexing, without the (large) component.
+    """
+
+    def __init__(self, rid, start, end, transp, fbtype):
+        self.rid = rid
+        self.start = start
+        self.end = end
+        self.transp = transp
+        self.fbtype = fbtype
+
+
+class CompactInstanceList(object):
+    """
+    The equivalent of an L{InstanceList} built from L{CompactInstance}s.
+    """
+
+    def __init__(self, instances, limit, lowerLimit):
+        self.instances = instances
+        self.limit = limit
+        self.lowerLimit = lowerLimit
+
+    def __iter__(self):
+        # Return keys in sorted order via iterator
+        for i in sorted(self.instances.keys()):
+            yield i
+
+    def __getitem__(self, key):
+        return self.instances[key]
+
+    @classmethod
+    def fromInstanceList(cls, instances):
+        """
+        Create from a full L{InstanceList}.
+        """
+        return cls(
+            dict([
+                (
+                    key,
+                    CompactInstance(
+                        instance.rid,
+                        instance.start,
+                        instance.end,
+                        instance.component.adjustedTransp() == "TRANSPARENT",
+                        instance.component.getFBType(),
+                    ),
+                )
+                for key, instance in instances.instances.items()
+            ]),
+            instances.limit,
+            instances.lowerLimit,
+        )
+
+
+# Errors that are passed back from the helper process and re-raised in the
+# calling process
+_errorsByName = {
+    "InvalidICalendarDataError": lambda args: InvalidICalendarDataError(*args),
+    "InvalidOverriddenInstanceError": lambda args: InvalidOverriddenInstanceError(*args),
+    "TooManyInstancesError": lambda args: TooManyInstancesError(),
+}
+
+
+class CalendarDataOffloadWorker(Int32StringReceiver):
+    """
+    Protocol run in a helper process that processes calendar data. Each
+    request is a pickled (command, arguments) tuple, and each response a
+    pickled (error name or C{None}, result) tuple.
+    """
+
+    MAX_LENGTH = 256 * 1024 * 1024
+
+    def stringReceived(self, data):
+        command, args = cPickle.loads(data)
+        try:
+            result = (None, getattr(self, "command_%s" % (command,))(*args),)
+        except InvalidICalendarDataError, e:
+            result = ("InvalidICalendarDataError", (str(e),),)
+        except InvalidOverriddenInstanceError, e:
+            result = ("InvalidOverriddenInstanceError", (e.rid,),)
+        except TooManyInstancesError:
+            result = ("TooManyInstancesError", (),)
+        except Exception, e:
+            log.failure("Failed to process offloaded {command}", command=command)
+            result = ("error", (str(e),),)
+        try:
+            response = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        except Exception, e:
+            log.failure("Failed to return offloaded {command}", command=command)
+            response = cPickle.dumps(("error", (str(e),),), cPickle.HIGHEST_PROTOCOL)
+        self.sendString(response)
+
+    def command_configure(self, configFile):
+        """
+        Load the server configuration and set up the timezone database so
+        that data processing matches that done in the server.
+        """
+        if configFile:
+            config.load(configFile)
+        TimezoneCache.create()
+
+    def command_validate(self, text):
+        """
+        Parse and validate (fixing where possible) calendar data.
+
+        @return: a tuple of the fixed calendar text (C{None} if nothing was
+            fixed), the fixed problems and the unfixed problems
+        """
+        component = Component.fromString(text)
+        fixed, unfixed = component.validCalendarData(doFix=True, doRaise=False)
+        return (str(component) if fixed else None, fixed, unfixed,)
+
+    def command_expand(self, text, limit, lowerLimit, ignoreInvalidInstances):
+        """
+        Expand the recurrences of calendar data.
+
+        @return: a L{CompactInstanceList}
+        """
+        component = Component.fromString(text)
+        instances = component.expandTimeRanges(
+            limit, lowerLimit=lowerLimit, ignoreInvalidInstances=ignoreInvalidInstances
+        )
+        return CompactInstanceList.fromInstanceList(instances)
+
+
+class CalendarDataOffloadClient(Int32StringReceiver):
+    """
+    Protocol run in the server process to talk to a helper process. The
+    helper processes requests in order, so responses are matched to requests
+    first-in, first-out.
+    """
+
+    MAX_LENGTH = 256 * 1024 * 1024
+
+    def __init__(self, service=None):
+        self.service = service
+        self._pending = collections.deque()
+        self.connected = False
+
+    def connectionMade(self):
+        self.connected = True
+
+    def connectionLost(self, reason):
+        self.connected = False
+        pending, self._pending = self._pending, collections.deque()
+        for d in pending:
+            d.errback(OffloadError("Helper process went away"))
+        if self.service is not None:
+            self.service.workerLost(self)
+
+    def outstanding(self):
+        """
+        The number of requests waiting for a response.
+        """
+        return len(self._pending)
+
+    def callRemote(self, command, *args):
+        """
+        Send a request to the helper process.
+
+        @return: a L{Deferred} that fires with the result.
+        """
+        if not self.connected:
+            raise OffloadError("Helper process not connected")
+        d = Deferred()
+        self._pending.append(d)
+        self.sendString(cPickle.dumps((command, args,), cPickle.HIGHEST_PROTOCOL))
+        return d
+
+    def stringReceived(self, data):
+        errorName, result = cPickle.loads(data)
+        d = self._pending.popleft()
+        if errorName is None:
+            d.callback(result)
+        elif errorName in _errorsByName:
+            d.errback(_errorsByName[errorName](result))
+        else:
+            d.errback(OffloadError(*result))
+
+
+class CalendarDataOffloadService(SpawnerService, object):
+    """
+    Runs a pool of helper processes that parse, validate and expand large
+    calendar data, and dispatches requests to the least busy one.
+
+    @ivar minSize: calendar data smaller than this is processed in-process
+    @type minSize: L{int}
+    """
+
+    def __init__(self, processCount, minSize, configFile=None):
+        super(CalendarDataOffloadService, self).__init__()
+        self.processCount = processCount
+        self.minSize = minSize
+        self.configFile = configFile
+        self.workers = []
+
+    def startService(self):
+        super(CalendarDataOffloadService, self).startService()
+        for _ignore in range(self.processCount):
+            self._startWorker()
+
+    def stopService(self):
+        self.workers = []
+        return super(CalendarDataOffloadService, self).stopService()
+
+    @inlineCallbacks
+    def _startWorker(self):
+        try:
+            worker = yield self.spawn(CalendarDataOffloadClient(self), CalendarDataOffloadWorker)
+            yield worker.callRemote("configure", self.configFile)
+        except Exception:
+            log.failure("Unable to start calendar data helper process")
+        else:
+            if self.running:
+                self.workers.append(worker)
+
+    def workerLost(self, worker):
+        """
+        A helper process went away - replace it.
+        """
+        if worker in self.workers:
+            self.workers.remove(worker)
+            if self.running:
+                self._startWorker()
+
+    def wantsOffload(self, size):
+        """
+        Determine whether calendar data of the given size should be processed
+        by a helper process.
+
+        @param size: the length of the serialized calendar data
+        @type size: L{int}
+        """
+        return size >= self.minSize and len(self.workers) != 0
+
+    def _callRemote(self, command, *args):
+        if not self.workers:
+            raise OffloadError("No helper processes available")
+        worker = min(self.workers, key=lambda x: x.outstanding())
+        return worker.callRemote(command, *args)
+
+    def validate(self, text):
+        """
+        Parse and validate calendar data, fixing what can be fixed.
+
+        @param text: the calendar data
+        @type text: L{str}
+
+        @return: a L{Deferred} firing with a tuple of the fixed calendar text
+            (C{None} if nothing needed fixing), the list of fixed problems and
+            the list of unfixed problems. Fails with L{InvalidICalendarDataError}
+            if the data cannot be parsed, or L{OffloadError} if the helper
+            could not do the work.
+        """
+        return self._callRemote("validate", text)
+
+    def expandTimeRanges(self, text, limit, lowerLimit, ignoreInvalidInstances):
+        """
+        Expand the recurrences of calendar data. Arguments match those of
+        L{Component.expandTimeRanges}.
+
+        @return: a L{Deferred} firing with a L{CompactInstanceList}. Fails
+            with the same errors as L{Component.expandTimeRanges}, or with
+            L{OffloadError} if the helper could not do the work.
+        """
+        return self._callRemote("expand", text, limit, lowerLimit, ignoreInvalidInstances)
@@ -255,9 +255,25 @@ class MailReceiver(object):
     INCOMPLETE_DSN = 7
     UNKNOWN_FAILURE = 8
 
-    def __init__(self, store, directory):
+    def __init__(self, store, directory, smtpSender=None):
         self.store = store
         self.directory = directory
+        self._smtpSender = smtpSender
+
+    def smtpSender(self):
+        """
+        The L{SMTPSender} used to forward replies to organizers, created on
+        first use and then reused so that its pooled SMTP sessions are shared
+        by all the replies this receiver forwards.
+
+        @return: an L{SMTPSender}
+        """
+        if self._smtpSender is None:
+            settings = config.Scheduling["iMIP"]["Sending"]
+            self._smtpSender = SMTPSender(
+                settings.Username, settings.Password,
+                settings.UseSSL, settings.Server, settings.Port)
+        return self._smtpSender
 
     def checkDSN(self, message):
         # returns (isdsn, action, icalendar attachment)
@@ -433,11 +449,6 @@ class MailReceiver(object):
                     "Don't have an email address for the organizer; ignoring reply.")
                 returnValue(self.NO_ORGANIZER_ADDRESS)
 
-            settings = config.Scheduling["iMIP"]["Sending"]
-            smtpSender = SMTPSender(
-                settings.Username, settings.Password,
-                settings.UseSSL, settings.Server, settings.Port)
-
             del msg["From"]
             msg["From"] = fromAddr
             del msg["Reply-To"]
@@ -445,7 +456,7 @@ class MailReceiver(object):
             del msg["To"]
             msg["To"] = toAddr
             log.warn("Mail gateway forwarding reply back to organizer")
-            yield smtpSender.sendMessage(fromAddr, toAddr, SMTPSender.betterMessageID(), msg.as_string())
+            yield self.smtpSender().sendMessage(fromAddr, toAddr, SMTPSender.betterMessageID(), msg.as_string())
             returnValue(self.REPLY_FORWARDED_TO_ORGANIZER)
 
         # Process the imip attachment; inject to calendar server
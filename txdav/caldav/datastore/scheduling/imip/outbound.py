@@ -21,6 +21,7 @@ Outbound IMIP mail handling for Calendar Server
 from __future__ import with_statement
 
 from cStringIO import StringIO
+import collections
 import os
 import re
 
@@ -304,11 +305,15 @@ class MailSender(object):
     """
     log = Logger()
 
+    # Number of rendered message bodies to keep
+    renderCacheSize = 100
+
     def __init__(self, address, suppressionDays, smtpSender, language):
         self.address = address
         self.suppressionDays = suppressionDays
         self.smtpSender = smtpSender
         self.language = language
+        self._renderCache = collections.OrderedDict()
 
     @inlineCallbacks
     def outbound(self, txn, originator, recipient, calendar, onlyAfter=None):
@@ -548,44 +553,24 @@ class MailSender(object):
             the full MIME message, ready for transport over SMTP.
         """
 
-        details = self.getEventDetails(calendar, language=language)
         canceled = (calendar.propertyValue("METHOD") == "CANCEL")
 
-        subjectFormat, labels = localizedLabels(language, canceled, inviteState)
-        details.update(labels)
-
-        details['subject'] = subjectFormat % {'summary': details['summary']}
-
-        plainText = self.renderPlainText(details, (orgCN, orgEmail),
-                                         attendees, canceled)
-
-        htmlText = self.renderHTML(
-            details, (orgCN, orgEmail), attendees, canceled
+        subject, msgAlt = self.renderBody(
+            inviteState, calendar, orgEmail, orgCN, attendees, canceled,
+            language
         )
 
         msg = MIMEMultipart()
         msg["From"] = fromAddress
-        msg["Subject"] = self._scrubHeader(details['subject'])
+        msg["Subject"] = self._scrubHeader(subject)
         msg["Reply-To"] = self._scrubHeader(replyToAddress)
         msg["To"] = self._scrubHeader(toAddress)
         msg["Date"] = rfc822date()
         msgId = SMTPSender.betterMessageID()
         msg["Message-ID"] = msgId
 
-        msgAlt = MIMEMultipart("alternative")
         msg.attach(msgAlt)
 
-        # plain version
-        msgPlain = MIMEText(plainText, "plain", "UTF-8")
-        msgAlt.attach(msgPlain)
-
-        # html version
-        msgHtmlRelated = MIMEMultipart("related", type="text/html")
-        msgAlt.attach(msgHtmlRelated)
-
-        msgHtml = MIMEText(htmlText, "html", "UTF-8")
-        msgHtmlRelated.attach(msgHtml)
-
         # the icalendar attachment
 
         # Make sure we always have the timezones used in the calendar data as iMIP requires VTIMEZONE
@@ -604,6 +589,78 @@ class MailSender(object):
 
         return msgId, msg.as_string()
 
+    def renderBody(self, inviteState, calendar, orgEmail, orgCN, attendees,
+                   canceled, language):
+        """
+        Render the subject and the human readable (plain text and HTML) parts
+        of a message. These do not depend on the recipient, so when the same
+        event is sent to many recipients they are only rendered once.
+
+        @return: a 2-tuple of the subject (C{unicode}) and the
+            C{multipart/alternative} L{MIMEMultipart} with the rendered parts.
+            The part is shared between messages, so it must only be attached
+            and serialized (serializing it sets the MIME boundaries of its
+            parts the first time, and later messages reuse them).
+        """
+
+        # The organizer updates DTSTAMP whenever the event changes. For
+        # messages containing only overridden instances the main component is
+        # the first of those, so identify the instance too.
+        component = calendar.mainComponent()
+        key = (
+            component.propertyValue("UID"),
+            component.propertyValue("SEQUENCE"),
+            str(component.getProperty("DTSTAMP")),
+            str(component.getProperty("RECURRENCE-ID")),
+            str(component.getProperty("DTSTART")),
+            inviteState,
+            orgEmail,
+            orgCN,
+            tuple(attendees),
+            canceled,
+            language,
+        )
+        try:
+            rendered = self._renderCache.pop(key)
+        except KeyError:
+            rendered = None
+        if rendered is None:
+            details = self.getEventDetails(calendar, language=language)
+
+            subjectFormat, labels = localizedLabels(language, canceled, inviteState)
+            details.update(labels)
+
+            details['subject'] = subjectFormat % {'summary': details['summary']}
+
+            plainText = self.renderPlainText(details, (orgCN, orgEmail),
+                                             attendees, canceled)
+
+            htmlText = self.renderHTML(
+                details, (orgCN, orgEmail), attendees, canceled
+            )
+
+            msgAlt = MIMEMultipart("alternative")
+
+            # plain version
+            msgPlain = MIMEText(plainText, "plain", "UTF-8")
+            msgAlt.attach(msgPlain)
+
+            # html version
+            msgHtmlRelated = MIMEMultipart("related", type="text/html")
+            msgAlt.attach(msgHtmlRelated)
+
+            msgHtml = MIMEText(htmlText, "html", "UTF-8")
+            msgHtmlRelated.attach(msgHtml)
+
+            rendered = (details['subject'], msgAlt,)
+
+        # Most recently used entries go last
+        self._renderCache[key] = rendered
+        while len(self._renderCache) > self.renderCacheSize:
+            self._renderCache.popitem(last=False)
+
+        return rendered
+
     def renderPlainText(self, details, (orgCN, orgEmail), attendees, canceled):
         """
         Render text/plain message part based on invitation details and a flag
@@ -25,21 +25,318 @@ from twext.internet.gaiendpoint import GAIEndpoint
 from twext.internet.ssl import simpleClientContextFactory
 from twext.python.log import Logger
 from twisted.internet import defer, reactor as _reactor
-from twisted.mail.smtp import ESMTPSenderFactory, messageid
+from twisted.internet.protocol import ClientFactory
+from twisted.mail.smtp import ESMTPSender, SMTPClient, SMTPDeliveryError, \
+    SMTPConnectError, DNSNAME, messageid
 from twistedcaldav.config import config
 
+import collections
+
 log = Logger()
 
 
+class _QueuedMessage(object):
+    """
+    A message waiting to be sent by an L{SMTPSenderPool}.
+    """
+
+    def __init__(self, fromAddr, toAddr, message):
+        self.fromAddr = fromAddr
+        self.toAddr = toAddr
+        self.message = message
+        self.deferred = defer.Deferred()
+        self.attempts = 0
+
+
+class PooledESMTPSender(ESMTPSender):
+    """
+    An ESMTP client that sends messages queued in an L{SMTPSenderPool} over a
+    single session, issuing RSET between messages, and waits (up to the pool's
+    idle timeout) for more messages once the queue is empty.
+    """
+
+    def __init__(self, pool, *args, **kw):
+        ESMTPSender.__init__(self, *args, **kw)
+        self.pool = pool
+        self.current = None
+        self.sentCount = 0
+        self.usable = True
+        self.ready = False
+        self.error = None
+
+    def smtpState_from(self, code, resp):
+        if not self.ready:
+            # Greeting, EHLO, STARTTLS and AUTH all succeeded
+            self.ready = True
+            self.pool.sessionReady(self)
+        if self.usable and self.sentCount < self.pool.maxMessagesPerSession and not self.pool.hasQueued():
+            # Nothing to send right now - keep the session open for a while
+            self.setTimeout(self.pool.idleTimeout)
+            self.pool.sessionIdle(self)
+        else:
+            ESMTPSender.smtpState_from(self, code, resp)
+
+    def resume(self):
+        """
+        Start sending queued messages on an idle session.
+        """
+        self.setTimeout(self.timeout)
+        ESMTPSender.smtpState_from(self, 250, "")
+
+    def getMailFrom(self):
+        if self.usable and self.sentCount < self.pool.maxMessagesPerSession:
+            self.current = self.pool.nextMessage()
+        if self.current is None:
+            # Either the queue is empty or this session has sent its share -
+            # the session will be closed
+            self.usable = False
+            self.pool.sessionDone(self)
+            return None
+        self.current.attempts += 1
+        return self.current.fromAddr
+
+    def getMailTo(self):
+        return [self.current.toAddr]
+
+    def getMailData(self):
+        # per http://trac.calendarserver.org/ticket/416 ...
+        return StringIO(self.current.message.replace("\r\n", "\n"))
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        current, self.current = self.current, None
+        self.sentCount += 1
+        if 200 <= code < 300:
+            current.deferred.callback((numOk, addresses,))
+        else:
+            current.deferred.errback(SMTPDeliveryError(code, resp, log))
+
+    def sendError(self, exc):
+        self.usable = False
+        self.error = exc
+        if self.ready:
+            # A session that failed during setup is handled by the pool once
+            # its connection has gone
+            self.pool.sessionDone(self)
+        current, self.current = self.current, None
+        if current is not None:
+            current.deferred.errback(exc)
+        SMTPClient.sendError(self, exc)
+
+    def connectionLost(self, reason):
+        ESMTPSender.connectionLost(self, reason)
+        self.usable = False
+        current, self.current = self.current, None
+        self.pool.sessionLost(self, current, reason)
+
+
+class _PooledSMTPFactory(ClientFactory):
+    """
+    Factory for the sessions of an L{SMTPSenderPool}.
+    """
+
+    protocol = PooledESMTPSender
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def buildProtocol(self, addr):
+        pool = self.pool
+        p = self.protocol(pool, pool.username, pool.password, pool.contextFactory, DNSNAME)
+        p.heloFallback = False
+        p.requireAuthentication = False
+        p.requireTransportSecurity = pool.useSSL
+        p.factory = self
+        p.timeout = pool.timeout
+        p.callLater = pool.reactor.callLater
+        pool.sessionConnected(p)
+        return p
+
+    def clientConnectionFailed(self, connector, reason):
+        self.pool.connectionFailed(reason)
+
+
+class SMTPSenderPool(object):
+    """
+    Sends messages over a bounded number of SMTP sessions, each of which sends
+    a number of messages before being closed, rather than connecting to the
+    SMTP server for every message.
+
+    @ivar maxSessions: the maximum number of concurrent SMTP sessions
+    @type maxSessions: L{int}
+    @ivar maxMessagesPerSession: the number of messages after which a session
+        is closed and a new one started
+    @type maxMessagesPerSession: L{int}
+    @ivar idleTimeout: how long an idle session is kept open (seconds)
+    @type idleTimeout: L{int}
+    @ivar maxSetupFailures: the number of consecutive sessions that can fail
+        before sending a message (e.g. the server's greeting or AUTH was
+        refused) before the queued messages are failed
+    @type maxSetupFailures: L{int}
+    @ivar retryDelay: the delay before starting a new session after the first
+        setup failure (seconds), doubled for each further consecutive failure
+    @type retryDelay: L{int}
+    """
+
+    timeout = 60
+    maxAttempts = 2
+    maxSetupFailures = 3
+    retryDelay = 5
+
+    def __init__(
+        self, username, password, useSSL, server, port,
+        maxSessions=2, maxMessagesPerSession=100, idleTimeout=30, reactor=None
+    ):
+        self.username = username
+        self.password = password
+        self.useSSL = useSSL
+        self.server = server
+        self.port = port
+        self.maxSessions = maxSessions
+        self.maxMessagesPerSession = maxMessagesPerSession
+        self.idleTimeout = idleTimeout
+        if reactor is None:
+            reactor = _reactor
+        self.reactor = reactor
+
+        self.contextFactory = simpleClientContextFactory(server) if useSSL else None
+        self._queue = collections.deque()
+        self._connecting = 0
+        self._sessions = set()
+        self._idle = []
+        self._setupFailures = 0
+        self._retryCall = None
+
+    def send(self, fromAddr, toAddr, message):
+        """
+        Queue a message for sending.
+
+        @return: a L{Deferred} that fires when the message has been accepted
+            by the SMTP server, or fails if it could not be sent.
+        """
+        queued = _QueuedMessage(fromAddr, toAddr, message)
+        self._queue.append(queued)
+        self._dispatch()
+        return queued.deferred
+
+    def hasQueued(self):
+        return len(self._queue) != 0
+
+    def nextMessage(self):
+        """
+        @return: the next L{_QueuedMessage} to send, or C{None}
+        """
+        return self._queue.popleft() if self._queue else None
+
+    def _dispatch(self):
+        """
+        Hand queued messages to idle sessions, and start new sessions if there
+        are more queued messages than sessions to send them.
+        """
+        while self._queue and self._idle:
+            self._idle.pop().resume()
+        if self._retryCall is not None:
+            # Backing off after sessions failed to set up
+            return
+        while len(self._queue) > self._connecting and len(self._sessions) + self._connecting < self.maxSessions:
+            self._connecting += 1
+            self._connect()
+
+    def _connect(self):
+        connect(GAIEndpoint(self.reactor, self.server, self.port), _PooledSMTPFactory(self))
+
+    def sessionConnected(self, session):
+        self._connecting -= 1
+        self._sessions.add(session)
+
+    def sessionReady(self, session):
+        """
+        The session is ready to send messages.
+        """
+        self._setupFailures = 0
+
+    def sessionIdle(self, session):
+        self._idle.append(session)
+        self._dispatch()
+
+    def sessionDone(self, session):
+        """
+        The session will not send any more messages.
+        """
+        if session in self._idle:
+            self._idle.remove(session)
+        self._sessions.discard(session)
+        self._dispatch()
+
+    def sessionLost(self, session, current, reason):
+        """
+        The connection for a session went away - retry the message it was
+        sending (the server may have dropped an idle connection just as it was
+        reused), and start new sessions for any queued messages.
+        """
+        if not session.ready:
+            self._setupFailed(session, reason)
+            return
+        self.sessionDone(session)
+        if current is not None:
+            if current.attempts < self.maxAttempts:
+                self._queue.appendleft(current)
+            else:
+                current.deferred.errback(reason)
+        self._dispatch()
+
+    def _setupFailed(self, session, reason):
+        """
+        A session was lost before it could send any message - back off before
+        starting another one, and fail the queued messages if sessions keep
+        failing and no other session is able to send them.
+        """
+        if session in self._idle:
+            self._idle.remove(session)
+        self._sessions.discard(session)
+        self._setupFailures += 1
+        if self._setupFailures >= self.maxSetupFailures and not self._sessions and not self._connecting:
+            self._setupFailures = 0
+            self._failQueued(session.error if session.error is not None else reason)
+        elif self._retryCall is None:
+            delay = self.retryDelay * 2 ** (min(self._setupFailures, self.maxSetupFailures) - 1)
+            self._retryCall = self.reactor.callLater(delay, self._retry)
+
+    def _retry(self):
+        self._retryCall = None
+        self._dispatch()
+
+    def _failQueued(self, error):
+        queue, self._queue = self._queue, collections.deque()
+        for queued in queue:
+            queued.deferred.errback(error)
+
+    def connectionFailed(self, reason):
+        """
+        Unable to connect to the SMTP server - fail the queued messages unless
+        other sessions are still able to send them.
+        """
+        self._connecting -= 1
+        if not self._sessions and not self._connecting:
+            self._failQueued(SMTPConnectError(-1, reason.getErrorMessage()))
+
+
 class SMTPSender(object):
 
-    def __init__(self, username, password, useSSL, server, port):
+    def __init__(self, username, password, useSSL, server, port, maxSessions=None, maxMessagesPerSession=None, idleTimeout=None):
         self.username = username
         self.password = password
         self.useSSL = useSSL
         self.server = server
         self.port = port
 
+        settings = config.Scheduling.iMIP.Sending
+        self.pool = SMTPSenderPool(
+            username, password, useSSL, server, port,
+            maxSessions=maxSessions if maxSessions is not None else settings.MaxSessions,
+            maxMessagesPerSession=maxMessagesPerSession if maxMessagesPerSession is not None else settings.MaxMessagesPerSession,
+            idleTimeout=idleTimeout if idleTimeout is not None else settings.SessionIdleTimeout,
+        )
+
     def sendMessage(self, fromAddr, toAddr, msgId, message):
 
         log.debug("Sending: {msg}", msg=message)
@@ -67,24 +364,7 @@ class SMTPSender(object):
                 AlertPoster.postAlert("MailCertificateAlert", 7 * 24 * 60 * 60, [])
             return False
 
-        deferred = defer.Deferred()
-
-        if self.useSSL:
-            contextFactory = simpleClientContextFactory(self.server)
-        else:
-            contextFactory = None
-
-        factory = ESMTPSenderFactory(
-            self.username, self.password,
-            fromAddr, toAddr,
-            # per http://trac.calendarserver.org/ticket/416 ...
-            StringIO(message.replace("\r\n", "\n")), deferred,
-            contextFactory=contextFactory,
-            requireAuthentication=False,
-            requireTransportSecurity=self.useSSL)
-
-        connect(GAIEndpoint(_reactor, self.server, self.port),
-                factory)
+        deferred = self.pool.send(fromAddr, toAddr, message)
         deferred.addCallback(_success, msgId, fromAddr, toAddr)
         deferred.addErrback(_failure, msgId, fromAddr, toAddr)
         return deferred
@@ -273,6 +273,45 @@ END:VCALENDAR
 
         yield JobItem.waitEmpty(self.store.newTransaction, reactor, 60)
 
+    @inlineCallbacks
+    def test_processReplyForwardedWithOneSender(self):
+        """
+        Replies forwarded to organizers are all sent by the receiver's one
+        L{SMTPSender}, so that they share its SMTP sessions.
+        """
+
+        class StubSender(object):
+            def __init__(self):
+                self.sent = []
+
+            def sendMessage(self, fromAddr, toAddr, msgId, message):
+                self.sent.append((fromAddr, toAddr,))
+                return succeed(True)
+
+        sender = StubSender()
+        receiver = MailReceiver(self.store, self.directory, smtpSender=sender)
+        self.assertIdentical(receiver.smtpSender(), sender)
+
+        txn = self.store.newTransaction()
+        yield txn.imipCreateToken(
+            "urn:x-uid:5A985493-EE2C-4665-94CF-4DFEA3A89500",
+            "mailto:xyzzy@example.com",
+            "1E71F9C8-AEDA-48EB-98D0-76E898F6BB5C",
+            token="d7cdf68d-8b73-4df1-ad3b-f08002fb285f"
+        )
+        yield txn.commit()
+
+        for _ignore in range(2):
+            msg = email.message_from_string(
+                self.dataFile('reply_missing_attachment')
+            )
+            result = (yield receiver.processReply(msg))
+            self.assertEquals(result, MailReceiver.REPLY_FORWARDED_TO_ORGANIZER)
+        self.assertEquals(len(sender.sent), 2)
+
+        # Without one given, the receiver creates its own and keeps it
+        self.assertIdentical(self.receiver.smtpSender(), self.receiver.smtpSender())
+
     @inlineCallbacks
     def test_injectMessage(self):
 
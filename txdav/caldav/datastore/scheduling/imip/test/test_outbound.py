@@ -618,6 +618,79 @@ END:VCALENDAR
         ])
         self.assertEquals(actualTypes, expectedTypes)
 
+    def test_generateEmail_renderCache(self):
+        """
+        L{MailHandler.generateEmail} renders the human readable parts once for
+        messages about the same event sent to different recipients.
+        """
+        rendered = []
+        original = self.sender.getEventDetails
+
+        def _getEventDetails(calendar, language='en'):
+            rendered.append(calendar)
+            return original(calendar, language=language)
+        self.patch(self.sender, "getEventDetails", _getEventDetails)
+
+        calendar = Component.fromString(initialInviteText)
+        messages = []
+        for toAddress in ("user03@localhost", "user04@localhost"):
+            _ignore_msgID, msgTxt = self.sender.generateEmail(
+                inviteState='new',
+                calendar=calendar,
+                orgEmail=u"user01@localhost",
+                orgCN=u"User Z\xe9ro One",
+                attendees=[(u"Us\xe9r One", "user01@localhost"),
+                           (u"User 2", "user02@localhost")],
+                fromAddress="user01@localhost",
+                replyToAddress="imip-system@localhost",
+                toAddress=toAddress,
+            )
+            messages.append(email.message_from_string(msgTxt))
+
+        self.assertEquals(len(rendered), 1)
+        self.assertEquals(messages[0]["To"], "user03@localhost")
+        self.assertEquals(messages[1]["To"], "user04@localhost")
+        self.assertEquals(messages[0]["Subject"], messages[1]["Subject"])
+        self.assertNotEquals(messages[0]["Message-ID"], messages[1]["Message-ID"])
+        plain = [
+            [part.get_payload(decode=True) for part in message.walk() if part.get_content_type() == "text/plain"]
+            for message in messages
+        ]
+        self.assertEquals(plain[0], plain[1])
+
+        # A different invite state is rendered separately
+        self.sender.generateEmail(
+            inviteState='update',
+            calendar=calendar,
+            orgEmail=u"user01@localhost",
+            orgCN=u"User Z\xe9ro One",
+            attendees=[(u"Us\xe9r One", "user01@localhost"),
+                       (u"User 2", "user02@localhost")],
+            fromAddress="user01@localhost",
+            replyToAddress="imip-system@localhost",
+            toAddress="user03@localhost",
+        )
+        self.assertEquals(len(rendered), 2)
+
+        # Different overridden instances of the same event are rendered separately
+        for day in ("25", "26"):
+            instance = Component.fromString(initialInviteText.replace(
+                "DTSTART:20200325T154500Z\nDTEND:20200325T164500Z",
+                "RECURRENCE-ID:202003{day}T154500Z\nDTSTART:202003{day}T154500Z\nDTEND:202003{day}T164500Z".format(day=day),
+            ))
+            self.sender.generateEmail(
+                inviteState='new',
+                calendar=instance,
+                orgEmail=u"user01@localhost",
+                orgCN=u"User Z\xe9ro One",
+                attendees=[(u"Us\xe9r One", "user01@localhost"),
+                           (u"User 2", "user02@localhost")],
+                fromAddress="user01@localhost",
+                replyToAddress="imip-system@localhost",
+                toAddress="user03@localhost",
+            )
+        self.assertEquals(len(rendered), 4)
+
     def test_generateEmail_noOrganizerCN(self):
         """
         L{MailHandler.generateEmail} generates a MIME-formatted email when
@@ -0,0 +1,154 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.internet.error import ConnectionDone
+from twisted.mail.smtp import SMTPConnectError
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport, Clock
+from twisted.trial import unittest
+
+from txdav.caldav.datastore.scheduling.imip.smtpsender import SMTPSenderPool, \
+    _PooledSMTPFactory
+
+
+class TestPool(SMTPSenderPool):
+    """
+    L{SMTPSenderPool} that connects sessions to in-memory transports.
+    """
+
+    def _connect(self):
+        session = _PooledSMTPFactory(self).buildProtocol(None)
+        session.makeConnection(StringTransport())
+        self.connected.append(session)
+
+
+class SMTPSenderPoolTests(unittest.TestCase):
+
+    message = "Subject: test\r\n\r\nTest message\r\n"
+
+    def setUp(self):
+        self.pool = TestPool(
+            "", "", False, "smtp.example.com", 25,
+            maxSessions=1, maxMessagesPerSession=2, reactor=Clock()
+        )
+        self.pool.connected = []
+
+    def serverSays(self, session, *lines):
+        for line in lines:
+            session.dataReceived(line + "\r\n")
+            # Let the message body be written
+            while session.transport.producer is not None:
+                session.transport.producer.resumeProducing()
+
+    def deliver(self, session):
+        """
+        Have the server accept one message.
+        """
+        self.serverSays(session, "250 OK", "250 OK", "354 Go ahead", "250 OK", "250 OK")
+
+    def test_sessionReused(self):
+        """
+        Messages sent one after another reuse the same session.
+        """
+        results = []
+        self.pool.send("a@example.com", "b@example.com", self.message).addCallback(results.append)
+        self.assertEqual(len(self.pool.connected), 1)
+        session = self.pool.connected[0]
+        self.serverSays(session, "220 smtp.example.com ESMTP", "250-smtp.example.com", "250 HELP")
+        self.deliver(session)
+        self.assertEqual(len(results), 1)
+
+        # Session is now idle - the next message goes straight to it
+        session.transport.clear()
+        self.pool.send("a@example.com", "c@example.com", self.message).addCallback(results.append)
+        self.assertEqual(len(self.pool.connected), 1)
+        self.assertTrue(session.transport.value().startswith("MAIL FROM:<a@example.com>"))
+        self.deliver(session)
+        self.assertEqual(len(results), 2)
+
+        # Session has sent its share of messages - the next one needs a new session
+        self.pool.send("a@example.com", "d@example.com", self.message).addCallback(results.append)
+        self.assertEqual(len(self.pool.connected), 2)
+
+    def test_retryOnConnectionLost(self):
+        """
+        A message being sent when the connection is lost is sent again over a
+        new session.
+        """
+        results = []
+        self.pool.send("a@example.com", "b@example.com", self.message).addCallback(results.append)
+        session = self.pool.connected[0]
+        self.serverSays(session, "220 smtp.example.com ESMTP", "250-smtp.example.com", "250 HELP")
+        session.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(len(self.pool.connected), 2)
+
+        session = self.pool.connected[1]
+        self.serverSays(session, "220 smtp.example.com ESMTP", "250-smtp.example.com", "250 HELP")
+        self.deliver(session)
+        self.assertEqual(len(results), 1)
+
+    def failSetup(self, session, *lines):
+        """
+        Have the server refuse to set up a session, then drop the connection.
+        """
+        self.serverSays(session, *lines)
+        session.connectionLost(Failure(ConnectionDone()))
+
+    def test_backOffOnRefusedGreeting(self):
+        """
+        When the server refuses sessions before any message is sent, new
+        sessions are started after an increasing delay, and the queued
+        messages fail after L{SMTPSenderPool.maxSetupFailures} attempts.
+        """
+        failures = []
+        self.pool.send("a@example.com", "b@example.com", self.message).addErrback(failures.append)
+        for attempt in range(self.pool.maxSetupFailures - 1):
+            self.failSetup(self.pool.connected[-1], "421 Service not available")
+            self.assertEqual(len(self.pool.connected), attempt + 1)
+            self.pool.reactor.advance(self.pool.retryDelay * 2 ** attempt)
+            self.assertEqual(len(self.pool.connected), attempt + 2)
+        self.assertEqual(failures, [])
+
+        self.failSetup(self.pool.connected[-1], "421 Service not available")
+        self.assertEqual(len(failures), 1)
+        failures[0].trap(SMTPConnectError)
+        self.assertEqual(len(self.pool.connected), self.pool.maxSetupFailures)
+        self.assertEqual(self.pool.reactor.getDelayedCalls(), [])
+
+    def test_backOffOnAuthDeclined(self):
+        """
+        When the server declines authentication, the next session is started
+        after a delay, and a session that is then set up sends the queued
+        message.
+        """
+        self.pool.username = "user"
+        self.pool.password = "secret"
+        results = []
+        self.pool.send("a@example.com", "b@example.com", self.message).addCallback(results.append)
+        self.failSetup(
+            self.pool.connected[0],
+            "220 smtp.example.com ESMTP", "250-smtp.example.com", "250 AUTH CRAM-MD5",
+            "535 Authentication failed",
+        )
+        self.assertEqual(len(self.pool.connected), 1)
+        self.pool.reactor.advance(self.pool.retryDelay)
+        self.assertEqual(len(self.pool.connected), 2)
+
+        session = self.pool.connected[1]
+        self.serverSays(session, "220 smtp.example.com ESMTP", "250-smtp.example.com", "250 HELP")
+        self.deliver(session)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.pool._setupFailures, 0)
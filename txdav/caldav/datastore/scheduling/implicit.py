@@ -1283,10 +1283,12 @@ class ImplicitScheduler(object):
         @type queued: L{bool}
         """
 
-        # TODO: a better policy here is to aggregate by attendees with the same set of instances
-        # being requested, but for now we will do one scheduling message per attendee.
+        # Attendees with the same set of instances get the same iTIP message, so generate one
+        # message (serialized once when queued) for each distinct set of instances.
+        instanceSets = self.attendeeInstanceSets()
+        itipmsgs = {}
+        viaJobQueue = self.sendViaJobQueue()
 
-        # Do one per attendee
         count = 0
         recipientProperties = collections.defaultdict(list)
         for p in self.calendar.getAllAttendeeProperties():
@@ -1324,7 +1326,20 @@ class ImplicitScheduler(object):
                     p.setParameter("SCHEDULE-STATUS", iTIPRequestStatus.REQUEST_FORWARDED_CODE if config.GroupAttendees.Enabled else iTIPRequestStatus.NO_USER_SUPPORT_CODE)
                 continue
 
-            itipmsg = iTipGenerator.generateAttendeeRequest(self.calendar, (attendee,), self.changed_rids)
+            instanceSet = instanceSets.get(normalizeCUAddr(attendee), ())
+            if instanceSet not in itipmsgs:
+                itipmsg = iTipGenerator.generateAttendeeRequest(self.calendar, (attendee,), self.changed_rids)
+                itiptext = None
+                if itipmsg is not None and not queued:
+                    # Add split details if needed
+                    if self.split_details is not None:
+                        rid, uid, newer_piece, ignore = self.split_details
+                        itipmsg.addProperty(Property("X-CALENDARSERVER-SPLIT-RID", rid))
+                        itipmsg.addProperty(Property("X-CALENDARSERVER-SPLIT-OLDER-UID" if newer_piece else "X-CALENDARSERVER-SPLIT-NEWER-UID", uid))
+                    if viaJobQueue:
+                        itiptext = itipmsg.getTextWithTimezones(includeTimezones=not config.EnableTimezonesByReference)
+                itipmsgs[instanceSet] = (itipmsg, itiptext,)
+            itipmsg, itiptext = itipmsgs[instanceSet]
 
             # Send scheduling message
             if itipmsg is not None:
@@ -1333,21 +1348,51 @@ class ImplicitScheduler(object):
                     # Always make it look like scheduling succeeded when queuing
                     for p in recipientProperties[attendee]:
                         p.setParameter("SCHEDULE-STATUS", iTIPRequestStatus.MESSAGE_DELIVERED_CODE)
+                elif viaJobQueue:
+                    yield self.processSend(attendee, itipmsg, count=count + cancel_count, itiptext=itiptext)
                 else:
-                    # Add split details if needed
-                    if self.split_details is not None:
-                        rid, uid, newer_piece, ignore = self.split_details
-                        itipmsg.addProperty(Property("X-CALENDARSERVER-SPLIT-RID", rid))
-                        itipmsg.addProperty(Property("X-CALENDARSERVER-SPLIT-OLDER-UID" if newer_piece else "X-CALENDARSERVER-SPLIT-NEWER-UID", uid))
-
-                    yield self.processSend(attendee, itipmsg, count=count + cancel_count)
+                    # Direct delivery may change the message, so each attendee gets its own copy
+                    yield self.processSend(attendee, itipmsg.duplicate(), count=count + cancel_count)
 
                 count += 1
 
         returnValue(count)
 
+    def attendeeInstanceSets(self):
+        """
+        Determine the set of instances that an iTIP REQUEST to each attendee would contain,
+        i.e., the components in which the attendee appears and is scheduled by the server.
+        This matches the filtering done by L{iTipGenerator.generateAttendeeView}, so attendees
+        with the same set of instances are sent the same iTIP message.
+
+        @return: a map of normalized calendar user address to a L{tuple} of the
+            recurrence-ids of the components the attendee is in
+        @rtype: L{dict}
+        """
+        instanceSets = collections.defaultdict(list)
+        for component in self.calendar.subcomponents(ignore=True):
+            rid = component.getRecurrenceIDUTC()
+            rid = rid.getText() if rid is not None else None
+
+            # Only the first property for an attendee counts
+            attendees = {}
+            for attendee in component.getRecipientProperties():
+                attendees.setdefault(normalizeCUAddr(attendee.value()), attendee)
+            for cuaddr, attendee in attendees.items():
+                if attendee.parameterValue("SCHEDULE-AGENT", "SERVER") == "SERVER":
+                    instanceSets[cuaddr].append(rid)
+
+        return dict([(cuaddr, tuple(rids),) for cuaddr, rids in instanceSets.items()])
+
+    def sendViaJobQueue(self):
+        """
+        Determine whether iTIP messages will be sent via queued work rather than directly.
+        Attendee refreshes are already executed in a job (in batches) so don't create more.
+        """
+        return config.Scheduling.Options.WorkQueues.Enabled and not hasattr(self.txn, "doing_attendee_refresh")
+
     @inlineCallbacks
-    def processSend(self, attendee, itipmsg, jobqueue=True, count=0):
+    def processSend(self, attendee, itipmsg, jobqueue=True, count=0, itiptext=None):
         """
         Send an iTIP message to an attendee. This might send it directly, or it might create job to
         send it later.
@@ -1358,10 +1403,12 @@ class ImplicitScheduler(object):
         @type itipmsg: L{Component}
         @param jobqueue: if allowed, queue up a job to do the actual work
         @type jobqueue: L{bool}
+        @param itiptext: the serialized iTIP message, when already available
+        @type itiptext: L{str}
         """
 
         # Attendee refreshes are already executed in a job (in batches) so don't create more
-        if jobqueue and config.Scheduling.Options.WorkQueues.Enabled and not hasattr(self.txn, "doing_attendee_refresh"):
+        if jobqueue and self.sendViaJobQueue():
             # Create job for the work
             yield ScheduleOrganizerSendWork.schedule(
                 self.txn,
@@ -1373,6 +1420,7 @@ class ImplicitScheduler(object):
                 itipmsg,
                 self.suppress_refresh,
                 count,
+                itiptext=itiptext,
             )
         else:
             # Execute the work right now
@@ -36,7 +36,8 @@ from twisted.internet.protocol import Factory
 from twisted.python.failure import Failure
 
 from twistedcaldav.accounting import accountingEnabledForCategory, emitAccounting
-from twistedcaldav.client.pool import _configuredClientContextFactory
+from twistedcaldav.client.pool import _configuredClientContextFactory, \
+    HTTPClientPool
 from twistedcaldav.config import config
 from twistedcaldav.ical import normalizeCUAddress, Component
 from twistedcaldav.util import utf8String
@@ -67,6 +68,27 @@ __all__ = [
 
 log = Logger()
 
+_connectionPools = {}     # Maps (ssl, host, port) to a persistent HTTPClientPool
+
+
+def _connectionPool(ssl, host, port, reactor):
+    """
+    Get the pool of persistent connections to an iSchedule server, creating it
+    if needed.
+    """
+    key = (ssl, host, port,)
+    if key not in _connectionPools:
+        _connectionPools[key] = HTTPClientPool(
+            "iSchedule {}:{}".format(host, port),
+            "https" if ssl else "http",
+            GAIEndpoint(reactor, host, port),
+            GAIEndpoint(reactor, host, port, _configuredClientContextFactory(host)),
+            maxClients=config.Scheduling.iSchedule.ConnectionPool.MaxClients,
+            reactor=reactor,
+            persistent=True,
+        )
+    return _connectionPools[key]
+
 
 class ScheduleViaISchedule(DeliveryService):
 
@@ -490,6 +512,17 @@ class IScheduleRequest(object):
     @inlineCallbacks
     def _submitRequest(self, ssl, host, port, request):
         from twisted.internet import reactor
+        if config.Scheduling.iSchedule.ConnectionPool.Enabled:
+            pool = _connectionPool(ssl, host, port, reactor)
+            response = (yield pool.submitRequest(request))
+
+            # Read the entire response so the connection is free for the next
+            # request to this server, whatever we do with the response
+            data = (yield allDataFromStream(response.stream))
+            response.stream = MemoryStream(data if data is not None else "")
+            response.stream.doStartReading = None
+            returnValue(response)
+
         f = Factory()
         f.protocol = HTTPClientProtocol
         if ssl:
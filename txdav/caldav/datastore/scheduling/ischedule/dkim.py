@@ -22,6 +22,7 @@ from txweb2.http_headers import MimeType
 from txweb2.stream import MemoryStream
 
 from twisted.internet.defer import inlineCallbacks, returnValue, succeed
+from twisted.internet.threads import deferToThread
 from twistedcaldav.client.geturl import getURL
 from twistedcaldav.config import ConfigurationError
 from twistedcaldav.simpleresource import SimpleResource, SimpleDataResource
@@ -317,6 +318,9 @@ class DKIMRequest(ClientRequest):
 
     keys = {}
 
+    # RSA signing is CPU bound - do it in a thread rather than blocking the reactor
+    signInThread = True
+
     def __init__(
         self,
         method,
@@ -402,7 +406,10 @@ class DKIMRequest(ClientRequest):
         headers, dkim_tags = (yield self.signatureHeaders())
 
         # Sign the hash
-        signature = self.generateSignature(headers)
+        if self.signInThread:
+            signature = (yield deferToThread(self.generateSignature, headers))
+        else:
+            signature = self.generateSignature(headers)
 
         # Complete the header
         dkim_tags[-1] = ("b", signature,)
@@ -701,9 +708,15 @@ class PublicKeyLookup(object):
 
     The L{method} attribute indicated the DKIM q= lookup method that the class will support, or if set to "*",
     the class will handle any q= value.
+
+    Looked up keys are cached for L{keyCacheTTL} seconds (L{keyCacheNegativeTTL} seconds when no keys were found),
+    with at most L{keyCacheSize} entries in the cache.
     """
 
     keyCache = {}
+    keyCacheTTL = 3600
+    keyCacheNegativeTTL = 300
+    keyCacheSize = 1000
     method = None
 
     def __init__(self, dkim_tags):
@@ -718,12 +731,28 @@ class PublicKeyLookup(object):
         @type useCache: C{bool}
         """
         key = self._getSelectorKey()
-        if key not in PublicKeyLookup.keyCache or not useCache:
+        now = time.time()
+        if not useCache or PublicKeyLookup.keyCache.get(key, (0, None,))[0] <= now:
             pubkeys = (yield self._lookupKeys())
-            PublicKeyLookup.keyCache[key] = pubkeys
+            self._cacheKeys(key, pubkeys, now)
 
         returnValue(self._selectKey())
 
+    @staticmethod
+    def _cacheKeys(key, pubkeys, now):
+        """
+        Add looked up keys to the cache, making room by removing expired entries
+        and then those that expire soonest.
+        """
+        cache = PublicKeyLookup.keyCache
+        if key not in cache and len(cache) >= PublicKeyLookup.keyCacheSize:
+            for oldkey in [oldkey for oldkey, (expires, _ignore) in cache.items() if expires <= now]:
+                del cache[oldkey]
+            while len(cache) >= PublicKeyLookup.keyCacheSize:
+                del cache[min(cache, key=lambda x: cache[x][0])]
+        ttl = PublicKeyLookup.keyCacheTTL if pubkeys else PublicKeyLookup.keyCacheNegativeTTL
+        cache[key] = (now + ttl, pubkeys,)
+
     def _getSelectorKey(self):
         """
         Get a token used to uniquely identify the key being looked up. Token format will
@@ -743,7 +772,7 @@ class PublicKeyLookup(object):
         Select a specific key from the list that best matches the DKIM-Signature tags
         """
 
-        pubkeys = PublicKeyLookup.keyCache.get(self._getSelectorKey(), [])
+        _ignore_expires, pubkeys = PublicKeyLookup.keyCache.get(self._getSelectorKey(), (0, [],))
         for pkey in pubkeys:
             # Check validity
             if pkey.get("v", "DKIM1") != "DKIM1":
@@ -14,18 +14,22 @@
 # limitations under the License.
 ##
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.names import client
 from twisted.python.modules import getModule
 from twisted.trial import unittest
+from twistedcaldav.client.test.test_pool import TestReactor
 from twistedcaldav.stdconfig import config
-from txdav.caldav.datastore.scheduling.ischedule import utils
+from txdav.caldav.datastore.scheduling.ischedule import delivery, utils
 from txdav.caldav.datastore.scheduling.ischedule.delivery import ScheduleViaISchedule, \
     IScheduleRequest
 from txdav.caldav.datastore.scheduling.ischedule.remoteservers import IScheduleServerRecord
 from txdav.caldav.datastore.scheduling.cuaddress import CalendarUser
 from txdav.common.datastore.test.util import CommonCommonTests
 import txweb2.dav.test.util
+from txweb2.dav.util import allDataFromStream
+from txweb2.http import Response
+from txweb2.stream import MemoryStream, ProducerStream
 from twistedcaldav.ical import Component
 
 
@@ -79,6 +83,54 @@ class TestiSchedule (unittest.TestCase):
         self.assertFalse(result)
 
 
+class TestIScheduleConnectionPool (unittest.TestCase):
+    """
+    iSchedule requests sent over persistent connections
+    """
+
+    def setUp(self):
+        self.patch(delivery, "_connectionPools", {})
+        self.patch(delivery, "_configuredClientContextFactory", lambda host: None)
+
+    def test_poolPerServer(self):
+        """
+        Requests to the same server share one persistent connection pool.
+        """
+        reactor = TestReactor()
+        pool = delivery._connectionPool(True, "example.com", 8443, reactor)
+        self.assertTrue(pool._persistent)
+        self.assertTrue(delivery._connectionPool(True, "example.com", 8443, reactor) is pool)
+        self.assertFalse(delivery._connectionPool(True, "example.org", 8443, reactor) is pool)
+        self.assertFalse(delivery._connectionPool(False, "example.com", 8080, reactor) is pool)
+
+    @inlineCallbacks
+    def test_submitRequestReadsResponse(self):
+        """
+        A request sent through the pool has its response read entirely, so the
+        connection is free for the next request.
+        """
+        self.patch(config.Scheduling.iSchedule.ConnectionPool, "Enabled", True)
+        submitted = []
+
+        class FakePool(object):
+
+            def submitRequest(self, request):
+                submitted.append(request)
+                stream = ProducerStream()
+                stream.write("response")
+                stream.finish()
+                return succeed(Response(200, None, stream))
+
+        self.patch(delivery, "_connectionPool", lambda ssl, host, port, reactor: FakePool())
+
+        request = IScheduleRequest.__new__(IScheduleRequest)
+        response = yield request._submitRequest(True, "example.com", 8443, "request")
+        self.assertEqual(submitted, ["request"])
+        self.assertTrue(isinstance(response.stream, MemoryStream))
+        data = yield allDataFromStream(response.stream)
+        self.assertEqual(data, "response")
+
+
 class TestIScheduleRequest (CommonCommonTests, txweb2.dav.test.util.TestCase):
     """
     txdav.caldav.datastore.scheduling.ischedule tests
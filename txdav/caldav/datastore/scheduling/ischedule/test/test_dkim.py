@@ -29,7 +29,7 @@ from twistedcaldav.stdconfig import config
 
 from txdav.caldav.datastore.scheduling.ischedule import utils
 from txdav.caldav.datastore.scheduling.ischedule.dkim import DKIMRequest, DKIMVerifier, \
-    DKIMVerificationError, DKIMUtils, PublicKeyLookup_DNSTXT, \
+    DKIMVerificationError, DKIMUtils, PublicKeyLookup, PublicKeyLookup_DNSTXT, \
     PublicKeyLookup_HTTP_WellKnown, PublicKeyLookup_PrivateExchange
 
 import base64
@@ -780,6 +780,35 @@ class TestPublicKeyLookup (TestDKIMBase):
         pubkey = (yield lookup.getPublicKey())
         self.assertTrue(pubkey is None)
 
+    @inlineCallbacks
+    def test_cached_key_expired(self):
+
+        dkim = "v=1; d=example.com; s = dkim; t = 1234; a=rsa-sha1; q=dns/txt:http/well-known:private-exchange ; http=UE9TVDov; c=relaxed/simple; h=Content-Type:Originator:Recipient:Recipient:iSchedule-Version:iSchedule-Message-ID; bh=abc; b="
+        lookup = TestPublicKeyLookup.PublicKeyLookup_Testing(DKIMUtils.extractTags(dkim))
+        lookup.flushCache()
+        self.patch(PublicKeyLookup, "keyCacheTTL", -1)
+        lookup.keys = [DKIMUtils.extractTags("v=DKIM1; p=%s" % (self.public_key_data,))]
+        pubkey = (yield lookup.getPublicKey())
+        self.assertTrue(pubkey is not None)
+
+        # Expired entry is looked up again
+        lookup.keys = []
+        pubkey = (yield lookup.getPublicKey())
+        self.assertTrue(pubkey is None)
+
+    @inlineCallbacks
+    def test_cache_size(self):
+
+        self.patch(PublicKeyLookup, "keyCacheSize", 2)
+        PublicKeyLookup.flushCache()
+        for d in ("example.com", "example.org", "example.net",):
+            dkim = "v=1; d=%s; s = dkim; t = 1234; a=rsa-sha1; q=dns/txt:http/well-known:private-exchange ; http=UE9TVDov; c=relaxed/simple; h=Content-Type:Originator:Recipient:Recipient:iSchedule-Version:iSchedule-Message-ID; bh=abc; b=" % (d,)
+            lookup = TestPublicKeyLookup.PublicKeyLookup_Testing(DKIMUtils.extractTags(dkim))
+            lookup.keys = [DKIMUtils.extractTags("v=DKIM1; p=%s" % (self.public_key_data,))]
+            pubkey = (yield lookup.getPublicKey())
+            self.assertTrue(pubkey is not None)
+        self.assertEqual(len(PublicKeyLookup.keyCache), 2)
+
     @inlineCallbacks
     def test_TXT_key(self):
 
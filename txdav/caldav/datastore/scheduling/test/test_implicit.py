@@ -870,6 +870,51 @@ END:VCALENDAR
             self.assertEqual(set(recipients), set(result_set))
             yield self.commit()
 
+    def test_attendeeInstanceSets(self):
+        """
+        Test that attendeeInstanceSets groups attendees by the components they
+        will be sent.
+        """
+
+        calendar = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DTEND:20080601T130000Z
+RRULE:FREQ=DAILY
+ORGANIZER;CN="User 01":mailto:user01@example.com
+ATTENDEE:mailto:user01@example.com
+ATTENDEE:mailto:user02@example.com
+ATTENDEE:mailto:user03@example.com
+ATTENDEE:mailto:user04@example.com
+ATTENDEE:MAILTO:User05@example.com
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+RECURRENCE-ID:20080602T120000Z
+DTSTART:20080602T130000Z
+DTEND:20080602T140000Z
+ORGANIZER;CN="User 01":mailto:user01@example.com
+ATTENDEE:mailto:user01@example.com
+ATTENDEE:mailto:user02@example.com
+ATTENDEE;SCHEDULE-AGENT=CLIENT:mailto:user03@example.com
+ATTENDEE:mailto:user05@example.com
+END:VEVENT
+END:VCALENDAR
+"""
+
+        scheduler = ImplicitScheduler()
+        scheduler.calendar = Component.fromString(calendar)
+        instanceSets = scheduler.attendeeInstanceSets()
+
+        both = (None, "20080602T120000Z",)
+        self.assertEqual(instanceSets["mailto:user02@example.com"], both)
+        self.assertEqual(instanceSets["mailto:user03@example.com"], (None,))
+        self.assertEqual(instanceSets["mailto:user04@example.com"], (None,))
+        self.assertEqual(instanceSets["mailto:user05@example.com"], both)
+
 
 class ImplicitRequests(CommonCommonTests, TestCase):
     """
@@ -467,7 +467,7 @@ class ScheduleOrganizerSendWork(ScheduleWorkMixin, fromTable(schema.SCHEDULE_ORG
 
     @classmethod
     @inlineCallbacks
-    def schedule(cls, txn, action, home, resource, organizer, attendee, itipmsg, no_refresh, stagger, pause=0):
+    def schedule(cls, txn, action, home, resource, organizer, attendee, itipmsg, no_refresh, stagger, pause=0, itiptext=None):
         """
         Create the work item. Because there may be lots of these dumped onto the server in one go, we will
         stagger them via notBefore. However, we are using a "chained" work item so when one completes, it
@@ -486,11 +486,16 @@ class ScheduleOrganizerSendWork(ScheduleWorkMixin, fromTable(schema.SCHEDULE_ORG
         @type no_refresh: L{bool}
         @param stagger: number of seconds into the future for notBefore
         @type stagger: L{int}
+        @param itiptext: the serialized iTIP message, if already available - used when the same
+            message is sent to many attendees
+        @type itiptext: L{str}
         """
 
         # Always queue up new work - coalescing happens when work is executed
         notBefore = datetime.datetime.utcnow() + datetime.timedelta(seconds=config.Scheduling.Options.WorkQueues.RequestDelaySeconds + stagger)
         uid = itipmsg.resourceUID()
+        if itiptext is None:
+            itiptext = itipmsg.getTextWithTimezones(includeTimezones=not config.EnableTimezonesByReference)
         work = (yield txn.enqueue(
             cls,
             notBefore=notBefore,
@@ -499,7 +504,7 @@ class ScheduleOrganizerSendWork(ScheduleWorkMixin, fromTable(schema.SCHEDULE_ORG
             homeResourceID=home.id(),
             resourceID=resource.id() if resource else None,
             attendee=attendee,
-            itipMsg=itipmsg.getTextWithTimezones(includeTimezones=not config.EnableTimezonesByReference),
+            itipMsg=itiptext,
             noRefresh=no_refresh,
             pause=pause,
         ))
@@ -48,11 +48,14 @@ from twistedcaldav.stdconfig import config
 from twistedcaldav.datafilters.peruserdata import PerUserDataFilter
 from twistedcaldav.dateops import normalizeForIndex, \
     pyCalendarToSQLTimestamp, parseSQLDateToPyCalendar
-from twistedcaldav.ical import Component, InvalidICalendarDataError, Property, ATTENDEE_COMMENT
+from twistedcaldav.ical import Component, InvalidICalendarDataError, Property, ATTENDEE_COMMENT, \
+    PERUSER_COMPONENT, PRIVATE_COMMENT
 from twistedcaldav.instance import InvalidOverriddenInstanceError
 from twistedcaldav.timezones import TimezoneException, readVTZ, hasTZ
 
 from txdav.base.propertystore.base import PropertyName
+from txdav.caldav.datastore.offload import calendarDataOffload, OffloadError, \
+    CompactInstance
 from txdav.caldav.datastore.query.builder import buildExpression
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.datastore.query.generator import CalDAVSQLQueryGenerator
@@ -3869,6 +3872,9 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             instanceIndexingRequired = getattr(self, "tr_change", True) in (None, True)
         instances = None
 
+        # Serialize once, for both the offload size check and the store
+        componentText = str(component) if not reCreate else None
+
         if instanceIndexingRequired:
 
             # Decide how far to expand based on the component. doInstanceIndexing will indicate whether we
@@ -3923,7 +3929,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             # Always do recurrence expansion even if we do not intend to index - we need this to double-check the
             # validity of the iCalendar recurrence data.
             try:
-                instances = component.expandTimeRanges(expand, lowerLimit=truncateLowerLimit, ignoreInvalidInstances=reCreate)
+                instances = yield self._expandTimeRanges(component, expand, truncateLowerLimit, reCreate, componentText)
                 recurrenceLimit = instances.limit
                 recurrenceLowerLimit = instances.lowerLimit
             except InvalidOverriddenInstanceError, e:
@@ -3934,7 +3940,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
                 if txn._migrating:
                     # TODO: fix the data here by re-writing component then re-index
-                    instances = component.expandTimeRanges(expand, lowerLimit=truncateLowerLimit, ignoreInvalidInstances=True)
+                    instances = yield self._expandTimeRanges(component, expand, truncateLowerLimit, True, componentText)
                     recurrenceLimit = instances.limit
                     recurrenceLowerLimit = instances.lowerLimit
                 else:
@@ -3952,7 +3958,6 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         # Do not update if reCreate (re-indexing - we don't want to re-write data
         # or cause modified to change)
         if not reCreate:
-            componentText = str(component)
             self._objectText = componentText
             self._cachedComponent = component
             self._cachedCommponentPerUser = {}
@@ -4060,6 +4065,37 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         yield self.removeOldEventGroupLink(component, instances, inserting, txn)
 
+    @inlineCallbacks
+    def _expandTimeRanges(self, component, limit, lowerLimit, ignoreInvalidInstances, text=None):
+        """
+        Expand the recurrence instances of a component, handing the work off to
+        a helper process when the calendar data is large and offloading is
+        enabled.
+
+        @param text: the serialized component, if the caller has it. If not,
+            the component is only serialized when the stored size of this
+            object says it is large enough to offload.
+        @type text: L{str}
+
+        @return: a L{Deferred} firing with an L{InstanceList} or L{CompactInstanceList}
+        """
+        offload = calendarDataOffload()
+        if offload is not None:
+            if text is None and self._size is not None and offload.wantsOffload(self._size):
+                text = str(component)
+            if text is not None and offload.wantsOffload(len(text)):
+                try:
+                    instances = yield offload.expandTimeRanges(text, limit, lowerLimit, ignoreInvalidInstances)
+                except OffloadError, e:
+                    self.log.error(
+                        "Unable to offload expansion of {name} in {cal!r}: {ex}",
+                        name=self._name, cal=self._calendar, ex=e,
+                    )
+                else:
+                    returnValue(instances)
+
+        returnValue(component.expandTimeRanges(limit, lowerLimit=lowerLimit, ignoreInvalidInstances=ignoreInvalidInstances))
+
     @inlineCallbacks
     def _addInstances(self, component, instances, truncateLowerLimit, isInboxItem, txn):
         """
@@ -4084,8 +4120,12 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             start = instance.start
             end = instance.end
             floating = instance.start.floating()
-            transp = instance.component.adjustedTransp() == "TRANSPARENT"
-            fbtype = instance.component.getFBType()
+            if isinstance(instance, CompactInstance):
+                transp = instance.transp
+                fbtype = instance.fbtype
+            else:
+                transp = instance.component.adjustedTransp() == "TRANSPARENT"
+                fbtype = instance.component.getFBType()
             start.setTimezoneUTC(True)
             end.setTimezoneUTC(True)
 
@@ -4187,7 +4227,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             text = yield self._text()
 
             try:
-                component = Component.fromString(text)
+                component, fixed, unfixed = yield self._parseAndValidate(text)
             except InvalidICalendarDataError, e:
                 # This is a really bad situation, so do raise
                 raise InternalDataStoreError(
@@ -4196,9 +4236,6 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                     )
                 )
 
-            # Fix any bogus data we can
-            fixed, unfixed = component.validCalendarData(doFix=True, doRaise=False)
-
             if unfixed:
                 self.log.error(
                     "Calendar data id={id} had unfixable problems:\n  {problems}",
@@ -4220,6 +4257,35 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         returnValue(self._cachedComponent)
 
+    @inlineCallbacks
+    def _parseAndValidate(self, text):
+        """
+        Parse calendar data and fix any bogus data we can. For large calendar
+        data the parsing and validation are handed off to a helper process when
+        offloading is enabled, which returns the fixed text (if any) so that only
+        a plain parse is done here.
+
+        @return: a L{Deferred} firing with a tuple of the L{Component}, the
+            fixed problems and the unfixed problems
+        """
+        offload = calendarDataOffload()
+        if offload is not None and offload.wantsOffload(len(text)):
+            try:
+                result = yield offload.validate(text)
+            except OffloadError, e:
+                self.log.error(
+                    "Unable to offload validation of id={id}: {ex}",
+                    id=self._resourceID, ex=e,
+                )
+            else:
+                fixedText, fixed, unfixed = result
+                component = Component.fromString(text if fixedText is None else fixedText)
+                returnValue((component, fixed, unfixed,))
+
+        component = Component.fromString(text)
+        fixed, unfixed = component.validCalendarData(doFix=True, doRaise=False)
+        returnValue((component, fixed, unfixed,))
+
     @inlineCallbacks
     def componentForUser(self, user_uuid=None):
         """
@@ -4241,6 +4307,41 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             self._cachedCommponentPerUser[user_uuid] = filtered
         returnValue(self._cachedCommponentPerUser[user_uuid])
 
+    # Markers in stored calendar data that mean the data has to be parsed and
+    # filtered before being returned to a user
+    _filteredTextMarkers = (
+        PERUSER_COMPONENT,
+        PRIVATE_COMMENT,
+        ATTENDEE_COMMENT,
+        Component.ACCESS_PROPERTY,
+        Component.HIDDEN_INSTANCE_PROPERTY,
+        "VALUE=DATE:",
+        "VALUE=DATE;",
+    )
+
+    @inlineCallbacks
+    def unfilteredText(self):
+        """
+        Return the stored iCalendar text if it is exactly what L{componentForUser}
+        would produce for any user, without parsing it. That is the case when
+        the data has no per-user data, private comments, access restrictions or
+        hidden instances, and no all-day components (which get a default
+        TRANSP added for each user).
+
+        @return: the stored text, or C{None} if the data needs to be parsed and
+            filtered
+        @rtype: L{str} or C{None}
+        """
+
+        if self._cachedComponent is not None or self._dataversion < self._currentDataVersion or self._access:
+            returnValue(None)
+
+        text = yield self._text()
+        for marker in self._filteredTextMarkers:
+            if marker in text:
+                returnValue(None)
+        returnValue(text)
+
     @inlineCallbacks
     def upgradeData(self, component, doUpdate=False):
         """
@@ -0,0 +1,159 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for txdav.caldav.datastore.offload.
+"""
+
+from pycalendar.datetime import DateTime
+from pycalendar.timezone import Timezone
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+
+from twistedcaldav.ical import Component, InvalidICalendarDataError
+from twistedcaldav.timezones import TimezoneCache
+
+from txdav.caldav.datastore.offload import CalendarDataOffloadClient, \
+    CalendarDataOffloadWorker, CalendarDataOffloadService, \
+    CompactInstanceList, OffloadError
+
+
+class OffloadTests(TestCase):
+    """
+    Tests for the calendar data offload protocols.
+    """
+
+    data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:offload-1
+DTSTART:20170101T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+RRULE:FREQ=DAILY;COUNT=5
+TRANSP:TRANSPARENT
+SUMMARY:Recurring
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+    def setUp(self):
+        """
+        Connect a client to a worker via in-memory transports.
+        """
+        self.client = CalendarDataOffloadClient()
+        self.clientTransport = StringTransport()
+        self.client.makeConnection(self.clientTransport)
+        self.worker = CalendarDataOffloadWorker()
+        self.workerTransport = StringTransport()
+        self.worker.makeConnection(self.workerTransport)
+
+    def pump(self):
+        """
+        Deliver the client's requests to the worker, and the worker's
+        responses back to the client.
+        """
+        self.worker.dataReceived(self.clientTransport.value())
+        self.clientTransport.clear()
+        self.client.dataReceived(self.workerTransport.value())
+        self.workerTransport.clear()
+
+    def test_compactInstanceListOrder(self):
+        """
+        L{CompactInstanceList} iterates its keys in sorted order, as
+        L{InstanceList} does.
+        """
+        instances = CompactInstanceList({"c": 3, "a": 1, "b": 2}, None, None)
+        self.assertEqual(list(instances), ["a", "b", "c"])
+        self.assertEqual(instances["b"], 2)
+
+    @inlineCallbacks
+    def test_validate(self):
+        """
+        Valid calendar data is validated without problems, and no fixed text
+        is sent back.
+        """
+        d = self.client.callRemote("validate", self.data)
+        self.assertEqual(self.client.outstanding(), 1)
+        self.pump()
+        fixedText, fixed, unfixed = yield d
+        self.assertTrue(fixedText is None)
+        self.assertEqual(fixed, [])
+        self.assertEqual(unfixed, [])
+        self.assertEqual(self.client.outstanding(), 0)
+
+    def test_configure(self):
+        """
+        Configuring a helper process sets up the timezone database.
+        """
+        created = []
+        self.patch(TimezoneCache, "create", staticmethod(lambda: created.append(True)))
+        self.worker.command_configure(None)
+        self.assertEqual(created, [True])
+
+    @inlineCallbacks
+    def test_validateInvalid(self):
+        """
+        Unparseable calendar data results in L{InvalidICalendarDataError}.
+        """
+        d = self.client.callRemote("validate", "BEGIN:VCALENDAR\r\nBOGUS\r\n")
+        self.pump()
+        yield self.assertFailure(d, InvalidICalendarDataError)
+
+    @inlineCallbacks
+    def test_expand(self):
+        """
+        Expanding recurrences in the worker matches doing so locally.
+        """
+        limit = DateTime(2018, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
+        d = self.client.callRemote("expand", self.data, limit, None, False)
+        self.pump()
+        instances = yield d
+
+        expected = Component.fromString(self.data).expandTimeRanges(limit)
+        self.assertEqual(list(instances), list(expected))
+        self.assertEqual(instances.limit, expected.limit)
+        for key in instances:
+            self.assertEqual(instances[key].start, expected[key].start)
+            self.assertEqual(instances[key].end, expected[key].end)
+            self.assertTrue(instances[key].transp)
+            self.assertEqual(instances[key].fbtype, expected[key].component.getFBType())
+
+    @inlineCallbacks
+    def test_connectionLost(self):
+        """
+        Outstanding requests fail with L{OffloadError} when the helper process
+        goes away, and new requests are refused.
+        """
+        d = self.client.callRemote("validate", self.data)
+        self.client.connectionLost(Failure(Exception("gone")))
+        yield self.assertFailure(d, OffloadError)
+        self.assertRaises(OffloadError, self.client.callRemote, "validate", self.data)
+
+    def test_wantsOffload(self):
+        """
+        L{CalendarDataOffloadService.wantsOffload} only accepts large data, and
+        only when helper processes are running.
+        """
+        service = CalendarDataOffloadService(1, 10)
+        self.assertFalse(service.wantsOffload(20))
+        service.workers.append(self.client)
+        self.assertFalse(service.wantsOffload(5))
+        self.assertTrue(service.wantsOffload(20))
@@ -1531,6 +1531,86 @@ END:VCALENDAR
         yield obj1.remove()
         yield self.commit()
 
+    @inlineCallbacks
+    def test_unfilteredText(self):
+        """
+        L{CalendarObject.unfilteredText} returns the stored text only when no
+        per-user filtering of the data is needed.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:unfiltered
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+SUMMARY:unfiltered
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n") % self.nowYear
+
+        caldata_alarm = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:filtered
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+SUMMARY:filtered
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:filtered
+TRIGGER:-PT10M
+END:VALARM
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n") % self.nowYear
+
+        calendar = yield self.calendarUnderTest()
+        yield calendar.createCalendarObjectWithName("unfiltered.ics", Component.fromString(caldata))
+        yield calendar.createCalendarObjectWithName("filtered.ics", Component.fromString(caldata_alarm))
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="unfiltered.ics")
+        text = yield calendarObject.unfilteredText()
+        component = yield calendarObject.componentForUser()
+        self.assertEqual(text, str(component))
+        yield self.commit()
+
+        # Alarms are stored as per-user data
+        calendarObject = yield self.calendarObjectUnderTest(name="filtered.ics")
+        text = yield calendarObject.unfilteredText()
+        self.assertTrue(text is None)
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_loadObjectResourceText(self):
+        """
+        L{CommonHomeChild.loadObjectResourceText} pre-loads the text of the
+        specified objects in bulk.
+        """
+
+        self.patch(CalendarObject, "BATCH_LOAD_SIZE", 2)
+
+        calendar = yield self.calendarUnderTest()
+        objects = yield calendar.objectResources()
+        self.assertTrue(len(objects) > 2)
+        for obj in objects:
+            self.assertTrue(obj._textData is None)
+
+        yield calendar.loadObjectResourceText(objects)
+        for obj in objects:
+            self.assertTrue(obj._textData is not None)
+            component = yield obj.component()
+            self.assertEqual(component.resourceUID(), obj.uid())
+
     @inlineCallbacks
     def test_loadObjectResourcesWithName(self):
         """
@@ -299,22 +299,25 @@ class AddressBookHome(CommonHome):
             ),
         )
 
-    @classproperty
-    def _changesQuery(cls):  # @NoSelf
+    @classmethod
+    def _changesQuery(cls, limit):
         rev = cls._revisionsSchema
         return Select(
             [rev.ADDRESSBOOK_NAME,
              rev.RESOURCE_NAME,
-             rev.DELETED],
+             rev.DELETED,
+             rev.REVISION],
             From=rev,
             Where=(rev.REVISION > Parameter("revision")).And(
-                rev.HOME_RESOURCE_ID == Parameter("resourceID"))
+                rev.HOME_RESOURCE_ID == Parameter("resourceID")),
+            OrderBy=rev.REVISION,
+            Limit=limit,
         )
 
     @inlineCallbacks
-    def doChangesQuery(self, revision):
+    def doChangesQuery(self, revision, limit):
 
-        rows = yield self._changesQuery.on(
+        rows = yield self._changesQuery(limit).on(
             self._txn,
             resourceID=self._resourceID,
             revision=revision
@@ -302,6 +302,7 @@ class CommonStoreTransaction(DataStoreTransaction):
         self._notificationHomes = {}
         self._notifierFactories = notifierFactories
         self._notifiedAlready = set()
+        self._pushWorkItems = {}
         self._migrating = migrating
 
         extraInterfaces = []
@@ -400,6 +401,30 @@ class CommonStoreTransaction(DataStoreTransaction):
     def notificationAddedForObject(self, obj):
         self._notifiedAlready.add(obj)
 
+    def pushWorkItem(self, pushID):
+        """
+        The push notification work item already enqueued for a push ID in
+        this transaction, so that only one is enqueued per push ID.
+
+        @param pushID: the push ID
+        @type pushID: L{str}
+
+        @return: the work item, or C{None} if none has been enqueued
+        """
+        return self._pushWorkItems.get(pushID)
+
+    def setPushWorkItem(self, pushID, work):
+        """
+        Record the push notification work item enqueued for a push ID in this
+        transaction.
+
+        @param pushID: the push ID
+        @type pushID: L{str}
+        @param work: the work item
+        @type work: L{PushNotificationWork}
+        """
+        self._pushWorkItems[pushID] = work
+
 
 class StubResource(object):
     """
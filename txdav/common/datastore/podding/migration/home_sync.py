@@ -935,6 +935,8 @@ class CrossPodHomeSync(object):
         remote_records = yield txn.dumpIndividualDelegatesExternal(self.record)
         for record in remote_records:
             yield record.insert(txn)
+        for readWrite in (True, False):
+            yield txn.refreshExpandedDelegates(self.record.uid, readWrite)
 
         self.accounting("  Found {} individual delegates".format(len(remote_records)))
 
@@ -951,6 +953,8 @@ class CrossPodHomeSync(object):
             local_group = yield txn.groupByUID(group.groupUID)
             delegator.groupID = local_group.groupID
             yield delegator.insert(txn)
+        for readWrite in (True, False):
+            yield txn.refreshExpandedDelegates(self.record.uid, readWrite)
 
         self.accounting("  Found {} group delegates".format(len(remote_records)))
 
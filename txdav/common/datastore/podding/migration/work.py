@@ -24,7 +24,7 @@ from txdav.caldav.datastore.scheduling.work import allScheduleWork
 from txdav.common.datastore.podding.migration.sync_metadata import CalendarMigrationRecord, \
     CalendarObjectMigrationRecord, AttachmentMigrationRecord
 from txdav.common.datastore.sql_directory import DelegateRecord, \
-    DelegateGroupsRecord, ExternalDelegateGroupsRecord
+    DelegateGroupsRecord, ExternalDelegateGroupsRecord, DelegateExpandedRecord
 from txdav.common.datastore.sql_tables import schema, _HOME_STATUS_DISABLED
 
 
@@ -100,6 +100,7 @@ class MigratedHomeCleanupWork(WorkItem, fromTable(schema.MIGRATED_HOME_CLEANUP_W
         yield DelegateRecord.deletesome(self.transaction, DelegateRecord.delegator == self.ownerUID)
         yield DelegateGroupsRecord.deletesome(self.transaction, DelegateGroupsRecord.delegator == self.ownerUID)
         yield ExternalDelegateGroupsRecord.deletesome(self.transaction, ExternalDelegateGroupsRecord.delegator == self.ownerUID)
+        yield DelegateExpandedRecord.deletesome(self.transaction, DelegateExpandedRecord.delegator == self.ownerUID)
 
 
 class MigrationCleanupWork(WorkItem, fromTable(schema.MIGRATION_CLEANUP_WORK)):
@@ -594,6 +594,7 @@ class CommonStoreTransaction(
         }
         self._notifierFactories = notifierFactories
         self._notifiedAlready = set()
+        self._pushWorkItems = {}
         self._bumpedRevisionAlready = set()
         self._label = label
         self._migrating = migrating
@@ -866,6 +867,30 @@ class CommonStoreTransaction(
     def notificationAddedForObject(self, obj):
         self._notifiedAlready.add(obj.id())
 
+    def pushWorkItem(self, pushID):
+        """
+        The push notification work item already enqueued for a push ID in
+        this transaction, so that only one is enqueued per push ID.
+
+        @param pushID: the push ID
+        @type pushID: L{str}
+
+        @return: the work item, or C{None} if none has been enqueued
+        """
+        return self._pushWorkItems.get(pushID)
+
+    def setPushWorkItem(self, pushID, work):
+        """
+        Record the push notification work item enqueued for a push ID in this
+        transaction.
+
+        @param pushID: the push ID
+        @type pushID: L{str}
+        @param work: the work item
+        @type work: L{PushNotificationWork}
+        """
+        self._pushWorkItems[pushID] = work
+
     def isRevisionBumpedAlready(self, obj):
         """
         Indicates whether or not bumpRevisionForObject has already been
@@ -1120,19 +1145,10 @@ class CommonStoreTransaction(
             count += 1
         returnValue(count)
 
-    def orphanedAttachments(self, uuid=None, batchSize=None):
-        """
-        Find attachments no longer referenced by any events.
-
-        Returns a deferred to a list of (calendar_home_owner_uid, quota used, total orphan size, total orphan count) tuples.
-        """
-        kwds = {}
-        if uuid:
-            kwds["uuid"] = uuid
-
+    def _orphanedAttachmentsBase(self, uuid, limit):
         options = {}
-        if batchSize:
-            options["Limit"] = batchSize
+        if limit:
+            options["Limit"] = limit
 
         ch = schema.CALENDAR_HOME
         chm = schema.CALENDAR_HOME_METADATA
@@ -1153,7 +1169,18 @@ class CommonStoreTransaction(
             Where=where,
             GroupBy=(ch.OWNER_UID, chm.QUOTA_USED_BYTES),
             **options
-        ).on(self, **kwds)
+        )
+
+    def orphanedAttachments(self, uuid=None, batchSize=None):
+        """
+        Find attachments no longer referenced by any events.
+
+        Returns a deferred to a list of (calendar_home_owner_uid, quota used, total orphan size, total orphan count) tuples.
+        """
+        kwds = {}
+        if uuid:
+            kwds["uuid"] = uuid
+        return self._orphanedAttachmentsBase(uuid, batchSize).on(self, **kwds)
 
     @inlineCallbacks
     def removeOrphanedAttachments(self, uuid=None, batchSize=None):
@@ -1443,6 +1470,97 @@ class CommonStoreTransaction(
                         )
                     ).on(self, revisionsToRemove=revisionsToRemove)
 
+    @inlineCallbacks
+    def compactRevisions(self, batchSize, lastHomeIDs=None):
+        """
+        Remove redundant rows for one batch of homes from each of the revision
+        tables that can have them. A row is redundant if it is superseded by a
+        later row for the same resource name, or for the same deleted collection
+        name. Homes are handled in order of resource ID, so that each batch only
+        has to look at the revision rows of its own homes. Tombstones older than
+        the minimum valid revision are not handled here, since
+        L{deleteRevisionsBefore} has already removed them.
+
+        @param batchSize: the maximum number of homes to handle for each table
+        @type batchSize: C{int}
+        @param lastHomeIDs: the resource ID of the last home handled by the
+            previous batch, or C{None} if that batch finished the table, keyed by
+            revision table name. Tables not present start from the first home.
+        @type lastHomeIDs: C{dict}
+
+        @return: the number of rows removed from each table, and the value of
+            C{lastHomeIDs} for the next batch - every value is C{None} when there
+            is nothing more to do
+        @rtype: C{tuple} of (C{dict}, C{dict})
+        """
+        if lastHomeIDs is None:
+            lastHomeIDs = {}
+        removed = {}
+        nextHomeIDs = {}
+        for table, homeTable in (
+            (schema.CALENDAR_OBJECT_REVISIONS, schema.CALENDAR_HOME),
+            (schema.ADDRESSBOOK_OBJECT_REVISIONS, schema.ADDRESSBOOK_HOME),
+        ):
+            tableName = table.model.name
+            removed[tableName] = 0
+            nextHomeIDs[tableName] = None
+            lastHomeID = lastHomeIDs.get(tableName, 0)
+            if lastHomeID is None:
+                continue
+
+            homeRows = yield Select(
+                [homeTable.RESOURCE_ID],
+                From=homeTable,
+                Where=homeTable.RESOURCE_ID > lastHomeID,
+                OrderBy=homeTable.RESOURCE_ID,
+                Limit=batchSize,
+            ).on(self)
+            if not homeRows:
+                continue
+            if len(homeRows) == batchSize:
+                nextHomeIDs[tableName] = homeRows[-1][0]
+            inBatch = (table.HOME_RESOURCE_ID >= homeRows[0][0]).And(
+                table.HOME_RESOURCE_ID <= homeRows[-1][0])
+
+            # Child resources with more than one row - keep only the latest
+            rows = yield Select(
+                [table.HOME_RESOURCE_ID, table.RESOURCE_ID, table.RESOURCE_NAME, Max(table.REVISION)],
+                From=table,
+                Where=inBatch.And(table.RESOURCE_ID != None).And(table.RESOURCE_NAME != None),
+                GroupBy=(table.HOME_RESOURCE_ID, table.RESOURCE_ID, table.RESOURCE_NAME),
+                Having=Count(table.REVISION) > 1,
+            ).on(self)
+            for homeID, resourceID, name, revision in rows:
+                removed[tableName] += len((yield Delete(
+                    From=table,
+                    Where=(table.HOME_RESOURCE_ID == homeID).And(
+                        table.RESOURCE_ID == resourceID).And(
+                        table.RESOURCE_NAME == name).And(
+                        table.REVISION < revision),
+                    Return=table.REVISION,
+                ).on(self)))
+
+            # Collections deleted more than once - keep only the latest tombstone
+            rows = yield Select(
+                [table.HOME_RESOURCE_ID, table.COLLECTION_NAME, Max(table.REVISION)],
+                From=table,
+                Where=inBatch.And(table.RESOURCE_ID == None).And(table.RESOURCE_NAME == None),
+                GroupBy=(table.HOME_RESOURCE_ID, table.COLLECTION_NAME),
+                Having=Count(table.REVISION) > 1,
+            ).on(self)
+            for homeID, name, revision in rows:
+                removed[tableName] += len((yield Delete(
+                    From=table,
+                    Where=(table.HOME_RESOURCE_ID == homeID).And(
+                        table.COLLECTION_NAME == name).And(
+                        table.RESOURCE_ID == None).And(
+                        table.RESOURCE_NAME == None).And(
+                        table.REVISION < revision),
+                    Return=table.REVISION,
+                ).on(self)))
+
+        returnValue((removed, nextHomeIDs,))
+
     @classproperty
     def _inboxItemsInHomeIDCreatedBeforeCutoffQuery(cls):
         """
@@ -2359,8 +2477,13 @@ class CommonHome(SharingHomeMixIn):
             revision = int((yield self._txn.calendarserverValue("MIN-VALID-REVISION")))
         returnValue(revision)
 
-    @classproperty
-    def _changesQuery(cls):
+    @classmethod
+    def _changesQuery(cls, limit):
+        """
+        DAL query for the changes in this home since a revision, returning at
+        most C{limit} rows in revision order. Each row ends with its revision
+        so that callers can page through the changes.
+        """
         bind = cls._bindSchema
         rev = cls._revisionsSchema
         return Select(
@@ -2369,6 +2492,7 @@ class CommonHome(SharingHomeMixIn):
                 rev.COLLECTION_NAME,
                 rev.RESOURCE_NAME,
                 rev.DELETED,
+                rev.REVISION,
             ],
             From=rev.join(
                 bind,
@@ -2377,16 +2501,21 @@ class CommonHome(SharingHomeMixIn):
                 'left outer'
             ),
             Where=(rev.REVISION > Parameter("revision")).And
-                  (rev.HOME_RESOURCE_ID == Parameter("resourceID"))
+                  (rev.HOME_RESOURCE_ID == Parameter("resourceID")),
+            OrderBy=rev.REVISION,
+            Limit=limit,
         )
 
     @inlineCallbacks
-    def doChangesQuery(self, revision):
+    def doChangesQuery(self, revision, limit):
         """
-            Do the changes query.
+            Do the changes query for at most C{limit} changes after C{revision}.
             Subclasses may override.
+
+        @return: rows of (path, collection name, resource name, deleted flag,
+            revision) in revision order
         """
-        result = yield self._changesQuery.on(
+        result = yield self._changesQuery(limit).on(
             self._txn,
             resourceID=self._resourceID,
             revision=revision)
@@ -2442,18 +2571,6 @@ class CommonHome(SharingHomeMixIn):
             results = yield self.resourceNamesSinceRevisionZero(depth)
             returnValue(results)
 
-        # Use revision table to find changes since the last revision - this will not include
-        # changes to child resources of shared collections - those we will get later
-        results = [
-            (
-                path if path else (collection if collection else ""),
-                name if name else "",
-                wasdeleted
-            )
-            for path, collection, name, wasdeleted in
-            (yield self.doChangesQuery(revision))
-        ]
-
         if not config.ExposeTrashCollection:
             trash = yield self.getTrash(create=False)
             trashName = trash.name() if trash else None
@@ -2464,32 +2581,46 @@ class CommonHome(SharingHomeMixIn):
         deleted = set()
         invalid = set()
         deleted_collections = set()
-        for path, name, wasdeleted in results:
 
-            # Don't report the trash if it is hidden
-            if trashName and path == trashName:
-                continue
+        # Use revision table to find changes since the last revision - this will not include
+        # changes to child resources of shared collections - those we will get later. The rows
+        # are read in batches, in revision order, and collapsed as we go, so that a very old
+        # token on a busy home does not pull every revision row into memory at once.
+        batchSize = config.SyncReportBatchSize
+        lastRevision = revision
+        while True:
+            rows = yield self.doChangesQuery(lastRevision, batchSize)
+            for path, collection, name, wasdeleted, lastRevision in rows:
+                path = path if path else (collection if collection else "")
+                name = name if name else ""
+
+                # Don't report the trash if it is hidden
+                if trashName and path == trashName:
+                    continue
 
-            if wasdeleted:
-                if name:
-                    # Resource deleted - for depth "1" report collection as changed,
-                    # otherwise report resource as deleted
-                    if depth == "1":
-                        changed.add("%s/" % (path,))
+                if wasdeleted:
+                    if name:
+                        # Resource deleted - for depth "1" report collection as changed,
+                        # otherwise report resource as deleted
+                        if depth == "1":
+                            changed.add("%s/" % (path,))
+                        else:
+                            deleted.add("%s/%s" % (path, name,))
                     else:
-                        deleted.add("%s/%s" % (path, name,))
-                else:
-                    # Collection was deleted
-                    deleted.add("%s/" % (path,))
-                    deleted_collections.add(path)
+                        # Collection was deleted
+                        deleted.add("%s/" % (path,))
+                        deleted_collections.add(path)
 
-            if path not in deleted_collections:
-                # Always report collection as changed
-                changed.add("%s/" % (path,))
+                if path not in deleted_collections:
+                    # Always report collection as changed
+                    changed.add("%s/" % (path,))
 
-                # Resource changed - for depth "infinity" report resource as changed
-                if name and depth != "1":
-                    changed.add("%s/%s" % (path, name,))
+                    # Resource changed - for depth "infinity" report resource as changed
+                    if name and depth != "1":
+                        changed.add("%s/%s" % (path, name,))
+
+            if len(rows) < batchSize:
+                break
 
         # Now deal with existing shared collections
         # TODO: think about whether this can be done in one query rather than looping over each share
@@ -3677,6 +3808,16 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
         self._objectNames = sorted([result.name() for result in results])
         returnValue(results)
 
+    def loadObjectResourceText(self, objects):
+        """
+        Pre-load the data of the specified child objects with as few queries as
+        possible.
+
+        @param objects: the child objects to load
+        @type objects: C{list} of L{CommonObjectResource}
+        """
+        return self._objectResourceClass.loadAllText(self, objects)
+
     @inlineCallbacks
     def listObjectResources(self):
         """
@@ -4043,36 +4184,33 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
                     results = yield self.sharedChildResourceNamesSinceRevisionZero(depth)
                     returnValue(results)
 
-            rev = self._revisionsSchema
-            results = [
-                (
-                    self.name(),
-                    name if name else "",
-                    wasdeleted
-                )
-                for name, wasdeleted in
-                (yield Select(
-                    [rev.RESOURCE_NAME, rev.DELETED],
-                    From=rev,
-                    Where=(rev.REVISION > revision).And(
-                        rev.RESOURCE_ID == self._resourceID)
-                ).on(self._txn))
-                if name
-            ]
-
-            for path, name, wasdeleted in results:
-                if wasdeleted:
-                    if depth == "1":
-                        changed.add("%s/" % (path,))
-                    else:
-                        deleted.add("%s/%s" % (path, name,))
-
-                # Always report collection as changed
-                changed.add("%s/" % (path,))
+            # Page through the revisions of the shared collection in the same way as
+            # L{CommonHome.resourceNamesSinceRevision} does for the home
+            path = self.name()
+            batchSize = config.SyncReportBatchSize
+            lastRevision = revision
+            while True:
+                rows = yield self._objectNamesSinceRevisionQuery(batchSize).on(
+                    self._txn, revision=lastRevision, resourceID=self._resourceID)
+                for name, wasdeleted, lastRevision in rows:
+                    if not name:
+                        continue
+
+                    if wasdeleted:
+                        if depth == "1":
+                            changed.add("%s/" % (path,))
+                        else:
+                            deleted.add("%s/%s" % (path, name,))
+
+                    # Always report collection as changed
+                    changed.add("%s/" % (path,))
+
+                    # Resource changed - for depth "infinity" report resource as changed
+                    if depth != "1":
+                        changed.add("%s/%s" % (path, name,))
 
-                # Resource changed - for depth "infinity" report resource as changed
-                if name and depth != "1":
-                    changed.add("%s/%s" % (path, name,))
+                if len(rows) < batchSize:
+                    break
 
         returnValue((changed, deleted, invalid,))
 
@@ -5014,6 +5152,33 @@ class CommonObjectResource(FancyEqMixin, object):
         return Select([obj.TEXT], From=obj,
                       Where=obj.RESOURCE_ID == Parameter("resourceID"))
 
+    @classmethod
+    def _textByIDsQuery(cls, count):
+        """
+        DAL query to load iCalendar/vCard text for a set of resource IDs.
+        """
+        obj = cls._objectSchema
+        return Select([obj.RESOURCE_ID, obj.TEXT], From=obj,
+                      Where=obj.RESOURCE_ID.In(Parameter("resourceIDs", count)))
+
+    @classmethod
+    @inlineCallbacks
+    def loadAllText(cls, parent, objects):
+        """
+        Load the iCalendar/vCard text of all the specified child objects that
+        do not already have it, doing so in batches rather than with one query
+        per object. This is an optimization for reports that return the data of
+        many objects.
+        """
+        byID = dict([(obj._resourceID, obj) for obj in objects if obj._textData is None])
+        resourceIDs = tuple(byID.keys())
+        while(len(resourceIDs)):
+            batch = resourceIDs[:cls.BATCH_LOAD_SIZE]
+            rows = yield cls._textByIDsQuery(len(batch)).on(parent._txn, resourceIDs=batch)
+            for resourceID, text in rows:
+                byID[resourceID]._textData = text
+            resourceIDs = resourceIDs[cls.BATCH_LOAD_SIZE:]
+
     @inlineCallbacks
     def _text(self):
         if self._textData is None:
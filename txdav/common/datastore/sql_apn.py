@@ -17,7 +17,7 @@
 
 from twext.enterprise.dal.record import SerializableRecord, fromTable
 from twext.python.log import Logger
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from txdav.common.datastore.sql_tables import schema
 from txdav.common.icommondatastore import InvalidSubscriptionValues
 
@@ -109,6 +109,32 @@ class APNSubscriptionsMixin(object):
             resourceKey=key,
         )
 
+    @inlineCallbacks
+    def apnSubscriptionsByKeys(self, keys, batchSize=100):
+        """
+        Look up the subscriptions for many resource keys at once, using one
+        query per C{batchSize} keys rather than one per key.
+
+        @param keys: the resource keys to look up
+        @type keys: iterable of L{str}
+        @param batchSize: the maximum number of keys in each query
+        @type batchSize: L{int}
+
+        @return: a L{dict} mapping each key to a L{list} of its
+            L{APNSubscriptionsRecord}s; keys with no subscriptions map to an
+            empty list
+        """
+        keys = list(set(keys))
+        results = dict([(key, []) for key in keys])
+        for ctr in range(0, len(keys), batchSize):
+            records = yield APNSubscriptionsRecord.query(
+                self,
+                APNSubscriptionsRecord.resourceKey.In(keys[ctr:ctr + batchSize]),
+            )
+            for record in records:
+                results[record.resourceKey].append(record)
+        returnValue(results)
+
     def apnSubscriptionsBySubscriber(self, guid):
         return APNSubscriptionsRecord.querysimple(
             self,
@@ -22,8 +22,8 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from txdav.common.datastore.sql_tables import schema
 from txdav.common.icommondatastore import AllRetriesFailed, NotFoundError
 from txdav.who.delegates import Delegates
+from txdav.who.directory import groupMembershipHash
 import datetime
-import hashlib
 
 log = Logger()
 
@@ -134,22 +134,24 @@ class DelegateGroupsRecord(SerializableRecord, fromTable(schema.DELEGATE_GROUPS)
         )
 
     @classmethod
-    def indirectDelegates(cls, txn, delegator, readWrite):
+    def indirectDelegates(cls, txn, delegator, readWrite, members=None):
         """
-        Get delegates who are in groups which have been delegated to.
+        Get delegates who are in groups which have been delegated to,
+        optionally only those amongst the given member UIDs.
         """
 
-        return GroupMembershipRecord.query(
-            txn,
-            GroupMembershipRecord.groupID.In(
-                DelegateGroupsRecord.queryExpr(
-                    (DelegateGroupsRecord.delegator == delegator.encode("utf-8")).And(
-                        DelegateGroupsRecord.readWrite == (1 if readWrite else 0)
-                    ),
-                    attributes=(DelegateGroupsRecord.groupID,),
-                )
-            ),
+        expr = GroupMembershipRecord.groupID.In(
+            DelegateGroupsRecord.queryExpr(
+                (DelegateGroupsRecord.delegator == delegator.encode("utf-8")).And(
+                    DelegateGroupsRecord.readWrite == (1 if readWrite else 0)
+                ),
+                attributes=(DelegateGroupsRecord.groupID,),
+            )
         )
+        if members is not None:
+            expr = expr.And(GroupMembershipRecord.memberUID.In([uid.encode("utf-8") for uid in members]))
+
+        return GroupMembershipRecord.query(txn, expr)
 
     @classmethod
     @inlineCallbacks
@@ -191,6 +193,17 @@ class ExternalDelegateGroupsRecord(SerializableRecord, fromTable(schema.EXTERNAL
     pass
 
 
+class DelegateExpandedRecord(SerializableRecord, fromTable(schema.DELEGATE_EXPANDED)):
+    """
+    @DynamicAttrs
+    L{Record} for L{schema.DELEGATE_EXPANDED}: the delegates of each delegator
+    with group delegate assignments expanded to the group members. This is
+    derived from the DELEGATES, DELEGATE_GROUPS and GROUP_MEMBERSHIP tables and
+    kept up to date as they change.
+    """
+    pass
+
+
 class GroupsAPIMixin(object):
     """
     A mixin for L{CommonStoreTransaction} that covers the groups API.
@@ -292,6 +305,45 @@ class GroupsAPIMixin(object):
         else:
             raise NotFoundError
 
+    @inlineCallbacks
+    def removeGroups(self, groupUIDs):
+        """
+        Delete groups, together with their cached membership and any delegate
+        assignments to them.
+
+        @param groupUIDs: the UIDs of the groups to delete
+        @type groupUIDs: L{list} of C{unicode}
+
+        @return: Deferred firing with the UIDs of the groups deleted
+        """
+
+        # Delegate assignments to the groups are removed by a cascade, so note
+        # which delegators' expanded delegates will need refreshing
+        results = yield DelegateGroupsRecord.query(
+            self,
+            DelegateGroupsRecord.groupID.In(
+                GroupsRecord.queryExpr(
+                    GroupsRecord.groupUID.In(groupUIDs),
+                    attributes=(GroupsRecord.groupID,),
+                )
+            ),
+        )
+        delegators = set([(record.delegator.decode("utf-8"), record.readWrite == 1) for record in results])
+
+        rows = yield GroupsRecord.deletesome(
+            self,
+            GroupsRecord.groupUID.In(groupUIDs),
+            returnCols=GroupsRecord.groupUID,
+        )
+
+        if delegators:
+            changes = {}
+            for delegator, readWrite in delegators:
+                changes[(delegator, readWrite)] = yield self.refreshExpandedDelegates(delegator, readWrite)
+            yield Delegates.expandedDelegatesChanged(self, changes, directChanged=True)
+
+        returnValue([row[0] for row in rows])
+
 
 class GroupCacherAPIMixin(object):
     """
@@ -324,19 +376,23 @@ class GroupCacherAPIMixin(object):
         returnValue(set([record.memberUID.decode("utf-8") for record in members]))
 
     @inlineCallbacks
-    def refreshGroup(self, group, record):
+    def refreshGroup(self, group, record, memberUIDs=None):
         """
         @param group: the group record
         @type group: L{GroupsRecord}
         @param record: the directory record
         @type record: C{iDirectoryRecord}
+        @param memberUIDs: the expanded member UIDs of the directory record, if
+            already known
+        @type memberUIDs: iterable of C{unicode}
 
         @return: Deferred firing with membershipChanged C{boolean}
 
         """
 
         if record is not None:
-            memberUIDs = yield record.expandedMemberUIDs()
+            if memberUIDs is None:
+                memberUIDs = yield record.expandedMemberUIDs()
             name = record.displayName
             extant = True
         else:
@@ -344,10 +400,7 @@ class GroupCacherAPIMixin(object):
             name = group.name
             extant = False
 
-        membershipHashContent = hashlib.md5()
-        for memberUID in sorted(memberUIDs):
-            membershipHashContent.update(str(memberUID))
-        membershipHash = membershipHashContent.hexdigest()
+        membershipHash = groupMembershipHash(memberUIDs)
 
         if group.membershipHash != membershipHash:
             membershipChanged = True
@@ -411,7 +464,18 @@ class GroupCacherAPIMixin(object):
         @param removedUIDs: set of old member UIDs removed from the group
         @type removedUIDs: L{set} of L{str}
         """
-        yield Delegates.groupChanged(self, groupID, addedUIDs, removedUIDs)
+
+        # Only the changed members need checking in the expanded delegates of
+        # each delegator using the group
+        changes = {}
+        for readWrite in (True, False):
+            delegators = yield self.delegatorsToGroup(groupID, readWrite)
+            for delegator in delegators:
+                changes[(delegator, readWrite)] = yield self.refreshExpandedDelegates(
+                    delegator, readWrite, addedUIDs | removedUIDs
+                )
+
+        yield Delegates.expandedDelegatesChanged(self, changes)
 
     @inlineCallbacks
     def groupMembers(self, groupID):
@@ -478,6 +542,9 @@ class DelegatesAPIMixin(object):
     A mixin for L{CommonStoreTransaction} that covers the delegates API.
     """
 
+    # Largest number of UIDs to check at once in the expanded delegates
+    expandedDelegatesBatchSize = 100
+
     @inlineCallbacks
     def addDelegate(self, delegator, delegate, readWrite):
         """
@@ -506,6 +573,8 @@ class DelegatesAPIMixin(object):
         except AllRetriesFailed:
             pass
 
+        yield self.refreshExpandedDelegates(delegator, readWrite, (delegate,))
+
     @inlineCallbacks
     def addDelegateGroup(self, delegator, delegateGroupID, readWrite,
                          isExternal=False):
@@ -536,6 +605,9 @@ class DelegatesAPIMixin(object):
         except AllRetriesFailed:
             pass
 
+        yield self.refreshExpandedDelegates(delegator, readWrite)
+
+    @inlineCallbacks
     def removeDelegate(self, delegator, delegate, readWrite):
         """
         Removes a row from the DELEGATES table.  The delegate should not be a
@@ -549,13 +621,16 @@ class DelegatesAPIMixin(object):
             read-only access
         @type readWrite: C{boolean}
         """
-        return DelegateRecord.deletesimple(
+        yield DelegateRecord.deletesimple(
             self,
             delegator=delegator.encode("utf-8"),
             delegate=delegate.encode("utf-8"),
             readWrite=(1 if readWrite else 0),
         )
 
+        yield self.refreshExpandedDelegates(delegator, readWrite, (delegate,))
+
+    @inlineCallbacks
     def removeDelegates(self, delegator, readWrite):
         """
         Removes all rows for this delegator/readWrite combination from the
@@ -567,12 +642,15 @@ class DelegatesAPIMixin(object):
             read-only access
         @type readWrite: C{boolean}
         """
-        return DelegateRecord.deletesimple(
+        yield DelegateRecord.deletesimple(
             self,
             delegator=delegator.encode("utf-8"),
             readWrite=(1 if readWrite else 0)
         )
 
+        yield self.refreshExpandedDelegates(delegator, readWrite)
+
+    @inlineCallbacks
     def removeDelegateGroup(self, delegator, delegateGroupID, readWrite):
         """
         Removes a row from the DELEGATE_GROUPS table.  The delegate should be a
@@ -586,13 +664,16 @@ class DelegatesAPIMixin(object):
             read-only access
         @type readWrite: C{boolean}
         """
-        return DelegateGroupsRecord.deletesimple(
+        yield DelegateGroupsRecord.deletesimple(
             self,
             delegator=delegator.encode("utf-8"),
             groupID=delegateGroupID,
             readWrite=(1 if readWrite else 0),
         )
 
+        yield self.refreshExpandedDelegates(delegator, readWrite)
+
+    @inlineCallbacks
     def removeDelegateGroups(self, delegator, readWrite):
         """
         Removes all rows for this delegator/readWrite combination from the
@@ -604,12 +685,14 @@ class DelegatesAPIMixin(object):
             read-only access
         @type readWrite: C{boolean}
         """
-        return DelegateGroupsRecord.deletesimple(
+        yield DelegateGroupsRecord.deletesimple(
             self,
             delegator=delegator.encode("utf-8"),
             readWrite=(1 if readWrite else 0),
         )
 
+        yield self.refreshExpandedDelegates(delegator, readWrite)
+
     @inlineCallbacks
     def delegates(self, delegator, readWrite, expanded=False):
         """
@@ -627,9 +710,19 @@ class DelegatesAPIMixin(object):
             type)
         @rtype: a Deferred resulting in a set
         """
-        delegates = set()
         delegatorU = delegator.encode("utf-8")
 
+        if expanded:
+            results = yield DelegateExpandedRecord.query(
+                self,
+                (DelegateExpandedRecord.delegator == delegatorU).And(
+                    DelegateExpandedRecord.readWrite == (1 if readWrite else 0)
+                )
+            )
+            returnValue(set([record.delegate.decode("utf-8") for record in results]))
+
+        delegates = set()
+
         # First get the direct delegates
         results = yield DelegateRecord.query(
             self,
@@ -639,20 +732,11 @@ class DelegatesAPIMixin(object):
         )
         delegates.update([record.delegate.decode("utf-8") for record in results])
 
-        if expanded:
-            # Get those who are in groups which have been delegated to
-            results = yield DelegateGroupsRecord.indirectDelegates(
-                self, delegator, readWrite
-            )
-            # Skip the delegator if they are in one of the groups
-            delegates.update([record.memberUID.decode("utf-8") for record in results if record.memberUID != delegatorU])
-
-        else:
-            # Get the directly-delegated-to groups
-            results = yield DelegateGroupsRecord.delegateGroups(
-                self, delegator, readWrite,
-            )
-            delegates.update([record.groupUID.decode("utf-8") for record in results])
+        # Get the directly-delegated-to groups
+        results = yield DelegateGroupsRecord.delegateGroups(
+            self, delegator, readWrite,
+        )
+        delegates.update([record.groupUID.decode("utf-8") for record in results])
 
         returnValue(delegates)
 
@@ -671,27 +755,158 @@ class DelegatesAPIMixin(object):
             type)
         @rtype: a Deferred resulting in a set
         """
-        delegators = set()
-        delegateU = delegate.encode("utf-8")
-
-        # First get the direct delegators
-        results = yield DelegateRecord.query(
+        results = yield DelegateExpandedRecord.query(
             self,
-            (DelegateRecord.delegate == delegateU).And(
-                DelegateRecord.readWrite == (1 if readWrite else 0)
+            (DelegateExpandedRecord.delegate == delegate.encode("utf-8")).And(
+                DelegateExpandedRecord.readWrite == (1 if readWrite else 0)
             )
         )
-        delegators.update([record.delegator.decode("utf-8") for record in results])
+        returnValue(set([record.delegator.decode("utf-8") for record in results]))
 
-        # Finally get those who have delegated to groups the delegate
-        # is a member of
-        results = yield DelegateGroupsRecord.indirectDelegators(
-            self, delegate, readWrite
+    @inlineCallbacks
+    def delegatorsOfDelegates(self, delegates, readWrite):
+        """
+        Returns the UIDs of the delegators which have granted access to each
+        of the given delegates, either directly or indirectly via groups,
+        using one query per batch of delegates.
+
+        @param delegates: the UIDs of the delegates
+        @type delegates: iterable of C{unicode}
+        @param readWrite: the access-type to check for; read and write
+            access if True, otherwise read-only access
+        @type readWrite: C{boolean}
+        @returns: the UIDs of the delegators (for the specified access
+            type) keyed by delegate UID
+        @rtype: a Deferred resulting in a dict
+        """
+        delegates = list(delegates)
+        delegators = dict([(delegate, set()) for delegate in delegates])
+        while delegates:
+            batch = delegates[:self.expandedDelegatesBatchSize]
+            del delegates[:self.expandedDelegatesBatchSize]
+            results = yield DelegateExpandedRecord.query(
+                self,
+                DelegateExpandedRecord.delegate.In([delegate.encode("utf-8") for delegate in batch]).And(
+                    DelegateExpandedRecord.readWrite == (1 if readWrite else 0)
+                )
+            )
+            for record in results:
+                delegators[record.delegate.decode("utf-8")].add(record.delegator.decode("utf-8"))
+
+        returnValue(delegators)
+
+    @inlineCallbacks
+    def _expandDelegates(self, delegator, readWrite, delegates=None):
+        """
+        Work out the expanded delegates of the given delegator from the direct
+        and group delegate assignments and the cached group membership.
+
+        @param delegator: the UID of the delegator
+        @type delegator: C{unicode}
+        @param readWrite: the access-type to check for; read and write
+            access if True, otherwise read-only access
+        @type readWrite: C{boolean}
+        @param delegates: if not C{None}, only these UIDs are considered
+        @type delegates: iterable of C{unicode}
+        @returns: the UIDs of the delegates
+        @rtype: a Deferred resulting in a set
+        """
+        expanded = set()
+        delegatorU = delegator.encode("utf-8")
+
+        # First get the direct delegates
+        expr = (DelegateRecord.delegator == delegatorU).And(
+            DelegateRecord.readWrite == (1 if readWrite else 0)
+        )
+        if delegates is not None:
+            expr = expr.And(DelegateRecord.delegate.In([delegate.encode("utf-8") for delegate in delegates]))
+        results = yield DelegateRecord.query(self, expr)
+        expanded.update([record.delegate.decode("utf-8") for record in results])
+
+        # Get those who are in groups which have been delegated to
+        results = yield DelegateGroupsRecord.indirectDelegates(
+            self, delegator, readWrite, members=delegates
         )
         # Skip the delegator if they are in one of the groups
-        delegators.update([record.delegator.decode("utf-8") for record in results if record.delegator != delegateU])
+        expanded.update([record.memberUID.decode("utf-8") for record in results if record.memberUID != delegatorU])
 
-        returnValue(delegators)
+        returnValue(expanded)
+
+    @inlineCallbacks
+    def refreshExpandedDelegates(self, delegator, readWrite, delegates=None):
+        """
+        Bring the DELEGATE_EXPANDED rows for the given delegator up to date
+        with its delegate assignments and the membership of any groups it has
+        delegated to. This needs to be called whenever any of those change.
+
+        @param delegator: the UID of the delegator
+        @type delegator: C{unicode}
+        @param readWrite: the access-type to refresh; read and write access if
+            True, otherwise read-only access
+        @type readWrite: C{boolean}
+        @param delegates: if not C{None}, only these UIDs can have changed, so
+            only these are checked
+        @type delegates: iterable of C{unicode}
+        @returns: the UIDs added to and removed from the expanded delegates
+        @rtype: a Deferred resulting in a tuple of two sets
+        """
+        if delegates is not None:
+            delegates = set(delegates)
+            if not delegates:
+                returnValue((set(), set(),))
+            if len(delegates) > self.expandedDelegatesBatchSize:
+                delegates = None
+
+        delegatorU = delegator.encode("utf-8")
+        readWriteValue = 1 if readWrite else 0
+
+        expanded = yield self._expandDelegates(delegator, readWrite, delegates)
+
+        expr = (DelegateExpandedRecord.delegator == delegatorU).And(
+            DelegateExpandedRecord.readWrite == readWriteValue
+        )
+        if delegates is not None:
+            expr = expr.And(DelegateExpandedRecord.delegate.In([delegate.encode("utf-8") for delegate in delegates]))
+        results = yield DelegateExpandedRecord.query(self, expr)
+        existing = set([record.delegate.decode("utf-8") for record in results])
+
+        removed = existing - expanded
+        if removed:
+            yield DelegateExpandedRecord.deletesome(
+                self,
+                (DelegateExpandedRecord.delegator == delegatorU).And(
+                    DelegateExpandedRecord.readWrite == readWriteValue
+                ).And(
+                    DelegateExpandedRecord.delegate.In([delegate.encode("utf-8") for delegate in removed])
+                ),
+            )
+
+        added = expanded - existing
+        if added:
+            def _addExpanded(toAdd):
+                @inlineCallbacks
+                def _add(subtxn):
+                    for delegate in toAdd:
+                        yield DelegateExpandedRecord.create(
+                            subtxn,
+                            delegator=delegatorU,
+                            delegate=delegate.encode("utf-8"),
+                            readWrite=readWriteValue,
+                        )
+                return self.subtransaction(_add, retries=0, failureOK=True)
+
+            try:
+                yield _addExpanded(added)
+            except AllRetriesFailed:
+                # Another transaction refreshing the same delegator got to
+                # some of these first, so add them one at a time
+                for delegate in added:
+                    try:
+                        yield _addExpanded((delegate,))
+                    except AllRetriesFailed:
+                        pass
+
+        returnValue((added, removed,))
 
     @inlineCallbacks
     def delegatorsToGroup(self, delegateGroupID, readWrite):
@@ -826,10 +1041,14 @@ class DelegatesAPIMixin(object):
             yield self.addDelegateGroup(
                 delegator, readDelegateGroupID, False, isExternal=True
             )
+        else:
+            yield self.refreshExpandedDelegates(delegator, False)
         if writeDelegateGroupID is not None:
             yield self.addDelegateGroup(
                 delegator, writeDelegateGroupID, True, isExternal=True
             )
+        else:
+            yield self.refreshExpandedDelegates(delegator, True)
 
     def dumpIndividualDelegatesLocal(self, delegator):
         """
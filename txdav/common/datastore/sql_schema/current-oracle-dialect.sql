@@ -591,6 +591,14 @@ create table DELEGATE_GROUPS (
 );
 
 
+create table DELEGATE_EXPANDED (
+    "DELEGATOR" nvarchar2(255),
+    "DELEGATE" nvarchar2(255),
+    "READ_WRITE" integer not null, 
+    primary key ("DELEGATOR", "READ_WRITE", "DELEGATE")
+);
+
+
 create table EXTERNAL_DELEGATE_GROUPS (
     "DELEGATOR" nvarchar2(255) primary key,
     "GROUP_UID_READ" nvarchar2(255),
@@ -623,6 +631,13 @@ create table REVISION_CLEANUP_WORK (
     "JOB_ID" integer not null references JOB
 );
 
+create table REVISION_COMPACTION_WORK (
+    "WORK_ID" integer primary key,
+    "JOB_ID" integer not null references JOB,
+    "CALENDAR_HOME_RESOURCE_ID" integer default 0,
+    "ADDRESSBOOK_HOME_RESOURCE_ID" integer default 0
+);
+
 
 create table INBOX_CLEANUP_WORK (
     "WORK_ID" integer primary key,
@@ -772,7 +787,7 @@ create table CALENDARSERVER (
     "VALUE" nvarchar2(255)
 );
 
-insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '65');
+insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '67');
 insert into CALENDARSERVER (NAME, VALUE) values ('CALENDAR-DATAVERSION', '6');
 insert into CALENDARSERVER (NAME, VALUE) values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER (NAME, VALUE) values ('NOTIFICATION-DATAVERSION', '1');
@@ -1062,6 +1077,12 @@ create index DELEGATE_GROUPS_GROUP_25117446 on DELEGATE_GROUPS (
     "GROUP_ID"
 );
 
+create index DELEGATE_EXPANDED_TO__b5131e43 on DELEGATE_EXPANDED (
+    "DELEGATE",
+    "READ_WRITE",
+    "DELEGATOR"
+);
+
 create index CALENDAR_OBJECT_SPLIT_af71dcda on CALENDAR_OBJECT_SPLITTER_WORK (
     "RESOURCE_ID"
 );
@@ -1086,6 +1107,10 @@ create index REVISION_CLEANUP_WORK_eb062686 on REVISION_CLEANUP_WORK (
     "JOB_ID"
 );
 
+create index REVISION_COMPACTION_W_61d3c53a on REVISION_COMPACTION_WORK (
+    "JOB_ID"
+);
+
 create index INBOX_CLEANUP_WORK_JO_799132bd on INBOX_CLEANUP_WORK (
     "JOB_ID"
 );
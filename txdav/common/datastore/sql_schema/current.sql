@@ -994,6 +994,16 @@ create table DELEGATE_GROUPS (
 create index DELEGATE_GROUPS_GROUP_ID on
   DELEGATE_GROUPS(GROUP_ID);
 
+create table DELEGATE_EXPANDED (
+  DELEGATOR                     varchar(255) not null,
+  DELEGATE                      varchar(255) not null,
+  READ_WRITE                    integer      not null, -- 1 = ReadWrite, 0 = ReadOnly
+
+  primary key (DELEGATOR, READ_WRITE, DELEGATE)
+);
+create index DELEGATE_EXPANDED_TO_DELEGATOR on
+  DELEGATE_EXPANDED(DELEGATE, READ_WRITE, DELEGATOR);
+
 create table EXTERNAL_DELEGATE_GROUPS (
   DELEGATOR                     varchar(255) primary key,
   GROUP_UID_READ                varchar(255),
@@ -1050,6 +1060,16 @@ create table REVISION_CLEANUP_WORK (
 create index REVISION_CLEANUP_WORK_JOB_ID on
   REVISION_CLEANUP_WORK(JOB_ID);
 
+create table REVISION_COMPACTION_WORK (
+  WORK_ID                       integer      primary key default nextval('WORKITEM_SEQ'), -- implicit index
+  JOB_ID                        integer      references JOB not null,
+  CALENDAR_HOME_RESOURCE_ID     integer      default 0,
+  ADDRESSBOOK_HOME_RESOURCE_ID  integer      default 0
+);
+
+create index REVISION_COMPACTION_WORK_JOB_ID on
+  REVISION_COMPACTION_WORK(JOB_ID);
+
 ------------------------
 -- Inbox Cleanup Work --
 ------------------------
@@ -1314,7 +1334,7 @@ create table CALENDARSERVER (
   VALUE                         varchar(255)
 );
 
-insert into CALENDARSERVER values ('VERSION', '65');
+insert into CALENDARSERVER values ('VERSION', '67');
 insert into CALENDARSERVER values ('CALENDAR-DATAVERSION', '6');
 insert into CALENDARSERVER values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER values ('NOTIFICATION-DATAVERSION', '1');
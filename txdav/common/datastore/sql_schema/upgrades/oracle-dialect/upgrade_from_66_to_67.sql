@@ -0,0 +1,44 @@
+----
+-- Copyright (c) 2012-2017 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+---------------------------------------------------
+-- Upgrade database schema from VERSION 66 to 67 --
+---------------------------------------------------
+
+create table DELEGATE_EXPANDED (
+    "DELEGATOR" nvarchar2(255),
+    "DELEGATE" nvarchar2(255),
+    "READ_WRITE" integer not null, 
+    primary key ("DELEGATOR", "READ_WRITE", "DELEGATE")
+);
+
+create index DELEGATE_EXPANDED_TO__b5131e43 on DELEGATE_EXPANDED (
+    "DELEGATE",
+    "READ_WRITE",
+    "DELEGATOR"
+);
+
+-- populate from the existing direct and group delegate assignments
+insert into DELEGATE_EXPANDED (DELEGATOR, DELEGATE, READ_WRITE)
+    select DELEGATOR, DELEGATE, READ_WRITE from DELEGATES
+    union
+    select DELEGATE_GROUPS.DELEGATOR, GROUP_MEMBERSHIP.MEMBER_UID, DELEGATE_GROUPS.READ_WRITE
+        from DELEGATE_GROUPS, GROUP_MEMBERSHIP
+        where DELEGATE_GROUPS.GROUP_ID = GROUP_MEMBERSHIP.GROUP_ID
+            and DELEGATE_GROUPS.DELEGATOR != GROUP_MEMBERSHIP.MEMBER_UID;
+
+
+-- update the version
+update CALENDARSERVER set VALUE = '67' where NAME = 'VERSION';
@@ -0,0 +1,36 @@
+----
+-- Copyright (c) 2012-2017 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+
+---------------------------------------------------
+-- Upgrade database schema from VERSION 65 to 66 --
+---------------------------------------------------
+
+------------------------------
+-- Revision Compaction Work --
+------------------------------
+
+create table REVISION_COMPACTION_WORK (
+  WORK_ID                       integer      primary key default nextval('WORKITEM_SEQ'), -- implicit index
+  JOB_ID                        integer      references JOB not null,
+  CALENDAR_HOME_RESOURCE_ID     integer      default 0,
+  ADDRESSBOOK_HOME_RESOURCE_ID  integer      default 0
+);
+
+create index REVISION_COMPACTION_WORK_JOB_ID on
+  REVISION_COMPACTION_WORK(JOB_ID);
+
+-- update the version
+update CALENDARSERVER set VALUE = '66' where NAME = 'VERSION';
@@ -20,6 +20,7 @@ from twext.enterprise.dal.syntax import Max, Select, Parameter, Delete, Insert,
 from twext.python.clsprop import classproperty
 from twext.python.log import Logger
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue
+from twistedcaldav.config import config
 from txdav.base.datastore.util import normalizeUUIDOrNot
 from txdav.common.datastore.sql_tables import schema
 from txdav.common.icommondatastore import SyncTokenValidException, \
@@ -114,18 +115,22 @@ class _SharedSyncLogic(object):
         raise NotImplementedError()
 
     @classmethod
-    def _objectNamesSinceRevisionQuery(cls, deleted=True):
+    def _objectNamesSinceRevisionQuery(cls, limit, deleted=True):
         """
-        DAL query for (resource, deleted-flag)
+        DAL query for (resource, deleted-flag, revision), returning at most
+        C{limit} rows in revision order so that callers can page through the
+        changes by passing the last revision seen as the next C{revision}.
         """
         rev = cls._revisionsSchema
         where = (rev.REVISION > Parameter("revision")).And(rev.RESOURCE_ID == Parameter("resourceID"))
         if not deleted:
             where = where.And(rev.DELETED == False)
         return Select(
-            [rev.RESOURCE_NAME, rev.DELETED],
+            [rev.RESOURCE_NAME, rev.DELETED, rev.REVISION],
             From=rev,
             Where=where,
+            OrderBy=rev.REVISION,
+            Limit=limit,
         )
 
     def resourceNamesSinceToken(self, token):
@@ -155,15 +160,20 @@ class _SharedSyncLogic(object):
             if revision < int(minValidRevision):
                 raise SyncTokenValidException
 
-            results = [
-                (name if name else "", removed) for name, removed in (
-                    yield self._objectNamesSinceRevisionQuery().on(
-                        self._txn, revision=revision, resourceID=self._resourceID)
-                )
-            ]
-            results.sort(key=lambda x: x[1])
-
-            for name, wasdeleted in results:
+            # Page through the revisions in batches so that a very old token
+            # on a busy collection does not read every row in one go
+            results = {}
+            batchSize = config.SyncReportBatchSize
+            lastRevision = revision
+            while True:
+                rows = yield self._objectNamesSinceRevisionQuery(batchSize).on(
+                    self._txn, revision=lastRevision, resourceID=self._resourceID)
+                for name, removed, lastRevision in rows:
+                    results[name if name else ""] = (removed, lastRevision)
+                if len(rows) < batchSize:
+                    break
+
+            for name, (wasdeleted, _ignore_revision) in sorted(results.items(), key=lambda x: x[1]):
                 if name:
                     if wasdeleted:
                         deleted.append(name)
@@ -26,6 +26,7 @@ from twisted.internet.defer import Deferred
 from twisted.internet.defer import inlineCallbacks, returnValue, succeed
 from twisted.internet.task import Clock
 from twisted.trial.unittest import TestCase
+from twistedcaldav.config import config
 # from twistedcaldav.vcard import Component as VCard
 from txdav.common.datastore.sql import (
     log, CommonStoreTransactionMonitor,
@@ -344,6 +345,38 @@ class CommonSQLStoreTests(CommonCommonTests, TestCase):
 
         yield txn.abort()
 
+    @inlineCallbacks
+    def test_changeRevisionBatches(self):
+        """
+        Changes since a revision are read in batches, and give the same results
+        whatever the batch size.
+        """
+        txn = self.transactionUnderTest()
+        home = yield txn.homeWithUID(ECALENDARTYPE, "uid", create=True)
+        calendar = yield home.createCalendarWithName("B")
+        revision = yield calendar.syncTokenRevision()
+
+        for name in ("C", "D", "E", "F", "G"):
+            yield calendar._changeRevision("insert", name)
+        yield calendar._changeRevision("update", "C")
+        yield calendar._changeRevision("delete", "D")
+
+        results = []
+        for batchSize in (1, 2, 1000):
+            self.patch(config, "SyncReportBatchSize", batchSize)
+            changed = yield calendar.resourceNamesSinceRevision(revision)
+            homeChanged = yield home.resourceNamesSinceRevision(revision, "infinity")
+            results.append((changed, homeChanged,))
+
+        self.assertEqual(results[0][0], (["E", "F", "G", "C"], ["D"], [],))
+        self.assertEqual(results[0][1], (
+            ["B/", "B/C", "B/D", "B/E", "B/F", "B/G"], ["B/D"], [],
+        ))
+        self.assertEqual(results[1], results[0])
+        self.assertEqual(results[2], results[0])
+
+        yield txn.abort()
+
     @inlineCallbacks
     def test_normalizeColumnUUIDs(self):
         """
@@ -89,6 +89,10 @@ class FindMinValidRevisionWork(RegeneratingWorkItem, fromTable(schema.FIND_MIN_V
             # Schedule revision cleanup
             yield RevisionCleanupWork.reschedule(self.transaction, seconds=0)
 
+        elif config.RevisionCleanup.CompactionEnabled:
+            # Nothing to clean up, but there may still be superseded rows
+            yield RevisionCompactionWork.reschedule(self.transaction, seconds=0)
+
 
 class RevisionCleanupWork(SingletonWorkItem, fromTable(schema.REVISION_CLEANUP_WORK)):
 
@@ -103,6 +107,48 @@ class RevisionCleanupWork(SingletonWorkItem, fromTable(schema.REVISION_CLEANUP_W
         # delete revisions
         yield self.transaction.deleteRevisionsBefore(minValidRevision)
 
+        # Schedule revision compaction
+        if config.RevisionCleanup.CompactionEnabled:
+            yield RevisionCompactionWork.reschedule(self.transaction, seconds=0)
+
+
+class RevisionCompactionWork(SingletonWorkItem, fromTable(schema.REVISION_COMPACTION_WORK)):
+    """
+    Remove superseded rows from the revision tables, one batch of homes at a
+    time, rescheduling itself after a delay until there is nothing left to do.
+    The work item records the last calendar and addressbook home handled so far,
+    or C{None} once all of them have been.
+    """
+
+    group = "group_revision_compaction"
+
+    @inlineCallbacks
+    def doWork(self):
+
+        # compact one batch
+        calendarRevisions = schema.CALENDAR_OBJECT_REVISIONS.model.name
+        addressbookRevisions = schema.ADDRESSBOOK_OBJECT_REVISIONS.model.name
+        removed, lastHomeIDs = yield self.transaction.compactRevisions(
+            config.RevisionCleanup.CompactionBatchSize,
+            {
+                calendarRevisions: self.calendarHomeResourceID,
+                addressbookRevisions: self.addressbookHomeResourceID,
+            },
+        )
+        log.info(
+            "Revision compaction removed {count} rows: {removed}",
+            count=sum(removed.values()),
+            removed=", ".join(["{}={}".format(table, count) for table, count in sorted(removed.items())]),
+        )
+
+        if any([homeID is not None for homeID in lastHomeIDs.values()]):
+            yield RevisionCompactionWork.reschedule(
+                self.transaction,
+                seconds=config.RevisionCleanup.CompactionBatchDelaySeconds,
+                calendarHomeResourceID=lastHomeIDs[calendarRevisions],
+                addressbookHomeResourceID=lastHomeIDs[addressbookRevisions],
+            )
+
 
 @inlineCallbacks
 def _triggerRevisionCleanup(txn, backSeconds):
@@ -15,7 +15,7 @@
 ##
 
 
-from twext.enterprise.dal.syntax import Select
+from twext.enterprise.dal.syntax import Insert, Select
 from twext.enterprise.jobs.jobitem import JobItem
 from twext.python.clsprop import classproperty
 from twisted.internet import reactor
@@ -26,7 +26,8 @@ from twistedcaldav.ical import Component
 from twistedcaldav.vcard import Component as VCard
 from txdav.common.datastore.sql_tables import schema, _BIND_MODE_READ
 from txdav.common.datastore.test.util import CommonCommonTests, populateCalendarsFrom
-from txdav.common.datastore.work.revision_cleanup import FindMinValidRevisionWork, RevisionCleanupWork
+from txdav.common.datastore.work.revision_cleanup import FindMinValidRevisionWork, RevisionCleanupWork, \
+    RevisionCompactionWork
 from txdav.common.icommondatastore import SyncTokenValidException
 import datetime
 import time
@@ -580,3 +581,112 @@ END:VCARD
         # old sync token fails
         addressbook = yield self.addressbookUnderTest(home="user01", name="addressbook")
         yield self.failUnlessFailure(addressbook.resourceNamesSinceToken(token), SyncTokenValidException)
+
+    @inlineCallbacks
+    def test_revisionCompaction(self):
+        """
+        Verify that superseded calendar object revisions are removed in batches by
+        RevisionCompactionWork, without changing sync results
+        """
+
+        self.patch(config.RevisionCleanup, "CompactionBatchSize", 1)
+        self.patch(config.RevisionCleanup, "CompactionBatchDelaySeconds", 0)
+
+        home = yield self.homeUnderTest(name="user01")
+        homeID = home._resourceID
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        calendarID = calendar._resourceID
+        revision = yield calendar.syncTokenRevision()
+
+        # Later rows for existing resource names, and a collection deleted twice
+        rev = schema.CALENDAR_OBJECT_REVISIONS
+        for name in ("cal1.ics", "cal2.ics",):
+            yield Insert({
+                rev.CALENDAR_HOME_RESOURCE_ID: homeID,
+                rev.CALENDAR_RESOURCE_ID: calendarID,
+                rev.RESOURCE_NAME: name,
+                rev.DELETED: False,
+            }).on(self.transactionUnderTest())
+        for _ignore in range(2):
+            yield Insert({
+                rev.CALENDAR_HOME_RESOURCE_ID: homeID,
+                rev.CALENDAR_RESOURCE_ID: None,
+                rev.CALENDAR_NAME: "removed",
+                rev.RESOURCE_NAME: None,
+                rev.DELETED: True,
+            }).on(self.transactionUnderTest())
+        yield self.commit()
+
+        home = yield self.homeUnderTest(name="user01")
+        homeNames = yield home.resourceNamesSinceRevision(revision, "infinity")
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        names = yield calendar.resourceNamesSinceRevision(revision)
+        revisionRows = yield Select(
+            [rev.REVISION],
+            From=rev,
+            Where=rev.CALENDAR_HOME_RESOURCE_ID == homeID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+
+        # do RevisionCompactionWork
+        yield self.transactionUnderTest().enqueue(RevisionCompactionWork, notBefore=datetime.datetime.utcnow())
+        yield self.commit()
+        yield JobItem.waitEmpty(self.storeUnderTest().newTransaction, reactor, 60)
+
+        # One row removed for each duplicated name
+        compactedRows = yield Select(
+            [rev.REVISION],
+            From=rev,
+            Where=rev.CALENDAR_HOME_RESOURCE_ID == homeID,
+        ).on(self.transactionUnderTest())
+        self.assertEqual(len(compactedRows), len(revisionRows) - 3)
+
+        # Same sync results
+        home = yield self.homeUnderTest(name="user01")
+        self.assertEqual((yield home.resourceNamesSinceRevision(revision, "infinity")), homeNames)
+        self.assertTrue("removed/" in homeNames[1])
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        self.assertEqual((yield calendar.resourceNamesSinceRevision(revision)), names)
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_compactRevisionsBatches(self):
+        """
+        Verify that compactRevisions handles one batch of homes at a time, and
+        returns where the next batch starts until every home has been handled
+        """
+
+        home = yield self.homeUnderTest(name="user01")
+        homeID = home._resourceID
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        rev = schema.CALENDAR_OBJECT_REVISIONS
+        yield Insert({
+            rev.CALENDAR_HOME_RESOURCE_ID: homeID,
+            rev.CALENDAR_RESOURCE_ID: calendar._resourceID,
+            rev.RESOURCE_NAME: "cal1.ics",
+            rev.DELETED: False,
+        }).on(self.transactionUnderTest())
+        yield self.commit()
+
+        ch = schema.CALENDAR_HOME
+        homeIDs = [row[0] for row in (yield Select(
+            [ch.RESOURCE_ID],
+            From=ch,
+            OrderBy=ch.RESOURCE_ID,
+        ).on(self.transactionUnderTest()))]
+
+        # One home per batch
+        cursors = []
+        removed = 0
+        lastHomeIDs = {}
+        while True:
+            counts, lastHomeIDs = yield self.transactionUnderTest().compactRevisions(1, lastHomeIDs)
+            removed += counts[rev.model.name]
+            if all([homeID is None for homeID in lastHomeIDs.values()]):
+                break
+            if lastHomeIDs[rev.model.name] is not None:
+                cursors.append(lastHomeIDs[rev.model.name])
+        yield self.commit()
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(cursors, homeIDs)
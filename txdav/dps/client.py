@@ -45,7 +45,8 @@ from txdav.dps.commands import (
     StatsCommand, ExternalDelegatesCommand, ExpandedMemberUIDsCommand,
     AddMembersCommand, RemoveMembersCommand,
     UpdateRecordsCommand, ExpandedMembersCommand, FlushCommand,
-    SetAutoScheduleModeCommand, ContainsUIDsCommand
+    SetAutoScheduleModeCommand, ContainsUIDsCommand,
+    ChangedGroupMembershipsCommand
 )
 from txdav.who.delegates import RecordType as DelegatesRecordType
 from txdav.who.directory import (
@@ -385,6 +386,31 @@ class DirectoryService(BaseDirectoryService, CalendarDirectoryServiceMixin):
             self._processMultipleRecords
         )
 
+    def _processMemberships(self, results):
+        records = {}
+        memberships = {}
+        for item in results["items"]:
+            uid, fields, memberUIDs = pickle.loads(item)
+            if memberUIDs is None:
+                memberships[uid] = None
+            else:
+                if fields is not None:
+                    records[uid] = self._dictToRecord(fields)
+                memberships.setdefault(uid, set()).update(memberUIDs)
+        return dict([
+            (uid, (records.get(uid), frozenset(memberUIDs)) if memberUIDs is not None else None)
+            for uid, memberUIDs in memberships.iteritems()
+        ])
+
+    def changedGroupMemberships(self, membershipHashes):
+        uids = list(membershipHashes)
+        return self._call(
+            ChangedGroupMembershipsCommand,
+            self._processMemberships,
+            uids=[uid.encode("utf-8") for uid in uids],
+            hashes=[membershipHashes[uid] or "" for uid in uids],
+        )
+
     def recordsFromExpression(self, expression, recordTypes=None):
         raise NotImplementedError(
             "This won't work until expressions are serializable to send "
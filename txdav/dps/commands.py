@@ -198,6 +198,17 @@ class ExpandedMemberUIDsCommand(amp.Command):
     ]
 
 
+class ChangedGroupMembershipsCommand(amp.Command):
+    arguments = [
+        ('uids', amp.ListOf(amp.String())),
+        ('hashes', amp.ListOf(amp.String())),
+    ]
+    response = [
+        ('items', amp.ListOf(amp.String())),
+        ('continuation', amp.String(optional=True)),
+    ]
+
+
 class ContainsUIDsCommand(amp.Command):
     arguments = [
         ('uid', amp.String()),
@@ -46,9 +46,12 @@ from txdav.dps.commands import (
     ExternalDelegatesCommand, StatsCommand, ExpandedMemberUIDsCommand,
     ContainsUIDsCommand, AddMembersCommand, RemoveMembersCommand,
     UpdateRecordsCommand, FlushCommand, SetAutoScheduleModeCommand,
+    ChangedGroupMembershipsCommand,
     # RemoveRecordsCommand,
 )
+from txdav.who.cache import IndexType
 from txdav.who.idirectory import AutoScheduleMode
+from txdav.who.sharedcache import SharedRecordTable
 from txdav.who.wiki import WikiAccessLevel
 
 from zope.interface import implementer
@@ -56,6 +59,10 @@ from zope.interface import implementer
 
 log = Logger()
 
+# Record fields which are never published to the shared cache, since anything
+# which can read that file would see them
+_unsharedFields = frozenset((u"password",))
+
 
 #
 # Server implementation of Directory Proxy Service
@@ -67,15 +74,22 @@ class DirectoryProxyAMPProtocol(amp.AMP):
     Server side of directory proxy
     """
 
-    def __init__(self, directory):
+    def __init__(self, directory, sharedCache=None):
         """
+        @param directory: the directory service to proxy
+        @param sharedCache: the host-local L{SharedRecordTable} to publish
+            looked up records to, or L{None}
         """
         amp.AMP.__init__(self)
         self._directory = directory
+        self._sharedCache = sharedCache
 
         # How to large we let an AMP response get before breaking it up
         self._maxSize = 55000
 
+        # How many member UIDs go into each item of a group membership response
+        self._membersPerItem = 100
+
         # The cache of results we have not fully responded with.  A dictionary
         # whose keys are "continuation tokens" and whose values are tuples of
         # (timestamp, list-of-records).  When a response does not fit within
@@ -234,6 +248,37 @@ class DirectoryProxyAMPProtocol(amp.AMP):
                     fields[field.name] = value.name if value else None
         return fields
 
+    def _publish(self, indexType, key, fields, indexTypes=(IndexType.uid, IndexType.guid, IndexType.shortName)):
+        """
+        Add the result of a single record lookup to the shared cache, indexed
+        the same way L{CachingDirectoryService} would index it.
+        """
+        if self._sharedCache is None:
+            return
+        try:
+            if fields:
+                fields = dict([
+                    (name, value) for name, value in fields.iteritems()
+                    if name not in _unsharedFields
+                ])
+                self._sharedCache.putRecord(fields, indexTypes)
+            elif config.DirectoryCaching.NegativeCachingEnabled:
+                self._sharedCache.put(self._sharedCache.key(indexType, key), None)
+        except Exception as e:
+            log.error("Failed to update shared directory cache", error=e)
+
+    def _clearSharedCache(self):
+        """
+        Empty the shared cache after the directory records have changed, so
+        that workers do not keep using the old ones.
+        """
+        if self._sharedCache is None:
+            return
+        try:
+            self._sharedCache.clear()
+        except Exception as e:
+            log.error("Failed to clear shared directory cache", error=e)
+
     @RecordWithShortNameCommand.responder
     @inlineCallbacks
     def recordWithShortName(self, recordType, shortName, timeoutSeconds=None):
@@ -245,6 +290,7 @@ class DirectoryProxyAMPProtocol(amp.AMP):
             timeoutSeconds=timeoutSeconds
         ))
         fields = self.recordToDict(record)
+        self._publish(IndexType.shortName, (recordType, shortName), fields)
         response = {
             "fields": pickle.dumps(fields),
         }
@@ -262,8 +308,10 @@ class DirectoryProxyAMPProtocol(amp.AMP):
             ))
         except Exception as e:
             log.error("Failed in recordWithUID", error=e)
-            record = None
-        fields = self.recordToDict(record)
+            fields = self.recordToDict(None)
+        else:
+            fields = self.recordToDict(record)
+            self._publish(IndexType.uid, uid, fields)
         response = {
             "fields": pickle.dumps(fields),
         }
@@ -279,6 +327,7 @@ class DirectoryProxyAMPProtocol(amp.AMP):
             guid, timeoutSeconds=timeoutSeconds
         ))
         fields = self.recordToDict(record)
+        self._publish(IndexType.guid, guid, fields)
         response = {
             "fields": pickle.dumps(fields),
         }
@@ -311,6 +360,14 @@ class DirectoryProxyAMPProtocol(amp.AMP):
             emailAddress,
             limitResults=limitResults, timeoutSeconds=timeoutSeconds
         ))
+        if not records or len(records) == 1:
+            # As with CachingDirectoryService, only index by email address when
+            # there is a single match
+            self._publish(
+                IndexType.emailAddress, emailAddress,
+                self.recordToDict(list(records)[0]) if records else None,
+                (IndexType.uid, IndexType.guid, IndexType.shortName, IndexType.emailAddress),
+            )
         response = self._recordsToResponse(records)
         # log.debug("Responding with: {response}", response=response)
         returnValue(response)
@@ -527,6 +584,7 @@ class DirectoryProxyAMPProtocol(amp.AMP):
                 if record is not None:
                     records.append(record)
             yield self._directory.updateRecords(records, create=False)
+            self._clearSharedCache()
             success = True
         else:
             log.debug("Update Records - cannot create")
@@ -546,6 +604,7 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         autoScheduleMode = autoScheduleMode.decode("utf-8")
         autoScheduleMode = AutoScheduleMode.lookupByName(autoScheduleMode)
         yield self._directory.setAutoScheduleMode(record, autoScheduleMode)
+        self._clearSharedCache()
         response = {
             "success": True
         }
@@ -585,6 +644,33 @@ class DirectoryProxyAMPProtocol(amp.AMP):
         # log.debug("Responding with: {response}", response=response)
         returnValue(response)
 
+    @ChangedGroupMembershipsCommand.responder
+    @inlineCallbacks
+    def changedGroupMemberships(self, uids, hashes):
+        membershipHashes = dict([
+            (uid.decode("utf-8"), membershipHash or None)
+            for uid, membershipHash in zip(uids, hashes)
+        ])
+        log.debug("ChangedGroupMemberships: {u}", u=membershipHashes.keys())
+        memberships = yield self._directory.changedGroupMemberships(membershipHashes)
+
+        # Each item is a pickled (group UID, record fields, member UIDs) tuple -
+        # large groups are split over several items to keep each one well
+        # within the AMP value size limit, with the fields in the first only
+        items = []
+        for uid, membership in memberships.iteritems():
+            if membership is None:
+                items.append(pickle.dumps((uid, None, None)))
+                continue
+            record, memberUIDs = membership
+            fields = self.recordToDict(record)
+            memberUIDs = list(memberUIDs)
+            for i in xrange(0, max(len(memberUIDs), 1), self._membersPerItem):
+                items.append(pickle.dumps((uid, fields if i == 0 else None, memberUIDs[i:i + self._membersPerItem])))
+        response = self._itemsToResponse(items)
+        # log.debug("Responding with: {response}", response=response)
+        returnValue(response)
+
     @VerifyPlaintextPasswordCommand.responder
     @inlineCallbacks
     def verifyPlaintextPassword(self, uid, password):
@@ -667,6 +753,7 @@ class DirectoryProxyAMPProtocol(amp.AMP):
     @inlineCallbacks
     def flush(self):
         yield self._directory.flush()
+        self._clearSharedCache()
         response = {
             "flush": True,
         }
@@ -696,11 +783,12 @@ class DirectoryProxyAMPFactory(Factory):
     """
     protocol = DirectoryProxyAMPProtocol
 
-    def __init__(self, directory):
+    def __init__(self, directory, sharedCache=None):
         self._directory = directory
+        self._sharedCache = sharedCache
 
     def buildProtocol(self, addr):
-        return DirectoryProxyAMPProtocol(self._directory)
+        return DirectoryProxyAMPProtocol(self._directory, self._sharedCache)
 
 
 class DirectoryProxyOptions(Options):
@@ -827,11 +915,22 @@ class DirectoryProxyServiceMaker(object):
 
         log.info("Created directory service")
 
+        if config.DirectoryProxy.SharedCache.Enabled:
+            sharedCache = SharedRecordTable(
+                config.DirectoryProxy.SharedCache.Path,
+                writable=True,
+                size=config.DirectoryProxy.SharedCache.SizeMB * 1024 * 1024,
+                buckets=config.DirectoryProxy.SharedCache.Buckets,
+                expireSeconds=config.DirectoryCaching.CachingSeconds,
+            )
+        else:
+            sharedCache = None
+
         dpsService = strPortsService(
             "unix:{path}:mode=660".format(
                 path=config.DirectoryProxy.SocketPath
             ),
-            DirectoryProxyAMPFactory(store.directoryService())
+            DirectoryProxyAMPFactory(store.directoryService(), sharedCache)
         )
         dpsService.setServiceParent(multiService)
 
@@ -290,10 +290,14 @@ class CachingDirectoryService(
         FieldName,
     ))
 
-    def __init__(self, directory, expireSeconds=30, lookupsBetweenPurges=0, negativeCaching=True):
+    def __init__(self, directory, expireSeconds=30, lookupsBetweenPurges=0, negativeCaching=True, sharedCache=None):
         BaseDirectoryService.__init__(self, directory.realmName)
         self._directory = directory
 
+        # Host-local L{SharedRecordTable} filled in by the DPS, only used when
+        # wrapping the DPS client
+        self._sharedCache = sharedCache
+
         # Patch the wrapped directory service's recordWithXXX to instead
         # use this cache
 
@@ -583,6 +587,23 @@ class CachingDirectoryService(
             except KeyError:
                 pass
 
+        # Check the host-local shared cache. Records found there are not copied
+        # into this process's cache - they are cheap to look up again.
+        if self._sharedCache is not None:
+            found, fields = self._sharedCache.get(self._sharedCache.key(indexType, key), now=now)
+            if found:
+                log.debug(
+                    "Directory shared cache hit: {index} {key}",
+                    index=indexType.value,
+                    key=key
+                )
+                if fields is None:
+                    self._addTiming("{}-shared-neg-hit".format(name), 0)
+                    return (None, False,)
+                self._hitCount += 1
+                self._addTiming("{}-shared-hit".format(name), 0)
+                return (self._directory._dictToRecord(fields), False,)
+
         # Check memcache
         if self._memcacher is not None:
 
@@ -800,6 +821,10 @@ class CachingDirectoryService(
     def recordsWithDirectoryBasedDelegates(self):
         return self._directory.recordsWithDirectoryBasedDelegates()
 
+    def changedGroupMemberships(self, membershipHashes):
+        # Defer to the directory service we're caching
+        return self._directory.changedGroupMemberships(membershipHashes)
+
     def recordWithCalendarUserAddress(self, cua, timeoutSeconds=None):
         # This will get cached by the underlying recordWith... call
         return CalendarDirectoryServiceMixin.recordWithCalendarUserAddress(
@@ -424,32 +424,75 @@ class CachingDelegates(object):
             yield self._memcacher.deleteMembership(uid, readWrite)
 
     @inlineCallbacks
-    def groupChanged(self, txn, groupID, addedUIDs, removedUIDs):
+    def expandedDelegatesChanged(self, txn, changes, directChanged=False):
         """
-        A group has changed. We need to see which delegators might be using this group
-        and invalidate caches.
+        The expanded delegates of some delegators have been refreshed, typically
+        because the membership of a group they delegate to has changed. Rather
+        than leave the affected cache entries to miss, re-populate them from the
+        expanded delegates table, looking up the memberships of all the changed
+        delegates together. The entries are removed straight away, but only
+        re-populated once C{txn} has committed, so that the cache never holds
+        values which might yet be rolled back.
 
-        @param groupID: group id of group that changed
-        @type groupID: L{str}
-        @param addedUIDs: set of new member UIDs added to the group
-        @type addedUIDs: L{set} of L{str}
-        @param removedUIDs: set of old member UIDs removed from the group
-        @type removedUIDs: L{set} of L{str}
+        @param changes: the UIDs added to and removed from the expanded
+            delegates, keyed by delegator UID and read-write flag
+        @type changes: L{dict} of (L{str}, L{bool}) to (L{set}, L{set})
+        @param directChanged: L{True} if the direct delegates have changed too,
+            so that the unexpanded member cache entries are also invalid
+        @type directChanged: L{bool}
         """
 
-        # Remove member cache entry for delegators using the group
-        delegators = set()
+        changed = {}
         for readWrite in (True, False):
-            delegators.update((yield txn.delegatorsToGroup(groupID, readWrite)))
+            delegators = set()
+            delegates = set()
+            for (delegator, delegatorReadWrite), (addedUIDs, removedUIDs) in changes.items():
+                if delegatorReadWrite != readWrite:
+                    continue
+                if not (directChanged or addedUIDs or removedUIDs):
+                    continue
+
+                yield self._memcacher.deleteMember(delegator, readWrite)
+                delegators.add(delegator)
+                delegates.update(addedUIDs | removedUIDs)
+
+            for delegate in delegates:
+                yield self._memcacher.deleteMembership(delegate, readWrite)
 
-        for delegator in delegators:
-            yield self._memcacher.deleteMember(delegator, True)
-            yield self._memcacher.deleteMember(delegator, False)
+            if delegators:
+                changed[readWrite] = (delegators, delegates)
 
-        # Remove membership cache entries for added/removed delegates
-        for delegate in (addedUIDs | removedUIDs):
-            yield self._memcacher.deleteMembership(delegate, True)
-            yield self._memcacher.deleteMembership(delegate, False)
+        if changed:
+            store = txn.store()
+            txn.postCommit(lambda: self._populateExpandedDelegates(store, changed))
+
+    def _populateExpandedDelegates(self, store, changed):
+        """
+        Re-populate the cache entries removed by L{expandedDelegatesChanged}
+        from the committed expanded delegates table.
+
+        @param changed: the changed delegators and delegates, keyed by
+            read-write flag
+        @type changed: L{dict} of L{bool} to (L{set}, L{set})
+        """
+
+        @inlineCallbacks
+        def _populate(txn):
+            for readWrite, (delegators, delegates) in changed.items():
+                for delegator in delegators:
+                    delegateUIDs = yield txn.delegates(delegator, readWrite, expanded=True)
+                    yield self._memcacher.setMembers(delegator, readWrite, delegateUIDs, True)
+
+                # Memberships include delegators on other pods, so leave them
+                # to be looked up in full
+                if delegates and not config.Servers.Enabled:
+                    delegatorUIDs = yield txn.delegatorsOfDelegates(delegates, readWrite)
+                    for delegate, uids in delegatorUIDs.items():
+                        yield self._memcacher.setMemberships(delegate, readWrite, uids)
+
+        d = store.inTransaction("CachingDelegates._populateExpandedDelegates", _populate)
+        d.addErrback(lambda f: log.error("Failed to populate delegate cache: {f}", f=f))
+        return d
 
     @inlineCallbacks
     def delegatesOf(self, txn, delegator, readWrite, expanded=False):
@@ -18,6 +18,7 @@
 Calendar/Contacts specific methods for DirectoryRecord
 """
 
+import hashlib
 import uuid
 
 from twext.python.log import Logger
@@ -27,7 +28,7 @@ from twext.who.expression import (
 )
 from twext.who.idirectory import RecordType as BaseRecordType, FieldName as BaseFieldName
 from twisted.cred.credentials import UsernamePassword
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, gatherResults
 from twistedcaldav.config import config
 from twistedcaldav.ical import Property
 from txdav.caldav.datastore.scheduling.utils import normalizeCUAddr
@@ -45,15 +46,60 @@ log = Logger()
 __all__ = [
     "CalendarDirectoryRecordMixin",
     "CalendarDirectoryServiceMixin",
+    "groupMembershipHash",
 ]
 
 
+def groupMembershipHash(memberUIDs):
+    """
+    Generate the hash of a group's expanded membership that is stored in the
+    group cache and used to detect membership changes.
+
+    @param memberUIDs: the expanded member UIDs
+    @type memberUIDs: iterable of L{unicode}
+
+    @return: the hash
+    @rtype: L{str}
+    """
+    membershipHashContent = hashlib.md5()
+    for memberUID in sorted(memberUIDs):
+        membershipHashContent.update(str(memberUID))
+    return membershipHashContent.hexdigest()
+
+
+def _directMembershipIndicator(record):
+    """
+    Generate a cheap indicator of a group's direct membership from the member
+    UIDs or DNs its record carries, without looking up any other records.
+
+    @param record: the group's directory record
+
+    @return: the indicator, or C{None} if the record does not carry its
+        direct members
+    @rtype: L{str}
+    """
+    values = []
+    for field, value in record.fields.iteritems():
+        if field.name in (u"memberUIDs", u"memberDNs"):
+            values.extend([(field.name, member) for member in value])
+    if not values:
+        return None
+    indicatorContent = hashlib.md5()
+    for fieldName, member in sorted(values):
+        indicatorContent.update((u"{}:{}\n".format(fieldName, member)).encode("utf-8"))
+    return indicatorContent.hexdigest()
+
+
 class CalendarDirectoryServiceMixin(object):
 
     guid = "1332A615-4D3A-41FE-B636-FBE25BFB982E"
 
     _serversDB = None
 
+    # Group UID -> (direct membership indicator, membership hash, indicators of
+    # nested groups) as of the last time the group was expanded
+    _groupExpansions = None
+
     def serversDB(self):
         return self._serversDB
 
@@ -332,6 +378,114 @@ class CalendarDirectoryServiceMixin(object):
         )
         returnValue(records)
 
+    @inlineCallbacks
+    def changedGroupMemberships(self, membershipHashes):
+        """
+        Find the groups whose expanded membership no longer matches a known
+        membership hash. A group is only expanded if the direct members on its
+        record, or on the records of its nested groups, have changed since it
+        was last expanded here (or if its record does not carry its direct
+        members). The records and memberships of changed groups are returned,
+        so the group cacher can refresh them without looking them up or
+        expanding them again.
+
+        @param membershipHashes: a L{dict} mapping group UIDs to their known
+            membership hash (see L{groupMembershipHash}), or C{None} if the
+            membership is not known
+        @type membershipHashes: L{dict}
+
+        @return: a L{dict} mapping the UID of each changed group to a tuple of
+            its record and expanded member UIDs, or to C{None} if the group is
+            not in the directory
+        @rtype: a L{Deferred} which fires with a L{dict}
+        """
+        if self._groupExpansions is None:
+            self._groupExpansions = {}
+
+        uids = list(membershipHashes)
+        records = yield gatherResults([self.recordWithUID(uid) for uid in uids])
+
+        results = {}
+        groups = []
+        for uid, record in zip(uids, records):
+            if record is None:
+                self._groupExpansions.pop(uid, None)
+                results[uid] = None
+            else:
+                groups.append(record)
+        unchanged = yield gatherResults([
+            self._groupUnchanged(record, membershipHashes[record.uid])
+            for record in groups
+        ])
+        groups = [record for record, same in zip(groups, unchanged) if not same]
+        expanded = yield gatherResults([self._expandGroup(record) for record in groups])
+
+        for record, memberUIDs in zip(groups, expanded):
+            if groupMembershipHash(memberUIDs) != membershipHashes[record.uid]:
+                results[record.uid] = (record, memberUIDs)
+        returnValue(results)
+
+    @inlineCallbacks
+    def _groupUnchanged(self, record, membershipHash):
+        """
+        Determine, without expanding it, whether a group still has the known
+        membership hash: it must have had that hash when last expanded, and
+        neither its direct members nor those of its nested groups may have
+        changed since.
+        """
+        expansion = self._groupExpansions.get(record.uid)
+        if membershipHash is None or expansion is None:
+            returnValue(False)
+        indicator, expandedHash, nestedIndicators = expansion
+        if (
+            expandedHash != membershipHash or indicator is None or
+            _directMembershipIndicator(record) != indicator
+        ):
+            returnValue(False)
+
+        nested = sorted(nestedIndicators.items())
+        nestedRecords = yield gatherResults([self.recordWithUID(uid) for uid, _ignore in nested])
+        for (_ignore_uid, nestedIndicator), nestedRecord in zip(nested, nestedRecords):
+            if (
+                nestedRecord is None or nestedIndicator is None or
+                _directMembershipIndicator(nestedRecord) != nestedIndicator
+            ):
+                returnValue(False)
+        returnValue(True)
+
+    @inlineCallbacks
+    def _expandGroup(self, record):
+        """
+        Expand a group's membership the way L{expandedMembers} does, and
+        remember the direct membership indicators of the group and the groups
+        nested in it for L{_groupUnchanged}.
+
+        @return: a L{Deferred} firing with a L{frozenset} of the expanded
+            member UIDs
+        """
+        memberUIDs = set()
+        nestedIndicators = {}
+        seen = set([record.uid])
+        pending = [record]
+        while pending:
+            members = yield pending.pop().members()
+            for member in members:
+                if member.recordType == BaseRecordType.group:
+                    if member.uid not in seen:
+                        seen.add(member.uid)
+                        nestedIndicators[member.uid] = _directMembershipIndicator(member)
+                        pending.append(member)
+                else:
+                    memberUIDs.add(member.uid)
+
+        memberUIDs = frozenset(memberUIDs)
+        self._groupExpansions[record.uid] = (
+            _directMembershipIndicator(record),
+            groupMembershipHash(memberUIDs),
+            nestedIndicators,
+        )
+        returnValue(memberUIDs)
+
 
 class CalendarDirectoryRecordMixin(object):
     """
@@ -226,8 +226,10 @@ class GroupCacher(object):
         useDirectoryBasedDelegates=False,
         directoryBasedDelegatesSource=None,
         cacheNotifier=None,
+        incrementalRefresh=False,
     ):
         self.directory = directory
+        self.incrementalRefresh = incrementalRefresh
         self.useDirectoryBasedDelegates = useDirectoryBasedDelegates
         if useDirectoryBasedDelegates and directoryBasedDelegatesSource is None:
             directoryBasedDelegatesSource = self.directory.recordsWithDirectoryBasedDelegates
@@ -237,6 +239,7 @@ class GroupCacher(object):
         self.initialSchedulingDelaySeconds = initialSchedulingDelaySeconds
         self.batchSize = batchSize
         self.batchSchedulingIntervalSeconds = batchSchedulingIntervalSeconds
+        self._refreshing = None
 
     @inlineCallbacks
     def update(self, txn):
@@ -290,22 +293,26 @@ class GroupCacher(object):
             batch = groupsToRemove[:batchSize]
             del groupsToRemove[:batchSize]
 
-            rows = yield GroupsRecord.deletesome(
-                txn,
-                GroupsRecord.groupUID.In(batch),
-                returnCols=GroupsRecord.groupUID,
-            )
-            deletedGroupUIDs.extend([row[0] for row in rows])
+            deleted = yield txn.removeGroups(batch)
+            deletedGroupUIDs.extend(deleted)
 
         if deletedGroupUIDs:
             self.log.debug(
                 "Deleted old or unused groups {d}", d=deletedGroupUIDs
             )
 
+        groupUIDs = set(groupUIDs) - set(deletedGroupUIDs)
+        if self.incrementalRefresh:
+            # Compare memberships once this transaction has committed, so that
+            # no transaction is held open while the directory is queried
+            store = txn.store()
+            txn.postCommit(lambda: self.refreshChangedGroups(store, groupUIDs))
+            returnValue(None)
+
         # For each of those groups, create a per-group refresh work item
         futureSeconds = self.initialSchedulingDelaySeconds
         i = 0
-        for groupUID in set(groupUIDs) - set(deletedGroupUIDs):
+        for groupUID in groupUIDs:
             self.log.debug(
                 "Enqueuing group refresh for {u} in {sec} seconds",
                 u=groupUID, sec=futureSeconds
@@ -316,6 +323,97 @@ class GroupCacher(object):
                 i = 0
                 futureSeconds += self.batchSchedulingIntervalSeconds
 
+    def refreshChangedGroups(self, store, groupUIDs):
+        """
+        Refresh the cached membership of those groups whose membership or
+        existence in the directory has changed. The directory is asked about a
+        batch of groups at a time, and returns the records and memberships of
+        the changed groups, so they are not looked up or expanded again. Each transaction is kept
+        short, and none is open while the directory is queried.
+
+        If a previous call is still running, this does nothing.
+
+        @param store: the store holding the group cache
+        @type store: L{CommonDataStore}
+        @param groupUIDs: the UIDs of the groups to check
+        @type groupUIDs: iterable of L{unicode}
+
+        @return: a Deferred which fires when the groups have been refreshed
+        """
+        if self._refreshing is not None:
+            self.log.debug("Changed groups are still being refreshed")
+            return self._refreshing
+
+        def _failed(f):
+            self.log.error(
+                "Failed to refresh changed groups ({error})",
+                error=f.getErrorMessage()
+            )
+
+        def _done(_ignore):
+            self._refreshing = None
+
+        d = self._refreshing = self._refreshChangedGroups(store, groupUIDs)
+        d.addErrback(_failed)
+        d.addBoth(_done)
+        return d
+
+    @inlineCallbacks
+    def _refreshChangedGroups(self, store, groupUIDs):
+        groupUIDs = [
+            groupUID.decode("utf-8") if isinstance(groupUID, str) else groupUID
+            for groupUID in groupUIDs
+        ]
+        refreshed = 0
+        while groupUIDs:
+            batch = groupUIDs[:self.batchSize]
+            del groupUIDs[:self.batchSize]
+
+            groups = yield store.inTransaction(
+                "GroupCacher.refreshChangedGroups",
+                lambda txn, batch=batch: GroupsRecord.query(
+                    txn,
+                    GroupsRecord.groupUID.In([groupUID.encode("utf-8") for groupUID in batch]),
+                )
+            )
+            cachedGroups = dict([(group.groupUID.decode("utf-8"), group) for group in groups])
+
+            # The directory reports any group with no known membership hash
+            # that it has, so missing groups it now has are picked up too
+            membershipHashes = {}
+            for groupUID in batch:
+                group = cachedGroups.get(groupUID)
+                membershipHashes[groupUID] = group.membershipHash if group is not None and group.extant else None
+            changed = yield self.directory.changedGroupMemberships(membershipHashes)
+
+            for groupUID, membership in changed.iteritems():
+                group = cachedGroups.get(groupUID)
+                if membership is None:
+                    if group is None or not group.extant:
+                        # Already known to be missing from the directory
+                        continue
+                    record = memberUIDs = None
+                else:
+                    record, memberUIDs = membership
+
+                try:
+                    yield store.inTransaction(
+                        "GroupCacher.refreshChangedGroups",
+                        lambda txn, groupUID=groupUID, record=record, memberUIDs=memberUIDs: self._refreshGroup(
+                            txn, groupUID, record, memberUIDs
+                        )
+                    )
+                except Exception, e:
+                    self.log.error(
+                        "Failed to refresh group {group} {err}",
+                        group=groupUID, err=e
+                    )
+                refreshed += 1
+
+        self.log.debug(
+            "Refreshed {refreshed} changed groups", refreshed=refreshed
+        )
+
     @inlineCallbacks
     def scheduleExternalAssignments(
         self, txn, newAssignments, immediately=False
@@ -428,6 +526,18 @@ class GroupCacher(object):
         self.log.debug("Refreshing group: {g}", g=groupUID)
 
         record = (yield self.directory.recordWithUID(groupUID))
+        result = yield self._refreshGroup(txn, groupUID, record)
+        returnValue(result)
+
+    @inlineCallbacks
+    def _refreshGroup(self, txn, groupUID, record, memberUIDs=None):
+        """
+        Update the cached membership of a group from its directory record.
+
+        @param record: the group's directory record, or C{None} if the group
+            is not in the directory
+        @param memberUIDs: the group's expanded member UIDs, if already known
+        """
         if record is None:
             # the group has disappeared from the directory
             self.log.info("Group is missing: {g}", g=groupUID)
@@ -437,7 +547,7 @@ class GroupCacher(object):
         group = yield txn.groupByUID(groupUID, create=(record is not None))
 
         if group:
-            membershipChanged, addedUIDs, removedUIDs = yield txn.refreshGroup(group, record)
+            membershipChanged, addedUIDs, removedUIDs = yield txn.refreshGroup(group, record, memberUIDs)
 
             if membershipChanged:
                 self.log.info(
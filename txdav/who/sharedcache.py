@@ -0,0 +1,315 @@
+# -*- test-case-name: txdav.who.test.test_sharedcache -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Host-local shared cache of directory records.
+
+The directory proxy process appends the records it looks up to a memory mapped
+file, and the worker processes on the same host look records up in that file
+directly rather than each asking memcache or the directory proxy and keeping
+their own copy.
+
+The file has a fixed size and is laid out as::
+
+    header | hash index (one offset per bucket) | entries...
+
+Each entry holds the offset of the next entry in the same bucket, an expiry
+time, a key and a marshalled dictionary of record fields (an empty value means
+the record does not exist). New entries are only ever appended and then linked
+in at the head of their bucket, so readers always find the latest entry for a
+key first. When the file is full, or the directory records may have changed,
+the writer empties it and starts again, bumping a generation counter around the
+reset so that readers can tell a lookup overlapped it and treat that as a miss.
+
+There must only ever be one writer for a given file. The file is only readable
+by its owner, so the workers must run as the same user as the writer.
+"""
+
+__all__ = [
+    "SharedRecordTable",
+]
+
+import marshal
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from twext.python.log import Logger
+
+log = Logger()
+
+
+class SharedRecordTable(object):
+    """
+    A memory mapped table of directory record fields, keyed by index type and
+    index value, written by one process and read by any number of others.
+    """
+
+    MAGIC = "CSDC"
+    VERSION = 1
+
+    # magic, version, generation, number of buckets, end of data
+    _header = struct.Struct("<4sIIIQ")
+    _indexOffset = 32
+    _slot = struct.Struct("<Q")
+
+    # next entry in bucket, expiry time, key length, value length
+    _entry = struct.Struct("<QdHI")
+
+    # Longest bucket chain a reader will follow
+    maxChain = 32
+
+    # How often readers check whether the writer has replaced the file
+    reopenSeconds = 5
+
+    def __init__(self, path, writable=False, size=64 * 1024 * 1024, buckets=65536, expireSeconds=60):
+        """
+        @param path: the path of the shared file
+        @type path: L{str}
+        @param writable: L{True} for the (single) writer, which creates the file
+        @type writable: L{bool}
+        @param size: size of the file in bytes, used by the writer
+        @type size: L{int}
+        @param buckets: number of hash index buckets, used by the writer
+        @type buckets: L{int}
+        @param expireSeconds: how long entries added by the writer remain valid
+        @type expireSeconds: L{int}
+        """
+        self._path = path
+        self._writable = writable
+        self._size = size
+        self._buckets = buckets
+        self._expireSeconds = expireSeconds
+        self._map = None
+        self._inode = None
+        self._nextCheck = 0
+
+        if self._writable:
+            self._create()
+
+    def _create(self):
+        """
+        Create or re-use the shared file and empty it.
+        """
+        dataStart = self._indexOffset + self._buckets * self._slot.size
+        if self._size < dataStart + 1024:
+            raise ValueError("Shared record table too small for {} buckets".format(self._buckets))
+
+        # Re-use an existing file of the right size in place, so that readers
+        # which have it mapped see the reset rather than a stale table. Any
+        # other file is replaced rather than resized underneath its readers.
+        newPath = None
+        if os.path.exists(self._path) and os.path.getsize(self._path) == self._size:
+            fd = os.open(self._path, os.O_RDWR)
+        else:
+            newPath = self._path + ".new"
+            fd = os.open(newPath, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0600)
+            os.ftruncate(fd, self._size)
+        try:
+            # Also tighten up a file left over from an earlier version
+            os.fchmod(fd, 0600)
+            self._map = mmap.mmap(fd, self._size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+        magic, version, generation, _ignore_buckets, _ignore_end = self._header.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            generation = 0
+        self._generation = generation + generation % 2
+        self._dataStart = dataStart
+        self._reset()
+        if newPath is not None:
+            os.rename(newPath, self._path)
+        log.info(
+            "Shared directory cache {path}: {size} bytes, {buckets} buckets",
+            path=self._path, size=self._size, buckets=self._buckets,
+        )
+
+    def clear(self):
+        """
+        Empty the table, for when the records it holds may have changed. Only
+        the writer can do this.
+        """
+        if not self._writable:
+            raise ValueError("Shared record table is read-only")
+        log.info("Shared directory cache {path} cleared", path=self._path)
+        self._reset()
+
+    def _reset(self):
+        """
+        Empty the table. The generation is odd whilst the reset is in progress.
+        """
+        self._header.pack_into(self._map, 0, self.MAGIC, self.VERSION, self._generation + 1, self._buckets, self._dataStart)
+        self._map[self._indexOffset:self._dataStart] = "\0" * (self._dataStart - self._indexOffset)
+        self._generation += 2
+        self._header.pack_into(self._map, 0, self.MAGIC, self.VERSION, self._generation, self._buckets, self._dataStart)
+
+    def _open(self):
+        """
+        Map the shared file for reading, if the writer has created it, or re-map
+        it if the writer has since replaced it.
+
+        @return: L{True} if the table is available
+        @rtype: L{bool}
+        """
+        now = time.time()
+        if now < self._nextCheck:
+            return self._map is not None
+        self._nextCheck = now + self.reopenSeconds
+
+        try:
+            inode = os.stat(self._path).st_ino
+        except OSError:
+            inode = None
+        if inode == self._inode and self._map is not None:
+            return True
+
+        self.close()
+        if inode is None:
+            return False
+        try:
+            with open(self._path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError), e:
+            log.error("Unable to open shared directory cache {path}: {ex}", path=self._path, ex=e)
+            return False
+        self._inode = inode
+        return True
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._inode = None
+
+    @staticmethod
+    def key(indexType, indexKey):
+        """
+        Return the key for an index value.
+
+        @param indexType: one of the L{txdav.who.cache.IndexType} values
+        @param indexKey: the value being indexed, a tuple of record type name
+            and short name for short name lookups
+        @rtype: L{str}
+        """
+        if not isinstance(indexKey, tuple):
+            indexKey = (indexKey,)
+        return u"|".join([indexType.value] + [unicode(part) for part in indexKey]).encode("utf-8")
+
+    def get(self, key, now=None):
+        """
+        Look up a key.
+
+        @param key: the key, as returned by L{key}
+        @type key: L{str}
+
+        @return: a tuple of whether a current entry was found and the record
+            fields, which are L{None} if the record is known not to exist
+        @rtype: L{tuple} of (L{bool}, L{dict} or L{None})
+        """
+        if not self._writable and not self._open():
+            return (False, None,)
+        if now is None:
+            now = time.time()
+
+        try:
+            magic, _ignore_version, generation, buckets, end = self._header.unpack_from(self._map, 0)
+            if magic != self.MAGIC or generation % 2:
+                return (False, None,)
+
+            offset = self._slot.unpack_from(self._map, self._indexOffset + self._bucket(key, buckets) * self._slot.size)[0]
+            for _ignore in xrange(self.maxChain):
+                if offset == 0 or offset + self._entry.size > end:
+                    break
+                nextOffset, expires, keyLength, valueLength = self._entry.unpack_from(self._map, offset)
+                start = offset + self._entry.size
+                if keyLength == len(key) and self._map[start:start + keyLength] == key:
+                    if expires < now:
+                        break
+                    value = self._map[start + keyLength:start + keyLength + valueLength]
+
+                    # Ignore anything read whilst the writer was resetting
+                    if self._header.unpack_from(self._map, 0)[2] != generation:
+                        break
+                    return (True, marshal.loads(value) if value else None,)
+                offset = nextOffset
+        except (struct.error, ValueError, EOFError, TypeError), e:
+            log.debug("Shared directory cache lookup failed: {ex}", ex=e)
+
+        return (False, None,)
+
+    def put(self, key, fields, now=None):
+        """
+        Add an entry, replacing any earlier one for the same key.
+
+        @param key: the key, as returned by L{key}
+        @type key: L{str}
+        @param fields: the record fields, or L{None} if there is no such record
+        @type fields: L{dict} or L{None}
+        """
+        if now is None:
+            now = time.time()
+        value = marshal.dumps(fields) if fields else ""
+        length = self._entry.size + len(key) + len(value)
+        length += -length % 8
+
+        _ignore_magic, _ignore_version, _ignore_generation, buckets, end = self._header.unpack_from(self._map, 0)
+        if end + length > self._size:
+            if self._dataStart + length > self._size:
+                log.debug("Shared directory cache entry too large: {key}", key=key)
+                return
+            log.info("Shared directory cache {path} full, resetting", path=self._path)
+            self._reset()
+            end = self._dataStart
+
+        # Write the entry then link it in, so that readers never see a partial entry
+        slot = self._indexOffset + self._bucket(key, buckets) * self._slot.size
+        head = self._slot.unpack_from(self._map, slot)[0]
+        self._entry.pack_into(self._map, end, head, now + self._expireSeconds, len(key), len(value))
+        start = end + self._entry.size
+        self._map[start:start + len(key)] = key
+        self._map[start + len(key):start + len(key) + len(value)] = value
+        self._header.pack_into(self._map, 0, self.MAGIC, self.VERSION, self._generation, buckets, end + length)
+        self._slot.pack_into(self._map, slot, end)
+
+    def putRecord(self, fields, indexTypes, now=None):
+        """
+        Add a record's fields under each of its values for the given index types.
+
+        @param fields: the record fields, keyed by field name
+        @type fields: L{dict}
+        @param indexTypes: an iterable of L{txdav.who.cache.IndexType}
+        """
+        for indexType in indexTypes:
+            if indexType.value == "uid":
+                values = [fields.get("uid")]
+            elif indexType.value == "guid":
+                values = [fields.get("guid")]
+            elif indexType.value == "shortName":
+                values = [(fields.get("recordType"), name) for name in fields.get("shortNames", ())]
+            elif indexType.value == "emailAddress":
+                values = fields.get("emailAddresses", ())
+            else:
+                values = ()
+            for value in values:
+                if value:
+                    self.put(self.key(indexType, value), fields, now=now)
+
+    def _bucket(self, key, buckets):
+        return (zlib.crc32(key) & 0xffffffff) % buckets
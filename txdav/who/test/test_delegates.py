@@ -439,6 +439,72 @@ class DelegationCachingTest(StoreTestCase):
         yield Delegates.delegatedTo(self.transactionUnderTest(), delegate1, False)
         self.assertEqual(delegators_query[0], 2)
 
+    @inlineCallbacks
+    def test_groupChangeExpanded(self):
+        """
+        When the membership of a delegated-to group changes, the expanded
+        delegates are updated and the affected cache entries are re-populated
+        rather than invalidated. Removing the group removes its members.
+        """
+
+        delegator = yield self.directory.recordWithUID(u"__wsanchez1__")
+        group1 = yield self.directory.recordWithUID(u"__top_group_1__")
+
+        yield Delegates.addDelegate(self.transactionUnderTest(), delegator, group1, True)
+        yield self.commit()
+
+        txn = self.transactionUnderTest()
+        delegateUIDs = yield txn.delegates(delegator.uid, True, expanded=True)
+        self.assertEqual(delegateUIDs, set((u"__sagen1__", u"__cdaboo1__", u"__glyph1__")))
+        delegatorUIDs = yield txn.delegators(u"__glyph1__", True)
+        self.assertEqual(delegatorUIDs, set((u"__wsanchez1__",)))
+
+        # Replace a member - the delegator being a member is ignored
+        group = yield txn.groupByUID(group1.uid)
+        yield self.groupCacher.synchronizeMembers(
+            txn, group.groupID,
+            set((u"__wsanchez1__", u"__sagen1__", u"__cdaboo1__", u"__dre1__")),
+        )
+
+        # Nothing is cached until the change has committed
+        delegateUIDs = yield Delegates._memcacher.getMembers(delegator.uid, True, True)
+        self.assertTrue(delegateUIDs is None)
+        delegatorUIDs = yield Delegates._memcacher.getMemberships(u"__dre1__", True)
+        self.assertTrue(delegatorUIDs is None)
+        yield self.commit()
+
+        txn = self.transactionUnderTest()
+        delegateUIDs = yield txn.delegates(delegator.uid, True, expanded=True)
+        self.assertEqual(delegateUIDs, set((u"__sagen1__", u"__cdaboo1__", u"__dre1__")))
+        delegatorUIDs = yield txn.delegatorsOfDelegates((u"__dre1__", u"__glyph1__", u"__wsanchez1__"), True)
+        self.assertEqual(delegatorUIDs, {
+            u"__dre1__": set((u"__wsanchez1__",)),
+            u"__glyph1__": set(),
+            u"__wsanchez1__": set(),
+        })
+
+        # Cache entries for the changes are populated, others are untouched
+        delegateUIDs = yield Delegates._memcacher.getMembers(delegator.uid, True, True)
+        self.assertEqual(delegateUIDs, set((u"__sagen1__", u"__cdaboo1__", u"__dre1__")))
+        delegatorUIDs = yield Delegates._memcacher.getMemberships(u"__dre1__", True)
+        self.assertEqual(delegatorUIDs, set((u"__wsanchez1__",)))
+        delegatorUIDs = yield Delegates._memcacher.getMemberships(u"__glyph1__", True)
+        self.assertEqual(delegatorUIDs, set())
+        delegatorUIDs = yield Delegates._memcacher.getMemberships(u"__sagen1__", True)
+        self.assertTrue(delegatorUIDs is None)
+
+        # Remove the group
+        yield txn.removeGroups([group1.uid])
+        yield self.commit()
+
+        txn = self.transactionUnderTest()
+        delegateUIDs = yield txn.delegates(delegator.uid, True, expanded=True)
+        self.assertEqual(delegateUIDs, set())
+        delegatorUIDs = yield txn.delegators(u"__sagen1__", True)
+        self.assertEqual(delegatorUIDs, set())
+        delegateUIDs = yield Delegates._memcacher.getMembers(delegator.uid, True, False)
+        self.assertTrue(delegateUIDs is None)
+
     @inlineCallbacks
     def test_addRemoveDelegation(self):
 
@@ -21,7 +21,7 @@ Group membership caching implementation tests
 from twext.enterprise.jobs.jobitem import JobItem
 from twext.who.idirectory import RecordType
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from twistedcaldav.stdconfig import config
 from twistedcaldav.test.util import StoreTestCase
 from txdav.common.icommondatastore import NotFoundError
@@ -865,3 +865,80 @@ class DynamicGroupTest(StoreTestCase):
             group = yield txn.groupByUID(uid, create=False)
             yield txn.commit()
             self.assertEqual(group, None)
+
+    @inlineCallbacks
+    def test_update_incremental(self):
+        """
+        Verify that with incremental refresh, only groups whose membership has
+        changed in the directory are refreshed, once the polling transaction
+        has committed, and without any refresh work items
+        """
+        store = self.storeUnderTest()
+        groupCacher = GroupCacher(self.directory, incrementalRefresh=True)
+
+        @inlineCallbacks
+        def _changed():
+            txn = store.newTransaction()
+            membershipHashes = {}
+            for uid in (u"testgroup", u"emptygroup",):
+                group = yield txn.groupByUID(uid, create=False)
+                membershipHashes[uid] = group.membershipHash if group.extant else None
+            yield txn.commit()
+            changed = yield self.directory.changedGroupMemberships(membershipHashes)
+            returnValue(changed)
+
+        txn = store.newTransaction()
+        for uid in (u"testgroup", u"emptygroup",):
+            group = yield txn.groupByUID(uid)
+            yield txn.addDelegateGroup(delegator=u"sagen", delegateGroupID=group.groupID, readWrite=True)
+        yield txn.commit()
+        changed = yield _changed()
+        self.assertEqual(changed, {})
+
+        # A group whose direct members have not changed is not expanded again
+        expanded = []
+        expandGroup = self.directory._expandGroup
+
+        def _expandGroup(record):
+            expanded.append(record.uid)
+            return expandGroup(record)
+        self.patch(self.directory, "_expandGroup", _expandGroup)
+        changed = yield _changed()
+        self.assertEqual(changed, {})
+        self.assertFalse(u"testgroup" in expanded)
+
+        # Change the membership of one group
+        group = yield self.directory.recordWithUID(u"emptygroup")
+        members = yield self.directory.recordsWithRecordType(RecordType.user)
+        yield group.setMembers(members[:10])
+        changed = yield _changed()
+        self.assertEqual(changed.keys(), [u"emptygroup"])
+        record, memberUIDs = changed[u"emptygroup"]
+        self.assertEqual(record.uid, u"emptygroup")
+        self.assertEqual(len(memberUIDs), 10)
+
+        # Polling refreshes the changed group after commit
+        txn = store.newTransaction()
+        yield groupCacher.update(txn)
+        yield txn.commit()
+        yield groupCacher.refreshChangedGroups(store, (u"testgroup", u"emptygroup",))
+
+        txn = store.newTransaction()
+        works = yield GroupRefreshWork.all(txn)
+        members = yield txn.groupMemberUIDs((yield txn.groupByUID(u"emptygroup")).groupID)
+        yield txn.commit()
+        self.assertEqual(works, [])
+        self.assertEqual(len(members), 10)
+        changed = yield _changed()
+        self.assertEqual(changed, {})
+
+        # Remove the other group
+        yield self.directory.removeRecords([u"testgroup"])
+        changed = yield _changed()
+        self.assertEqual(changed, {u"testgroup": None})
+        yield groupCacher.refreshChangedGroups(store, (u"testgroup", u"emptygroup",))
+
+        txn = store.newTransaction()
+        group = yield txn.groupByUID(u"testgroup", create=False)
+        yield txn.commit()
+        self.assertFalse(group.extant)
@@ -0,0 +1,214 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Shared directory record cache tests
+"""
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import TestCase
+
+from txdav.dps.client import DirectoryService as DPSClientDirectoryService
+from txdav.dps.server import DirectoryProxyAMPProtocol
+from txdav.who.cache import CachingDirectoryService, IndexType
+from txdav.who.directory import CalendarDirectoryServiceMixin
+from txdav.who.sharedcache import SharedRecordTable
+from txdav.who.xml import DirectoryService as XMLDirectoryService
+
+import os
+import stat
+import uuid
+
+
+class CalendarXMLDirectoryService(
+    CalendarDirectoryServiceMixin,
+    XMLDirectoryService
+):
+    pass
+
+
+class SharedRecordTableTest(TestCase):
+
+    fields = {
+        "uid": u"user01",
+        "guid": "10000000-0000-0000-0000-000000000001",
+        "recordType": "user",
+        "shortNames": [u"user01", u"User 01"],
+        "fullNames": [u"User 01"],
+        "emailAddresses": [u"user01@example.com"],
+        "hasCalendars": True,
+    }
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.writer = SharedRecordTable(self.path, writable=True, size=64 * 1024, buckets=64, expireSeconds=10)
+        self.reader = SharedRecordTable(self.path)
+        self.addCleanup(self.writer.close)
+        self.addCleanup(self.reader.close)
+
+    def test_putRecord(self):
+        """
+        A record is found by each of the requested index types, in another
+        instance of the table.
+        """
+        self.writer.putRecord(self.fields, (IndexType.uid, IndexType.guid, IndexType.shortName))
+
+        for indexType, key in (
+            (IndexType.uid, u"user01"),
+            (IndexType.guid, uuid.UUID("10000000-0000-0000-0000-000000000001")),
+            (IndexType.shortName, ("user", u"user01")),
+            (IndexType.shortName, ("user", u"User 01")),
+        ):
+            self.assertEqual(self.reader.get(SharedRecordTable.key(indexType, key)), (True, self.fields))
+
+        self.assertEqual(self.reader.get(SharedRecordTable.key(IndexType.emailAddress, u"user01@example.com")), (False, None))
+        self.assertEqual(self.reader.get(SharedRecordTable.key(IndexType.uid, u"user02")), (False, None))
+
+    def test_negative(self):
+        """
+        A record known not to exist is found with no fields.
+        """
+        self.writer.put(SharedRecordTable.key(IndexType.uid, u"missing"), None)
+        self.assertEqual(self.reader.get(SharedRecordTable.key(IndexType.uid, u"missing")), (True, None))
+
+    def test_latest(self):
+        """
+        The most recent entry for a key is returned, and entries expire.
+        """
+        key = SharedRecordTable.key(IndexType.uid, u"user01")
+        self.writer.put(key, self.fields, now=1000)
+        self.writer.put(key, dict(self.fields, fullNames=[u"Changed"]), now=1005)
+        self.assertEqual(self.reader.get(key, now=1012)[1]["fullNames"], [u"Changed"])
+        self.assertEqual(self.reader.get(key, now=1016), (False, None))
+
+    def test_full(self):
+        """
+        When the table is full it is emptied and filled again.
+        """
+        for i in range(3000):
+            self.writer.put(SharedRecordTable.key(IndexType.uid, u"user%04d" % (i,)), {"uid": u"user%04d" % (i,)})
+        self.assertEqual(self.reader.get(SharedRecordTable.key(IndexType.uid, u"user2999")), (True, {"uid": u"user2999"}))
+        self.assertEqual(self.reader.get(SharedRecordTable.key(IndexType.uid, u"user0000")), (False, None))
+
+    def test_replaced(self):
+        """
+        Readers pick up a file the writer has replaced with one of a different
+        size, and the old entries are gone.
+        """
+        key = SharedRecordTable.key(IndexType.uid, u"user01")
+        self.writer.put(key, self.fields)
+        self.assertEqual(self.reader.get(key), (True, self.fields))
+
+        writer = SharedRecordTable(self.path, writable=True, size=128 * 1024, buckets=64)
+        self.addCleanup(writer.close)
+        self.assertFalse(os.path.exists(self.path + ".new"))
+        self.reader._nextCheck = 0
+        self.assertEqual(self.reader.get(key), (False, None))
+
+        writer.put(key, self.fields)
+        self.assertEqual(self.reader.get(key), (True, self.fields))
+
+    def test_mode(self):
+        """
+        The shared file is only readable by its owner, including one re-used
+        from an earlier writer.
+        """
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+
+        self.writer.close()
+        os.chmod(self.path, 0644)
+        self.writer = SharedRecordTable(self.path, writable=True, size=64 * 1024, buckets=64)
+        self.addCleanup(self.writer.close)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+
+    @inlineCallbacks
+    def test_noPassword(self):
+        """
+        Records the directory proxy publishes do not include their password.
+        """
+        path = FilePath(__file__).parent().parent().sibling("dps").child("test").child("test.xml")
+        copy = FilePath(self.mktemp())
+        path.copyTo(copy)
+        server = DirectoryProxyAMPProtocol(CalendarXMLDirectoryService(copy), sharedCache=self.writer)
+
+        yield server.recordWithUID("__wsanchez__")
+        found, fields = self.reader.get(SharedRecordTable.key(IndexType.uid, u"__wsanchez__"))
+        self.assertTrue(found)
+        self.assertEqual(fields["uid"], u"__wsanchez__")
+        self.assertFalse("password" in fields)
+
+    def test_clear(self):
+        """
+        Clearing the table empties it for readers, and new entries can be added
+        afterwards. Readers cannot clear the table.
+        """
+        key = SharedRecordTable.key(IndexType.uid, u"user01")
+        self.writer.put(key, self.fields)
+        self.writer.clear()
+        self.assertEqual(self.reader.get(key), (False, None))
+        self.writer.put(key, self.fields)
+        self.assertEqual(self.reader.get(key), (True, self.fields))
+        self.assertRaises(ValueError, self.reader.clear)
+
+    @inlineCallbacks
+    def test_flush(self):
+        """
+        A worker's lookup after the directory proxy is flushed misses the
+        shared cache.
+        """
+        path = FilePath(__file__).parent().parent().sibling("dps").child("test").child("test.xml")
+        copy = FilePath(self.mktemp())
+        path.copyTo(copy)
+        server = DirectoryProxyAMPProtocol(CalendarXMLDirectoryService(copy), sharedCache=self.writer)
+
+        key = SharedRecordTable.key(IndexType.uid, u"__wsanchez__")
+        yield server.recordWithUID("__wsanchez__")
+        self.assertTrue(self.reader.get(key)[0])
+
+        yield server.flush()
+        self.assertEqual(self.reader.get(key), (False, None))
+
+    def test_noFile(self):
+        """
+        A reader with no file to read finds nothing.
+        """
+        reader = SharedRecordTable(self.mktemp())
+        self.assertEqual(reader.get(SharedRecordTable.key(IndexType.uid, u"user01")), (False, None))
+
+    @inlineCallbacks
+    def test_cachingDirectory(self):
+        """
+        L{CachingDirectoryService} returns records from the shared cache without
+        asking the DPS.
+        """
+        directory = CachingDirectoryService(
+            DPSClientDirectoryService(None),
+            expireSeconds=10,
+            sharedCache=self.reader,
+        )
+        self.writer.putRecord(self.fields, (IndexType.uid, IndexType.guid, IndexType.shortName))
+        self.writer.put(SharedRecordTable.key(IndexType.uid, u"missing"), None)
+
+        record = yield directory.recordWithUID(u"user01")
+        self.assertEqual(record.uid, u"user01")
+        self.assertEqual(record.fullNames, [u"User 01"])
+
+        record = yield directory.recordWithShortName(directory.recordType.user, u"User 01")
+        self.assertEqual(record.uid, u"user01")
+
+        record = yield directory.recordWithUID(u"missing")
+        self.assertTrue(record is None)
@@ -254,6 +254,7 @@ def buildDirectory(
     #
     serviceClass = {
         "xml": "twistedcaldav.directory.augment.AugmentXMLDB",
+        "sqlite": "twistedcaldav.directory.augment.AugmentSqliteDB",
     }
 
     for augmentFile in augmentServiceInfo.params.xmlFiles:
@@ -46,6 +46,7 @@ __all__ = [
 ]
 
 import cPickle as pickle
+import time
 import urllib
 
 from zope.interface import implements
@@ -1393,34 +1394,45 @@ class DAVResource (DAVPropertyMixIn, StaticRenderMixin):
                 errors.append((uri, list(privileges)))
                 continue
 
-            pending = list(privileges)
+            # Each requested privilege is a bit in a mask, and each ACE
+            # has the mask of all the privileges it grants or denies, so
+            # the principal only needs matching against ACEs that apply to
+            # one of the pending privileges.
+            masks = _privilegeMasksFor(supportedPrivs)
+            requested = [
+                (privilege, masks.bit(element.Privilege(privilege)))
+                for privilege in privileges
+            ]
+            pending = 0
+            for _ignore_privilege, bit in requested:
+                pending |= bit
             denied = []
 
-            for ace in acl.children:
-                for privilege in tuple(pending):
-                    if not self.matchPrivilege(
-                        element.Privilege(privilege),
-                        ace.privileges, supportedPrivs
-                    ):
-                        continue
+            for ace_principal, invert, allow, mask in _compileACL(resource, acl, masks):
+                matched = pending & mask
+                if not matched:
+                    continue
 
-                    match = (
-                        yield self.matchPrincipal(principal, ace.principal, request)
-                    )
+                match = (
+                    yield self.matchPrincipal(principal, ace_principal, request)
+                )
 
-                    if match:
-                        if ace.invert:
-                            continue
-                    else:
-                        if not ace.invert:
-                            continue
+                if bool(match) == bool(invert):
+                    continue
 
-                    pending.remove(privilege)
+                pending &= ~matched
 
-                    if not ace.allow:
-                        denied.append(privilege)
+                if not allow:
+                    denied.extend([
+                        privilege for privilege, bit in requested
+                        if bit & matched
+                    ])
 
-            denied += pending  # If no matching ACE, then denied
+            # If no matching ACE, then denied
+            denied += [
+                privilege for privilege, bit in requested
+                if bit & pending
+            ]
 
             if denied:
                 errors.append((uri, denied))
@@ -1784,6 +1796,24 @@ class DAVResource (DAVPropertyMixIn, StaticRenderMixin):
         d.addCallback(cache)
         return d
 
+    # Number of seconds that group membership results are remembered
+    # across requests.  Results are only remembered when
+    # groupMembershipCacheToken provides a token.
+    groupMembershipCacheSeconds = 0
+
+    def groupMembershipCacheToken(self, principal, request):
+        """
+        Get a token that changes whenever the membership of a group
+        principal changes.  Membership results are remembered across
+        requests under this token.
+
+        @param principal: C{str} principalURL for the group principal.
+        @param request: the request being processed.
+        @return: L{Deferred} with the token, or C{None} if there is no
+            token for C{principal} and results must not be remembered.
+        """
+        return succeed(None)
+
     @inlineCallbacks
     def principalIsGroupMember(self, principal1, principal2, request):
         """
@@ -1796,13 +1826,28 @@ class DAVResource (DAVPropertyMixIn, StaticRenderMixin):
         @return: L{Deferred} with result C{True} if principal1 is a
             member of principal2, C{False} otherwise
         """
+        cache_key = None
+        if self.groupMembershipCacheSeconds:
+            token = yield self.groupMembershipCacheToken(principal2, request)
+            if token is not None:
+                cache_key = (principal1, principal2, token)
+                result = _groupMembershipCache.get(cache_key)
+                if result is not None:
+                    returnValue(result)
+
         resource1 = yield request.locateResource(principal1)
         resource2 = yield request.locateResource(principal2)
 
         if resource2 and isinstance(resource2, DAVPrincipalResource):
             isContained = yield resource2.containsPrincipal(resource1)
-            returnValue(isContained)
-        returnValue(False)
+        else:
+            isContained = False
+
+        if cache_key is not None:
+            _groupMembershipCache.set(
+                cache_key, isContained, self.groupMembershipCacheSeconds
+            )
+        returnValue(isContained)
 
     def validPrincipal(self, ace_principal, request):
         """
@@ -2588,6 +2633,136 @@ class AccessDeniedError(Exception):
         self.errors = errors
 
 
+class _PrivilegeMasks(object):
+    """
+    Lookup table for a L{element.SupportedPrivilegeSet}, used to compile
+    ACLs into bitmasks.  Each privilege is assigned a bit, and the mask
+    for a privilege has the bits of the privilege itself and all the
+    privileges it aggregates.
+    """
+
+    def __init__(self, supportedPrivileges):
+        self.bits = {}
+        self.masks = {}
+
+        def expand(supportedPrivilege):
+            key = self.key(supportedPrivilege.childOfType(element.Privilege))
+            mask = self._bitForKey(key)
+            for child in supportedPrivilege.childrenOfType(
+                element.SupportedPrivilege
+            ):
+                mask |= expand(child)
+            self.masks[key] = self.masks.get(key, 0) | mask
+            return mask
+
+        for supportedPrivilege in supportedPrivileges.children:
+            expand(supportedPrivilege)
+
+    @staticmethod
+    def key(privilege):
+        return tuple([child.qname() for child in privilege.children])
+
+    def _bitForKey(self, key):
+        bit = self.bits.get(key)
+        if bit is None:
+            bit = self.bits[key] = 1 << len(self.bits)
+        return bit
+
+    def bit(self, privilege):
+        """
+        @param privilege: a L{element.Privilege}.
+        @return: the bit for C{privilege}.
+        """
+        return self._bitForKey(self.key(privilege))
+
+    def mask(self, privileges):
+        """
+        @param privileges: an iterable of L{element.Privilege}s, as found
+            in an ACE.
+        @return: the mask of all the privileges in C{privileges} and all
+            the privileges they aggregate.
+        """
+        result = 0
+        for privilege in privileges:
+            key = self.key(privilege)
+            if key == ((dav_namespace, "all"),):
+                # DAV:all is an aggregate of every privilege, supported or not
+                return -1
+            mask = self.masks.get(key)
+            if mask is None:
+                mask = self.masks[key] = self._bitForKey(key)
+            result |= mask
+        return result
+
+
+# Supported privilege sets are almost always module-level constants, so
+# their lookup tables are kept by identity.
+_privilegeMasks = {}
+
+
+def _privilegeMasksFor(supportedPrivileges):
+    entry = _privilegeMasks.get(id(supportedPrivileges))
+    if entry is None or entry[0] is not supportedPrivileges:
+        if len(_privilegeMasks) >= 100:
+            _privilegeMasks.clear()
+        entry = (supportedPrivileges, _PrivilegeMasks(supportedPrivileges))
+        _privilegeMasks[id(supportedPrivileges)] = entry
+    return entry[1]
+
+
+def _compileACL(resource, acl, masks):
+    """
+    Compile an ACL into a list of C{(principal, invert, allow, mask)}
+    tuples, one per ACE.  The compiled ACL is kept on the resource for as
+    long as the resource returns the same ACL.
+    """
+    compiled = getattr(resource, "_compiledACL", None)
+    if compiled is not None and compiled[0] is acl and compiled[1] is masks:
+        return compiled[2]
+
+    aces = [
+        (ace.principal, ace.invert, ace.allow, masks.mask(ace.privileges))
+        for ace in acl.children
+    ]
+    resource._compiledACL = (acl, masks, aces)
+    return aces
+
+
+class _ExpiringCache(object):
+    """
+    A dict whose entries expire after a given number of seconds.
+    """
+
+    def __init__(self, maxSize=10000):
+        self.maxSize = maxSize
+        self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self.entries[key]
+            return None
+        return entry[1]
+
+    def set(self, key, value, seconds):
+        now = time.time()
+        if len(self.entries) >= self.maxSize:
+            for expiredKey in [
+                k for k, (expires, _ignore_value) in self.entries.iteritems()
+                if expires < now
+            ]:
+                del self.entries[expiredKey]
+            if len(self.entries) >= self.maxSize:
+                self.entries.clear()
+        self.entries[key] = (now + seconds, value)
+
+
+# Group membership results remembered across requests
+_groupMembershipCache = _ExpiringCache()
+
+
 ##
 # Utilities
 ##
@@ -22,7 +22,8 @@
 # DRI: Wilfredo Sanchez, wsanchez@apple.com
 ##
 
-from twisted.internet.defer import DeferredList, waitForDeferred, deferredGenerator, succeed
+from twisted.internet.defer import DeferredList, waitForDeferred, deferredGenerator, succeed, \
+    inlineCallbacks
 from twisted.cred.portal import Portal
 from twisted.python.log import addObserver, removeObserver
 from txweb2 import responsecode
@@ -31,7 +32,8 @@ from txweb2.auth import basic
 from txweb2.server import Site
 from txdav.xml import element as davxml
 from txweb2.dav.resource import DAVResource, AccessDeniedError, \
-    DAVPrincipalResource, DAVPrincipalCollectionResource, davPrivilegeSet
+    DAVPrincipalResource, DAVPrincipalCollectionResource, davPrivilegeSet, \
+    _PrivilegeMasks
 from txweb2.dav.auth import TwistedPasswordProperty, DavRealm, TwistedPropertyChecker, IPrincipal, AuthenticationWrapper
 from txweb2.test.test_server import SimpleRequest
 from txweb2.dav.test.util import InMemoryPropertyStore
@@ -312,6 +314,59 @@ class AccessTests(TestCase):
 
         return DeferredList(ds)
 
+    @inlineCallbacks
+    def test_checkPrivilegesDenyAggregated(self):
+        """
+        DAVResource.checkPrivileges() denies a privilege aggregated by a
+        denied privilege, even when a later ACE grants all privileges.
+        """
+        resource = TestResource("/")
+        resource.setAccessControlList(davxml.ACL(
+            davxml.ACE(
+                davxml.Principal(davxml.All()),
+                davxml.Deny(davxml.Privilege(davxml.Write())),
+            ),
+            davxml.ACE(
+                davxml.Principal(davxml.All()),
+                davxml.Grant(davxml.Privilege(davxml.All())),
+            ),
+        ))
+        request = SimpleRequest(Site(resource), "GET", "/")
+
+        yield resource.checkPrivileges(request, (davxml.Read(), davxml.ReadACL(),))
+
+        try:
+            yield resource.checkPrivileges(request, (davxml.Read(), davxml.WriteProperties(),))
+        except AccessDeniedError, e:
+            self.assertEquals(e.errors, [(None, [davxml.WriteProperties()])])
+        else:
+            self.fail("AccessDeniedError not raised")
+
+    def test_privilegeMasks(self):
+        """
+        L{_PrivilegeMasks} matches privileges in the same way as
+        L{DAVResource.matchPrivilege}.
+        """
+        masks = _PrivilegeMasks(davPrivilegeSet)
+        resource = DAVResource()
+
+        privileges = []
+
+        def collect(supportedPrivilege):
+            privileges.append(supportedPrivilege.childOfType(davxml.Privilege))
+            for child in supportedPrivilege.childrenOfType(davxml.SupportedPrivilege):
+                collect(child)
+        for supportedPrivilege in davPrivilegeSet.children:
+            collect(supportedPrivilege)
+
+        for privilege in privileges:
+            for ace_privilege in privileges:
+                self.assertEquals(
+                    bool(masks.bit(privilege) & masks.mask((ace_privilege,))),
+                    resource.matchPrivilege(privilege, (ace_privilege,), davPrivilegeSet),
+                    "%r in %r" % (privilege, ace_privilege,)
+                )
+
     def test_authorize(self):
         """
         Authorizing a known user with the correct password will not raise an
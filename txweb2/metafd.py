@@ -29,7 +29,7 @@ from twext.internet.sendfdport import (
     IStatus)
 from twext.internet.tcp import MaxAcceptTCPServer
 from twext.python.log import Logger
-from txweb2.channel.http import HTTPFactory
+from txweb2.channel.http import HTTPFactory, HTTPChannel
 from twisted.application.service import MultiService, Service
 from twisted.internet import reactor
 from twisted.python.util import FancyStrMixin
@@ -37,6 +37,11 @@ from twisted.internet.tcp import Server
 from twext.internet.sendfdport import IStatusWatcher
 from twext.internet.socketfile import MaxAcceptSocketFileServer
 
+from socket import error as SocketError
+
+import hashlib
+import time
+
 log = Logger()
 
 
@@ -65,11 +70,16 @@ class ReportingHTTPService(Service, object):
         for inbound connections tagged with the string 'SSL' as their
         descriptive data, or None if SSL is not enabled for this server.
     @type contextFactory: L{twisted.internet.ssl.ContextFactory} or C{NoneType}
+
+    @ivar reportLatency: whether to report the time taken by each request to
+        the master process, which it only needs when adapting its connection
+        limit to request latency.
+    @type reportLatency: C{bool}
     """
 
     _connectionCount = 0
 
-    def __init__(self, site, fd, contextFactory, usingSocketFile=False):
+    def __init__(self, site, fd, contextFactory, usingSocketFile=False, reportLatency=False):
         self.contextFactory = contextFactory
         # Unlike other 'factory' constructions, config.MaxRequests and
         # config.MaxAccepts are dealt with in the master process, so we don't
@@ -81,6 +91,7 @@ class ReportingHTTPService(Service, object):
         # we'll tweak the transport object enough to appear secure without
         # actually doing startTLS ourselves.
         self.usingSocketFile = usingSocketFile
+        self.reportLatency = reportLatency
 
     def startService(self):
         """
@@ -88,6 +99,8 @@ class ReportingHTTPService(Service, object):
         """
         Service.startService(self)
         self.reportingFactory = ReportingHTTPFactory(self.site, vary=True)
+        if self.reportLatency:
+            self.reportingFactory.protocol = ReportingHTTPChannel
         inheritedPort = self.reportingFactory.inheritedPort = InheritedPort(
             self.fd, self.createTransport, self.reportingFactory
         )
@@ -128,6 +141,20 @@ class ReportingHTTPService(Service, object):
         return transport
 
 
+class ReportingHTTPChannel(HTTPChannel):
+    """
+    An L{HTTPChannel} which tells its L{ReportingHTTPFactory} how long each
+    request took to process, so that the master process can adapt its
+    connection limit to the current request latency.
+    """
+
+    def requestWriteFinished(self, request):
+        txrequest = getattr(request, "request", None)
+        if txrequest is not None and hasattr(txrequest, "timeStamps"):
+            self.factory.requestFinished(time.time() - txrequest.timeStamps[0][1])
+        super(ReportingHTTPChannel, self).requestWriteFinished(request)
+
+
 class ReportingHTTPFactory(HTTPFactory):
     """
     An L{HTTPFactory} which reports its status to a
@@ -166,6 +193,16 @@ class ReportingHTTPFactory(HTTPFactory):
         HTTPFactory.removeConnectedChannel(self, channel)
         self._report("-")
 
+    def requestFinished(self, elapsed):
+        """
+        Report the time taken to process a request, in milliseconds, to the
+        parent.
+
+        @param elapsed: the request processing time in seconds
+        @type elapsed: L{float}
+        """
+        self._report("L%d" % (int(elapsed * 1000),))
+
 
 @implementer(IStatus)
 class WorkerStatus(FancyStrMixin, object):
@@ -226,6 +263,10 @@ class WorkerStatus(FancyStrMixin, object):
         self.starting = starting
         self.stopped = stopped
 
+        # Smoothed request latency (in seconds) reported by the worker - this
+        # is transient and not part of the reported status
+        self.latency = 0.0
+
     def items(self):
         return dict([(attr, getattr(self, attr)) for attr in self.showAttributes])
 
@@ -275,6 +316,18 @@ class WorkerStatus(FancyStrMixin, object):
             stopped=1,
         )
 
+    def recordLatency(self, latency, smoothing):
+        """
+        Update the smoothed request latency of the worker with a new sample.
+
+        @param latency: the latency of a completed request in seconds
+        @type latency: L{float}
+        @param smoothing: the weight given to the new sample
+        @type smoothing: L{float}
+        """
+        self.latency += smoothing * (latency - self.latency)
+        return self
+
     def adjust(self, **kwargs):
         """
         Update the L{WorkerStatus} by adding the supplied values to the specified attributes.
@@ -293,29 +346,150 @@ class WorkerStatus(FancyStrMixin, object):
         return self
 
 
+class LatencyAwareSocketDispatcher(InheritedSocketDispatcher):
+    """
+    An L{InheritedSocketDispatcher} that, when choosing between workers with
+    the same load, prefers the one with the lowest recent request latency.
+    """
+
+    def candidateSockets(self, skt):
+        """
+        Determine the worker sockets the base class may dispatch to, in order
+        of preference.
+
+        @param skt: the connection socket being dispatched
+        @type skt: L{socket.socket}
+
+        @rtype: L{list}
+        """
+        return sorted(self._subprocessSockets, key=lambda x: x.status.latency)
+
+    def sendFileDescriptor(self, skt, description):
+        # The base class picks the least loaded worker with a stable sort of
+        # this list, so pre-ordering (or restricting) it lets us steer the
+        # choice without changing how load is counted
+        sockets = self._subprocessSockets
+        self._subprocessSockets = self.candidateSockets(skt)
+        try:
+            return InheritedSocketDispatcher.sendFileDescriptor(self, skt, description)
+        finally:
+            self._subprocessSockets = sockets
+
+
+class AffinitySocketDispatcher(LatencyAwareSocketDispatcher):
+    """
+    An L{InheritedSocketDispatcher} that sends connections from the same
+    client address to the same worker, as long as that worker's load is
+    within C{affinityTolerance} of the least loaded worker. This keeps each
+    worker's in-process caches warm for the users it sees.
+
+    The worker is chosen by rendezvous hashing of the client address over
+    the active workers, so only the clients of a worker that stops or starts
+    move elsewhere.
+    """
+
+    affinityTolerance = 1
+
+    def preferredSocket(self, skt):
+        """
+        Determine the worker socket that connections from the client of the
+        given socket should go to.
+
+        @param skt: the connection socket being dispatched
+        @type skt: L{socket.socket}
+
+        @return: the preferred worker socket, or C{None} if there is no
+            usable client address or no active worker.
+        """
+        try:
+            peer = skt.getpeername()
+        except (AttributeError, SocketError):
+            return None
+        if not isinstance(peer, tuple) or not peer[0]:
+            # Unix domain sockets (e.g. behind a proxy) have no useful address
+            return None
+
+        best = None
+        bestScore = None
+        for index, subskt in enumerate(self._subprocessSockets):
+            if not subskt.status.active():
+                continue
+            score = hashlib.md5("%s:%d" % (peer[0], index,)).digest()
+            if bestScore is None or score > bestScore:
+                best = subskt
+                bestScore = score
+        return best
+
+    def candidateSockets(self, skt):
+        preferred = self.preferredSocket(skt)
+        if preferred is not None:
+            lowest = min(
+                subskt.status.effective()
+                for subskt in self._subprocessSockets
+                if subskt.status.active()
+            )
+            if preferred.status.effective() <= lowest + self.affinityTolerance:
+                return [preferred]
+        return LatencyAwareSocketDispatcher.candidateSockets(self, skt)
+
+
 @implementer(IStatusWatcher)
 class ConnectionLimiter(MultiService, object):
     """
     Connection limiter for use with L{InheritedSocketDispatcher}.
 
     This depends on statuses being reported by L{ReportingHTTPFactory}
+
+    When a target latency is given, the limit on outstanding requests adapts
+    to the request latency reported by the workers (additive increase,
+    multiplicative decrease), staying between C{minRequests} and
+    C{maxRequests}.
     """
 
     _outstandingRequests = 0
     _maxOutstandingRequests = 0
 
-    def __init__(self, maxAccepts, maxRequests):
+    # Weight given to each new latency sample when smoothing
+    latencySmoothing = 0.2
+
+    # Multiplier applied to the request limit when latency is too high
+    decreaseFactor = 0.9
+
+    def __init__(self, maxAccepts, maxRequests, minRequests=None, targetLatency=None, affinityTolerance=None):
         """
         Create a L{ConnectionLimiter} with an associated dispatcher and
         list of factories.
+
+        @param minRequests: the lowest the adaptive request limit may go, or
+            C{None} to use C{maxRequests}
+        @type minRequests: L{int} or C{None}
+        @param targetLatency: the smoothed request latency (in seconds) above
+            which the request limit is reduced, or C{None} to use a fixed limit
+        @type targetLatency: L{float} or C{None}
+        @param affinityTolerance: how many more outstanding requests than the
+            least loaded worker a client's preferred worker may have and still
+            be given the client's connections, or C{None} to disable
+            client-to-worker affinity
+        @type affinityTolerance: L{int} or C{None}
         """
         MultiService.__init__(self)
         self.factories = []
         # XXX dispatcher needs to be a service, so that it can shut down its
         # sub-sockets.
-        self.dispatcher = InheritedSocketDispatcher(self)
+        if affinityTolerance is not None:
+            self.dispatcher = AffinitySocketDispatcher(self)
+            self.dispatcher.affinityTolerance = affinityTolerance
+        elif targetLatency is not None:
+            self.dispatcher = LatencyAwareSocketDispatcher(self)
+        else:
+            self.dispatcher = InheritedSocketDispatcher(self)
         self.maxAccepts = maxAccepts
         self.maxRequests = maxRequests
+        self.minRequests = max(1, minRequests if minRequests is not None else maxRequests)
+        self.targetLatency = targetLatency
+        self.requestLimit = float(maxRequests)
+        self.latency = 0.0
+        self._lastDecrease = 0.0
         self.overloaded = False
 
     def startService(self):
@@ -368,6 +542,12 @@ class ConnectionLimiter(MultiService, object):
             # A new process just started accepting new connections.
             return previousStatus.restarted()
 
+        elif message.startswith('L'):
+            # A request finished, with its latency in milliseconds
+            latency = int(message[1:]) / 1000.0
+            self.latencyReported(latency)
+            return previousStatus.recordLatency(latency, self.latencySmoothing)
+
         else:
             # '+' acknowledges that the subprocess has taken on the work.
             return previousStatus.adjust(
@@ -390,6 +570,37 @@ class ConnectionLimiter(MultiService, object):
         """
         return previousStatus.adjust(unacknowledged=1)
 
+    def latencyReported(self, latency):
+        """
+        Adjust the request limit based on the latency of a completed request.
+        The limit grows by one for each limit's worth of fast requests, and
+        shrinks by L{decreaseFactor} at most once per smoothed latency period
+        while requests are slow.
+
+        @param latency: the latency of a completed request in seconds
+        @type latency: L{float}
+        """
+        if self.targetLatency is None:
+            return
+        self.latency += self.latencySmoothing * (latency - self.latency)
+        if self.latency > self.targetLatency:
+            now = time.time()
+            if now - self._lastDecrease >= self.latency:
+                self.requestLimit = max(self.minRequests, self.requestLimit * self.decreaseFactor)
+                self._lastDecrease = now
+        else:
+            self.requestLimit = min(self.maxRequests, self.requestLimit + 1.0 / self.requestLimit)
+
+    @property
+    def currentMaximum(self):
+        """
+        The number of outstanding requests at which new connections stop
+        being accepted.
+        """
+        if self.targetLatency is None:
+            return self.maxRequests
+        return int(self.requestLimit)
+
     def statusesChanged(self, statuses):
         """
         The L{InheritedSocketDispatcher} is reporting that the list of
@@ -405,7 +616,7 @@ class ConnectionLimiter(MultiService, object):
                       for status in self.dispatcher.statuses)
         self._outstandingRequests = current  # preserve for or= field in log
         self._maxOutstandingRequests = max(self._maxOutstandingRequests, self._outstandingRequests)
-        maximum = self.maxRequests
+        maximum = self.currentMaximum
         overloaded = (current >= maximum)
         available = len(filter(lambda x: x.active(), self.dispatcher.statuses))
         self.overloaded = (overloaded or available == 0)
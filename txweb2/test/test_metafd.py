@@ -25,7 +25,8 @@ from errno import ENOTCONN
 from twext.internet import sendfdport
 from txweb2 import metafd
 from txweb2.channel.http import HTTPChannel
-from txweb2.metafd import ReportingHTTPService, ConnectionLimiter
+from txweb2.metafd import ReportingHTTPService, ReportingHTTPChannel, \
+    ConnectionLimiter
 from twisted.internet.tcp import Server
 from twisted.application.service import Service
 
@@ -140,12 +141,25 @@ class ReportingHTTPServiceTests(TestCase):
         self.assertEqual(len(channels), 1)
         self.assertEqual(list(channels)[0].transport.getPeer().host, "0.0.0.0")
 
+    def test_reportLatency(self):
+        """
+        Channels only report request latency to the master process when
+        asked to.
+        """
+        self.assertIdentical(self.svc.reportingFactory.protocol, HTTPChannel)
+
+        svc = ReportingHTTPService(None, None, None, reportLatency=True)
+        svc.startService()
+        self.assertIdentical(svc.reportingFactory.protocol, ReportingHTTPChannel)
+
 
 class ConnectionLimiterTests(TestCase):
     """
     Tests for L{ConnectionLimiter}
     """
 
+    peerNameSucceed = True
+
     def test_loadReducedStartsReadingAgain(self):
         """
         L{ConnectionLimiter.statusesChanged} determines whether the current
@@ -203,6 +217,84 @@ class ConnectionLimiterTests(TestCase):
         builder.processRestart()
         self.assertEquals(builder.port.reading, True)
 
+    def test_latencyMessageUpdatesStatus(self):
+        """
+        An C{L} status message records the request latency on the worker's
+        status without changing its load.
+        """
+        builder = LimiterBuilder(self)
+        builder.fillUp(True, 1)
+        skt = builder.dispatcher._subprocessSockets[0]
+        builder.dispatcher.statusMessage(skt, "L500")
+        self.assertEquals(skt.status.effective(), 1)
+        self.assertAlmostEqual(
+            skt.status.latency, 0.5 * builder.limiter.latencySmoothing
+        )
+
+    def test_adaptiveLimitDecreasesWhenSlow(self):
+        """
+        With a target latency, L{ConnectionLimiter} reduces its request limit
+        when requests are slow, and stops reading once the reduced limit is
+        reached.
+        """
+        builder = LimiterBuilder(self, targetLatency=0.1, minRequests=2)
+        limiter = builder.limiter
+        self.assertEquals(limiter.currentMaximum, limiter.maxRequests)
+        for _ignore in range(20):
+            limiter._lastDecrease = 0.0
+            limiter.latencyReported(10.0)
+        self.assertEquals(limiter.currentMaximum, 2)
+        builder.fillUp(True, 2)
+        self.assertEquals(builder.port.reading, False)
+
+    def test_adaptiveLimitIncreasesWhenFast(self):
+        """
+        With a target latency, L{ConnectionLimiter} grows its request limit
+        back up to the maximum when requests are fast.
+        """
+        builder = LimiterBuilder(self, targetLatency=1.0, minRequests=2)
+        limiter = builder.limiter
+        limiter.requestLimit = 2.0
+        for _ignore in range(100):
+            limiter.latencyReported(0.01)
+        self.assertEquals(limiter.currentMaximum, limiter.maxRequests)
+
+    def test_fixedLimitIgnoresLatency(self):
+        """
+        Without a target latency, the request limit is fixed.
+        """
+        builder = LimiterBuilder(self)
+        builder.limiter.latencyReported(100.0)
+        self.assertEquals(builder.limiter.currentMaximum, builder.limiter.maxRequests)
+
+    def test_affinityPrefersSameWorker(self):
+        """
+        With affinity enabled, connections from the same client address go to
+        the same worker while its load is within tolerance, even though
+        another worker is less loaded.
+        """
+        builder = LimiterBuilder(self, requestsPerSocket=10, affinityTolerance=2)
+        dispatcher = builder.dispatcher
+        peer = FakeSocket(self)
+        preferred = dispatcher.preferredSocket(peer)
+        self.assertTrue(preferred in dispatcher._subprocessSockets)
+        for _ignore in range(3):
+            dispatcher.sendFileDescriptor(peer, "TCP")
+        self.assertEquals(preferred.status.effective(), 3)
+        # Beyond the tolerance the least loaded worker is used
+        dispatcher.sendFileDescriptor(peer, "TCP")
+        self.assertEquals(preferred.status.effective(), 3)
+
+    def test_affinityWithoutAddress(self):
+        """
+        With affinity enabled, connections without a usable client address
+        are dispatched to the least loaded worker.
+        """
+        builder = LimiterBuilder(self, affinityTolerance=2)
+        self.assertEquals(builder.dispatcher.preferredSocket(None), None)
+        builder.fillUp(False, 2)
+        self.assertEquals(builder.highestLoad(), 1)
+
     def test_workerStatusRepr(self):
         """
         L{WorkerStatus.__repr__} will show all the values associated with the
@@ -234,13 +326,13 @@ class LimiterBuilder(object):
     for a given unit test.
     """
 
-    def __init__(self, test, requestsPerSocket=3, socketCount=2):
+    def __init__(self, test, requestsPerSocket=3, socketCount=2, **kwargs):
         # Similar to MaxRequests in the configuration.
         self.requestsPerSocket = requestsPerSocket
         # Similar to ProcessCount in the configuration.
         self.socketCount = socketCount
         self.limiter = ConnectionLimiter(
-            2, maxRequests=requestsPerSocket * socketCount
+            2, maxRequests=requestsPerSocket * socketCount, **kwargs
         )
         self.dispatcher = self.limiter.dispatcher
         self.dispatcher.reactor = ReaderAdder()